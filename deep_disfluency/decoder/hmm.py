@@ -19,12 +19,13 @@ import re
 from copy import deepcopy
 import numpy as np
 from collections import defaultdict
-import cPickle as pickle
-import nltk
+from itertools import count, islice
+import heapq
 
+from deep_disfluency.utils.instrumentation import clock
 import tag_conversion
-from hmm_utils import tabulate_cfd
 from hmm_utils import log
+from markov_model import MarkovTransitionModel
 
 # boosts for rare classes
 SPARSE_WEIGHT_T_ = 6.0  # for <t  # with timings this naturally gets boost
@@ -51,19 +52,20 @@ class FirstOrderHMM():
     """
     def __init__(self, disf_dict, markov_model_file=None,
                  timing_model=None, timing_model_scaler=None,
-                 n_history=20, constraint_only=True, noisy_channel=None):
+                 n_history=20, constraint_only=True, noisy_channel=None,
+                 markov_model=None):
 
         self.tagToIndexDict = disf_dict  # dict maps from tags -> indices
         self.n_history = n_history  # how many steps back we should store
         self.observation_tags = set(self.tagToIndexDict.keys())
         self.observation_tags.add('s')  # all tag sets need a start tag
-        self.cfd_tags = nltk.ConditionalFreqDist()
-        self.cpd_tags = None
+        self.markov_model = MarkovTransitionModel()
         self.tag_set = None
         self.timing_model = None
         self.timing_model_scaler = None
         self.constraint_only = constraint_only
         self.noisy_channel_source_model = noisy_channel
+        self.instrumentation = None  # optional latency/counter stats
 
         if any(["<ct/>" in x for x in self.observation_tags]):
             # if a segmentation problem
@@ -98,41 +100,24 @@ class FirstOrderHMM():
                 # if only dialogue acts
                 self.convert_tag = tag_conversion.convert_to_diact_tag
 
-        if markov_model_file:
+        if markov_model is not None:
+            # an already loaded MarkovTransitionModel, e.g. from a bundle
+            self.markov_model = markov_model
+        elif markov_model_file:
             print "loading", markov_model_file, "Markov model"
-
-            # print "If we have just seen 'DET', \
-            # the probability of 'N' is", cpd_tags["DET"].prob("N")
-            # or load from file
             mm_path = os.path.dirname(os.path.realpath(__file__)) +\
-                "/models/{}_tags.pkl".format(markov_model_file)
-            # if load:
-            self.cfd_tags = pickle.load(open(mm_path, "rb"))
-            # else:
-            #    # or create this from scratch
-            #    graph = convert_to_dot("../decoder/models/{}.csv".format(
-            #                                                markov_model_file))
-            #    # loading MM from the graph/dot representation
-            #    tags = []
-            #    for line in graph.split("\n"):
-            #        spl = line.replace(";", "").split()
-            #        if not len(spl) == 3:
-            #            continue
-            #        assert spl[1] == "->"
-            #        tags.append((spl[0], spl[2]))
-            #    self.cfd_tags += nltk.ConditionalFreqDist(tags)
+                "/models/{}_tags.npz".format(markov_model_file)
+            if not os.path.exists(mm_path):
+                # not converted yet, load (and convert) the nltk pickle
+                mm_path = mm_path.replace(".npz", ".pkl")
+            self.markov_model = MarkovTransitionModel.load(mm_path)
         else:
-            print 'No Markov model file specified, empty CFD. Needs training.'
-        # whatever happens turn this into a cond prob dist:
-        self.cpd_tags = nltk.ConditionalProbDist(self.cfd_tags,
-                                                 nltk.MLEProbDist)
-
-        all_outcomes = [v.keys() for v in self.cfd_tags.values()]
-        self.tag_set = set(self.cfd_tags.keys() +
-                           [y for x in all_outcomes for y in x])
+            print 'No Markov model file specified, empty. Needs training.'
+        self.tag_set = self.markov_model.tag_set()
         self.viterbi_init()  # initialize viterbi
         # print "Test: If we have just seen 'rpSM',\
-        # the probability of 'f' is", self.cpd_tags["c_rpSM_c"].prob("c_f_c")
+        # the probability of 'f' is", self.markov_model.prob("c_rpSM_c",
+        #                                                     "c_f_c")
         if timing_model:
             self.timing_model = timing_model
             self.timing_model_scaler = timing_model_scaler
@@ -152,15 +137,15 @@ class FirstOrderHMM():
 
     def train_markov_model_from_file(self, corpus_path, mm_path, update=False,
                                      non_sparse=False):
-        """Adds to the self.cfd_tags conditional frequency distribution
+        """Adds to the self.markov_model transition counts
         loaded, if there is one, else starts afresh.
-        Recalculate the conditional prob distribution afresh.
+        Recalculate the transition probabilities afresh.
 
         args:
         --filepath : filepath to newline separated file to learn sequence
         probabilities from.
-        --mm_path : filepath to markov model distribution path to write to.
-        --update : whether to update the current cfd, if not start anew.
+        --mm_path : filepath to write the markov model (.npz) to.
+        --update : whether to add to the current counts, if not start anew.
         --non_sparse : whether to omit lines in the corpus without repairs,
         gives higher prob to repairs
         """
@@ -220,59 +205,29 @@ class FirstOrderHMM():
                 # add end tag
                 tags.append((previous, 'se'))
         # print "If we have just seen 'DET', \
-        # the probability of 'N' is", cpd_tags["DET"].prob("N")
+        # the probability of 'N' is", markov_model.prob("DET", "N")
         # assumes these are added to exisiting one
+        markov_model = MarkovTransitionModel.from_transitions(tags)
         if update:
-            self.cfd_tags += nltk.ConditionalFreqDist(tags)
-        else:
-            self.cfd_tags = nltk.ConditionalFreqDist(tags)
-        print "cfd trained, counts:"
-        self.cfd_tags.tabulate()
-        print "test:"
-        print tabulate_cfd(self.cfd_tags)
-        # save this new cfd for later use
-        pickle.dump(self.cfd_tags, open(mm_path, "wb"))
-        # initialize the cpd
-        self.cpd_tags = nltk.ConditionalProbDist(self.cfd_tags,
-                                                 nltk.MLEProbDist)
-        # print "cpd summary:"
-        # print self.cpd_tags.viewitems()
-        print tabulate_cfd(self.cpd_tags)
-        all_outcomes = [v.keys() for v in self.cfd_tags.values()]
-        self.tag_set = set(self.cfd_tags.keys() +
-                           [y for x in all_outcomes for y in x])
-        self.viterbi_init()  # initialize viterbi
+            markov_model = self.markov_model.merge(markov_model)
+        self.set_markov_model(markov_model, mm_path)
 
     def train_markov_model_from_constraint_matrix(self, csv_path, mm_path,
                                                   delim="\t"):
-        table = [line.split(delim) for line in open(csv_path)]
-        tags = []
-        range_states = table.pop(0)[1:]
-        for row in table:
-            domain = row[0]
-            for i, r in enumerate(row[1:]):
-                s = r.replace(" ", "").strip("\n")
-                if (s == ''):
-                    continue
-                if int(s) > 0:
-                    for _ in range(0, int(s)):
-                        tags.append((domain, range_states[i]))
-        self.cfd_tags = nltk.ConditionalFreqDist(tags)
-        print "cfd trained, counts:"
-        self.cfd_tags.tabulate()
-        print "test:"
-        print tabulate_cfd(self.cfd_tags)
-        # save this new cfd for later use
-        pickle.dump(self.cfd_tags, open(mm_path, "wb"))
-        # initialize the cpd
-        self.cpd_tags = nltk.ConditionalProbDist(self.cfd_tags,
-                                                 nltk.MLEProbDist)
-        # print "cpd summary:"
-        # print self.cpd_tags.viewitems()
-        print tabulate_cfd(self.cpd_tags)
-        all_outcomes = [v.keys() for v in self.cfd_tags.values()]
-        self.tag_set = set(self.cfd_tags.keys() +
-                           [y for x in all_outcomes for y in x])
+        self.set_markov_model(
+            MarkovTransitionModel.from_count_table(csv_path, delim),
+            mm_path)
+
+    def set_markov_model(self, markov_model, mm_path=None):
+        """Use the trained markov_model, saving it to mm_path if given."""
+        self.markov_model = markov_model
+        print "markov model trained, counts:"
+        print self.markov_model.tabulate()
+        if mm_path:
+            # save this new model for later use
+            self.markov_model.save(mm_path)
+        print self.markov_model.tabulate(probabilities=True)
+        self.tag_set = self.markov_model.tag_set()
         self.viterbi_init()  # initialize viterbi
 
     def viterbi_init(self):
@@ -280,6 +235,8 @@ class FirstOrderHMM():
         self.viterbi = []
         self.backpointer = []
         self.converted = []
+        # the timing classifier's distribution at each step, if used
+        self.timing_distributions = []
         self.history = []
         if self.noisy_channel_source_model:
             self.noisy_channel_source_model.reset()
@@ -303,18 +260,72 @@ class FirstOrderHMM():
         self.viterbi = self.viterbi[:len(self.viterbi)-n]
         self.backpointer = self.backpointer[:len(self.backpointer)-n]
         self.converted = self.converted[:len(self.converted)-n]
+        self.timing_distributions = self.timing_distributions[
+            :len(self.timing_distributions)-n]
         self.best_tagsequence = self.best_tagsequence[
             :len(self.best_tagsequence)-n]
         if self.noisy_channel_source_model:
             end_idx = len(self.best_tagsequence) - n
             self.noisy_channel = self.noisy_channel[: end_idx]  # history
 
+    def transition_prob(self, prev_converted_tag, converted_tag, tag,
+                        timing_distribution=None):
+        """The (boosted) probability of the transition from
+        prev_converted_tag to converted_tag, the conversion of tag, 0.0 if
+        the markov model does not allow it, with the timing classifier's
+        distribution for the step if there is one.
+        """
+        tag_prob = self.markov_model.prob(prev_converted_tag,
+                                          converted_tag)
+        if tag_prob >= 0.000001:  # allowing for margin of error
+            if self.constraint_only:
+                # TODO for now treating this like a {0,1} constraint
+                tag_prob = 1.0
+            test = converted_tag.lower()
+            # check for different boosts for different tags
+            if "rps" in test:  # boost for start tags
+                # boost for rps
+                tag_prob = tag_prob * SPARSE_WEIGHT_RPS
+            if "rpe" in test:
+                # boost for rp end tags
+                tag_prob = tag_prob * SPARSE_WEIGHT_RPE
+            if "t_" in test[:2]:
+                # boost for t tags
+                tag_prob = tag_prob * SPARSE_WEIGHT_T_
+            if "_t" in test:
+                tag_prob = tag_prob * SPARSE_WEIGHT_T
+            if timing_distribution is not None:
+                found = False
+                for k, v in self.simple_trp_idx2label.items():
+                    if v in tag:
+                        timing_tag = k
+                        found = True
+                        break
+                if not found:
+                    raw_input("warning")
+                # using the prob from the timing classifier
+                # array over the different classes
+                timing_prob = timing_distribution[timing_tag]
+                if self.constraint_only:
+                    # just adapt the prob of the timing tag
+                    # tag_prob = timing_prob
+                    # the higher the timing weight the more influence
+                    # the timing classifier has
+                    tag_prob = (TIMING_WEIGHT * timing_prob) + tag_prob
+                    # print tag, timing_tag, timing_prob
+                else:
+                    tag_prob = (TIMING_WEIGHT * timing_prob) + tag_prob
+        else:
+            tag_prob = 0.0
+        return tag_prob
+
     def viterbi_step(self, input_distribution, word_index,
                      sequence_initial=False, timing_data=None):
         """The principal viterbi calculation for an extension to the
         input prefix, i.e. not reseting.
         """
         # source_weight = 13 # higher for WML
+        stats = self.instrumentation
         if sequence_initial:
             # first time requires initialization with the start of sequence tag
             first_viterbi = {}
@@ -331,7 +342,8 @@ class FirstOrderHMM():
                 # print input_distribution.shape
                 # print self.tagToIndexDict[tag]
                 # print input_distribution[word_index][self.tagToIndexDict[tag]]
-                tag_prob = self.cpd_tags["s"].prob(self.convert_tag("s", tag))
+                tag_prob = self.markov_model.prob("s",
+                                                  self.convert_tag("s", tag))
                 if tag_prob >= 0.00001:  # allowing for margin of error
                     if self.constraint_only:
                         # TODO for now treating this like a {0,1} constraint
@@ -365,10 +377,13 @@ class FirstOrderHMM():
             self.viterbi.append(first_viterbi)
             self.backpointer.append(first_backpointer)
             self.converted.append(first_converted)
+            self.timing_distributions.append(None)
             if self.noisy_channel_source_model:
                 self.noisy_channel.append(first_noisy_channel)
             self.add_to_history(first_viterbi, first_backpointer,
                                 first_converted)
+            if stats:
+                stats.increment("decoder_states", len(first_viterbi))
             return
         # else we're beyond the first word
         # start a new dictionary where we can store, for each tag, the prob
@@ -391,6 +406,8 @@ class FirstOrderHMM():
         if self.noisy_channel_source_model:
             this_noisy_channel = {}
             prev_noisy_channel = self.noisy_channel[-1]
+        noisy_channel_time = 0.0
+        timing_distribution = None
         # for each tag, determine what the best previous-tag is,
         # and what the probability is of the best tag sequence ending.
         # store this information in the dictionary this_viterbi
@@ -401,8 +418,13 @@ class FirstOrderHMM():
             # TODO may already be an array
             # print "calculating timing"
             # print timing_data
+            if stats:
+                t = clock()
             X = self.timing_model_scaler.transform(np.asarray([timing_data]))
             input_distribution_timing = self.timing_model.predict_proba(X)
+            timing_distribution = input_distribution_timing[0]
+            if stats:
+                stats.lap("timing_model", t)
             # print input_distribution_timing
             # raw_input()
         for tag in self.observation_tags:
@@ -429,48 +451,9 @@ class FirstOrderHMM():
                 converted_tag = self.convert_tag(prev_converted_tag, tag)
                 assert converted_tag in self.tag_set, tag + " " + \
                     converted_tag + " prev:" + str(prev_converted_tag)
-                tag_prob = self.cpd_tags[prev_converted_tag].prob(
-                    converted_tag)
-                if tag_prob >= 0.000001:  # allowing for margin of error
-                    if self.constraint_only:
-                        # TODO for now treating this like a {0,1} constraint
-                        tag_prob = 1.0
-                    test = converted_tag.lower()
-                    # check for different boosts for different tags
-                    if "rps" in test:  # boost for start tags
-                        # boost for rps
-                        tag_prob = tag_prob * SPARSE_WEIGHT_RPS
-                    if "rpe" in test:
-                        # boost for rp end tags
-                        tag_prob = tag_prob * SPARSE_WEIGHT_RPE
-                    if "t_" in test[:2]:
-                        # boost for t tags
-                        tag_prob = tag_prob * SPARSE_WEIGHT_T_
-                    if "_t" in test:
-                        tag_prob = tag_prob * SPARSE_WEIGHT_T
-                    if timing_data and self.timing_model:
-                        found = False
-                        for k, v in self.simple_trp_idx2label.items():
-                            if v in tag:
-                                timing_tag = k
-                                found = True
-                                break
-                        if not found:
-                            raw_input("warning")
-                        # using the prob from the timing classifier
-                        # array over the different classes
-                        timing_prob = input_distribution_timing[0][timing_tag]
-                        if self.constraint_only:
-                            # just adapt the prob of the timing tag
-                            # tag_prob = timing_prob
-                            # the higher the timing weight the more influence
-                            # the timing classifier has
-                            tag_prob = (TIMING_WEIGHT * timing_prob) + tag_prob
-                            # print tag, timing_tag, timing_prob
-                        else:
-                            tag_prob = (TIMING_WEIGHT * timing_prob) + tag_prob
-                else:
-                    tag_prob = 0.0
+                tag_prob = self.transition_prob(prev_converted_tag,
+                                                converted_tag, tag,
+                                                timing_distribution)
                 # the principal joint log prob
                 prob = prev_viterbi[prevtag] + log(tag_prob) + \
                     log(input_distribution[word_index][self.tagToIndexDict[tag]])
@@ -529,12 +512,16 @@ class FirstOrderHMM():
                                         convert_to_source_model_tags([tag])
                             n = 1  # just monotonic extention
                             # print back, i, source_tags
+                        if stats:
+                            t = clock()
                         source_prob, nc_node = \
                             self.noisy_channel_source_model.\
                             get_log_diff_of_tag_suffix(
                                         suffix,
                                         start_node_ID=prev_n_ch_node,
                                         n=n)
+                        if stats:
+                            noisy_channel_time += clock() - t
 
                     prob += (SOURCE_WEIGHT * source_prob)
 
@@ -557,89 +544,152 @@ class FirstOrderHMM():
         self.viterbi.append(this_viterbi)
         self.backpointer.append(this_backpointer)
         self.converted.append(this_converted)
+        self.timing_distributions.append(timing_distribution)
         if self.noisy_channel_source_model:
             self.noisy_channel.append(this_noisy_channel)
         self.add_to_history(this_viterbi, this_backpointer, this_converted)
+        if stats:
+            stats.increment("decoder_states", len(this_viterbi))
+            if self.noisy_channel_source_model:
+                stats.record("noisy_channel", noisy_channel_time)
         return
 
-    def get_best_n_tag_sequences(self, n, noisy_channel_source_model=None):
-        # Do a breadth-first search
-        # try the best final tag and its backpointers, then the second
-        # best final tag etc.
-        # once all final tags are done and n > len(final tags)
-        # move to the second best penult tags for each tag
-        # from the best to worst, then the 3rd row
-        # it terminates when n is reached
-        # use the history self.history = [{"viterbi": deepcopy(viterbi),
-        #                 "backpointer": deepcopy(backpointer),
-        #                 "converted": deepcopy(converted)}] + self.history
-        # num_seq = n if not noisy_channel_source_model else 1000
-        num_seq = n
-        best_n = []  # the tag sequences with their probability (tuple)
-        # print "len viterbi", len(self.viterbi)
-        # print "len backpoint", len(self.backpointer)
-        for viterbi_depth in range(len(self.viterbi)-1, -1, -1):
-            if len(best_n) == num_seq:
-                break
-            inc_prev_viterbi = deepcopy(self.viterbi[viterbi_depth])
-            # inc_best_previous = max(inc_prev_viterbi.keys(),
-            #                        key=lambda prevtag:
-            # inc_prev_viterbi[prevtag])
-            inc_previous = sorted(inc_prev_viterbi.items(),
-                                  key=lambda x: x[1], reverse=True)
-            for tag, prob in inc_previous:
-                # print tag, prob
-                # prob = inc_prev_viterbi[inc_best_previous]
-                # assert(prob != log(0)), "highest likelihood is 0!"
-                if prob == log(0):
+    def backtrack(self, position, tag, reference=None):
+        """The tag sequence (starting with the start tag "s") of the best
+        path ending in tag at position (the index of its viterbi step plus
+        one) by following the backpointers. Once the path reaches a tag
+        of the reference sequence at the same position the rest is taken
+        from the reference, as the backpointers before it are fixed, so
+        sequences share their backtracked prefixes.
+        """
+        if reference is None:
+            reference = []
+        suffix = [tag]
+        while position > 0:
+            if position < len(reference) and reference[position] == tag:
+                return reference[:position] + suffix[::-1]
+            tag = self.backpointer[position - 1][tag]
+            suffix.append(tag)
+            position -= 1
+        return suffix[::-1]
+
+    def k_best_derivations(self, k):
+        """The k best paths through the lattice as (log prob, tag sequence)
+        pairs, best first, each tag sequence starting with the start tag
+        "s".
+
+        The tags are scored as by viterbi_step, but a state of the search
+        is a tag with its converted tag rather than a tag, since the
+        conversion of a tag depends on the path taken to it: each state
+        keeps its k best derivations, those of a step being a lazy merge of
+        the (best first) derivations of the states of the previous step
+        extended by the transition to the tag. The emission (and noisy
+        channel) scores are those of the viterbi step, which are the same
+        whatever the previous tag, taken from the viterbi score of the tag
+        less that of its transition from its backpointer. Tags pruned from
+        a viterbi step are not considered, and the prefix before a committed
+        step (see tagger/session_state.py) is shared by all the paths.
+        """
+        tie = count()  # so derivations are never compared beyond scores
+
+        def extend(derivations, prob, tag):
+            for derivation in derivations:
+                yield (derivation[0] - prob, next(tie), tag, derivation)
+
+        start = 0
+        while not self.viterbi[start]:
+            start += 1  # committed
+        # a derivation is (-log prob, tie, tag, previous derivation) and the
+        # first derivations point back to the backtracked prefix instead
+        beams = {}
+        for tag, prob in self.viterbi[start].items():
+            if prob == log(0.0):
+                continue
+            prefix = self.backtrack(start, self.backpointer[start][tag],
+                                    self.best_tagsequence)
+            beams[(tag, self.converted[start][tag])] = \
+                [(-prob, next(tie), tag, prefix)]
+        for depth in range(start + 1, len(self.viterbi)):
+            prev_viterbi = self.viterbi[depth - 1]
+            prev_converted = self.converted[depth - 1]
+            timing_distribution = self.timing_distributions[depth]
+            incoming = defaultdict(list)
+            for tag, prob in self.viterbi[depth].items():
+                if prob == log(0.0):
                     continue
-                inc_best_tag_sequence = [tag]
-                # invert the list of backpointers
-                inc_backpointer = deepcopy(self.backpointer)
-                inc_backpointer.reverse()
-                # go backwards through the list of backpointers
-                # (or in this case forward, we have inverted the
-                # backpointer list)
-                inc_current_best_tag = tag
-                # print "backpointer..."
-                d = 0
-                for bp in inc_backpointer:
-                    d += 1
-                    # print "depth", d, "find bp for", inc_current_best_tag
-                    inc_best_tag_sequence.append(bp[inc_current_best_tag])
-                    inc_current_best_tag = bp[inc_current_best_tag]
-                # print "..."
-                inc_best_tag_sequence.reverse()
-                best_n.append((inc_best_tag_sequence, prob))
-                if len(best_n) == num_seq:
-                    break
-        best_n = sorted(best_n, key=lambda x: x[1], reverse=True)
-        debug = False
-        if debug:
-            print "getting best n"
-            for s, p in best_n:
-                print s[-1], p
-            print "***"
-        assert(best_n[0][1] > log(0.0)), "best prob 0!"
+                best_previous = self.backpointer[depth][tag]
+                emission_prob = prob - prev_viterbi[best_previous] - \
+                    log(self.transition_prob(
+                        prev_converted[best_previous],
+                        self.converted[depth][tag], tag,
+                        timing_distribution))
+                for (prevtag, prev_converted_tag), derivations in \
+                        beams.items():
+                    converted_tag = self.convert_tag(prev_converted_tag,
+                                                     tag)
+                    if converted_tag not in self.tag_set:
+                        continue
+                    tag_prob = self.transition_prob(prev_converted_tag,
+                                                    converted_tag, tag,
+                                                    timing_distribution)
+                    if tag_prob == 0.0:
+                        continue
+                    incoming[(tag, converted_tag)].append(
+                        (log(tag_prob) + emission_prob, derivations))
+            beams = {}
+            for state, extensions in incoming.items():
+                merged = heapq.merge(*[
+                    extend(derivations, prob, state[0])
+                    for prob, derivations in extensions])
+                beams[state] = list(islice(merged, k))
+        best_k = heapq.nsmallest(k, (d for derivations in beams.values()
+                                     for d in derivations))
+        k_best = []
+        for derivation in best_k:
+            prob = -derivation[0]
+            suffix = []
+            while not isinstance(derivation, list):
+                suffix.append(derivation[2])
+                derivation = derivation[3]
+            k_best.append((prob, derivation + suffix[::-1]))
+        return k_best
+
+    def get_best_n_tag_sequences(self, n, noisy_channel_source_model=None):
+        """The n best tag sequences (each starting with the start tag "s"),
+        best first.
 
+        For n = 1 this is the viterbi path, only backtracked until it joins
+        the previous best (self.best_tagsequence). Otherwise they are the n
+        best paths from k_best_derivations, the first of which is the
+        viterbi path unless the viterbi's keeping only the best conversion
+        of each tag missed a better one.
+
+        If a noisy channel source model is given the sequences are
+        rescored with it (see SourceModel.interpolate_probs_with_n_best).
+        """
+        if n > 1:
+            best_n = [(sequence, prob)
+                      for prob, sequence in self.k_best_derivations(n)]
+            assert(best_n), "best prob 0!"
+        else:
+            best_tag = max(self.viterbi[-1].keys(),
+                           key=lambda tag: self.viterbi[-1][tag])
+            best_prob = self.viterbi[-1][best_tag]
+            assert(best_prob > log(0.0)), "best prob 0!"
+            best_n = [(self.backtrack(len(self.viterbi), best_tag,
+                                      self.best_tagsequence), best_prob)]
         if not noisy_channel_source_model:
-            # return inc_best_tag_sequence
             return [x[0] for x in best_n]
-        # if noisy channel do the interpolation
-        # need to entertain the whole beam for the channel model and source
-        # model
-        # channel_beam = best_n  # the tag sequences with their probability
-        # source_beam = noisy_channel.get_best_n_tag_sequences(1000)
-        # self.interpolate_(channel_beam, source_beam)
-        channel_beam = [lambda x: (x[0], tag_conversion.
-                                   convert_to_source_model_tags(x[0]),
-                                   x[1]) for x in best_n]
-        best_seqs = noisy_channel_source_model.\
-            interpolate_probs_with_n_best(
-                channel_beam,
-                source_beam_width=1000,
-                output_beam_width=n)
-        return best_seqs
+        # if noisy channel rescore the beam with the source model
+        channel_beam = [(x[0],
+                         tag_conversion.convert_to_source_model_tags(
+                             x[0][1:]),
+                         x[1]) for x in best_n]
+        return noisy_channel_source_model.interpolate_probs_with_n_best(
+            channel_beam,
+            source_beam_width=1000,
+            output_beam_width=n,
+            source_weight=SOURCE_WEIGHT)
 
 #     def get_best_tag_sequence(self):
 #         """Returns the best tag sequence from the input so far.
@@ -663,6 +713,8 @@ class FirstOrderHMM():
 #         return inc_best_tag_sequence
 
     def get_best_tag_sequence(self, noisy_channel_source_model=None):
+        """The best tag sequence so far. Only the suffix which differs from
+        the previous best (self.best_tagsequence) is backtracked."""
         l = self.get_best_n_tag_sequences(1, noisy_channel_source_model)
 
         return l[0]
@@ -694,8 +746,8 @@ class FirstOrderHMM():
         prev_viterbi = self.viterbi[-1]
         best_previous = max(prev_viterbi.keys(),
                             key=lambda prevtag: prev_viterbi[prevtag] +
-                            log(self.cpd_tags[prev_converted[prevtag]].
-                            prob("se")))
+                            log(self.markov_model.prob(
+                                prev_converted[prevtag], "se")))
         self.best_tagsequence = ["se", best_previous]
         # invert the list of backpointers
         self.backpointer.reverse()
@@ -733,7 +785,8 @@ class FirstOrderHMM():
             (TODO maintaining the index/time spans is important
             to acheive this, even if only externally)
         """
-        previous_best = deepcopy(self.best_tagsequence)
+        # never changed in place, a new list is made below
+        previous_best = self.best_tagsequence
         # print "previous best", previous_best
         if not a_range:
             # if not specified consume the whole soft_max input
@@ -790,7 +843,7 @@ if __name__ == '__main__':
     print tags
 
     h = FirstOrderHMM(tags, markov_model_file=None)
-    mm_path = "models/{}_tags.pkl".format(tags_name)
+    mm_path = "models/{}_tags.npz".format(tags_name)
     # corpus_path = "../data/tag_representations/{}_tag_corpus.csv".format(
     #    tags_name).replace("_021", "")
     # h.train_markov_model_from_file(corpus_path, mm_path, non_sparse=True)
@@ -798,7 +851,7 @@ if __name__ == '__main__':
     h.train_markov_model_from_constraint_matrix(csv_file,
                                                 mm_path,
                                                 delim=",")
-    table = tabulate_cfd(h.cpd_tags)
+    table = h.markov_model.tabulate(probabilities=True)
     test_f = open("models/{}_tags_table.csv".format(tags_name), "w")
     test_f.write(table)
     test_f.close()
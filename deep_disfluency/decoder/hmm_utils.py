@@ -1,6 +1,5 @@
 from copy import deepcopy
 import math
-import nltk
 
 
 def log(prob):
@@ -23,6 +22,7 @@ def tabulate_cfd(cfd, *args, **kwargs):
     :type title: bool
     """
 
+    import nltk
     cumulative = False
     # conditions = sorted([c for c in cfd.conditions()
     #                     if "_t_" in c])   # only concerned with act-final
@@ -0,0 +1,201 @@
+"""A compact first order Markov model of the transitions between the
+converted tags of the HMM decoder, replacing the pickled nltk
+ConditionalFreqDist/ConditionalProbDist(MLEProbDist) pair.
+
+The transition counts are a dense integer matrix indexed by tag id, from
+which the maximum likelihood probability and (base 2) log probability
+matrices are derived. Models are saved as small .npz files of the tag
+list and the count matrix, which load in milliseconds without nltk.
+
+The existing pickled models (or constraint matrix csv files) can be
+converted with:
+
+    python markov_model.py models/swbd_disf1_uttseg_simple_033_tags.pkl
+    python markov_model.py -d , models/swbd_disf1_uttseg_simple_033.csv
+
+which write models/swbd_disf1_uttseg_simple_033_tags.npz.
+"""
+from __future__ import division
+import argparse
+import os
+import cPickle as pickle
+
+import numpy as np
+
+
+class MarkovTransitionModel(object):
+    """Transition counts and probabilities between tags,
+    counts[i, j] being the number of times tags[j] followed tags[i].
+    """
+
+    def __init__(self, tags=(), counts=None):
+        self.tags = [str(t) for t in tags]
+        self.tag_index = dict((t, i) for i, t in enumerate(self.tags))
+        n = len(self.tags)
+        if counts is None:
+            counts = np.zeros((n, n), dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape((n, n))
+        totals = self.counts.sum(axis=1).astype(np.float64)
+        self.probs = np.zeros((n, n), dtype=np.float64)
+        seen = totals > 0
+        self.probs[seen] = self.counts[seen] / totals[seen, np.newaxis]
+        with np.errstate(divide="ignore"):
+            self.log_probs = np.log2(self.probs)
+        # python lists for the decoder's scalar lookups, which are
+        # faster than indexing into the numpy array
+        self.prob_rows = self.probs.tolist()
+
+    def prob(self, prev_tag, tag):
+        """P(tag | prev_tag), 0.0 for unseen tags as the MLEProbDist."""
+        i = self.tag_index.get(prev_tag)
+        j = self.tag_index.get(tag)
+        if i is None or j is None:
+            return 0.0
+        return self.prob_rows[i][j]
+
+    def conditions(self):
+        """The tags with at least one transition from them."""
+        return [t for t, n in zip(self.tags, self.counts.sum(axis=1)) if n]
+
+    def tag_set(self):
+        """The tags seen either side of a transition."""
+        seen = (self.counts.sum(axis=0) + self.counts.sum(axis=1)) > 0
+        return set(t for t, s in zip(self.tags, seen) if s)
+
+    @classmethod
+    def from_transitions(cls, transitions):
+        """Count a list of (previous tag, tag) pairs."""
+        tags = sorted(set(t for pair in transitions for t in pair))
+        tag_index = dict((t, i) for i, t in enumerate(tags))
+        n = len(tags)
+        if not transitions:
+            return cls(tags)
+        pairs = np.asarray([(tag_index[a], tag_index[b])
+                            for a, b in transitions], dtype=np.int64)
+        counts = np.bincount(pairs[:, 0] * n + pairs[:, 1],
+                             minlength=n * n).reshape((n, n))
+        return cls(tags, counts)
+
+    @classmethod
+    def from_count_table(cls, csv_path, delim="\t"):
+        """Read a constraint matrix table whose first row is the
+        tags transitioned to and each other row the tag transitioned from
+        followed by the counts, empty cells being zero counts.
+        """
+        with open(csv_path) as f:
+            table = [line.split(delim) for line in f]
+        # NB the last tag of the header keeps its newline as in the
+        # original nltk training, so converted models match the shipped ones
+        range_tags = table.pop(0)[1:]
+        domain_tags = [row[0] for row in table]
+        tags = sorted(set(range_tags + domain_tags))
+        tag_index = dict((t, i) for i, t in enumerate(tags))
+        cells = np.zeros((len(domain_tags), len(range_tags)), dtype=np.int64)
+        for r, row in enumerate(table):
+            values = [c.replace(" ", "").strip("\n")
+                      for c in row[1:len(range_tags) + 1]]
+            cells[r, :len(values)] = [int(v) if v else 0 for v in values]
+        cells[cells < 0] = 0
+        counts = np.zeros((len(tags), len(tags)), dtype=np.int64)
+        rows = np.asarray([tag_index[t] for t in domain_tags],
+                          dtype=np.int64)
+        cols = np.asarray([tag_index[t] for t in range_tags], dtype=np.int64)
+        np.add.at(counts, (rows[:, np.newaxis], cols[np.newaxis, :]), cells)
+        return cls(tags, counts)
+
+    @classmethod
+    def from_cfd(cls, cfd):
+        """Convert an nltk ConditionalFreqDist of tag transitions."""
+        conditions = list(cfd.conditions())
+        tags = sorted(set(conditions +
+                          [o for c in conditions for o in cfd[c].keys()]))
+        tag_index = dict((t, i) for i, t in enumerate(tags))
+        counts = np.zeros((len(tags), len(tags)), dtype=np.int64)
+        for c in conditions:
+            for o, n in cfd[c].items():
+                counts[tag_index[c], tag_index[o]] = n
+        return cls(tags, counts)
+
+    def merge(self, other):
+        """A new model with the counts of both."""
+        tags = sorted(set(self.tags + other.tags))
+        tag_index = dict((t, i) for i, t in enumerate(tags))
+        counts = np.zeros((len(tags), len(tags)), dtype=np.int64)
+        for model in [self, other]:
+            idx = np.asarray([tag_index[t] for t in model.tags],
+                             dtype=np.int64)
+            counts[idx[:, np.newaxis], idx[np.newaxis, :]] += model.counts
+        return MarkovTransitionModel(tags, counts)
+
+    def save(self, file_path):
+        # through a file object so numpy doesn't add the .npz extension
+        with open(file_path, "wb") as f:
+            np.savez_compressed(f, tags=np.asarray(self.tags, dtype=str),
+                                counts=self.counts)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load a model saved as .npz or, converting it, an nltk
+        ConditionalFreqDist pickled in a .pkl file."""
+        if file_path.endswith(".pkl"):
+            with open(file_path, "rb") as f:
+                return cls.from_cfd(pickle.load(f))
+        data = np.load(file_path)
+        return cls(data["tags"].tolist(), data["counts"])
+
+    def tabulate(self, probabilities=False):
+        """The counts (or probabilities) as a tab separated table in the
+        format of hmm_utils.tabulate_cfd."""
+        conditions = sorted(self.conditions())
+        samples = sorted(t for t, n in zip(self.tags,
+                                           self.counts.sum(axis=0)) if n)
+        if samples == []:
+            print "No conditions for tabulate!"
+            return None
+        values = self.probs if probabilities else self.counts
+        final_string = "".join("\t" + str(s) for s in samples) + "\n"
+        for c in conditions:
+            final_string += str(c) + "\t"
+            for s in samples:
+                f = values[self.tag_index[c], self.tag_index[s]]
+                if f == 0:
+                    final_string += "\t"
+                elif probabilities:
+                    final_string += "{:.3f}\t".format(f)
+                else:
+                    final_string += "{}\t".format(f)
+            final_string = final_string[:-1] + "\n"
+        return final_string
+
+
+def converted_file_path(file_path):
+    """models/x_tags.pkl -> models/x_tags.npz,
+    models/x.csv -> models/x_tags.npz"""
+    root, ext = os.path.splitext(file_path)
+    if ext == ".csv":
+        root += "_tags"
+    return root + ".npz"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert pickled nltk\
+        Markov models or constraint matrix csv files to .npz\
+        MarkovTransitionModel files.')
+    parser.add_argument('files', nargs='+', help='.pkl or .csv files.')
+    parser.add_argument('-d', '--delim', type=str, default="\t",
+                        help='Delimiter of the csv files.')
+    args = parser.parse_args()
+    for file_path in args.files:
+        if file_path.endswith(".csv"):
+            model = MarkovTransitionModel.from_count_table(file_path,
+                                                           args.delim)
+        else:
+            model = MarkovTransitionModel.load(file_path)
+        output_path = converted_file_path(file_path)
+        model.save(output_path)
+        print file_path, "->", output_path, \
+            "({} tags)".format(len(model.tags))
+
+
+if __name__ == '__main__':
+    main()
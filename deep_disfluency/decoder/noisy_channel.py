@@ -25,6 +25,7 @@ class SourceModel(object):
         self.lm = lm  # language model
         self.pos_lm = pos_lm  # POS tag language model
         self.uttseg = uttseg  # whether this is for utterance segmentation too
+        self.instrumentation = None  # optional latency/counter stats
         self.reset()
 
     def reset(self):
@@ -165,12 +166,15 @@ class SourceModel(object):
                 parent_node_address)
 
     def find_or_generate_path_of_suffix_from_node(self, suffix, node_ID,
-                                                  new=False, debug=False):
+                                                  new=False, debug=False,
+                                                  add_nodes=True):
         """From a given node ID of tuple (tree depth, dict_id)
         (which must exist if this function is called),
         Find a path consistent with the suffix which matches
         the non-proper prefix of the words consumed so far.
         Returns the most probable path of nodes as a list.
+        If not add_nodes the nodes generated are only in the path
+        returned, not added to the word tree.
         """
         # print "calling find from node", suffix, node_ID
         node_path = []  # returns the successors of the node, not itself
@@ -210,6 +214,9 @@ class SourceModel(object):
                     # get the new successor nodes
                     node_address, node_value = nodes[0]
                     node_path.append((node_address, node_value))
+                    if self.instrumentation:
+                        # re-used node, no lm lookups needed
+                        self.instrumentation.increment("lm_cache_hits")
                     continue
                 # if not make one
                 else:
@@ -219,18 +226,22 @@ class SourceModel(object):
             # do the new node value calculations from the current node value
             node_value = self.get_successor_node_value(node_address,
                                                        node_value, tag, d)
+            if self.instrumentation:
+                self.instrumentation.increment("lm_cache_misses")
             
             node_address = 0 if len(self.word_tree[d].items()) == 0 \
                                 else max(self.word_tree[d].items(),
                                          key=lambda x: x[0])[0] + 1
-            self.word_tree[d][node_address] = node_value
+            if add_nodes:
+                self.word_tree[d][node_address] = node_value
             node_path.append((node_address, node_value))
         return node_path
 
-    def find_or_generate_best_path_of_suffix(self, suffix):
+    def find_or_generate_best_path_of_suffix(self, suffix, add_nodes=True):
         """Find the node values relevant for the suffix if possible,
         else generate the best path from an anchor node
         using find_or_generate_path_of_suffix_from_node method
+        (adding the nodes generated to the word tree if add_nodes)
         """
         node_path = []
         for s, d in zip(
@@ -280,7 +291,8 @@ class SourceModel(object):
                 path_tail = self.find_or_generate_path_of_suffix_from_node(
                                                 suffix[s:],
                                                 node_ID,
-                                                new=True)
+                                                new=True,
+                                                add_nodes=add_nodes)
                 return node_path + path_tail
         # got this far we have found a path through of existing nodes
         # print "got to end"
@@ -299,11 +311,14 @@ class SourceModel(object):
         return node_path
 
     def get_log_diff_of_tag_suffix(self, suffix, n=1, start_node_ID=None,
-                                   pos=True):
+                                   pos=True, add_nodes=True):
         """For a given suffix of edit operations on the original
         string, give the probability of that string in the lm
         in terms of the gain of negative log prob from
-        n words back from the end of the suffix"""
+        n words back from the end of the suffix, and the ID of its last
+        node. If not add_nodes the word tree is left as it is, the nodes
+        the suffix needs only being generated for the lookup, and the
+        node ID is None."""
         assert len(suffix) <= len(self.word_tree)
         # print "suffix", suffix
         if not suffix:
@@ -316,12 +331,13 @@ class SourceModel(object):
             # the suffix is consistent with up to that point
             # (this saves time)
             path = self.find_or_generate_path_of_suffix_from_node(
-                suffix, start_node_ID)
+                suffix, start_node_ID, add_nodes=add_nodes)
             #start_node = self.word_tree[start_node_ID[0]][start_node_ID[1]]
             #orig_log_prob = start_node[1]
             #orig_unigram_log_prob = start_node[2]
         else:
-            path = self.find_or_generate_best_path_of_suffix(suffix)
+            path = self.find_or_generate_best_path_of_suffix(
+                suffix, add_nodes=add_nodes)
         orig_log_prob = path[min([len(path)-1,len(path)-(1+n)])][1][1]
         orig_unigram_log_prob = path[min([len(path)-1,len(path)-(1+n)])][1][2]
         final_log_prob = path[-1][1][1]
@@ -337,8 +353,34 @@ class SourceModel(object):
         #print wml_diff
         #diff = log(wml_diff)
         diff = log(0.01) if diff == 0 else diff  #too much weight for 0s
+        if not add_nodes:
+            return diff, None
         return diff, (path[-1][1][3], path[-1][0])
 
+    def interpolate_probs_with_n_best(self, channel_beam, source_beam_width=1,
+                                      output_beam_width=1, source_weight=0.1):
+        """Rescore the channel model's n best hypotheses with the source
+        model. channel_beam is a list of (tag sequence, source model tag
+        sequence, channel log prob) triples; each hypothesis' score is its
+        channel log prob plus source_weight times the log diff of the
+        last source_beam_width (or fewer) tags of its source model tags.
+        Returns the output_beam_width best tag sequences, best first.
+        The word tree is not changed by the rescoring.
+        """
+        rescored = []
+        for tags, source_tags, channel_prob in channel_beam:
+            n = min(source_beam_width, len(source_tags),
+                    len(self.word_tree))
+            if n > 0:
+                source_diff, _ = self.get_log_diff_of_tag_suffix(
+                    source_tags[-n:], n=n, add_nodes=False)
+            else:
+                source_diff = 0
+            rescored.append((tags, channel_prob +
+                             (source_weight * source_diff)))
+        rescored = sorted(rescored, key=lambda x: x[1], reverse=True)
+        return [x[0] for x in rescored[:output_beam_width]]
+
     def get_top_n_sequences(self, n):
         """Get the most probable n sequences.
         """
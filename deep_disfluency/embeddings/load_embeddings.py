@@ -1,5 +1,39 @@
+import hashlib
+import os
+import tempfile
+
 import numpy
-from copy import deepcopy
+
+# (real path, modification time, size) -> read only memory mapped table
+_OPEN_EMBEDDINGS = {}
+
+
+def open_embeddings(file_path):
+    """A saved (.npy) embeddings table as a read only memory map, the same
+    array for every model in this process opening the same file, and
+    backed by the OS page cache shared with other processes. Indexing it
+    with word indices only reads the rows of those words.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.realpath(file_path), stat.st_mtime, stat.st_size)
+    emb = _OPEN_EMBEDDINGS.get(key)
+    if emb is None:
+        emb = numpy.load(file_path, mmap_mode="r")
+        _OPEN_EMBEDDINGS[key] = emb
+    return emb
+
+
+def _pretrained_vectors(pretrained):
+    """The word list and (n_words, dim) vector matrix of a gensim
+    Word2Vec model (or its KeyedVectors) of any gensim version."""
+    keyed_vectors = getattr(pretrained, "wv", pretrained)
+    vectors = getattr(keyed_vectors, "vectors", None)
+    if vectors is None:
+        vectors = getattr(keyed_vectors, "syn0", None)
+    if vectors is None:
+        vectors = numpy.asarray([pretrained[w]
+                                 for w in keyed_vectors.index2word])
+    return keyed_vectors.index2word, vectors
 
 
 def populate_embeddings(emb_dim, vocsize, words2index, pretrained):
@@ -12,18 +46,52 @@ def populate_embeddings(emb_dim, vocsize, words2index, pretrained):
         " " + str(emb_dim)
     emb = 0.2 * numpy.random.uniform(-1.0, 1.0,
                                      (vocsize+1, emb_dim)).astype('Float32')
-    vocab = deepcopy(words2index.keys())
-    for i in range(0, len(pretrained.index2word)):
-        word = pretrained.index2word[i]
-        index = words2index.get(word)
-        if index is None:
-            # i.e. no index for this word
-            print "no such word in vocab for embedding for word:", word
-            continue
-        # print i, word # returns the word and its index in pretrained
-        emb[index] = pretrained[word]  # assign the correct index
-        vocab.remove(word)
-    print len(vocab), "words with no pretrained embedding."
-    for v in vocab:
+    index2word, vectors = _pretrained_vectors(pretrained)
+    # join the pretrained words to the vocabulary indices in one pass
+    indices = numpy.asarray([words2index.get(word, -1)
+                             for word in index2word], dtype=numpy.int64)
+    found = indices >= 0
+    print (~found).sum(), "pretrained words not in the vocab."
+    emb[indices[found]] = vectors[found]
+    missing = set(words2index.keys()).difference(
+        word for word, f in zip(index2word, found) if f)
+    print len(missing), "words with no pretrained embedding."
+    for v in missing:
         print v
     return emb
+
+
+def _embeddings_cache_file(cache_dir, emb_dim, vocsize, words2index,
+                           pretrained_path):
+    stat = os.stat(pretrained_path)
+    digest = hashlib.sha1()
+    digest.update(repr((os.path.realpath(pretrained_path), stat.st_mtime,
+                        stat.st_size, emb_dim, vocsize,
+                        sorted(words2index.items()))))
+    return os.path.join(cache_dir, "emb_{}.npy".format(digest.hexdigest()))
+
+
+def load_pretrained_embeddings(emb_dim, vocsize, words2index,
+                               pretrained_path, cache_dir=None):
+    """The populate_embeddings table of the gensim Word2Vec model saved in
+    pretrained_path for the vocabulary, saved to a cache file (by default
+    next to the model) named by the model file and vocabulary the first
+    time and memory mapped from it (see open_embeddings) after that, so
+    the model is only loaded once. NB the rows of the words with no
+    pretrained embedding are therefore the same random ones each time.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.realpath(pretrained_path))
+    cache_file = _embeddings_cache_file(cache_dir, emb_dim, vocsize,
+                                        words2index, pretrained_path)
+    if not os.path.exists(cache_file):
+        import gensim
+        pretrained = gensim.models.Word2Vec.load(pretrained_path)
+        emb = populate_embeddings(emb_dim, vocsize, words2index, pretrained)
+        # written whole then renamed, so concurrent loaders never see
+        # a partial file
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            numpy.save(f, emb)
+        os.rename(tmp_file, cache_file)
+    return open_embeddings(cache_file)
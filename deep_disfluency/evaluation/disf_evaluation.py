@@ -75,6 +75,9 @@ KB3_1:7    6.00    7.10    pause    NN    <f/><cc/>
 Time: 7.30
 KB3_1:7    6.00    7.10    pause    NN    <f/><ct/>
 
+These files can also be given in the compact binary form written by
+load/increco_binary.py, which is read without parsing the text.
+
 The full evaluation method returns the non-incremental (final) and
 incremental  disfluency evaluation as in Hough & Purver 2014 and
 Hough & Schlangen 2015.
@@ -93,6 +96,7 @@ for both the incremental and non-incremental versions.
 """
 from __future__ import division
 
+import multiprocessing
 import os.path
 from copy import deepcopy
 from scipy.stats.stats import pearsonr, spearmanr
@@ -195,12 +199,123 @@ p_rps_del_novel,r_rps_del_novel,f1_rps_del_novel,\
 "
 
 
+# the keys of the tag dicts whose values are lists of samples, merged by
+# concatenation, rather than counts or durations, merged by addition
+SAMPLE_KEY_PREFIX = "t_t_detection_"
+
+
 def div(enum, denom):
     if denom == 0.0 or enum == 0.0:
         return 0.0
     return enum / denom
 
 
+def merge_tag_dicts(total, part):
+    """Add the counts and durations of the tag dict part to those of
+    total in place and append its samples, returning total.
+    Merging each speaker's tag dict in speaker order gives exactly the
+    totals (including the float sums) of accumulating them serially.
+    """
+    for key, value in part.items():
+        if key.startswith(SAMPLE_KEY_PREFIX):
+            total[key].extend(value)
+        else:
+            for i, x in enumerate(value):
+                total[key][i] += x
+    return total
+
+
+def merge_error_analysis(total, part):
+    """Append the repairs of the error analysis dict part to total's."""
+    for tag, outcomes in part.items():
+        for outcome, repairs in outcomes.items():
+            total[tag][outcome].extend(repairs)
+    return total
+
+
+def map_speakers(function, speakers, n_jobs=1):
+    """map the function over the list of the speakers' arguments, in a
+    pool of n_jobs processes if n_jobs is greater than 1 (or None,
+    one per cpu), the results being in the speakers' order either way.
+    """
+    if n_jobs == 1 or len(speakers) < 2:
+        return map(function, speakers)
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        return pool.map(function, speakers, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def final_output_speaker_eval(args):
+    """The final output evaluation of one speaker from the arguments
+    (speaker, hyp, gold, tag dict, interval tag dict, error analysis
+    dict, utt_eval, word, interval, whether to give the output text),
+    returning the speaker with their own filled copies of the dicts,
+    their speaker rate list and output text.
+    """
+    s, hyp, gold, tag_dict, tag_dict_interval, error_analysis, \
+        utt_eval, word, interval, output = args
+    tag_dict = deepcopy(tag_dict)
+    tag_dict_interval = deepcopy(tag_dict_interval)
+    error_analysis = deepcopy(error_analysis)
+    output_lines = []
+    if output:
+        output_lines.append("Speaker: " + s + "\n")
+    hypwords = hyp[1]
+    goldwords = gold[1]
+    if word:  # assumes number of words == no of intervals
+        prediction_tags = rename_all_repairs_in_line_with_index(
+            [x[0] for x in hyp[2]],
+            simple=not any(["<rm" in x[0] for x in hyp[2]]))
+        gold_tags = list(gold[3])
+        repairs_hyp,\
+            repairs_gold,\
+            number_of_utts_hyp,\
+            number_of_utts_gold = \
+            final_output_accuracy_word_level(goldwords,
+                                             prediction_tags,
+                                             gold_tags,
+                                             tag_dict=tag_dict,
+                                             utt_eval=utt_eval,
+                                             error_analysis=error_analysis)
+        if output:
+            final_words = []
+            for g_word, h_word in zip(goldwords, hypwords):
+                joint_w = g_word
+                if not h_word[0] == g_word:
+                    joint_w = joint_w + "@" + h_word[0]
+                final_words.append((h_word[1], h_word[2], joint_w))
+            for w, g_tag, h_tag in zip(final_words,
+                                       gold[3],
+                                       [x[0] for x in hyp[2]]):
+                output_lines.append("\t".join([str(w[0]),
+                                               str(w[1]),
+                                               str(w[2]),
+                                               "{0}@{1}"
+                                               .format(g_tag, h_tag)]) +
+                                    "\n")
+            output_lines.append("\n")
+    if interval:
+        repairs_hyp,\
+            repairs_gold,\
+            number_of_utts_hyp,\
+            number_of_utts_gold = \
+            final_output_accuracy_interval_level(
+                                    hyp,
+                                    gold,
+                                    tag_dict=tag_dict_interval,
+                                    utt_eval=utt_eval,
+                                    error_analysis=error_analysis)
+    # oesn't matter if word based or interval based, the speaker rate
+    # is based on turns
+    speaker_rate = [repairs_hyp, repairs_gold, number_of_utts_hyp,
+                    number_of_utts_gold, len(hypwords), len(goldwords)]
+    return s, tag_dict, tag_dict_interval, speaker_rate, error_analysis, \
+        "".join(output_lines)
+
+
 def final_output_disfluency_eval(prediction_speakers_dict,
                                  gold_speakers_dict,
                                  utt_eval=False,
@@ -208,7 +323,8 @@ def final_output_disfluency_eval(prediction_speakers_dict,
                                  word=True,
                                  interval=True,
                                  results=None,
-                                 outputfilename=None):
+                                 outputfilename=None,
+                                 n_jobs=1):
     """
     Non-incremental (dialogue-final) eval results.
     Returns a dict with all the required results as shown in the
@@ -237,6 +353,9 @@ def final_output_disfluency_eval(prediction_speakers_dict,
      results -- dict with other results, default None
      outputfilename -- path to file where final outputs are saved as
      text
+     n_jobs -- the number of processes to evaluate the speakers in
+     (None for one per cpu), the results being the same as evaluating
+     them serially
     """
     print "final output disfluency evaluation"
     print "word=", word, "interval=", interval, "utt_eval=", utt_eval
@@ -296,11 +415,8 @@ def final_output_disfluency_eval(prediction_speakers_dict,
                 "FN": []
             }
 
-    # loop through speakers
-    # print output
-    if outputfilename:
-        outputfile = open(outputfilename, "w")
-    # testfile = open("../test.text", "w")
+    # evaluate each speaker separately, then merge their counts in order
+    speakers = []
     for s in sorted(prediction_speakers_dict.keys()):
 
         # print s
@@ -313,68 +429,23 @@ def final_output_disfluency_eval(prediction_speakers_dict,
                 gold = gold_speakers_dict[s_test]
         else:
             gold = gold = gold_speakers_dict[s]
-
+        speakers.append((s, prediction_speakers_dict[s], gold, tag_dict,
+                         tag_dict_interval,
+                         error_analysis or {}, utt_eval, word, interval,
+                         bool(outputfilename)))
+    # print output
+    if outputfilename:
+        outputfile = open(outputfilename, "w")
+    for s, speaker_tag_dict, speaker_tag_dict_interval, speaker_rate, \
+            speaker_error_analysis, output in \
+            map_speakers(final_output_speaker_eval, speakers, n_jobs):
+        merge_tag_dicts(tag_dict, speaker_tag_dict)
+        merge_tag_dicts(tag_dict_interval, speaker_tag_dict_interval)
+        if error_analysis:
+            merge_error_analysis(error_analysis, speaker_error_analysis)
+        speaker_rate_dict[s] = speaker_rate
         if outputfilename:
-            outputfile.write("Speaker: " + s + "\n")
-        # testfile.write("\nSpeaker: " + s + "\n")
-        hyp = prediction_speakers_dict[s]
-
-        hypwords = hyp[1]
-        goldwords = gold[1]
-        if word:  # assumes number of words == no of intervals
-            prediction_tags = rename_all_repairs_in_line_with_index(
-                [x[0] for x in hyp[2]],
-                simple=not any(["<rm" in x[0] for x in hyp[2]]))
-            gold_tags = list(gold[3])
-            # for w, g, p in zip(goldwords, gold_tags, prediction_tags):
-            #     testfile.write("\t".join([w, g, p]) + "\n")
-            repairs_hyp,\
-                repairs_gold,\
-                number_of_utts_hyp,\
-                number_of_utts_gold = \
-                final_output_accuracy_word_level(goldwords,
-                                                 prediction_tags,
-                                                 gold_tags,
-                                                 tag_dict=tag_dict,
-                                                 utt_eval=utt_eval,
-                                                 error_analysis=error_analysis)
-            if outputfilename:
-                final_words = []
-                for g_word, h_word in zip(goldwords, hypwords):
-                    joint_w = g_word
-                    if not h_word[0] == g_word:
-                        joint_w = joint_w + "@" + h_word[0]
-                    final_words.append((h_word[1], h_word[2], joint_w))
-                for w, g_tag, h_tag in zip(final_words,
-                                           gold[3],
-                                           [x[0] for x in hyp[2]]):
-                    outputfile.write("\t".join([str(w[0]),
-                                                str(w[1]),
-                                                str(w[2]),
-                                                "{0}@{1}"
-                                                .format(g_tag, h_tag)]) + "\n")
-                outputfile.write("\n")
-        if interval:
-            repairs_hyp,\
-                repairs_gold,\
-                number_of_utts_hyp,\
-                number_of_utts_gold = \
-                final_output_accuracy_interval_level(
-                                        hyp,
-                                        gold,
-                                        tag_dict=tag_dict_interval,
-                                        utt_eval=utt_eval,
-                                        error_analysis=error_analysis)
-        if not speaker_rate_dict.get(s):
-            speaker_rate_dict[s] = [0, 0, 0, 0, 0, 0]
-        # oesn't matter if word based or interval based, the speaker rate
-        # is based on turns
-        speaker_rate_dict[s][0] += repairs_hyp
-        speaker_rate_dict[s][1] += repairs_gold
-        speaker_rate_dict[s][2] += number_of_utts_hyp
-        speaker_rate_dict[s][3] += number_of_utts_gold
-        speaker_rate_dict[s][4] += len(hypwords)
-        speaker_rate_dict[s][5] += len(goldwords)
+            outputfile.write(output)
     if outputfilename:
         outputfile.close()
     # the accuracy calculations
@@ -484,7 +555,8 @@ def final_output_disfluency_eval_from_file(prediction_filename,
                                            word=True,
                                            interval=False,
                                            results=None,
-                                           outputfilename=None):
+                                           outputfilename=None,
+                                           n_jobs=1):
     final_output = load_final_output_from_file(prediction_filename)
     return final_output_disfluency_eval(final_output,
                                         gold_speakers_dict,
@@ -492,7 +564,33 @@ def final_output_disfluency_eval_from_file(prediction_filename,
                                         error_analysis=error_analysis,
                                         word=word, interval=interval,
                                         results=results,
-                                        outputfilename=outputfilename)
+                                        outputfilename=outputfilename,
+                                        n_jobs=n_jobs)
+
+
+def incremental_output_speaker_eval(args):
+    """The incremental evaluation of one speaker from the arguments
+    (speaker, increco hyp, gold, tag dict, utt_eval, ttd_tags, word,
+    interval), returning the speaker, their final hyp and their own
+    filled copy of the tag dict.
+    """
+    s, hyp, gold_speaker, tag_dict, utt_eval, ttd_tags, word, interval = \
+        args
+    tag_dict = deepcopy(tag_dict)
+    gold = [(x, y[0], y[1])
+            for x, y in zip(gold_speaker[3], gold_speaker[0])]
+    # we do word + interval in one swoop
+    final_hyp = final_hyp_from_increco_and_incremental_metrics(
+                            hyp,
+                            gold,
+                            gold_speaker[1],
+                            utt_eval,
+                            ttd_tags=ttd_tags,
+                            word=word,
+                            interval=interval,
+                            tag_dict=tag_dict,
+                            speaker_ID=s)
+    return s, final_hyp, tag_dict
 
 
 def incremental_output_disfluency_eval(prediction_speakers_dict,
@@ -501,7 +599,8 @@ def incremental_output_disfluency_eval(prediction_speakers_dict,
                                        error_analysis=False,
                                        word=True,
                                        interval=False,
-                                       outputfilename=None):
+                                       outputfilename=None,
+                                       n_jobs=1):
     """
      The incremental results from an increco style outputs from the
      system and
@@ -524,6 +623,9 @@ def incremental_output_disfluency_eval(prediction_speakers_dict,
      results -- dict with other results, default None
      outputfilename -- path to file where final outputs are saved as
      text
+     n_jobs -- the number of processes to evaluate the speakers in
+     (None for one per cpu), the results being the same as evaluating
+     them serially
     """
     print "incremental output disfluency evaluation"
     print "word=", word, "interval=", interval, "utt_eval=", utt_eval
@@ -564,41 +666,20 @@ def incremental_output_disfluency_eval(prediction_speakers_dict,
                             INCREMENTAL_OUTPUT_TTO_ACCURACY_HEADER
                             .format("interval").split(",")})
     tag_dict.update({"edit_overhead": [0, 0]})
-    # started = False
+    # evaluate each speaker separately, then merge their samples in order
+    speakers = []
     for s in sorted(prediction_speakers_dict.keys()):
-        carry_on = True  # False
-        if s == "4611A":
-            carry_on = True
-        if not carry_on:
-            continue
         if gold_speakers_dict.get(s) == None:
             print s, "not in gold"
             continue
-        hyp = prediction_speakers_dict[s]
-        gold = [(x, y[0], y[1])
-                for x, y in zip(gold_speakers_dict[s][3],
-                                gold_speakers_dict[s][0])]
-        # we do word + interval in one swoop
-        final_hyp = final_hyp_from_increco_and_incremental_metrics(
-                                hyp,
-                                gold,
-                                gold_speakers_dict[s][1],
-                                utt_eval,
-                                ttd_tags=ttd_tags,
-                                word=word,
-                                interval=interval,
-                                tag_dict=tag_dict,
-                                speaker_ID=s)
+        speakers.append((s, prediction_speakers_dict[s],
+                         gold_speakers_dict[s], tag_dict, utt_eval, ttd_tags,
+                         word, interval))
+    for s, final_hyp, speaker_tag_dict in \
+            map_speakers(incremental_output_speaker_eval, speakers, n_jobs):
+        merge_tag_dicts(tag_dict, speaker_tag_dict)
         # replace the incremental results with the final one only
         prediction_speakers_dict[s] = final_hyp
-        #print gold_speakers_dict[s][1]
-        #final_gold_words = [x[0] for x in gold_speakers_dict[s][1]]
-        #print final_gold_words
-        #gold_speakers_dict[s] = (gold_speakers_dict[s][0],
-        #                         final_gold_words,
-        #                         gold_speakers_dict[s][2],
-        #                         gold_speakers_dict[s][3])
-        # break #todo remove
     # do the final output eval too
     for eval_mode in ["word", "interval"]:
         if (not word) and eval_mode == "word":
@@ -664,7 +745,8 @@ def incremental_output_disfluency_eval_from_file(prediction_filename,
                                                  error_analysis=False,
                                                  word=True,
                                                  interval=False,
-                                                 outputfilename=None):
+                                                 outputfilename=None,
+                                                 n_jobs=1):
     final_output = load_incremental_outputs_from_increco_file(
                         prediction_filename)
     return incremental_output_disfluency_eval(final_output,
@@ -673,7 +755,8 @@ def incremental_output_disfluency_eval_from_file(prediction_filename,
                                               error_analysis=error_analysis,
                                               word=word,
                                               interval=interval,
-                                              outputfilename=outputfilename)
+                                              outputfilename=outputfilename,
+                                              n_jobs=n_jobs)
 
 
 def save_results_to_file(test_filename,
@@ -2,11 +2,16 @@
 increco-style inputs.
 """
 from __future__ import division
+from bisect import bisect_left, bisect_right
 import re
 import numpy
 from copy import deepcopy
 from collections import defaultdict
-import pandas as pd
+
+from deep_disfluency.load.columnar import read_columns
+from deep_disfluency.load.increco_binary import BinaryIncreco, \
+    is_binary_increco_file
+from deep_disfluency.utils.edit_distance import edit_distance
 
 # requires mumodo from https://github.com/dsg-bielefeld/mumodo
 # from mumodo.analysis import intervalframe_overlaps
@@ -29,6 +34,7 @@ def intervalframe_overlaps(frame1, frame2, concatdelimiter='/'):
                          If empty string is given, the intervals are simply
                          labeled with 'overlap' instead.
     """
+    import pandas as pd
     overlaps = []
     if len(frame2) < len(frame1):
         frame1, frame2 = frame2, frame1
@@ -139,74 +145,51 @@ def fill_in_time_approximations(word_timing_tuples, idx):
 
 # IO methods for the different file types
 def load_incremental_outputs_from_increco_file(increco_filename):
-    """Loads increco style data from file.
+    """Loads increco style data from file (see load/columnar.py).
     For now returns word, timing and tag data only
     """
     all_speakers = defaultdict(list)
-    lex_data = []
-    tag_data = []
-    frames = []
-    latest_increco = []
-    latest_tag = []
-    f = open(increco_filename)
-    started = False
-    conv_no = ""
-    for line in f:
-        # print line
-        if "Time:" in line:
-            if not latest_increco == []:
-                lex_data.append(deepcopy(latest_increco))
-                tag_data.append(deepcopy(latest_tag))
-            latest_increco = []
-            latest_tag = []
-            continue
-        if "Speaker:" in line:
-            if not started:
-                started = True
-            else:
-                # flush
-                if not latest_increco == []:
-                    lex_data.append(deepcopy(latest_increco))
-                    tag_data.append(deepcopy(latest_tag))
-                # print lex_data
-                frames = [x[-1][-1] for x in lex_data]  # last word end time
-                assert(len(frames) == len(lex_data) == len(tag_data)), \
-                    "wrong lengths! {0} {1} {2}".format(len(frames),
-                                                        len(lex_data),
-                                                        len(tag_data))
-                all_speakers[conv_no] = [deepcopy(frames),
-                                         deepcopy(lex_data),
-                                         deepcopy(tag_data)]
-                # reset
-                lex_data = []
-                tag_data = []
-                latest_increco = []
-                latest_tag = []
-            conv_no = line.strip("\n").replace("Speaker: ", "")
-            continue
-        if line.strip("\n") == "":
-            continue
-        spl = line.strip("\n").split("\t")
-        start = float(spl[0])
-        end = float(spl[1])
-        assert len(spl) >= 3, "short line!" + "%".join(spl)
-        # assert len(spl[2].split('@'))==2, "short 3rd idx!" + "%".join(spl)
-        word = spl[2].split("@")[-1]
-        tag = spl[-1].split("@")[-1]  # covers the POS cases
-        latest_increco.append((word, start, end))
-        latest_tag.append(tag)
-    # flush
-    if not latest_increco == []:
-        lex_data.append(latest_increco)
-        tag_data.append(latest_tag)
-    frames = [x[-1][-1] for x in lex_data]  # last word end time
-    all_speakers[conv_no] = [deepcopy(frames), deepcopy(lex_data),
-                             deepcopy(tag_data)]
-    assert(len(frames) == len(lex_data) == len(tag_data)), \
-        "wrong lengths! {0} {1} {2}".format(len(frames),
-                                            len(lex_data),
-                                            len(tag_data))
-    print len(all_speakers.keys()), "speakers"
+    if is_binary_increco_file(increco_filename):
+        return load_incremental_outputs_from_binary_file(increco_filename)
+    columns = read_columns(increco_filename)
+    # the word and tag may be prefixed, e.g. by the word's index
+    assert all(len(row) >= 3 for row in columns.rows), "short line!" + \
+        "%".join(next(row for row in columns.rows if len(row) < 3))
+    starts = columns.float_column(0).tolist()
+    ends = columns.float_column(1).tolist()
+    words = [x.split("@")[-1] for x in columns.column(2)]
+    tags = [x.split("@")[-1] for x in columns.column(-1)]  # covers the POS
+    for speaker_index, conv_no in enumerate(columns.speakers):
+        lex_data = []
+        tag_data = []
+        for start, end in columns.speaker_updates(speaker_index):
+            lex_data.append(zip(words[start:end], starts[start:end],
+                                ends[start:end]))
+            tag_data.append(tags[start:end])
+        frames = [x[-1][-1] for x in lex_data]  # last word end time
+        all_speakers[conv_no] = [frames, lex_data, tag_data]
+    print len(all_speakers), "speakers"
+    return all_speakers
+
+
+def load_incremental_outputs_from_binary_file(increco_filename):
+    """As load_incremental_outputs_from_increco_file from a binary increco
+    file (see load/increco_binary.py), whose updates need no parsing.
+    """
+    all_speakers = defaultdict(list)
+    increco = BinaryIncreco(increco_filename)
+    # the word and tag may be prefixed, e.g. by the word's index
+    strings = [x.split("@")[-1] for x in increco.strings]
+    for speaker_index, conv_no in enumerate(increco.speakers):
+        lex_data = []
+        tag_data = []
+        for _, rows in increco.updates(speaker_index, strings=strings):
+            lex_data.append([(str(row[2]), float(row[0]), float(row[1]))
+                             for row in rows])
+            tag_data.append([str(row[-1]) for row in rows])
+        frames = [x[-1][-1] for x in lex_data]  # last word end time
+        all_speakers[conv_no] = [frames, lex_data, tag_data]
+    print len(all_speakers), "speakers"
     return all_speakers
 
 
@@ -305,6 +288,68 @@ def get_diff_and_new_prefix(current, newprefix, verbose=False):
     return (current, newprefix, rollback)
 
 
+def update_hypothesis_with_new_prefix(current, newprefix):
+    """Linear time, in-place version of get_diff_and_new_prefix.
+
+    Mutates current to the new hypothesis and returns the pair
+    (new suffix, rollback) with the same values get_diff_and_new_prefix
+    would give. Only the right frontier affected by newprefix is visited
+    and nothing is copied, so over a whole increco stream the total cost
+    is linear in the number of words received.
+
+    current :: list, of (word, start, end, ...) tuples, the hypothesis
+    newprefix :: list, of (word, start, end, ...) tuples from the ASR
+    """
+    if newprefix == []:
+        return [], 0
+    original_length = len(current)
+    new_start = float(newprefix[0][1])
+    # find the last word ending before the new prefix starts
+    i = original_length - 1
+    while i > -1 and new_start < float(current[i][2]):
+        i -= 1
+    if i == original_length - 1:
+        current.extend(newprefix)
+        return newprefix, 0
+    # skip the words repeated at the start of the new prefix
+    k = 0
+    marker = i + 1
+    while marker < original_length and k < len(newprefix) and \
+            current[marker] == newprefix[k]:
+        k += 1
+        marker += 1
+    if k == len(newprefix):
+        return [], 0  # just no rollback if no prefix
+    del current[marker:]
+    current.extend(newprefix[k:])
+    return newprefix[k:], original_length - marker
+
+
+class GoldIntervalIndex(object):
+    """The gold (tag, start, end) intervals of a speaker indexed by their
+    start times, so those within a hypothesis word's timings are found by
+    bisection rather than by scanning the whole gold list.
+    """
+    def __init__(self, gold):
+        self.gold = gold
+        self.order = sorted(range(len(gold)), key=lambda i: gold[i][1])
+        self.starts = [gold[i][1] for i in self.order]
+        # an interval ending before it starts could be within a word
+        # starting after it, so is only found by a scan
+        self.well_formed = all(val[1] <= val[2] for val in gold)
+
+    def within(self, start_time, end_time):
+        """The gold intervals starting and ending within start_time to
+        end_time, in gold order."""
+        if not self.well_formed:
+            return [val for val in self.gold
+                    if val[1] >= start_time and val[2] <= end_time]
+        lo = bisect_left(self.starts, start_time)
+        hi = bisect_right(self.starts, end_time)
+        return [self.gold[i] for i in sorted(self.order[lo:hi])
+                if self.gold[i][2] <= end_time]
+
+
 def final_hyp_from_increco_and_incremental_metrics(increco,
                                                    gold,
                                                    goldwords,
@@ -316,15 +361,21 @@ def final_hyp_from_increco_and_incremental_metrics(increco,
                                                    speaker_ID=None):
     """Returns the final sequence of each dialogue for non-incremental
     eval purposes. Also calculates the incremental metrics.
+
+    The hypothesis is updated in place with each increco update (see
+    update_hypothesis_with_new_prefix) and only the new words' metrics
+    are computed, with the gold intervals within each word found from a
+    GoldIntervalIndex, so the evaluation is linear in the number of
+    words received rather than quadratic.
     """
     final_hypothesis = []
     final_words = []
     final_timings = []
-    increco = deepcopy(increco)
     lengths = [len(increco[0]), len(increco[1]), len(increco[2])]
     if any([x != lengths[0] for x in lengths]):
         print len(increco[0]), len(increco[1]), len(increco[2])
         raw_input("problem0!")
+    gold_intervals = GoldIntervalIndex(gold) if interval else None
     rollback = 0
     no_edits = 0  # for edit overhead (relative to final hyp)
     for _, n_words, n_tags in zip(increco[0], increco[1], increco[2]):
@@ -332,16 +383,15 @@ def final_hyp_from_increco_and_incremental_metrics(increco,
         new_tags = [(n_tags[x], n_words[x][1], n_words[x][2])
                     for x in range(0, len(n_words))]
         orig_length = len(final_hypothesis)
-        final_hypothesis, new_prefix, rollback = \
-            get_diff_and_new_prefix(deepcopy(final_hypothesis), new_tags,
-                                    verbose=False)
+        new_prefix, rollback = update_hypothesis_with_new_prefix(
+            final_hypothesis, new_tags)
         if len(new_prefix) < len(n_words):
             print "correcting length of words"
             n_words = n_words[(len(n_words)-len(new_prefix)):]
         assert len(n_words) == len(new_prefix)
         no_edits += len(new_prefix)
-        final_words = final_words[:len(final_words)-rollback] \
-            + deepcopy(n_words)
+        del final_words[len(final_words)-rollback:]
+        final_words.extend(n_words)
         # calculating incremental metrics
         for n in range(orig_length-rollback, len(final_hypothesis)):
             if not len(final_hypothesis[n]) == 3:
@@ -349,9 +399,9 @@ def final_hyp_from_increco_and_incremental_metrics(increco,
                 print final_hypothesis
             start_time = final_hypothesis[n][1]
             end_time = final_hypothesis[n][2]
-            overlapped_intervals = [val for val in gold
-                                    if val[1] >= start_time and
-                                    val[2] <= end_time]
+            if interval:
+                overlapped_intervals = gold_intervals.within(start_time,
+                                                             end_time)
             for ttd_tag in ttd_tags:
                 if ttd_tag in final_hypothesis[n][0]:
                     if word:
@@ -457,69 +507,46 @@ def get_tag_data_from_corpus_file(f, representation="1", limit=8):
     just outputs lists of string labels.
     """
     print "loading data", f
-    f = open(f)
-    count_seq = 0
     IDs = []
     seq = []
     pos_seq = []
     targets = []
     timings = []
-    currentTimings = []
-
-    counter = 0
-    utt_reference = ""
-    currentWords = []
-    currentPOS = []
-    currentTags = []
-
-    for line in f:
-        counter += 1
-        if "Speaker:" in line:
-            if count_seq > 0:  # do not reset the first time
-                # convert to vectors
-                seq.append(tuple(currentWords))
-                pos_seq.append(tuple(currentPOS))
-                targets.append(tuple(currentTags))
-                IDs.append(utt_reference)
-                timings.append(tuple(currentTimings))
-                # reset the words
-                currentWords = []
-                currentPOS = []
-                currentTags = []
-                currentTimings = []
-            # set the utterance reference
-            count_seq += 1
-            utt_reference = line.strip("\n").replace("Speaker: ", "")
-        spl = line.strip("\n").split("\t")
-        if not len(spl) == 6:
-            continue
-        _, start_time, end_time, word, postag, disftag = spl
-        currentWords.append(word)
-        currentPOS.append(postag)
-        currentTags.append(disftag)
+
+    columns = read_columns(f)
+    # only the rows with all six fields (see load/columnar.py)
+    full = [len(row) == 6 for row in columns.rows]
+    for speaker_index, utt_reference in enumerate(columns.speakers):
+        first, last = columns.speaker_rows(speaker_index)
+        rows = [i for i in xrange(first, last) if full[i]]
+        if not rows and speaker_index == len(columns.speakers) - 1:
+            break
+        currentTimings = []
         approx_word_length = 0.3  # TODO approximation until end times gotten
-        start = max([float(start_time), float(end_time)-approx_word_length])
-        currentTimings.append((start, float(end_time)))
-        if (len(currentTimings) > 1 and currentTimings[-2][1] > start) or \
-                start >= float(end_time):
-            # switch this start and end of the last word
-            # start = currentTimings[-1][1]
-            if (len(currentTimings) > 1 and currentTimings[-2][1] > start):
-                currentTimings[-2] = (currentTimings[-2][0],
-                                      currentTimings[-2][0])
-                currentTimings = fill_in_time_approximations_timings(
-                                                currentTimings,
-                                                len(currentTimings) - 2)
-            if currentTimings[-1][0] >= currentTimings[-1][1]:
-                currentTimings[-1] = (currentTimings[-1][0],
-                                      currentTimings[-1][0])
-                currentTimings = fill_in_time_approximations_timings(
-                                                currentTimings,
-                                                len(currentTimings) - 1)
-    if not currentWords == []:
-        seq.append(tuple(currentWords))
-        pos_seq.append(tuple(currentPOS))
-        targets.append(tuple(currentTags))
+        for i in rows:
+            end_time = float(columns.rows[i][2])
+            start = max([float(columns.rows[i][1]),
+                         end_time - approx_word_length])
+            currentTimings.append((start, end_time))
+            if (len(currentTimings) > 1 and currentTimings[-2][1] > start) \
+                    or start >= end_time:
+                # switch this start and end of the last word
+                if (len(currentTimings) > 1 and
+                        currentTimings[-2][1] > start):
+                    currentTimings[-2] = (currentTimings[-2][0],
+                                          currentTimings[-2][0])
+                    currentTimings = fill_in_time_approximations_timings(
+                                                    currentTimings,
+                                                    len(currentTimings) - 2)
+                if currentTimings[-1][0] >= currentTimings[-1][1]:
+                    currentTimings[-1] = (currentTimings[-1][0],
+                                          currentTimings[-1][0])
+                    currentTimings = fill_in_time_approximations_timings(
+                                                    currentTimings,
+                                                    len(currentTimings) - 1)
+        seq.append(tuple(columns.rows[i][3] for i in rows))
+        pos_seq.append(tuple(columns.rows[i][4] for i in rows))
+        targets.append(tuple(columns.rows[i][5] for i in rows))
         IDs.append(utt_reference)
         timings.append(tuple(currentTimings))
     assert len(seq) == len(targets) == len(pos_seq), ("{0} {1} {2}".format(
@@ -529,7 +556,6 @@ def get_tag_data_from_corpus_file(f, representation="1", limit=8):
                                                                     )
                                                       )
     print "loaded " + str(len(seq)) + " sequences"
-    f.close()
     return (IDs, timings, seq, pos_seq, targets)
 
 
@@ -580,9 +606,7 @@ def SegER(results):
 
 
 def alignment_cost(r, h, subcost=1):
-    """Calculation of Levenshtein distance.
-    Works only for iterables up to 254 elements (uint8).
-    O(nm) time ans space complexity.
+    """Calculation of Levenshtein distance (see utils/edit_distance.py).
 
     >>> alignment_cost("who is there".split(), "is there".split())
     1
@@ -591,29 +615,7 @@ def alignment_cost(r, h, subcost=1):
     >>> alignment_cost("".split(), "who is there".split())
     3
     """
-    # initialisation
-    d = numpy.zeros((len(r)+1)*(len(h)+1), dtype=numpy.uint8)
-    d = d.reshape((len(r)+1, len(h)+1))
-
-    for i in range(len(r)+1):
-        for j in range(len(h)+1):
-            if i == 0:
-                d[0][j] = j
-            elif j == 0:
-                d[i][0] = i
-
-    # computation
-    for i in range(1, len(r)+1):
-        for j in range(1, len(h)+1):
-            if r[i-1] == h[j-1]:
-                d[i][j] = d[i-1][j-1]
-            else:
-                substitution = d[i-1][j-1] + subcost
-                insertion = d[i][j-1] + 1
-                deletion = d[i-1][j] + 1
-                d[i][j] = min(substitution, insertion, deletion)
-
-    return d[len(r)][len(h)]
+    return edit_distance(r, h, subcost)
 
 
 def final_output_accuracy_word_level(words, prediction_tags, gold_tags,
@@ -639,6 +641,10 @@ def final_output_accuracy_word_level(words, prediction_tags, gold_tags,
                                                                 )
     end_of_utt_align = {"ref":  len(gold_tags) * [""],
                         "hyp": len(gold_tags) * [""]}
+    if utt_eval:
+        # the reference segments before this call, so as to count those
+        # of this call only
+        previous_segments = tag_dict["DSER"][1]
     count = 0
     for word, prediction, label in zip(words, prediction_tags, gold_tags):
         turnFinal = False
@@ -841,7 +847,8 @@ def final_output_accuracy_word_level(words, prediction_tags, gold_tags,
             relaxedHypUtt = 0
     if utt_eval:
         cost = alignment_cost(end_of_utt_align["ref"], end_of_utt_align["hyp"])
-        tag_dict["SegER"][0] += tag_dict["DSER"][1]  # number of segments
+        # number of segments
+        tag_dict["SegER"][0] += tag_dict["DSER"][1] - previous_segments
         tag_dict["SegER"][1] += cost  # number of edits
     if not turnFinal:  # flush
         tag_dict["<rps_relaxed"][0] += min(relaxedHypUtt, relaxedGoldUtt)
@@ -851,15 +858,84 @@ def final_output_accuracy_word_level(words, prediction_tags, gold_tags,
     return repairs_hyp, repairs_gold, number_of_utts_hyp, number_of_utts_gold
 
 
+def _tag_intervals(starts, ends, texts, tag):
+    """The start and end time arrays of the intervals whose text matches
+    the tag (as a regular expression, like pandas' str.contains)."""
+    pattern = re.compile(tag)
+    mask = numpy.array([pattern.search(text) is not None
+                        for text in texts], dtype=bool)
+    return starts[mask], ends[mask]
+
+
+def _is_sorted(a):
+    return len(a) < 2 or bool(numpy.all(a[1:] >= a[:-1]))
+
+
+def _count_within(starts, ends, lower, upper, upper_inclusive=True):
+    """For each of the bounds in the arrays lower and upper, the number of
+    intervals starting at or after lower and ending before (or at) upper.
+    By bisection if the starts and ends are both in order, otherwise
+    by a scan for each bound.
+    """
+    side = "right" if upper_inclusive else "left"
+    if _is_sorted(starts) and _is_sorted(ends):
+        return numpy.maximum(0, numpy.searchsorted(ends, upper, side) -
+                             numpy.searchsorted(starts, lower, "left"))
+    if upper_inclusive:
+        return numpy.array([numpy.count_nonzero((starts >= l) & (ends <= u))
+                            for l, u in zip(lower, upper)], dtype=int)
+    return numpy.array([numpy.count_nonzero((starts >= l) & (ends < u))
+                        for l, u in zip(lower, upper)], dtype=int)
+
+
+def _overlap_durations(starts1, ends1, starts2, ends2):
+    """The durations of the intersections of each pair of intervals of
+    the two frames which overlap, in the order intervalframe_overlaps
+    gives them (by interval of the shorter frame, then of the other).
+    The overlapping intervals of the other frame are found by bisection
+    if its starts and ends are both in order.
+    """
+    if len(starts2) < len(starts1):
+        starts1, ends1, starts2, ends2 = starts2, ends2, starts1, ends1
+    if not (_is_sorted(starts2) and _is_sorted(ends2)):
+        durations = []
+        for st1, en1 in zip(starts1, ends1):
+            overlapping = (ends2 > st1) & (starts2 < en1)
+            durations.append(numpy.minimum(ends2[overlapping], en1) -
+                             numpy.maximum(starts2[overlapping], st1))
+        if not durations:
+            return numpy.zeros(0)
+        return numpy.concatenate(durations)
+    lo = numpy.searchsorted(ends2, starts1, "right")
+    hi = numpy.searchsorted(starts2, ends1, "left")
+    counts = numpy.maximum(0, hi - lo)
+    i = numpy.repeat(numpy.arange(len(starts1)), counts)
+    j = lo[i] + numpy.arange(counts.sum()) - \
+        numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return numpy.minimum(ends1[i], ends2[j]) - \
+        numpy.maximum(starts1[i], starts2[j])
+
+
 def final_output_accuracy_interval_level(hyp, reference, tag_dict,
                                          utt_eval=False,
                                          error_analysis=False, window=10):
+    """The interval level equivalent of final_output_accuracy_word_level.
+
+    The intervals with each tag are selected once as sorted arrays of
+    their start and end times, from which the counts in each window are
+    found by bisection, the overlaps of the gold and hypothesis
+    intervals by a sweep over them and the DSER in one pass over the
+    gold segments.
+    """
     r = [(float(a[0]), float(a[1]), d) for a, _, _, d in
          zip(reference[0], reference[1], reference[2], reference[3])]
     h = [(float(x[1]), float(x[2]), x[0]) for x in hyp[2]]
-
-    reference = pd.DataFrame(r, columns=['start_time', 'end_time', 'text'])
-    hyp = pd.DataFrame(h, columns=['start_time', 'end_time', 'text'])
+    ref_starts = numpy.array([x[0] for x in r], dtype=float)
+    ref_ends = numpy.array([x[1] for x in r], dtype=float)
+    ref_texts = [x[2] for x in r]
+    hyp_starts = numpy.array([x[0] for x in h], dtype=float)
+    hyp_ends = numpy.array([x[1] for x in h], dtype=float)
+    hyp_texts = [x[2] for x in h]
     # interval accuracy based on:
     # TPs = sum of durations of intervals with hyp label value
     # intersecting with gold label value
@@ -869,7 +945,7 @@ def final_output_accuracy_interval_level(hyp, reference, tag_dict,
     # not intersecting with a hyp label value
 
     windows = []
-    final_time = reference["end_time"].iloc[-1]
+    final_time = ref_ends[-1]
     start = 0
     end = window
     while end < final_time:
@@ -877,92 +953,79 @@ def final_output_accuracy_interval_level(hyp, reference, tag_dict,
         start += window
         end += window
     windows.append((start, final_time))
+    window_starts = numpy.array([x[0] for x in windows], dtype=float)
+    window_ends = numpy.array([x[1] for x in windows], dtype=float)
     repairs_hyp, repairs_gold, number_of_utts_hyp, number_of_utts_gold = \
         0, 0, 0, 0
     for tag in tag_dict.keys():
         if "<" not in tag and ">" not in tag:
             continue
+        gold_starts, gold_ends = _tag_intervals(ref_starts, ref_ends,
+                                                ref_texts, tag)
+        tag_hyp_starts, tag_hyp_ends = _tag_intervals(hyp_starts, hyp_ends,
+                                                      hyp_texts, tag)
         if tag in ["<rps", "<e", "t/>"]:
-            for s, e in windows:
-                refslots = reference[(reference['start_time'] >= s) &
-                                     (reference['end_time'] < e) &
-                                     (reference["text"].str.contains(tag))]
-                relaxedGold = refslots.shape[0]
-                hypslots = hyp[(hyp['start_time'] >= s) &
-                               (hyp['end_time'] < e) &
-                               (hyp["text"].str.contains(tag))]
-                relaxedHyp = hypslots.shape[0]
+            relaxed_gold = _count_within(gold_starts, gold_ends,
+                                         window_starts, window_ends,
+                                         upper_inclusive=False)
+            relaxed_hyp = _count_within(tag_hyp_starts, tag_hyp_ends,
+                                        window_starts, window_ends,
+                                        upper_inclusive=False)
+            for relaxedGold, relaxedHyp in zip(relaxed_gold.tolist(),
+                                               relaxed_hyp.tolist()):
                 tag_dict["{}_relaxed".format(tag)][0]\
                     += min(relaxedHyp, relaxedGold)
                 tag_dict["{}_relaxed".format(tag)][1]\
                     += max(0, relaxedHyp-relaxedGold)
                 tag_dict["{}_relaxed".format(tag)][2]\
                     += max(0, relaxedGold-relaxedHyp)
-        # now an overlap based eval
-        gold_intervals = deepcopy(reference[reference.text.str.contains(tag)])
-        hyp_intervals = deepcopy(hyp[hyp.text.str.contains(tag)])
-        overlaps = deepcopy(intervalframe_overlaps(gold_intervals,
-                                                   hyp_intervals))
         if tag == "t/>":
-            number_of_utts_gold += len(gold_intervals)
-            number_of_utts_hyp += len(hyp_intervals)
+            number_of_utts_gold += len(gold_starts)
+            number_of_utts_hyp += len(tag_hyp_starts)
             # Convert to points for hyp and tolerance interval for gold
+            # (ending where they did)
             # The tolerance allowed for overlap for end of utt detection
             tolerance = 0.75
-            hyp_intervals['start_time'] = hyp_intervals['end_time'].\
-                apply(lambda x: x - (0.001 / 2))
-            hyp_intervals['end__time'] = hyp_intervals['end_time'].\
-                apply(lambda x: x + (0.001 / 2))
-            gold_intervals['start_time'] = gold_intervals['end_time'].\
-                apply(lambda x: x - (tolerance / 2))
-            gold_intervals['end__time'] = gold_intervals['end_time'].\
-                apply(lambda x: x + (tolerance / 2))
-            overlaps = deepcopy(intervalframe_overlaps(gold_intervals,
-                                                       hyp_intervals))
-            correctly_segmented_dser = 0
-            in_correct_segment = True
-            prev_end = -1
-            for t in range(0, len(gold_intervals)):
-                s = gold_intervals["start_time"].iloc[t]
-                e = gold_intervals["end_time"].iloc[t]
-                # check for intervening bad interval
-                if hyp_intervals[(hyp_intervals['start_time'] >= prev_end) &
-                                 (hyp_intervals['end_time'] <= s)].\
-                        shape[0] > 0:
-                    in_correct_segment = False
-                if hyp_intervals[(hyp_intervals['start_time'] >= s) &
-                                 (hyp_intervals['end_time'] <= e)].\
-                        shape[0] > 0:
-                    if in_correct_segment:
-                        correctly_segmented_dser += 1
-                    in_correct_segment = True
-                else:
-                    in_correct_segment = False
-                prev_end = e
-            total_hyp_segments = hyp_intervals.shape[0]
-            correctly_segmented = overlaps.shape[0]
-            total_gold_segments = gold_intervals.shape[0]
+            tag_hyp_starts = tag_hyp_ends - (0.001 / 2)
+            gold_starts = gold_ends - (tolerance / 2)
+            correctly_segmented = len(_overlap_durations(
+                gold_starts, gold_ends, tag_hyp_starts, tag_hyp_ends))
+            # a gold segment is correctly segmented if a hyp boundary
+            # falls within it and within the previous one, with none
+            # in between them
+            previous_ends = numpy.concatenate([[-1], gold_ends[:-1]])
+            intervening = _count_within(tag_hyp_starts, tag_hyp_ends,
+                                        previous_ends, gold_starts) > 0
+            within = _count_within(tag_hyp_starts, tag_hyp_ends,
+                                   gold_starts, gold_ends) > 0
+            previous_within = numpy.concatenate([[True], within[:-1]])
+            correctly_segmented_dser = int(numpy.count_nonzero(
+                within & previous_within & ~intervening))
+            total_hyp_segments = len(tag_hyp_starts)
+            total_gold_segments = len(gold_starts)
             tag_dict['DSER'][1] += total_gold_segments
             tag_dict['DSER'][0] += correctly_segmented_dser
             tag_dict['NIST_SU'][0] += correctly_segmented
             tag_dict['NIST_SU'][1] += (total_hyp_segments-correctly_segmented)
             tag_dict['NIST_SU'][2] += (total_gold_segments-correctly_segmented)
             continue
-        gold_duration = sum(gold_intervals.end_time-gold_intervals.start_time)
-        hyp_duration = sum(hyp_intervals.end_time-hyp_intervals.start_time)
-        overlap_duration = sum(overlaps.end_time-overlaps.start_time)
+        # now an overlap based eval
+        # (summed in order, as the durations of the DataFrames were)
+        gold_duration = sum(gold_ends - gold_starts)
+        hyp_duration = sum(tag_hyp_ends - tag_hyp_starts)
+        overlap_duration = sum(_overlap_durations(gold_starts, gold_ends,
+                                                  tag_hyp_starts,
+                                                  tag_hyp_ends))
         # do overall rate
         if tag == "<rps":
-            repairs_hyp += len(hyp_intervals)
-            repairs_gold += len(gold_intervals)
+            repairs_hyp += len(tag_hyp_starts)
+            repairs_gold += len(gold_starts)
         if overlap_duration > gold_duration:
-            for x in gold_intervals.index:
-                print gold_intervals['start_time'][x] + " " +\
-                    gold_intervals['end_time'][x] + " " +\
-                    gold_intervals['text'][x]
-                assert gold_intervals['start_time'][x]\
-                    <= gold_intervals['end_time'][x]
-            print hyp_intervals
+            for s, e in zip(gold_starts, gold_ends):
+                print s, e, tag
+                assert s <= e
+            for s, e in zip(tag_hyp_starts, tag_hyp_ends):
+                print s, e, tag
             print overlap_duration, gold_duration, hyp_duration
             return False
         # TPs
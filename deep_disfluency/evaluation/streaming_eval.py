@@ -0,0 +1,272 @@
+"""Incremental evaluation of a live tagger's output as it is produced, for
+online quality monitoring and for shadow testing a new model against a
+replayed stream without writing and re-parsing increco files (as
+disf_evaluation.incremental_output_disfluency_eval_from_file needs).
+
+A StreamingIncrementalEval is given each speaker's gold standard
+(start_speaker) and then each update of the output, either:
+
+    - the diff returned by DeepDisfluencyTagger.tag_new_word for a word
+    (add_tagged_word)
+    - the updated word dicts from WordUpdateTagger.tag_word_updates, as
+    output by a DeepTaggerModule with this as its monitor
+    (add_word_updates)
+    - an increco style update of (tag, start, end) and (word, start, end)
+    lists (update).
+
+The hypothesis is updated in place as by
+final_hyp_from_increco_and_incremental_metrics and only the changed words
+are evaluated, so each update costs O(changed words), keeping:
+
+    - the time to detection samples and the edit overhead counts, which
+    are the same as those of the offline incremental evaluation of an
+    increco file of the same updates
+    - the word level relaxed TP, FP and FN counts of each tag in the
+    current hypothesis (or in its last window words) against the gold
+    tags at the same indices, the outcomes of revoked words being taken
+    out and those of the new words added.
+
+results() gives their values at any point, e.g. to shadow test a model:
+
+    live = StreamingIncrementalEval(window=500)
+    shadow = StreamingIncrementalEval(window=500)
+    for speaker in sorted(gold_speakers_dict.keys()):
+        live.start_speaker(speaker, gold_speakers_dict[speaker])
+        shadow.start_speaker(speaker, gold_speakers_dict[speaker])
+        ...
+            live.add_tagged_word(tagger.tag_new_word(word, pos, timing),
+                                 word, start, end)
+            shadow.add_tagged_word(new_tagger.tag_new_word(word, pos,
+                                                           timing),
+                                   word, start, end)
+        print live.results()["f1_<rps_rolling_word"], \\
+            shadow.results()["f1_<rps_rolling_word"]
+"""
+from __future__ import division
+
+import numpy as np
+
+from eval_utils import update_hypothesis_with_new_prefix
+from eval_utils import GoldIntervalIndex
+from eval_utils import p_r_f
+
+# as disf_evaluation.TTD_TAGS and RELAXED_TAGS, "t/>" only being used
+# with utt_eval
+TTD_TAGS = ["<rms", "<rps", "<e", "t/>"]
+RELAXED_TAGS = ["<rps", "<e", "t/>"]
+
+# word outcomes for a tag: in neither, the output only, the gold only, both
+NONE, FP, FN, TP = range(4)
+
+
+class StreamingIncrementalEval(object):
+    """Incremental metrics updated with each update of a tagger's output
+    (see module docstring).
+
+    utt_eval -- boolean, whether doing utterance segmentation evaluation
+    word -- boolean, whether evaluating at the word level
+    interval -- boolean, whether evaluating on the level of intervals
+    window -- the number of the speaker's last words the rolling scores
+    are over, or None for all the words so far
+    """
+    def __init__(self, utt_eval=False, word=True, interval=False,
+                 window=None):
+        self.utt_eval = utt_eval
+        self.word = word
+        self.interval = interval
+        self.window = window
+        self.ttd_tags = [t for t in TTD_TAGS if utt_eval or t != "t/>"]
+        self.relaxed_tags = [t for t in RELAXED_TAGS
+                             if utt_eval or t != "t/>"]
+        self.modes = [mode for mode, on in [("word", word),
+                                            ("interval", interval)] if on]
+        self.tag_dict = {"t_t_detection_{0}_{1}".format(tag, mode): []
+                         for tag in self.ttd_tags for mode in self.modes}
+        self.edits = 0  # for edit overhead (relative to final hyp)
+        self.finished_words = 0  # final hyp words of the past speakers
+        self.totals = [[0] * 4 for _ in self.relaxed_tags]
+        self.speaker = None
+        self.gold = []
+        self.goldwords = []
+        self.gold_intervals = None
+        self._new_speaker_state()
+
+    def _new_speaker_state(self):
+        self.hypothesis = []  # (tag, start, end) triples
+        self.words = []  # (word, start, end) triples
+        self.outcomes = []  # each word's outcome for each relaxed tag
+        self.window_counts = [[0] * 4 for _ in self.relaxed_tags]
+        self.window_start = 0
+        self.window_end = 0
+
+    def start_speaker(self, speaker, gold_speaker):
+        """Start evaluating the output for a speaker, given their gold
+        standard as in the gold_speakers_dict of the offline evaluation,
+        i.e. (timings, words, pos tags, labels).
+        """
+        self.finished_words += len(self.hypothesis)
+        self.speaker = speaker
+        self.gold = [(x, y[0], y[1])
+                     for x, y in zip(gold_speaker[3], gold_speaker[0])]
+        self.goldwords = gold_speaker[1]
+        self.gold_intervals = GoldIntervalIndex(self.gold) \
+            if self.interval else None
+        self._new_speaker_state()
+
+    def update(self, new_tags, new_words):
+        """Evaluate an increco style update, new_tags being the
+        (tag, start, end) triples and new_words the (word, start, end)
+        triples of the updated words. Returns the number of words
+        rolled back.
+        """
+        assert len(new_tags) == len(new_words)
+        orig_length = len(self.hypothesis)
+        new_prefix, rollback = update_hypothesis_with_new_prefix(
+            self.hypothesis, list(new_tags))
+        new_words = new_words[len(new_words) - len(new_prefix):]
+        self.edits += len(new_prefix)
+        del self.words[len(self.words) - rollback:]
+        self.words.extend(new_words)
+        first = orig_length - rollback
+        self._revoke_outcomes(first)
+        for n in range(first, len(self.hypothesis)):
+            self._add_outcome(n)
+            self._time_to_detection(n)
+        if self.window is not None:
+            self._slide_window()
+        return rollback
+
+    def add_tagged_word(self, diff, word, start, end, rollback=0):
+        """Evaluate the diff returned by tag_new_word for the word
+        from start to end, tagged after rolling back rollback words.
+        The rolled back words are revoked first, as an update of the
+        same word with the same tag and timings would otherwise be taken
+        as a repeat.
+        """
+        kept = len(self.words) - rollback
+        assert len(diff) - 1 <= kept, "diff longer than the hypothesis"
+        if rollback:
+            del self.hypothesis[kept:]
+            del self.words[kept:]
+            self._revoke_outcomes(kept)
+        new_words = self.words[kept - (len(diff) - 1):kept] + \
+            [(word, start, end)]
+        return rollback + self.update([(tag, w[1], w[2])
+                                       for tag, w in zip(diff, new_words)],
+                                      new_words)
+
+    def add_word_updates(self, word_updates):
+        """Evaluate the updated word dicts of a burst of word updates, as
+        returned by WordUpdateTagger.tag_word_updates, e.g.:
+
+            {'id': 1,
+            'start_time': 0.44,
+            'end_time': 0.77,
+            'word': 'john',
+            'pos_tag' : 'NN'
+            'disf_tag' : '<f/>'}
+        """
+        if not word_updates:
+            return 0
+        new_words = [(w['word'], w['start_time'], w['end_time'])
+                     for w in word_updates]
+        return self.update([(w['disf_tag'], w['start_time'], w['end_time'])
+                            for w in word_updates], new_words)
+
+    def _time_to_detection(self, n):
+        # as final_hyp_from_increco_and_incremental_metrics
+        start_time = self.hypothesis[n][1]
+        end_time = self.hypothesis[n][2]
+        overlapped_intervals = None
+        for ttd_tag in self.ttd_tags:
+            if ttd_tag not in self.hypothesis[n][0]:
+                continue
+            if self.word and n < len(self.gold) and \
+                    ttd_tag in self.gold[n][0]:
+                ttd_word = len(self.hypothesis) - n - 1
+                if "<r" in ttd_tag:
+                    ttd_word += 1
+                self.tag_dict["t_t_detection_{0}_word"
+                              .format(ttd_tag)].append(ttd_word)
+            if self.interval:
+                if overlapped_intervals is None:
+                    overlapped_intervals = self.gold_intervals.within(
+                        start_time, end_time)
+                if any([ttd_tag in x[0] for x in overlapped_intervals]):
+                    if ttd_tag in ["<rps", "<e"]:
+                        ttd = float(self.hypothesis[-1][2] -
+                                    overlapped_intervals[-1][1])
+                    else:
+                        ttd = float(self.hypothesis[-1][2] -
+                                    overlapped_intervals[-1][2])
+                    self.tag_dict["t_t_detection_{0}_interval"
+                                  .format(ttd_tag)].append(ttd)
+
+    def _count(self, counts, outcome, sign):
+        for tag_counts, tag_outcome in zip(counts, outcome):
+            tag_counts[tag_outcome] += sign
+
+    def _add_outcome(self, n):
+        tags = self.hypothesis[n][0]
+        gold = self.gold[n][0] if n < len(self.gold) else ""
+        outcome = tuple((tag in tags) + 2 * (tag in gold)
+                        for tag in self.relaxed_tags)
+        self.outcomes.append(outcome)
+        self._count(self.totals, outcome, 1)
+
+    def _revoke_outcomes(self, first):
+        """Take the outcomes of the words from first on out of the
+        counts."""
+        for outcome in self.outcomes[first:]:
+            self._count(self.totals, outcome, -1)
+        if self.window is not None:
+            for n in range(max(first, self.window_start), self.window_end):
+                self._count(self.window_counts, self.outcomes[n], -1)
+            if first < self.window_start:
+                self.window_start = self.window_end = first
+            elif first < self.window_end:
+                self.window_end = first
+        del self.outcomes[first:]
+
+    def _slide_window(self):
+        """Move the window counts to the last window words."""
+        end = len(self.outcomes)
+        start = max(0, end - self.window)
+        for n in range(self.window_end, end):
+            self._count(self.window_counts, self.outcomes[n], 1)
+        self.window_end = end
+        if start > self.window_start:
+            for n in range(self.window_start, start):
+                self._count(self.window_counts, self.outcomes[n], -1)
+        else:
+            for n in range(start, self.window_start):
+                self._count(self.window_counts, self.outcomes[n], 1)
+        self.window_start = start
+
+    def rolling_scores(self):
+        """The (precision, recall, F-score) of each relaxed tag over the
+        window, or over all the words so far if there is no window."""
+        counts = self.totals if self.window is None else self.window_counts
+        return {tag: p_r_f(c[TP], c[FP], c[FN])
+                for tag, c in zip(self.relaxed_tags, counts)}
+
+    def results(self):
+        """The incremental results so far, with the keys of those of
+        incremental_output_disfluency_eval for the time to detection and
+        edit overhead, plus the rolling word level relaxed scores,
+        e.g. f1_<rps_rolling_word."""
+        results = {}
+        words = self.finished_words + len(self.hypothesis)
+        for mode in self.modes:
+            results["edit_overhead_rel_{}".format(mode)] = \
+                100 * ((self.edits / words) - 1) if words else np.nan
+            for tag in self.ttd_tags:
+                samples = self.tag_dict["t_t_detection_{0}_{1}".format(
+                    tag, mode)]
+                results["t_t_detection_{0}_{1}".format(tag, mode)] = \
+                    np.average(samples) if samples else np.nan
+        for tag, (p, r, f) in self.rolling_scores().items():
+            results["p_{0}_rolling_word".format(tag)] = p
+            results["r_{0}_rolling_word".format(tag)] = r
+            results["f1_{0}_rolling_word".format(tag)] = f
+        return results
@@ -0,0 +1,357 @@
+"""
+Latency and throughput benchmark for the shipped trained models.
+
+For each system (config + saved model + options) this measures:
+    - cold start: import, tagger initialization and first word times
+    - per word latency distribution (mean, p50, p95, p99, max) in
+      incremental mode, and the share of that time spent in each stage
+      of the tagger (decoder, noisy channel LM scoring, POS tagging, ...)
+    - words/sec in incremental mode (tag_new_word per word)
+    - words/sec in bulk mode (one RNN pass + sequence viterbi per speaker)
+    - peak RSS of the process
+
+With --import-profile it also times importing each of the main modules in
+a fresh interpreter and lists which heavy dependencies (theano, sklearn,
+...) each import pulls in, so that importing e.g. the tagger for inference
+from a model bundle stays cheap.
+
+Each system runs in its own python process so cold start and peak memory
+are not polluted by the other systems. Results are printed as a table and
+can be saved as JSON to compare runs before and after a change, e.g.:
+
+    python benchmark.py -o results/benchmarks/before.json
+    python benchmark.py -s lstm_simple -s lstm_complex --max-words 1000
+    python benchmark.py --import-profile -s lstm_simple
+"""
+from __future__ import division
+import sys
+import os
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import time
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(THIS_DIR + "/../../")
+from deep_disfluency.utils.instrumentation import clock
+
+# name -> (config number, saved model dir, use timing data)
+# NB config 40 is config 36 with the noisy channel decoder, so
+# uses the weights of 036
+BENCHMARK_SYSTEMS = [
+    ("elman_simple", (33, "033/epoch_45", False)),
+    ("elman_complex", (34, "034/epoch_37", False)),
+    ("lstm_simple", (35, "035/epoch_6", False)),
+    ("lstm_complex", (36, "036/epoch_15", False)),
+    ("lstm_simple_timing", (35, "035/epoch_6", True)),
+    ("lstm_complex_timing", (36, "036/epoch_15", True)),
+    ("lstm_complex_noisy_channel", (40, "036/epoch_15", False)),
+]
+
+# modules whose import time is profiled and the heavy dependencies
+# they should only import when actually needed
+IMPORT_PROFILE_MODULES = [
+    "deep_disfluency.tagger.deep_tagger",
+    "deep_disfluency.tagger.model_bundle",
+    "deep_disfluency.tagger.deep_tagger_module",
+    "deep_disfluency.decoder.hmm",
+    "deep_disfluency.load.load",
+    "deep_disfluency.evaluation.eval_utils",
+]
+HEAVY_DEPENDENCIES = ["theano", "gensim", "nltk", "sklearn", "pandas",
+                      "scipy"]
+
+IMPORT_PROFILE_SCRIPT = """
+import sys
+import json
+import timeit
+sys.path.insert(0, {root!r})
+t = timeit.default_timer()
+__import__({module!r})
+seconds = timeit.default_timer() - t
+print "IMPORT_RESULT " + json.dumps({{
+    "module": {module!r},
+    "seconds": seconds,
+    "heavy_dependencies": [m for m in {heavy!r} if m in sys.modules]}})
+"""
+
+DEFAULT_DATA = THIS_DIR + "/../data/disfluency_detection/switchboard/" + \
+    "swbd_disf_test_partial_data_timings.csv"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB
+    (ru_maxrss is in KB on linux, bytes on OS X)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+def load_benchmark_dialogues(data_file, max_words):
+    """Returns a list of (speaker, words, pos_tags, timings) up to
+    max_words words in total."""
+    from deep_disfluency.evaluation.eval_utils import \
+        get_tag_data_from_corpus_file
+    IDs, timings, words, pos_tags, _ = get_tag_data_from_corpus_file(
+        data_file)
+    dialogues = []
+    n_words = 0
+    for speaker, t, w, p in zip(IDs, timings, words, pos_tags):
+        if n_words >= max_words:
+            break
+        n = min(len(w), max_words - n_words)
+        dialogues.append((speaker, w[:n], p[:n], t[:n]))
+        n_words += n
+    return dialogues
+
+
+def tag_incrementally(tagger, dialogues):
+    """Tag each dialogue word by word as in incremental_output_from_file.
+    Returns the number of words tagged."""
+    n_words = 0
+    for _, words, pos_tags, timings in dialogues:
+        tagger.reset()
+        current_time = 0
+        for word, pos, (_, end) in zip(words, pos_tags, timings):
+            timing = None
+            if tagger.args.use_timing_data:
+                timing = end - current_time
+            tagger.tag_new_word(word, pos, timing, diff_only=True)
+            current_time = end
+            n_words += 1
+    return n_words
+
+
+def tag_in_bulk(tagger, dialogues):
+    """Tag each dialogue with a single RNN pass over all its words
+    followed by the sequence level viterbi decode.
+    Returns the number of words tagged."""
+    import numpy as np
+    n_words = 0
+    start_word = tagger.word_to_index_map["<s>"]
+    start_pos = tagger.pos_to_index_map["<s>"]
+    win = tagger.window_size
+    for _, words, pos_tags, _ in dialogues:
+        tagger.reset()
+        word_idx = [start_word] * (win - 1)
+        pos_idx = [start_pos] * (win - 1)
+        for word, pos in zip(words, pos_tags):
+            word, pos = tagger.standardize_word_and_pos(word, pos)
+            word_idx.append(tagger.word_to_index_map[word])
+            pos_idx.append(tagger.pos_to_index_map[pos])
+        word_windows = [word_idx[i:i + win] for i in range(len(words))]
+        pos_windows = [pos_idx[i:i + win] for i in range(len(words))]
+        softmax = tagger.model.soft_max(word_windows, pos_windows)
+        if "disf" in tagger.args.tags:
+            edit_tag = "<e/><cc/>" if "uttseg" in tagger.args.tags \
+                else "<e/>"
+            softmax = np.concatenate((
+                softmax,
+                softmax[:, tagger.tag_to_index_map[edit_tag]].reshape(
+                    softmax.shape[0], 1)), 1)
+        # NB the decoder's viterbi list attribute shadows its viterbi method
+        tagger.decoder.__class__.viterbi(tagger.decoder, softmax)
+        n_words += len(words)
+    return n_words
+
+
+def run_system(name, data_file, max_words, repeats=1):
+    """Benchmark a single system in this process,
+    returning a dict of results."""
+    config_number, model_dir, use_timing_data = \
+        dict(BENCHMARK_SYSTEMS)[name]
+    results = {"system": name,
+               "config_number": config_number,
+               "saved_model_dir": model_dir,
+               "use_timing_data": use_timing_data}
+    # 1. cold start
+    t = clock()
+    from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+    results["import_seconds"] = clock() - t
+    t = clock()
+    tagger = DeepDisfluencyTagger(
+        config_file=THIS_DIR + "/experiment_configs.csv",
+        config_number=config_number,
+        saved_model_dir=THIS_DIR + "/" + model_dir,
+        use_timing_data=use_timing_data,
+        instrumentation=True)
+    results["init_seconds"] = clock() - t
+    dialogues = load_benchmark_dialogues(data_file, max_words)
+    word, pos, (start, end) = dialogues[0][1][0], dialogues[0][2][0], \
+        dialogues[0][3][0]
+    t = clock()
+    tagger.tag_new_word(word, pos, end - start if use_timing_data else None)
+    results["first_word_seconds"] = clock() - t
+    results["cold_start_seconds"] = results["import_seconds"] + \
+        results["init_seconds"] + results["first_word_seconds"]
+    # 2. per word latency distribution and per stage share of the time
+    tagger.reset_instrumentation()
+    tag_incrementally(tagger, dialogues)
+    report = tagger.get_instrumentation_report()
+    total = report["timers"]["total"]["total"]
+    results["per_word_latency"] = report["timers"]["total"]
+    results["stage_share"] = dict(
+        (stage, summary["total"] / total)
+        for stage, summary in report["timers"].items()
+        if stage != "total")
+    results["counters"] = report["counters"]
+    # 3. throughput, with instrumentation off
+    tagger.set_instrumentation(False)
+    for mode, method in [("incremental", tag_incrementally),
+                         ("bulk", tag_in_bulk)]:
+        if mode == "bulk" and (not tagger.decoder or
+                               tagger.decoder.noisy_channel_source_model):
+            # the noisy channel needs the words consumed incrementally
+            results["bulk_words_per_second"] = None
+            continue
+        elapsed = 0.0
+        n_words = 0
+        for _ in range(repeats):
+            t = clock()
+            n_words += method(tagger, dialogues)
+            elapsed += clock() - t
+        results["n_words"] = n_words // repeats
+        results[mode + "_words_per_second"] = n_words / elapsed
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def profile_import(module):
+    """Import the module in a fresh python process, returning the
+    time taken and the heavy dependencies it imported."""
+    script = IMPORT_PROFILE_SCRIPT.format(
+        root=os.path.realpath(THIS_DIR + "/../../"),
+        module=module,
+        heavy=HEAVY_DEPENDENCIES)
+    process = subprocess.Popen([sys.executable, "-c", script],
+                               stdout=subprocess.PIPE)
+    output, _ = process.communicate()
+    result_lines = [line for line in output.split("\n")
+                    if line.startswith("IMPORT_RESULT ")]
+    if process.returncode != 0 or not result_lines:
+        return {"module": module,
+                "error": "exit code {}".format(process.returncode)}
+    return json.loads(result_lines[-1].replace("IMPORT_RESULT ", "", 1))
+
+
+def print_import_profile(profile):
+    print "\t".join(["module", "import(s)", "heavy dependencies"])
+    for r in profile:
+        if "error" in r:
+            print r["module"], "FAILED:", r["error"]
+            continue
+        print "\t".join([r["module"], "{0:.3f}".format(r["seconds"]),
+                         ", ".join(r["heavy_dependencies"]) or "-"])
+
+
+def environment_info():
+    info = {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        info["git_commit"] = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=THIS_DIR).strip()
+    except (OSError, subprocess.CalledProcessError):
+        info["git_commit"] = None
+    try:
+        import theano
+        info["theano_device"] = theano.config.device
+        info["theano_floatX"] = theano.config.floatX
+    except ImportError:
+        pass
+    return info
+
+
+def print_results_table(results):
+    print "\t".join(["system", "cold_start(s)", "mean(ms)", "p50(ms)",
+                     "p95(ms)", "p99(ms)", "inc(w/s)", "bulk(w/s)",
+                     "decoder", "noisy_channel", "rss(MB)"])
+    for r in results:
+        if "error" in r:
+            print r["system"], "FAILED:", r["error"]
+            continue
+        latency = r["per_word_latency"]
+        bulk = r["bulk_words_per_second"]
+        print "\t".join([r["system"],
+                         "{0:.2f}".format(r["cold_start_seconds"])] +
+                        ["{0:.2f}".format(latency[k] * 1000)
+                         for k in ["mean", "p50", "p95", "p99"]] +
+                        ["{0:.1f}".format(r["incremental_words_per_second"]),
+                         "-" if bulk is None else "{0:.1f}".format(bulk),
+                         "{0:.1%}".format(r["stage_share"].get("decoder", 0)),
+                         "{0:.1%}".format(
+                             r["stage_share"].get("noisy_channel", 0)),
+                         "{0:.0f}".format(r["peak_rss_mb"])])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the latency and\
+        throughput of the trained disfluency taggers.')
+    parser.add_argument('-s', '--system', type=str, action='append',
+                        choices=[name for name, _ in BENCHMARK_SYSTEMS],
+                        help='System(s) to benchmark, default all.')
+    parser.add_argument('-d', '--data', type=str, default=DEFAULT_DATA,
+                        help='Disfluency corpus file with timings to tag.')
+    parser.add_argument('-n', '--max-words', type=int, default=2000,
+                        help='Maximum number of words to tag.')
+    parser.add_argument('-r', '--repeats', type=int, default=1,
+                        help='Number of repeats for the throughput runs.')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='File path to save the JSON results to.')
+    parser.add_argument('--import-profile', action='store_true',
+                        help='Also profile the import time of the main\
+                         modules.')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run in this process and print the JSON result\
+                         (used for the per system subprocesses).')
+    args = parser.parse_args()
+    systems = args.system or [name for name, _ in BENCHMARK_SYSTEMS]
+
+    if args.in_process:
+        results = [run_system(name, args.data, args.max_words, args.repeats)
+                   for name in systems]
+        print "BENCHMARK_RESULT " + json.dumps(results)
+        return
+
+    import_profile = None
+    if args.import_profile:
+        import_profile = [profile_import(module)
+                          for module in IMPORT_PROFILE_MODULES]
+        print_import_profile(import_profile)
+
+    results = []
+    for name in systems:
+        print "benchmarking", name, "..."
+        command = [sys.executable, os.path.realpath(__file__),
+                   "--in-process", "-s", name, "-d", args.data,
+                   "-n", str(args.max_words), "-r", str(args.repeats)]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        output, _ = process.communicate()
+        result_lines = [line for line in output.split("\n")
+                        if line.startswith("BENCHMARK_RESULT ")]
+        if process.returncode != 0 or not result_lines:
+            results.append({"system": name,
+                            "error": "exit code {}".format(
+                                process.returncode)})
+            continue
+        results.extend(json.loads(
+            result_lines[-1].replace("BENCHMARK_RESULT ", "", 1)))
+    print_results_table(results)
+    if args.output:
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment_info(),
+                       "max_words": args.max_words,
+                       "data": os.path.basename(args.data),
+                       "import_profile": import_profile,
+                       "results": results}, f, indent=2, sort_keys=True)
+        print "saved results to", args.output
+
+
+if __name__ == '__main__':
+    main()
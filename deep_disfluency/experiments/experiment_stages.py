@@ -0,0 +1,364 @@
+"""The stages of the experiment scripts (EACL_2017.py,
+InterSpeech_2015.py) for a utils.pipeline.Pipeline: downloading the raw
+data, creating the disfluency corpora, extracting the tag representations
+and feature matrices, training the models and testing them (writing their
+increco outputs), each with the files and folders it reads and writes.
+
+Each division and each experiment's training and test condition is a
+stage of its own, so they run concurrently up to the pipeline's worker
+limit. The training of an experiment depends on its config other than
+the decoder, the training and heldout feature matrices, the tag
+representations and the code of the tagger and RNNs, not of the decoder,
+so testing again after changing only the decoder (its code or an
+experiment's decoder_type) reruns only the tests.
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tarfile
+import urllib
+import zipfile
+
+from deep_disfluency.utils.pipeline import Pipeline, Stage, StageResult
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PACKAGE_DIR = os.path.dirname(THIS_DIR)
+DATA_DIR = PACKAGE_DIR + '/data'
+RAW_DATA_DIR = DATA_DIR + '/raw_data'
+CORPUS_DIR = DATA_DIR + '/disfluency_detection/switchboard'
+MATRIX_DIR = DATA_DIR + '/disfluency_detection/feature_matrices'
+TAG_DIR = DATA_DIR + '/tag_representations'
+LM_DIR = DATA_DIR + '/lm_corpora'
+ANNOTATION_DIR = DATA_DIR + '/disfluency_detection/' + \
+    'swda_disfluency_annotations'
+RANGE_DIR = DATA_DIR + \
+    '/disfluency_detection/swda_divisions_disfluency_detection'
+CONFIG_FILE = THIS_DIR + '/experiment_configs.csv'
+MANIFEST_FILE = THIS_DIR + '/pipeline_manifest.json'
+
+SWBD_TIMINGS_URL = 'http://www.isip.piconepress.com/' + \
+    'projects/switchboard/releases/ptree_word_alignments.tar.gz'
+
+SWDA_CORPUS_URL = 'https://github.com/julianhough/' + \
+    'swda/blob/master/swda.zip?raw=true'
+
+SWBD_TIMINGS_DIR = RAW_DATA_DIR + '/' + \
+    SWBD_TIMINGS_URL.split('/')[-1].replace(".tar.gz", "")
+
+SWDA_CORPUS_DIR = RAW_DATA_DIR + '/' + \
+    SWDA_CORPUS_URL.split('/')[-1].replace(".zip", "")
+
+# the code the training of a model depends on, the tests also depending
+# on the decoder, language model and evaluation code
+TRAIN_CODE_DIRS = [PACKAGE_DIR + '/' + d for d in
+                   ['tagger', 'rnn', 'load', 'utils', 'embeddings']]
+TEST_CODE_DIRS = TRAIN_CODE_DIRS + [PACKAGE_DIR + '/' + d for d in
+                                    ['decoder', 'language_model',
+                                     'evaluation']]
+# the config columns which only change the decoding of a trained model
+DECODER_CONFIG_COLUMNS = ['decoder_type', 'notes']
+
+file_divisions_transcripts = [
+    ('train', RANGE_DIR + '/swbd_disf_train_1_ranges.text'),
+    # RANGE_DIR + '/swbd_disf_train_audio_ranges.text',
+    ('heldout', RANGE_DIR + '/swbd_disf_heldout_ranges.text'),
+    ('test', RANGE_DIR + '/swbd_disf_test_ranges.text'),
+]
+
+
+def config_row(exp, config_file=CONFIG_FILE):
+    """The experiment's row of the config file as a dict of its columns."""
+    with open(config_file) as f:
+        for row in csv.DictReader(f):
+            if int(row['exp_id']) == exp:
+                return row
+    raise ValueError("no experiment {} in {}".format(exp, config_file))
+
+
+def corpus_filename(divfile, partial, timings=False):
+    """The disfluency corpus file the corpus creator writes for the
+    division file (and the word alignment mapping for the timings)."""
+    name = os.path.basename(divfile).replace("_ranges.text", "")
+    return CORPUS_DIR + '/' + name + ('_partial' if partial else '') + \
+        '_data' + ('_timings' if timings else '') + '.csv'
+
+
+def run_command(c):
+    """Run a script, failing the stage if it fails."""
+    print " ".join(c)
+    subprocess.check_call(c)
+
+
+def download(url, name, target_dir):
+    """Download the archive at url to name and extract it in
+    target_dir."""
+    print 'downloading', name
+    urllib.urlretrieve(url, name)
+    if name.endswith('.zip'):
+        archive = zipfile.ZipFile(name)
+    else:
+        archive = tarfile.open(name)
+    archive.extractall(path=target_dir)
+    archive.close()
+    print 'extracted at', target_dir
+
+
+def train_model(exp, model_dir, tag_accuracy_file):
+    """Train the experiment's model until convergence, returning its best
+    epoch."""
+    from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+    disf = DeepDisfluencyTagger(config_file=CONFIG_FILE, config_number=exp)
+    return disf.train_net(
+        train_dialogues_filepath=MATRIX_DIR + '/train',
+        validation_dialogues_filepath=MATRIX_DIR + '/heldout',
+        model_dir=model_dir,
+        tag_accuracy_file_path=tag_accuracy_file)
+
+
+def test_model(exp, saved_model_dir, use_timing_data, corpus_file,
+               target_file):
+    """Write the increco output of the experiment's saved model on the
+    corpus file (also outputting the speed)."""
+    from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+    disf = DeepDisfluencyTagger(config_file=CONFIG_FILE,
+                                config_number=exp,
+                                saved_model_dir=saved_model_dir,
+                                use_timing_data=use_timing_data)
+    disf.incremental_output_from_file(corpus_file,
+                                      target_file_path=target_file)
+
+
+def download_stages():
+    """Download the SWDA and word timings."""
+    swda_zip = RAW_DATA_DIR + '/swda.zip'
+    timings_tar = RAW_DATA_DIR + '/' + SWBD_TIMINGS_URL.split('/')[-1]
+    return [
+        Stage('download_swda', download,
+              [SWDA_CORPUS_URL, swda_zip, SWDA_CORPUS_DIR],
+              outputs=[swda_zip, SWDA_CORPUS_DIR]),
+        Stage('download_timings', download,
+              [SWBD_TIMINGS_URL, timings_tar, SWBD_TIMINGS_DIR],
+              outputs=[timings_tar, SWBD_TIMINGS_DIR])
+    ]
+
+
+def corpus_stages(swda_dir, partial, divisions=file_divisions_transcripts):
+    """Create the base disfluency tagged corpora in a standard format, the
+    first division also writing the word -> pos mapping folder the others
+    use.
+
+    corpus creator arguments:
+    -i string, path of source data (in swda style)
+    -t string, target path of folder for the preprocessed data
+    -f string, path of file with the division of files to be turned into
+    a corpus
+    -a string, path to disfluency annotations
+    -lm string, Location of where to write a clean language\
+    model files out of this corpus
+    -pos boolean, Whether to write a word2pos mapping folder
+    in the sister directory to the corpusLocation, else assume it is there
+    -p boolean, whether to include partial words or not
+    -d boolean, include dialogue act tags in the info
+    """
+    pos_map_dir = swda_dir + '/../swda_tree_pos_maps'
+    stages = []
+    for i, (div, divfile) in enumerate(divisions):
+        c = [sys.executable, PACKAGE_DIR +
+             '/corpus/disfluency_corpus_creator.py',
+             '-i', swda_dir,
+             '-t', CORPUS_DIR,
+             '-f', divfile,
+             '-a', ANNOTATION_DIR,
+             # '-lm', LM_DIR,
+             '-d'
+             ]
+        if partial:
+            c.append('-p')
+        inputs = [swda_dir, divfile, ANNOTATION_DIR,
+                  PACKAGE_DIR + '/corpus']
+        outputs = [corpus_filename(divfile, partial)]
+        if i == 0:
+            c.append('-pos')  # just call it once
+            outputs.append(pos_map_dir)
+        else:
+            inputs.append(pos_map_dir)
+        stages.append(Stage('corpus_' + div, run_command, [c],
+                            inputs=inputs, outputs=outputs))
+    return stages
+
+
+def feature_stages(partial, alignments_dir=None, flags=(),
+                   divisions=file_divisions_transcripts):
+    """Extract the features of each division into its feature matrices
+    folder, the first division also writing the tag representations the
+    others use. flags are extract_features.py's boolean options, e.g.
+    ['-u', '-d', '-l', '-joint'].
+
+    extract_features.py arguments:
+    -i string, path of source disfluency corpus
+    -m string, target path of folder feature matrices in this folder
+     (rather than use text files)
+    -f string, path of file with the division of files to be turned into
+    a corpus of vectors
+    -p boolean, whether to include partial words or not
+    -a string, path to word alignment folder
+    -tag string, path of folder with tag representations
+    -new_tag bool, whether to write new tag representations or use old ones
+    -u bool, include utterance segmentation tags, derivable from utts
+    -d bool, include dialogue act tags
+    -l bool, include laughter tags on words- either speech laugh on word or
+    bout
+    -joint bool, include big joint tag set as well as the individual ones
+    -lm string, Location of where to write a clean language\
+    model files out of this corpus
+    -xlm boolean, Whether to use a cross language model\
+    training to be used for getting lm features on the same data.
+    """
+    stages = []
+    for i, (div, divfile) in enumerate(divisions):
+        c = [sys.executable,
+             PACKAGE_DIR + '/feature_extraction/extract_features.py',
+             '-i', CORPUS_DIR,
+             '-m', MATRIX_DIR + '/' + div,
+             '-f', divfile,
+             '-tag', TAG_DIR
+             # '-lm', LM_DIR
+             ]
+        if alignments_dir:
+            c.extend(['-a', alignments_dir])
+        if partial:
+            c.append('-p')
+        c.extend(flags)
+        if 'train' in div and '-lm' in c:
+            c.append('-xlm')
+        inputs = [corpus_filename(divfile, partial, bool(alignments_dir)),
+                  divfile, PACKAGE_DIR + '/feature_extraction']
+        outputs = [MATRIX_DIR + '/' + div]
+        if i == 0:
+            c.append('-new_tag')
+            outputs.append(TAG_DIR)
+        else:
+            inputs.append(TAG_DIR)
+        stages.append(Stage('features_' + div, run_command, [c],
+                            inputs=inputs, outputs=outputs))
+    return stages
+
+
+def train_stages(experiments):
+    """Train each experiment's model on the training feature matrices, its
+    result being its best epoch on the heldout data.
+    NB each of these experiments can take up to 24 hours.
+    """
+    stages = []
+    for exp in experiments:
+        exp_str = '%03d' % exp
+        model_dir = THIS_DIR + '/' + exp_str
+        tag_accuracy_file = THIS_DIR + \
+            '/results/tag_accuracies/{}.text'.format(exp_str)
+        config = config_row(exp)
+        for column in DECODER_CONFIG_COLUMNS:
+            config.pop(column, None)
+        stages.append(Stage(
+            'train_' + exp_str, train_model,
+            [exp, model_dir, tag_accuracy_file],
+            inputs=[MATRIX_DIR + '/train', MATRIX_DIR + '/heldout',
+                    TAG_DIR] + TRAIN_CODE_DIRS,
+            outputs=[model_dir, tag_accuracy_file],
+            params=config))
+    return stages
+
+
+def test_stages(systems_best_epoch, timing_conditions, partial,
+                divisions=('heldout', 'test')):
+    """Test the models on each division with and/or without timing data,
+    writing the increco output in the folder of the epoch tested.
+
+    systems_best_epoch -- dict of the experiment to the epoch of its saved
+    model or, for models trained in the same pipeline, None for that of
+    its training stage
+    timing_conditions -- function from an experiment to the list of its
+    (use_timing_data, output file suffix) conditions
+    """
+    stages = []
+    for exp, best_epoch in sorted(systems_best_epoch.items()):
+        exp_str = '%03d' % exp
+        model_dir = THIS_DIR + '/{0}/epoch_{1}'.format(exp_str, '{0}')
+        if best_epoch is None:
+            epoch_dir = StageResult('train_' + exp_str, model_dir)
+        else:
+            epoch_dir = model_dir.format(best_epoch)
+        config = config_row(exp)
+        config.pop('notes', None)
+        if 'noisy_channel' in config['decoder_type']:
+            code_dirs = TEST_CODE_DIRS + [LM_DIR]
+        else:
+            code_dirs = TEST_CODE_DIRS
+        partial_string = '_partial' if partial else ''
+        for use_timing_data, timing_string in timing_conditions(exp):
+            for div in divisions:
+                corpus_file = CORPUS_DIR + \
+                    '/swbd_disf_{0}{1}_data_timings.csv'.format(
+                        div, partial_string)
+                target = model_dir + \
+                    '/swbd_disf_{0}{1}{2}_data_output_increco.text'.format(
+                        div, partial_string, timing_string).replace(
+                            '{', '{{').replace('}', '}}')
+                if best_epoch is None:
+                    target = StageResult('train_' + exp_str, target)
+                else:
+                    target = target.format(best_epoch)
+                stages.append(Stage(
+                    'test_{0}{1}_{2}'.format(exp_str, timing_string, div),
+                    test_model,
+                    [exp, epoch_dir, use_timing_data, corpus_file, target],
+                    inputs=[epoch_dir, corpus_file, TAG_DIR] + code_dirs,
+                    outputs=[target],
+                    params=config))
+    return stages
+
+
+def pipeline_argument_parser(description):
+    """The command line options of an experiment script: which parts of
+    the experiments to run (by default just testing the saved models)
+    and how."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--download', action='store_true',
+                        help='Download the SWDA and word timings.')
+    parser.add_argument('--corpus', action='store_true',
+                        help='Create the disfluency corpora.')
+    parser.add_argument('--features', action='store_true',
+                        help='Extract the tag representations and feature\
+                         matrices.')
+    parser.add_argument('--train', action='store_true',
+                        help='Train the models, testing their best epochs\
+                         rather than the saved models.')
+    parser.add_argument('--no-test', dest='test', action='store_false',
+                        help='Do not test the models.')
+    parser.add_argument('-e', '--experiment', type=int, action='append',
+                        help='Experiment(s) to train and/or test, default\
+                         all those of the paper.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Maximum number of stages to run at once, 0 for\
+                         one per cpu.')
+    parser.add_argument('--force', action='store_true',
+                        help='Run the stages even if they are up to date.')
+    parser.add_argument('--manifest', type=str, default=MANIFEST_FILE,
+                        help='File path of the JSON record of the stages\
+                         run.')
+    return parser
+
+
+def run_pipeline(args, stages):
+    """Run the stages, the up to date ones being skipped, exiting with an
+    error if any failed."""
+    pipeline = Pipeline(args.manifest, n_jobs=args.jobs or None)
+    for stage in stages:
+        pipeline.add(stage)
+    ran, up_to_date, failed = pipeline.run(force=args.force)
+    print "ran {0} stage(s), {1} up to date, {2} failed".format(
+        len(ran), len(up_to_date), len(failed))
+    if failed:
+        print "failed:", " ".join(failed)
+        sys.exit(1)
@@ -0,0 +1,254 @@
+"""
+Hyperparameter sweep over the configs of experiment_configs.csv, training
+each config in its own process, e.g. overnight on a CPU only machine:
+
+    python sweep.py -c 33-38 -c 41 -j 4 -o results/sweeps/lstm.csv
+
+The training and heldout feature matrices are checked and packed once
+into memory-mapped arrays (see load/shared_matrices.py) which every job
+maps read only, rather than each job verifying and np.loading every
+matrix file again every epoch. Up to -j jobs run at once, each pinned
+(with taskset, where there is one) to its own --threads cpus and with
+its BLAS and OpenMP thread pools limited to them. A job finishing, e.g.
+by stopping early for lack of improvement, frees its cpus for the next
+config straight away.
+
+As each job finishes, the results table (a csv file) is written again,
+with each config's best epoch and heldout score, the number of epochs
+run, why training stopped and how long it took, along with the config
+columns which differ between the configs swept. Each job's output is
+logged to <table name>_logs/<exp>.log. The models are saved in the
+experiments folder as by EACL_2017.py --train.
+"""
+from __future__ import division
+import sys
+import os
+import argparse
+import csv
+import json
+import multiprocessing
+import Queue
+import subprocess
+import threading
+import time
+from distutils.spawn import find_executable
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(THIS_DIR + "/../../")
+from deep_disfluency.load.shared_matrices import SharedMatrices
+from deep_disfluency.load.shared_matrices import load_shared_matrices
+from experiment_stages import CONFIG_FILE, MATRIX_DIR
+from experiment_stages import config_row
+
+DEFAULT_TABLE = THIS_DIR + "/results/sweeps/sweep.csv"
+DEFAULT_CACHE_DIR = os.path.dirname(MATRIX_DIR) + "/shared_feature_matrices"
+# environment variables limiting the threads of a job's BLAS and OpenMP
+THREAD_LIMIT_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                          "MKL_NUM_THREADS"]
+RESULT_COLUMNS = ["status", "best_epoch", "best_score", "epochs",
+                  "stop_reason", "seconds"]
+
+
+def parse_config_ids(specs):
+    """The config ids of specs like '35' or '33-38', in order."""
+    exps = []
+    for spec in specs:
+        for part in spec.split(","):
+            first, _, last = part.partition("-")
+            for exp in range(int(first), int(last or first) + 1):
+                if exp not in exps:
+                    exps.append(exp)
+    return exps
+
+
+def train_job(exp, cache_dir, result_file):
+    """Train the config on the packed matrices, writing its training
+    results as JSON to result_file."""
+    from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+    tic = time.time()
+    train = SharedMatrices(cache_dir + "/train")
+    heldout = SharedMatrices(cache_dir + "/heldout")
+    disf = DeepDisfluencyTagger(config_file=CONFIG_FILE, config_number=exp)
+    exp_str = '%03d' % exp
+    disf.train_net(train_dialogues_filepath=train.folder,
+                   validation_dialogues_filepath=heldout.folder,
+                   model_dir=THIS_DIR + '/' + exp_str,
+                   tag_accuracy_file_path=THIS_DIR +
+                   '/results/tag_accuracies/{}.text'.format(exp_str),
+                   train_matrices=train,
+                   validation_matrices=heldout)
+    results = dict(disf.training_results)
+    results["seconds"] = time.time() - tic
+    with open(result_file, "w") as f:
+        json.dump(results, f)
+
+
+def cpu_slots(n_jobs, threads):
+    """The cpus of each of the n_jobs slots."""
+    cpus = range(multiprocessing.cpu_count())
+    if n_jobs * threads > len(cpus):
+        print "WARNING: {} jobs of {} threads on {} cpus".format(
+            n_jobs, threads, len(cpus))
+    return [[cpus[(k * threads + i) % len(cpus)] for i in range(threads)]
+            for k in range(n_jobs)]
+
+
+def start_job(exp, cpus, cache_dir, log_dir):
+    """Start the training of the config in a new process on the cpus,
+    returning it."""
+    command = [sys.executable, os.path.realpath(__file__), "--job", str(exp),
+               "--cache", cache_dir, "--log-dir", log_dir]
+    taskset = find_executable("taskset")
+    if taskset:
+        command = [taskset, "-c", ",".join(map(str, cpus))] + command
+    env = dict(os.environ)
+    for variable in THREAD_LIMIT_VARIABLES:
+        env[variable] = str(len(cpus))
+    log = open(os.path.join(log_dir, "%03d.log" % exp), "w")
+    try:
+        return subprocess.Popen(command, stdout=log,
+                                stderr=subprocess.STDOUT, env=env)
+    finally:
+        log.close()
+
+
+def _wait_job(exp, process, finished):
+    process.wait()
+    finished.put((exp, process.returncode))
+
+
+def varying_columns(configs):
+    """The config columns whose values differ between the configs."""
+    with open(CONFIG_FILE) as f:
+        header = next(csv.reader(f))
+    columns = [c for c in header if c not in ["exp_id", "notes"]]
+    return [c for c in columns
+            if len(set(config[c] for config in configs)) > 1]
+
+
+def write_table(table_path, exps, configs, results):
+    """Write the csv results table, one row per config."""
+    columns = ["exp_id"] + varying_columns(configs) + RESULT_COLUMNS
+    with open(table_path, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for exp, config in zip(exps, configs):
+            row = dict(config)
+            row.update(results.get(exp, {"status": "pending"}))
+            writer.writerow([row.get(c, "") for c in columns])
+
+
+def _format(column, value):
+    if column == "best_score":
+        return "{0:.4f}".format(value)
+    if column == "seconds":
+        return "{0:.0f}".format(value)
+    return str(value)
+
+
+def print_results_table(exps, results):
+    """Print the results, the best scoring configs first."""
+    print "\t".join(["exp_id"] + RESULT_COLUMNS)
+    done = [exp for exp in exps if exp in results]
+    for exp in sorted(done, key=lambda x: -results[x].get("best_score", -1)):
+        print "\t".join([str(exp)] + [_format(c, results[exp][c])
+                                      if c in results[exp] else "-"
+                                      for c in RESULT_COLUMNS])
+
+
+def run_sweep(exps, n_jobs, threads, cache_dir, table_path):
+    """Train the configs, up to n_jobs at once, writing the results table
+    to table_path as they finish and returning the results."""
+    configs = [config_row(exp) for exp in exps]
+    matrices = [load_shared_matrices(MATRIX_DIR + "/" + div, cache_dir)
+                for div in ["train", "heldout"]]
+    log_dir = os.path.splitext(table_path)[0] + "_logs"
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    if not os.path.exists(THIS_DIR + "/results/tag_accuracies"):
+        os.makedirs(THIS_DIR + "/results/tag_accuracies")
+    results = {}
+    pending = []
+    for exp, config in zip(exps, configs):
+        # as train_net verifies the matrices of each config
+        if all(m.verify(n_lm=int(config["n_language_model_features"]),
+                        n_acoustic=int(config["n_acoustic_features"]))
+               for m in matrices):
+            pending.append(exp)
+        else:
+            print "config", exp, "does not fit the feature matrices"
+            results[exp] = {"status": "wrong_features"}
+    slots = cpu_slots(n_jobs, threads)
+    free = range(len(slots))
+    running = {}
+    finished = Queue.Queue()
+    while pending or running:
+        while pending and free:
+            exp = pending.pop(0)
+            slot = free.pop(0)
+            print "training config", exp, "on cpus", slots[slot]
+            result_file = os.path.join(log_dir, "%03d.json" % exp)
+            if os.path.exists(result_file):
+                os.remove(result_file)  # from an earlier sweep
+            process = start_job(exp, slots[slot], cache_dir, log_dir)
+            running[exp] = slot
+            waiter = threading.Thread(target=_wait_job,
+                                      args=(exp, process, finished))
+            waiter.daemon = True
+            waiter.start()
+        # a long timeout, as a bare get can't be interrupted
+        exp, returncode = finished.get(True, 1e9)
+        free.append(running.pop(exp))
+        result_file = os.path.join(log_dir, "%03d.json" % exp)
+        if returncode == 0 and os.path.exists(result_file):
+            with open(result_file) as f:
+                results[exp] = json.load(f)
+            results[exp]["status"] = "done"
+        else:
+            results[exp] = {"status": "failed ({})".format(returncode)}
+        print "config", exp, results[exp]["status"]
+        write_table(table_path, exps, configs, results)
+    write_table(table_path, exps, configs, results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a sweep of the\
+        configs of experiment_configs.csv on shared feature matrices.')
+    parser.add_argument('-c', '--config', type=str, action='append',
+                        help='Config id(s) to train, e.g. 35 or 33-38.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of configs to train at once.')
+    parser.add_argument('-t', '--threads', type=int, default=None,
+                        help='Cpus (and BLAS/OpenMP threads) per job,\
+                         default the cpus divided between the jobs.')
+    parser.add_argument('-o', '--output', type=str, default=DEFAULT_TABLE,
+                        help='File path of the csv results table.')
+    parser.add_argument('--cache', type=str, default=DEFAULT_CACHE_DIR,
+                        help='Folder of the packed feature matrices.')
+    parser.add_argument('--job', type=int, default=None,
+                        help='Train this config in this process (used for\
+                         the per config subprocesses).')
+    parser.add_argument('--log-dir', type=str, default=None,
+                        help='Folder to write the job\'s results to.')
+    args = parser.parse_args()
+
+    if args.job is not None:
+        train_job(args.job, args.cache,
+                  os.path.join(args.log_dir, "%03d.json" % args.job))
+        return
+    if not args.config:
+        parser.error("no configs to train, give them with -c")
+    exps = parse_config_ids(args.config)
+    threads = args.threads or \
+        max(1, multiprocessing.cpu_count() // args.jobs)
+    table_path = os.path.abspath(args.output)
+    if not os.path.exists(os.path.dirname(table_path)):
+        os.makedirs(os.path.dirname(table_path))
+    results = run_sweep(exps, args.jobs, threads, os.path.abspath(args.cache),
+                        table_path)
+    print_results_table(exps, results)
+    print "saved results to", table_path
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,10 @@
 from __future__ import division
-import csv
-import numpy
 from copy import deepcopy
 import argparse
 from deep_disfluency.utils.tools import \
     convert_from_eval_tags_to_inc_disfluency_tags
-
-
-def wer(r, h, macro=False):
-    """
-        Calculation of WER with Levenshtein distance.
-        O(nm) time ans space complexity.
-
-        >>> wer("who is there".split(), "is there".split())
-        33.3333333
-        >>> wer("who is there".split(), "".split())
-        100.0
-        >>> wer("".split(), "who is there".split())
-        100.0
-
-        macro :: Return the overall cost, else the WER
-    """
-    # initialisation
-    d = numpy.zeros((len(r)+1)*(len(h)+1), dtype=numpy.int)
-    d = d.reshape((len(r)+1, len(h)+1))
-
-    for i in range(len(r)+1):
-        for j in range(len(h)+1):
-            if i == 0:
-                d[0][j] = j
-            elif j == 0:
-                d[i][0] = i
-
-    # computation
-    for i in range(1, len(r)+1):
-        for j in range(1, len(h)+1):
-            if r[i-1] == h[j-1]:
-                d[i][j] = d[i-1][j-1]
-            else:
-                substitution = d[i-1][j-1] + 1
-                insertion = d[i][j-1] + 1
-                deletion = d[i-1][j] + 1
-                d[i][j] = min(substitution, insertion, deletion)
-    if macro:
-        return d[len(r)][len(h)]
-    wer = 1 if len(r) == 0 and 0 < len(h) else d[len(r)][len(h)]/float(len(r))
-    return 100 * float(wer)
+from deep_disfluency.load.columnar import read_columns
+from deep_disfluency.utils.edit_distance import wer
 
 
 def get_tags(s, open_delim='<',
@@ -323,65 +282,21 @@ def load_data_from_disfluency_corpus_file(fp, representation="disf1", limit=8,
      
     NB this does not convert them into one-hot arrays, just outputs lists of string tags."""
     print "loading from", fp
-    f = open(fp)
-    print "loading data", f.name
-    count_seq = 0
+    print "loading data", fp
     IDs = []
     seq = []
     pos_seq = []
     targets = []
     timings = []
-    currentTimings = []
-    current_fake_time = 0 # marks the current fake time for the dialogue (i.e. end of word)
-    current_dialogue = ""
-    
-    reader=csv.reader(f,delimiter='\t')
-    counter = 0
-    utt_reference = ""
-    currentWords = []
-    currentPOS = []
-    currentTags = []
-    current_fake_time = 0
-    
-    #corpus = "" # can write to file
-    for ref,timing,word,postag,disftag in reader: #mixture of POS and Words
-        # print ref, timing, word, postag, disftag
-        counter+=1
-        if not ref == "":
-            if count_seq>0: #do not reset the first time
-                #convert to the inc tags
-                if convert_to_dnn_format:
-                    currentTags = \
-                        convert_from_eval_tags_to_inc_disfluency_tags(
-                            currentTags,
-                            currentWords,
-                            representation,
-                            limit)
-                #corpus+=utt_reference #write data to a file for checking
-                #convert to vectors
-                seq.append(tuple(currentWords))
-                pos_seq.append(tuple(currentPOS))
-                targets.append(tuple(currentTags))
-                IDs.append(utt_reference)
-                timings.append(tuple(currentTimings))
-                #reset the words
-                currentWords = []
-                currentPOS = []
-                currentTags = []
-                currentTimings = []
-            #set the utterance reference
-            count_seq+=1
-            utt_reference = ref
-            if not utt_reference.split(":")[0] == current_dialogue:
-                current_dialogue = utt_reference.split(":")[0]
-                current_fake_time = 0 #TODO fake for now- reset the current beginning of word time
-        currentWords.append(word)
-        currentPOS.append(postag)
-        currentTags.append(disftag)
-        currentTimings.append(timing)
-        current_fake_time+=1
-    #flush
-    if not currentWords == []:
+
+    columns = read_columns(fp)  # the csv corpus format (see columnar.py)
+    all_timings = columns.column(1)
+    all_words = columns.column(2)
+    all_pos = columns.column(3)
+    all_tags = columns.column(4)
+    for utt_reference, start, end in columns.utterances():
+        currentWords = all_words[start:end]
+        currentTags = all_tags[start:end]
         if convert_to_dnn_format:
             currentTags = \
                 convert_from_eval_tags_to_inc_disfluency_tags(
@@ -390,14 +305,13 @@ def load_data_from_disfluency_corpus_file(fp, representation="disf1", limit=8,
                     representation,
                     limit)
         seq.append(tuple(currentWords))
-        pos_seq.append(tuple(currentPOS))
+        pos_seq.append(tuple(all_pos[start:end]))
         targets.append(tuple(currentTags))
         IDs.append(utt_reference)
-        timings.append(tuple(currentTimings))
+        timings.append(tuple(all_timings[start:end]))
 
     assert len(seq) == len(targets) == len(pos_seq)
     print "loaded " + str(len(seq)) + " sequences"
-    f.close()
     return (IDs,timings,seq,pos_seq,targets)
 
 
@@ -407,133 +321,56 @@ def load_data_from_corpus_file(filename, limit=8,
     """Loads from disfluency detection with timings file.
     """
     all_speakers = []
-    lex_data = []
-    pos_data = []
-    frames = []
-    labels = []
-    indices = []
-
-    latest_increco = []
-    latest_pos = []
-    latest_labels = []
-    latest_indices = []
-
-    a_file = open(filename)
-    started = False
-    conv_no = ""
-    prev_word = -1
-    prev_pos = -1
-    prev_index = ""
     print "loading in timings file", filename, "..."
-    for line in a_file:
-        if "Speaker:" in line:
-            if not started:
-                started = True
-            else:
-                # flush
-                # print line
-                if not latest_increco == []:
-                    shift = -1
-                    for i in range(0, len(latest_increco)):
-                        triple = latest_increco[i]
-                        if triple[1] == triple[2]:
-                            # print "same timing!", triple
-                            shift = i
-                            break
-                    if shift > -1:
-                        latest_increco = fill_in_time_approximations(
-                                                        latest_increco,
-                                                        shift)
-                    lex_data.extend(deepcopy(latest_increco))
-                    pos_data.extend(deepcopy(latest_pos))
-                    # convert to the disfluency tags for this
-                    # latest_labels = convertFromEvalTagsToIncDisfluencyTags()
-                    if convert_to_dnn_format:
-                        latest_labels = \
-                            convert_from_eval_tags_to_inc_disfluency_tags(
-                                latest_labels,
-                                latest_increco,
-                                representation,
-                                limit)
-                    labels.extend(deepcopy(latest_labels))
-                    indices.extend(deepcopy(latest_indices))
-                # fake
-                # print lex_data
-                frames = [x[-1] for x in lex_data]  # last word end time
-                # acoustic_data = [0] * len(lex_data)  # fakes
-                #indices = [0] * len(lex_data)
-
-                all_speakers.append((conv_no, (frames, lex_data, pos_data,
-                                               indices, labels)))
-                # reset
-                lex_data = []
-                pos_data = []
-                labels = []
-                indices = []
-                latest_increco = []
-                latest_pos = []
-                latest_labels = []
-                latest_indices = []
-                prev_word = -1
-                prev_pos = -1
-                prev_index = ""
-
-            conv_no = line.strip("\n").replace("Speaker: ", "")
-            continue
-        if line.strip("\n") == "":
-            continue
-        spl = line.strip("\n").split("\t")
-        # print "@@@@" + line + "@@@@"
-        # raw_input()
-        idx = spl[0]
-        start = float(spl[1])
-        end = float(spl[2])
-        word = spl[3]
-        pos = spl[4]
-        # need to convert to the right rep here
-        tag = spl[5]
-
-        latest_increco.append(([prev_word, word], start, end))
-        latest_pos.append(deepcopy([prev_pos, pos]))
-        latest_labels.append(tag)
-        latest_indices.append(idx)
-        prev_word = word
-        prev_pos = pos
-
-    # flush
-    if not latest_increco == []:
-        shift = -1
-        for i in range(0, len(latest_increco)):
-            triple = latest_increco[i]
-            if triple[1] == triple[2]:
-                shift = i
-                break
-        if shift > -1:
-            latest_increco = fill_in_time_approximations(latest_increco, shift)
-        lex_data.extend(latest_increco)
-        pos_data.extend(latest_pos)
-        if convert_to_dnn_format:
-            latest_labels = \
-                convert_from_eval_tags_to_inc_disfluency_tags(
-                    latest_labels,
-                    latest_increco,
-                    representation,
-                    limit)
-        labels.extend(latest_labels)
-        indices.extend(latest_indices)
-    frames = [x[-1] for x in lex_data]  # last word end time
-    # acoustic_data = [0,] * len(lex_data)  # fakes..
-    # indices = [0] * len(lex_data)
-    all_speakers.append((conv_no, (frames, lex_data, pos_data,
-                                   indices, labels)))
+    columns = read_columns(filename)  # see load/columnar.py
+    all_indices = columns.column(0)
+    starts = columns.float_column(1).tolist()
+    ends = columns.float_column(2).tolist()
+    words = columns.column(3)
+    pos_tags = columns.column(4)
+    # need to convert to the right rep here
+    tags = columns.column(5)
+    for speaker_index, conv_no in enumerate(columns.speakers):
+        lex_data = []
+        pos_data = []
+        labels = []
+        indices = []
+        prev_word = -1
+        prev_pos = -1
+        for start, end in columns.speaker_updates(speaker_index):
+            latest_increco = []
+            latest_pos = []
+            for i in xrange(start, end):
+                latest_increco.append(([prev_word, words[i]], starts[i],
+                                       ends[i]))
+                latest_pos.append([prev_pos, pos_tags[i]])
+                prev_word = words[i]
+                prev_pos = pos_tags[i]
+            shift = -1
+            for i in range(0, len(latest_increco)):
+                triple = latest_increco[i]
+                if triple[1] == triple[2]:
+                    shift = i
+                    break
+            if shift > -1:
+                latest_increco = fill_in_time_approximations(latest_increco,
+                                                             shift)
+            lex_data.extend(latest_increco)
+            pos_data.extend(latest_pos)
+            latest_labels = tags[start:end]
+            if convert_to_dnn_format:
+                latest_labels = \
+                    convert_from_eval_tags_to_inc_disfluency_tags(
+                        latest_labels,
+                        latest_increco,
+                        representation,
+                        limit)
+            labels.extend(latest_labels)
+            indices.extend(all_indices[start:end])
+        frames = [x[-1] for x in lex_data]  # last word end time
+        all_speakers.append((conv_no, (frames, lex_data, pos_data,
+                                       indices, labels)))
     print len(all_speakers), "speakers with timings input"
-    # print "first few lengths"
-    # limit = 10
-    # for s in all_speakers:
-    #     id, data = s
-    #     print [len(x) for x in data]
-    #     limit-=1
-    #     if limit<0: break
     return all_speakers
 
 
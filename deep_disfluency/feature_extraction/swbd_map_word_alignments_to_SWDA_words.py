@@ -10,7 +10,9 @@ i.e. all the possible tags
 """
 
 import argparse
+import multiprocessing
 from copy import deepcopy
+from itertools import izip
 #import sys
 #ssys.setrecursionlimit(10000) #NB shouldn't be needed
 
@@ -741,6 +743,29 @@ def getSWDAspeaker(MSfilename):
     f.close()
     return speaker
 
+def map_dialogue_speaker(args):
+    """map_MS_to_SWDA for one dialogue speaker from the arguments
+    (dialogue speaker ID, alignments folder, SWDA indices, SWDA words,
+    laughter), finding their MS file. The indices and words are used up.
+    """
+    dialogue_speakerID, alignments_dir, SWDAindices, SWDAwords, laughter = \
+        args
+    MSID = dialogue_speakerID[-1]
+    MSfilename = alignments_dir + "/" + dialogue_speakerID[0:1] + "/" +\
+     "sw{}-ms98-a-penn.text".format(dialogue_speakerID)
+    #can switch between A and B, use the original PTB role names 
+    #(not the MS ones)
+    speaker = getSWDAspeaker(MSfilename)
+    #NB do we need to sample the first n words to check which speaker
+    #is which???
+    if not speaker in MSID and not "2434" in MSfilename:
+        #NB 2434 is wrong in both versions
+        switched_speakerID = dialogue_speakerID[:-1] + speaker
+        MSfilename = alignments_dir + "/" + dialogue_speakerID[0:1] + "/"+\
+         "sw{}-ms98-a-penn.text".format(switched_speakerID) 
+    return map_MS_to_SWDA(MSfilename, SWDAindices, SWDAwords,
+                          laughter=laughter)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Adds word timings\
     to disfluency detection file.')
@@ -759,6 +784,10 @@ if __name__ == '__main__':
                         SWDisfTrain_ranges.text',
                         help='location of the file listing the \
                         files used in the corpus')
+    parser.add_argument('-j', action='store', dest='jobs', type=int,
+                        default=1,
+                        help='number of processes to map the dialogue \
+                        speakers in (0 for one per cpu)')
 
     args = parser.parse_args()
     range_file = args.divisionFile
@@ -801,48 +830,25 @@ if __name__ == '__main__':
     #where the last mapping is done through min. edit distance string alignment
     tests = ["2549B"]
     print "Creating word timing aligned corpus..."
-    for dialogue_triple in sorted(dialogue_speakers, key=lambda x: x[0]):
-        dialogue_speakerID, SWDAindices, SWDAwords, SWDApos, SWDAlabels = \
-                                                        dialogue_triple
-        origSWDAindices = deepcopy(SWDAindices)
-        origSWDAwords = deepcopy(SWDAwords)
-    
-        #print dialogue_speakerID
-        #print SWDAindices
-        #print SWDAwords
-        #print SWDApos
-        #print SWDAlabels
-        #if not dialogue_speakerID in tests:
-        #    continue
-        #if int(dialogue_speakerID[:4]) < int(tests[0][:4]):
-        #    continue
-        #print SWDAindices,
-        #print SWDAwords
-        MSID = dialogue_speakerID[-1]
-        #print SWDAindices[0:50], len(SWDAindices)
-        #print SWDAwords[0:50], len(SWDAwords)
-        MSfilename = alignments_dir + "/" + dialogue_speakerID[0:1] + "/" +\
-         "sw{}-ms98-a-penn.text".format(dialogue_speakerID)
-        #can switch between A and B, use the original PTB role names 
-        #(not the MS ones)
-        speaker = getSWDAspeaker(MSfilename)
-        #print speaker
-        #NB do we need to sample the first n words to check which speaker
-        #is which???
-        if not speaker in MSID and not "2434" in MSfilename:
-            #NB 2434 is wrong in both versions
-            switched_speakerID = dialogue_speakerID[:-1] + speaker
-            MSfilename = alignments_dir + "/" + dialogue_speakerID[0:1] + "/"+\
-             "sw{}-ms98-a-penn.text".format(switched_speakerID) 
-        
-    
-        start_times, stop_times, SWDAwords, laughter_bouts =  map_MS_to_SWDA(
-                                                            MSfilename,
-                                                            SWDAindices,
-                                                            SWDAwords,
-                                                            laughter=
-                                                    args.annotateLaughter)
-    
+    dialogue_speakers = sorted(dialogue_speakers, key=lambda x: x[0])
+    #the speakers are mapped independently, in parallel if asked, while
+    #their results are written in order
+    pool = None
+    if args.jobs != 1:
+        pool = multiprocessing.Pool(args.jobs or None)
+        mapped = pool.imap(map_dialogue_speaker,
+                           [(x[0], alignments_dir, x[1], x[2],
+                             args.annotateLaughter)
+                            for x in dialogue_speakers], chunksize=1)
+    else:
+        mapped = (map_dialogue_speaker((x[0], alignments_dir,
+                                        deepcopy(x[1]), deepcopy(x[2]),
+                                        args.annotateLaughter))
+                  for x in dialogue_speakers)
+    for dialogue_triple, mapping in izip(dialogue_speakers, mapped):
+        dialogue_speakerID, origSWDAindices, origSWDAwords, SWDApos, \
+            SWDAlabels = dialogue_triple
+        start_times, stop_times, SWDAwords, laughter_bouts = mapping
     
         if not len(origSWDAwords)==len(start_times):
             c = 0
@@ -902,6 +908,9 @@ if __name__ == '__main__':
             timings_corpus_file.write("\n")
             #mapping_file.close()
     
+    if pool is not None:
+        pool.close()
+        pool.join()
     if write_mapping: 
         timings_corpus_file.close()
     print "Timing aligned corpus complete."
\ No newline at end of file
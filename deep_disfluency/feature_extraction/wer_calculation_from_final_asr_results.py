@@ -1,6 +1,6 @@
 from mumodo.mumodoIO import open_intervalframe_from_textgrid
 import numpy
-from deep_disfluency.utils.accuracy import wer
+from deep_disfluency.utils.edit_distance import wer
 
 
 final_file = open('wer_test.text', "w")
@@ -15,10 +15,10 @@ for ranges in [ranges1, ranges2]:
                                                       .format(r, s))
             hyp = " ".join(iframe['Hyp']['text'])
             ref = " ".join(iframe['Ref']['text'])
-            wer = wer(ref, hyp)
-            cost = wer(ref, hyp, macro=True)
-            print r, s, wer
-            print>>final_file, r, s, wer, cost
+            rate = wer(ref.split(), hyp.split())
+            cost = wer(ref.split(), hyp.split(), macro=True)
+            print r, s, rate
+            print>>final_file, r, s, rate, cost
 final_file.close()
 
 
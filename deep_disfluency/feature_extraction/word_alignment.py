@@ -2,19 +2,93 @@ import re
 from collections import defaultdict
 from difflib import SequenceMatcher
 
+from deep_disfluency.utils.edit_distance import edit_distance_table
+
+# the initial half width of the band of the cost table around its
+# diagonal in align, doubled until it holds every cheapest alignment
+ALIGNMENT_BAND = 16
+
+_cleaned = {} # cache of cleanup, as the same words come up again and again
+
 
 def cleanup(astring):
     """this allows us to do agreement per word (without weird characters)"""
     #i.e. if this returns "" then don't consider it..
+    if astring in _cleaned:
+        return _cleaned[astring]
+    original = astring
     astring = re.sub("<[^>]+>", "", astring) #gets rid of tags
     unwantedchars = ['{', '{f', '{F', '}', '.', '+', '(', ')', '\'', ',', '-', '$unc$']
     for achar in unwantedchars:
         astring = astring.replace(achar, "")
     #astring = astring.strip()
     #astring = " ".join(astring.split())
+    _cleaned[original] = astring
     return astring
 
-def align(string1,string2):
+def _cost_table(keys1, keys2, band):
+    """The min edit distance table from keys1 to keys2 (substitutions
+    costing 2), filled only within the band of its diagonal. The band is
+    doubled until the total cost is no more than it, as then no cheapest
+    path can leave it (each step off the diagonal costs 1) and the table
+    is exact on all the cells the backtrace can reach."""
+    m = len(keys1)
+    n = len(keys2)
+    band = max(band, abs(m - n), 1)
+    while True:
+        D = edit_distance_table(keys1, keys2, subcost=2, band=band)
+        if D[m, n] <= band or band >= max(m, n):
+            return D
+        band *= 2
+
+def _pointers(D, keys1, keys2, i, j):
+    """The (arrow, category) pointers of the cheapest edits into cell i,j,
+    in the order of the set of the edits they were always read from."""
+    if i == 0:
+        return [("<", "INS")]
+    if j == 0:
+        return [("^", "DEL")]
+    if keys1[i-1] == keys2[j-1]: #identity, or the same once cleaned up
+        subtest = (i, j, "ID", int(D[i-1, j-1]), "\\") #NO COST
+    else:
+        subtest = (i, j, "S_ARB", int(D[i-1, j-1]) + 2, "\\")
+    tests = [(i, j, "DEL", int(D[i-1, j]) + 1, "^"),
+             (i, j, "INS", int(D[i, j-1]) + 1, "<"),
+             subtest]
+    mincost = min(t[3] for t in tests)
+    mincostset = set(t for t in tests if t[3] == mincost)
+    return [(a[-1], a[2]) for a in mincostset]
+
+def _column_scores(mymap):
+    """The score of the last mapping to each j of a path (its j only ever
+    go up)."""
+    scores = {}
+    for mapping in mymap:
+        scores[mapping[1]] = mapping[3]
+    return scores
+
+def _rank(mymaps,start,n):
+    tail = []
+    columns = [_column_scores(mymap) for mymap in mymaps]
+    for j in range(start,n):
+        if len(mymaps) == 1: return mymaps + tail
+        #the last mapping to j (i.e. highest value for i)
+        bestscores = [scores[j] for scores in columns]
+        best = min(bestscores)
+        #maintain all the best for further sorting; separately sort the tail?
+        i = 0; a = 0
+        while i < len(bestscores):
+            if bestscores[i] > best:
+                tail.append(list(mymaps[a])) #bad score
+                del mymaps[a]
+                del columns[a]
+            else: a+=1
+            i+=1
+        if len(tail)>0: tail = _rank(tail,j,n) #recursively sort the tail
+    #print "warning no difference!!"
+    return mymaps #if no difference just return all
+
+def align(string1,string2,band=ALIGNMENT_BAND):
     """min edit distance string aligner for string2-> string1
     Creates table of all possible edits, only considers the paths from i,j=0 to i=m, j= n
     returns mapping from i to j with the max alignment- problem, there may be several paths. Weights:
@@ -22,174 +96,49 @@ def align(string1,string2):
         insert(eps,string) 1
         delete(string1,eps) 1
         substitution(string1,string2) 2
+    The costs are an int table over the cells within band of the diagonal
+    (see _cost_table), and the pointers of a cell are only worked out when
+    the backtrace gets to it.
     """
-    #we have the normal del, insert and subs for min edit distance
-    #we only need define the sub relation for the special cases
-    #pointers
-    
     #do lower case for all
     string1 = map(lambda x : x.lower().replace("<laughter>","").\
                   replace("</laughter>",""), string1)
     string2 = map(lambda x : x.lower().replace("<laughter>","").\
                   replace("</laughter>",""), string2)
-    
-    
-    left = "<"
-    up = "^"
-    diag = "\\"
-    m = len(string1)
-    n = len(string2)
-    string1 = ["",] + list(string1) #add the empty strings
-    string2 = ["",] + list(string2)
-    #print "initial:"
-    #print string1
-    #print string2
-    
-    def sub(source,goal,initial): #2 words #initial = the table's content initialised as [i,j,"",currentScore,""]
-        if source == goal: return initial[0:2] + ["ID"] + [initial[3],diag]#NO COST
-        elif cleanup(source) == cleanup(goal): return initial[0:2] + ["ID"] + [initial[3],diag]#NO COST ?
-        else: return initial[0:2] + ["S_ARB"] + [initial[3]+2,diag] #2 for arbitrary sub
-    
-    def delete(source,initial):
-        category = "DEL"
-        return initial[0:2] + ["DEL"] + [initial[3]+1,up]
-    
-    def insert(goal,initial):
-        category = "INS"
-        return initial[0:2] + ["INS"] + [initial[3]+1,left]
-        
-    #initilisation of axes in table, hash from number to number to list (cell)
-    D = [] #the cost table
-    ptr = [] #the pointer table
-    for i in range(0,m+1):
-        D.append([0]*(n+1))
-        ptr.append([[]]*(n+1)) #these are mutable, just dummies
-    
-    #defaultdict(defaultdict(list)) #the pointer table with a list of (pointer,relation) pairs
-    #populate each of the table axes
-    D[0][0] = 0
-    j = 0
-    for i in range(1,m+1):
-        a = delete(string1[i],[i,j,"",D[i-1][j],""])
-        D[i][j] = a[3] #delete cost
-        ptr[i][j] = [(a[-1],a[2])] #delete type
-    i = 0
-    for j in range(1,n+1):
-        a = insert(string2[j],[i,j,"",D[i][j-1],""])
-        D[i][j] = a[3] #insert cost
-        ptr[i][j] = [(a[-1],a[2])] #insert type
-    
-    #for i in range(0,m+1):
-    #    print D[i]
-        
-    #for i in range(0,m+1):
-    #    print ptr[i]
-    
-    #main recurrence relation algorithm
-    for i in range(1,m+1):
-        for j in range(1,n+1):
-            #print "%%%%%%%"
-            #print i
-            #print j
-            deltest = delete(string1[i],[i,j,"",D[i-1][j],""])
-            #print deltest
-            instest = insert(string2[j],[i,j,"",D[i][j-1],""])
-            #print instest
-            subtest = sub(string1[i],string2[j],[i,j,"",D[i-1][j-1],""])
-            #print subtest
-            #print "%%%%%%%"
-            #get the min cost set
-            mincostset = set()
-            mincostset.add(tuple(deltest))
-            mincost = deltest[-2]
-            tests = [instest,subtest] #check the others
-            for t in tests:
-                if t[-2] < mincost:
-                    mincost = t[-2]
-                    mincostset = set()
-                    mincostset.add(tuple(t))
-                elif t[-2] == mincost:
-                    mincostset.add(tuple(t))
-            #add the pointers and their alignments
-            ptr[i][j] = []
-            for a in mincostset:
-            #    print a
-                ptr[i][j].append((a[-1],a[2]))
-            D[i][j] = mincost
-    #print the optimal alignment(s) backtrace-
-    #there should only be one given the weights as we shouldn't allow an ins+del to beat an arbsub
-    #return a list of the alignemnts
-    #gets them backwards then returns the reverse
-    #print "cost = " + str(D[m][n])
-    #for i in range(0,m+1):
-    #    print D[i]
-        
-    #for p in range(0,m+1):
-    #    print ptr[p]
-    
-    #return all and rank by best first approach
-    #if there is a branch, follow and pop the first pointer, effectively removing the path
-    def backtrace(D,ptr,i,j,mymap,mymaps):
-        if i == 0 and j == 0: #should always get there directly
-            mymaps.append(mymap)
-            return
-        arrow = ptr[i][j][0][0] #get the first one
-        alignment = ptr[i][j][0][1]
-        score = D[i][j]
-        if len(ptr[i][j])>1: #more than one!
-            del ptr[i][j][0] #remove it before copying and recursing
-            #mymapcopy = list(mymap)
-            backtrace(D,ptr,i,j,list(mymap),mymaps)
-            #ptr[i][j] = filter(lambda x: not x[0] == "\\", ptr[i][j])
-            #coarse approximation
-        mymap.insert(0,tuple([max(0,i-1),max(0,j-1),alignment,score]))
-        
-        if arrow == "\\":
-            backtrace(D,ptr,i-1,j-1,mymap,mymaps)
-        elif arrow == "^":
-            backtrace(D,ptr,i-1,j,mymap,mymaps)
-        elif arrow == "<":
-            backtrace(D,ptr,i,j-1,mymap,mymaps)
-        
-    def rank(mymaps,start,n):
-        tail = []
-        for j in range(start,n):
-            bestscores = []
-            if len(mymaps) == 1: return mymaps + tail
-            for mymap in mymaps: #should this recurse to the last mapping to j (i.e. highest value for i)? yes
-                for mapping in mymap:
-                    if mapping[1] == j:
-                        bestscore = mapping[3]
-                    elif mapping[1] >j: break
-                bestscores.append(bestscore) #should always get one!
-            best = min(bestscores)
-            #print "best"
-            #print best
-            #maintain all the best for further sorting; separately sort the tail?
-            i = 0; a = 0
-            while i < len(bestscores):
-            #    print bestscores[i]
-                if bestscores[i] > best:
-                    tail.append(list(mymaps[a])) #bad score
-                    del mymaps[a]
-                else: a+=1
-                i+=1
-            if len(tail)>0: tail = rank(tail,j,n) #recursively sort the tail
-        #print "warning no difference!!"
-        return mymaps #if no difference just return all        
-    
+    #words are the same (ID) if they are once cleaned up
+    keys1 = [cleanup(x) for x in string1]
+    keys2 = [cleanup(x) for x in string2]
+    m = len(keys1)
+    n = len(keys2)
+    D = _cost_table(keys1, keys2, band)
+
+    #backtrace of all the cheapest paths, gets them backwards.
+    #if there is a branch, follow the first pointer after all the paths
+    #through the others, popping it to effectively remove the path
+    arrows = {"\\": (1, 1), "^": (1, 0), "<": (0, 1)}
+    ptr = {}
     mymaps = []
-    mymap = []
-    backtrace(D,ptr,m,n,mymap,mymaps)
+    stack = [(m, n, [])]
+    while stack:
+        i, j, mymap = stack.pop()
+        if i == 0 and j == 0: #should always get there directly
+            mymaps.append(mymap[::-1])
+            continue
+        if (i, j) not in ptr:
+            ptr[i, j] = _pointers(D, keys1, keys2, i, j)
+        arrow, alignment = ptr[i, j][0] #get the first one
+        branch = None
+        if len(ptr[i, j]) > 1: #more than one!
+            del ptr[i, j][0] #remove it before copying
+            branch = (i, j, list(mymap))
+        mymap.append((max(0,i-1),max(0,j-1),alignment,int(D[i, j])))
+        di, dj = arrows[arrow]
+        stack.append((i - di, j - dj, mymap))
+        if branch is not None:
+            stack.append(branch)
+
     if len(mymaps)>1:
-        #print "ranking"
-        #print len(mymaps)
-        #print mymaps
-        mymaps = rank(mymaps,0,n) #sorts the list by best first as you pass left to right in the repair
-    #for mapping in mymaps:
-    #    print mapping
-    #print "returning:"
-    #print mymaps[0]
+        mymaps = _rank(mymaps,0,n) #sorts the list by best first as you pass left to right in the repair
     return mymaps[0] #only returns top, can change this
 
 def matchBlock(ss):
@@ -0,0 +1,94 @@
+"""Read only n-gram count tables held in numpy arrays.
+
+The count maps of a KneserNeySmoothingModel are dicts of hundreds of
+thousands of str keys and int values, every lookup of which writes to the
+reference counts of the objects it touches (and every full garbage
+collection to the dict's). In processes forked from the one which built the
+model those writes copy the touched pages, so over time each process ends
+up with its own copy of the language models. A CountTable holds the same
+counts as a sorted array of fixed width keys and an array of counts: the
+lookups only read the arrays' buffers, which stay shared.
+"""
+from collections import defaultdict
+
+import numpy as np
+
+# the maps of a KneserNeySmoothingModel used by ngram_prob
+LM_COUNT_MAPS = ["ngram_numerator_map", "ngram_denominator_map",
+                 "ngram_non_zero_map"]
+# the maps and lists only used in training and the entropy measures
+LM_TRAINING_TABLES = ["unigrams", "unigram_counts", "bigrams",
+                      "bigram_counts", "unigram_contexts", "bigram_contexts",
+                      "bigram_history_entropies", "trigram_history_entropies"]
+
+
+class CountTable(object):
+    """A read only mapping of str keys to int counts, behaving as the
+    defaultdict(int) count maps for lookups (missing keys count 0)
+    but without inserting the missing keys.
+    """
+
+    def __init__(self, keys, counts):
+        """keys must be sorted (as by sorted()) and unique."""
+        self.keys_array = np.asarray(keys, dtype=str) if len(keys) \
+            else np.zeros(0, dtype="S1")
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_dict(cls, count_map):
+        """The non-zero counts of a dict."""
+        items = sorted((k, v) for k, v in count_map.items() if v)
+        return cls([k for k, _ in items], [v for _, v in items])
+
+    def _index(self, key):
+        i = self.keys_array.searchsorted(key)
+        if i < len(self.keys_array) and self.keys_array[i] == key:
+            return i
+        return None
+
+    def get(self, key, default=None):
+        i = self._index(key)
+        if i is None:
+            return default
+        return self.counts.item(i)
+
+    def __getitem__(self, key):
+        return self.get(key, 0)
+
+    def __contains__(self, key):
+        return self._index(key) is not None
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        return iter(self.keys_array.tolist())
+
+    def keys(self):
+        return self.keys_array.tolist()
+
+    def items(self):
+        return zip(self.keys_array.tolist(), self.counts.tolist())
+
+    def nbytes(self):
+        return self.keys_array.nbytes + self.counts.nbytes
+
+
+def freeze_language_model(lm, drop_training_tables=True):
+    """Replace the count maps of the KneserNeySmoothingModel lm with
+    CountTables, so it can only be used for inference (ngram_prob).
+    If drop_training_tables, the tables only used for training and the
+    entropy measures are emptied too.
+    """
+    for map_name in LM_COUNT_MAPS:
+        count_map = getattr(lm, map_name)
+        if not isinstance(count_map, CountTable):
+            setattr(lm, map_name, CountTable.from_dict(count_map))
+    if drop_training_tables:
+        for table_name in LM_TRAINING_TABLES:
+            table = getattr(lm, table_name, None)
+            if isinstance(table, defaultdict):
+                setattr(lm, table_name, defaultdict(table.default_factory))
+            elif table is not None:
+                setattr(lm, table_name, type(table)())
+    return lm
@@ -0,0 +1,260 @@
+"""Bulk parsing of the tab separated text formats of the corpus and
+tagger output files into columns, shared by the loaders in load.py,
+evaluation/eval_utils.py and feature_extraction/feature_utils.py.
+
+The formats are all lines of tab separated fields, grouped by header
+lines with no tabs:
+
+    - "Speaker: <id>" or "File: <id>" lines start a speaker (a dialogue
+    participant) in the timings corpus files (swbd_*_timings.csv) and
+    in the increco files
+    - "Time: <t>" lines start an update of the hypothesis in the increco
+    files, e.g.:
+
+        Speaker: 4519A
+
+        Time: 2.722875
+        2.557375	2.722875	your	PRP$	<f/><ct/>
+
+        Time: 3.011125
+        2.722875	3.011125	turn	NN	<f/><tc/>
+
+    - the csv corpus files (swbd_*_data.csv) have no header lines,
+    their rows whose first field is not empty starting an utterance
+    (see ColumnarFile.utterances).
+
+read_columns reads a whole file and splits it in one pass into a
+ColumnarFile: its rows' fields plus offset arrays of where each speaker's
+updates and each update's rows begin, with the columns converted in bulk
+(float_column, id_column) on demand. build_speaker_index writes a side
+index of the byte range of each speaker in a file, with which
+read_speaker parses only that speaker's lines.
+"""
+import csv
+import json
+import os
+from operator import itemgetter
+
+import numpy as np
+
+SPEAKER_HEADERS = ("Speaker:", "File:")
+UPDATE_HEADER = "Time:"
+
+
+class ColumnarFile(object):
+    """The parsed lines of a file (see read_columns).
+
+    speakers -- the speaker ids in the order of their header lines
+    (a file or part of one with rows before any header has a first
+    speaker "")
+    speaker_offsets -- int array, speaker i's updates are
+    update_offsets[speaker_offsets[i]:speaker_offsets[i + 1]]
+    update_times -- float array, the time of each update (nan for the
+    single update of each speaker of files without "Time:" lines)
+    update_offsets -- int array, update j's rows are
+    rows[update_offsets[j]:update_offsets[j + 1]]
+    rows -- the list of each row's list of fields
+    """
+    def __init__(self, speakers, speaker_offsets, update_times,
+                 update_offsets, rows):
+        self.speakers = speakers
+        self.speaker_offsets = speaker_offsets
+        self.update_times = update_times
+        self.update_offsets = update_offsets
+        self.rows = rows
+        self._columns = {}
+        self._min_width = min(map(len, rows)) if rows else 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, index):
+        """The list of the index-th field of every row (e.g. -1 for the
+        last, None for rows without it)."""
+        if index not in self._columns:
+            if -self._min_width <= index < self._min_width:
+                self._columns[index] = map(itemgetter(index), self.rows)
+            else:
+                self._columns[index] = [
+                    row[index] if -len(row) <= index < len(row) else None
+                    for row in self.rows]
+        return self._columns[index]
+
+    def float_column(self, index):
+        """The index-th field of every row as a float array."""
+        key = ("float", index)
+        if key not in self._columns:
+            self._columns[key] = np.array(self.column(index),
+                                          dtype=np.float64)
+        return self._columns[key]
+
+    def id_column(self, index, index_map, unknown="<unk>"):
+        """The index-th field of every row as an int array of its index
+        in the index_map, or that of the unknown key if not in it,
+        each distinct value being looked up once."""
+        values, inverse = np.unique(np.array(self.column(index),
+                                             dtype=object),
+                                    return_inverse=True)
+        ids = np.array([index_map[v] if v in index_map
+                        else index_map[unknown] for v in values],
+                       dtype=np.int64)
+        return ids[inverse]
+
+    def speaker_updates(self, speaker_index):
+        """The (start, end) row offsets of each of the speaker's
+        updates."""
+        first = self.speaker_offsets[speaker_index]
+        last = self.speaker_offsets[speaker_index + 1]
+        return zip(self.update_offsets[first:last].tolist(),
+                   self.update_offsets[first + 1:last + 1].tolist())
+
+    def speaker_rows(self, speaker_index):
+        """The (start, end) row offsets of all the speaker's rows."""
+        return (int(self.update_offsets[
+                    self.speaker_offsets[speaker_index]]),
+                int(self.update_offsets[
+                    self.speaker_offsets[speaker_index + 1]]))
+
+    def utterances(self):
+        """The (reference, start, end) row offsets of the utterances of a
+        csv corpus file, each starting at a row with a non-empty first
+        field (its reference), any rows before the first being part of
+        the first utterance."""
+        refs = self.column(0)
+        starts = [i for i, ref in enumerate(refs) if ref]
+        if not starts:
+            return [("", 0, len(self.rows))] if self.rows else []
+        ends = starts[1:] + [len(self.rows)]
+        return [(refs[start], 0 if i == 0 else start, end)
+                for i, (start, end) in enumerate(zip(starts, ends))]
+
+
+def _split_fields(lines, text):
+    # fields beginning with a quote are unquoted as by the csv module,
+    # otherwise a plain split gives the same fields, much faster
+    if text.startswith('"') or '\n"' in text or '\t"' in text:
+        return [list(row) for row in csv.reader(lines, delimiter="\t")]
+    return [line.split("\t") for line in lines]
+
+
+def parse_columns(text):
+    """Parse the text of a whole file (or of some of its speakers) into
+    a ColumnarFile, empty updates being dropped."""
+    speakers = []
+    speaker_offsets = []
+    update_times = []
+    update_offsets = []
+    lines = []
+
+    def drop_empty_update():
+        if update_offsets and update_offsets[-1] == len(lines) and \
+                len(update_times) > speaker_offsets[-1]:
+            update_times.pop()
+            update_offsets.pop()
+
+    def add_rows(segment):
+        if not speakers:
+            speakers.append("")
+            speaker_offsets.append(len(update_times))
+        if len(update_times) == speaker_offsets[-1]:
+            # the single update of a speaker with no "Time:" lines
+            update_times.append(float("nan"))
+            update_offsets.append(len(lines))
+        lines.extend(segment)
+
+    all_lines = text.split("\n")
+    # the rows between each header (or blank) line are added in one go
+    breaks = [i for i, line in enumerate(all_lines) if "\t" not in line]
+    previous = 0
+    for i in breaks:
+        if i > previous:
+            add_rows(all_lines[previous:i])
+        previous = i + 1
+        line = all_lines[i]
+        if not line:
+            continue
+        if line.startswith(UPDATE_HEADER):
+            if not speakers:
+                speakers.append("")
+                speaker_offsets.append(len(update_times))
+            drop_empty_update()
+            update_times.append(float(line[len(UPDATE_HEADER):]))
+            update_offsets.append(len(lines))
+        elif line.startswith(SPEAKER_HEADERS):
+            if speakers:
+                drop_empty_update()
+            speakers.append(line.split(":", 1)[1].strip())
+            speaker_offsets.append(len(update_times))
+        else:
+            add_rows([line])
+    if previous < len(all_lines):
+        add_rows(all_lines[previous:])
+    if speakers:
+        drop_empty_update()
+    speaker_offsets.append(len(update_times))
+    update_offsets.append(len(lines))
+    return ColumnarFile(speakers,
+                        np.array(speaker_offsets, dtype=np.int64),
+                        np.array(update_times, dtype=np.float64),
+                        np.array(update_offsets, dtype=np.int64),
+                        _split_fields(lines, text))
+
+
+def read_columns(filename):
+    """Read and parse a whole file (see parse_columns)."""
+    with open(filename) as f:
+        return parse_columns(f.read())
+
+
+def _index_filename(filename):
+    return filename + ".speakers.json"
+
+
+def build_speaker_index(filename, index_filename=None):
+    """Write a side index of the (start, end) byte offsets of each
+    speaker's lines in the file (by default to filename.speakers.json),
+    returning it. Repeated speaker ids are indexed by their first
+    occurrence.
+    """
+    index = {}
+    with open(filename, "rb") as f:
+        offset = 0
+        speaker = None
+        for line in f:
+            if line.startswith(SPEAKER_HEADERS) and "\t" not in line:
+                if speaker is not None and speaker not in index:
+                    index[speaker] = [start, offset]
+                speaker = line.split(":", 1)[1].strip()
+                start = offset
+            offset += len(line)
+        if speaker is not None and speaker not in index:
+            index[speaker] = [start, offset]
+        stat = os.fstat(f.fileno())
+    header = {"size": stat.st_size, "mtime": stat.st_mtime,
+              "speakers": index}
+    with open(index_filename or _index_filename(filename), "w") as f:
+        json.dump(header, f)
+    return index
+
+
+def load_speaker_index(filename, index_filename=None):
+    """The side index of the file, (re)built if it is missing or the
+    file has changed since."""
+    index_filename = index_filename or _index_filename(filename)
+    stat = os.stat(filename)
+    if os.path.exists(index_filename):
+        with open(index_filename) as f:
+            header = json.load(f)
+        if header["size"] == stat.st_size and \
+                header["mtime"] == stat.st_mtime:
+            return header["speakers"]
+    return build_speaker_index(filename, index_filename)
+
+
+def read_speaker(filename, speaker, index_filename=None):
+    """Parse only the lines of one speaker of the file into a
+    ColumnarFile, found from its side index."""
+    start, end = load_speaker_index(filename, index_filename)[speaker]
+    with open(filename, "rb") as f:
+        f.seek(start)
+        return parse_columns(f.read(end - start))
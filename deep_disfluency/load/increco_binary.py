@@ -0,0 +1,497 @@
+"""A compact binary form of the increco text files (see columnar.py),
+read directly by the evaluation (eval_utils) with random access to one
+speaker and to the updates up to a time.
+
+Each update of the text repeats every changed word of the hypothesis in
+full, although mostly only the tags of the words before the new ones
+change. The binary form instead keeps, for each speaker, the updates as
+a stream of (time, rollback, retagged, new rows): the update replaces the
+last rollback rows of the hypothesis so far, its first retagged rows
+being those replaced rows with only their last field (the tag) changed,
+stored as that field alone, followed by its new rows in full. String
+fields are interned in one table and stored as ids; the columns whose
+every value is written as str() of its float are stored as floats, as
+integer multiples of a power of ten where that is exact (so the times in
+microseconds as int32), and the counts and ids in the smallest unsigned
+integer type that holds them.
+
+The speakers are stored in blocks, each encoded as above on its own (so
+with its own float fields and integer types) and written as soon as it is
+complete, and the string table is shared by the blocks. File layout:
+
+    b"DDINCREC" | uint32 version | uint64 header offset |
+    uint64 header length | array data, each array aligned to its item
+    size | JSON header
+
+The header, written last, holds the string table and for each block its
+speakers and the dtype, shape and file offset of each of its arrays; the
+arrays are read as numpy views on a read only memory map. Version 1 files
+(a single block with the header before the data, its arrays aligned to
+ALIGNMENT bytes) are still read.
+
+The conversion is lossless: the text written back from a binary file
+parses (see parse_columns) to the same speakers, update times and row
+fields, and is byte for byte the same for files in the layout written
+by DeepDisfluencyTagger.incremental_output_from_file. Tagger output
+written to a file path ending in BINARY_INCRECO_EXTENSION is stored in
+the binary form (see open_increco_output), a block per speaker, so only
+the text of the speaker being written is held in memory. Convert files
+with e.g.:
+
+    python increco_binary.py swbd_disf_heldout_data_output_increco.text \
+        swbd_disf_heldout_data_output_increco.incb
+"""
+from __future__ import division
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from deep_disfluency.load.columnar import SPEAKER_HEADERS
+from deep_disfluency.load.columnar import parse_columns, read_columns
+
+MAGIC = b"DDINCREC"
+BINARY_INCRECO_VERSION = 2
+PREFIX_FORMAT = "<IQQ"
+BINARY_INCRECO_EXTENSION = ".incb"
+ALIGNMENT = 64
+
+
+def _aligned(offset, alignment=ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _is_float_text(values):
+    """Whether every value of a column is the str() of a float."""
+    try:
+        return all(str(float(v)) == v for v in values)
+    except (TypeError, ValueError):
+        return False
+
+
+def _compact_integers(values):
+    values = np.asarray(values, dtype=np.int64)
+    return values.astype(np.min_scalar_type(max(values.max(), 0))
+                         if values.size else np.uint8)
+
+
+def _compact_floats(name, values, arrays):
+    """Add the float values to the arrays as name, as the integer
+    multiples of 10 ** -decimals that they exactly are for the decimals
+    giving the fewest bytes, with the values that are not stored as
+    exceptions (their indices and float64 values), or as float64 if that
+    is smaller. Returns the decimals, None for float64."""
+    values = np.asarray(values, dtype=np.float64)
+    arrays[name] = values
+    best_size = values.nbytes
+    decimals = None
+    if not values.size or not np.isfinite(values).all():
+        return decimals
+    for d in range(10):
+        scaled = np.round(values * 10 ** d)
+        exact = (scaled / 10 ** d == values) & (np.abs(scaled) < 2 ** 53)
+        if not exact.any():
+            continue
+        scaled = np.where(exact, scaled, 0).astype(np.int64)
+        dtype = np.result_type(np.min_scalar_type(scaled.min()),
+                               np.min_scalar_type(scaled.max()))
+        exceptions = np.flatnonzero(~exact)
+        size = scaled.size * dtype.itemsize + exceptions.size * 12
+        if size < best_size:
+            best_size = size
+            decimals = d
+            arrays[name] = scaled.astype(dtype)
+            arrays[name + "/exceptions"] = exceptions.astype(np.uint32)
+            arrays[name + "/exception_values"] = values[exceptions]
+    return decimals
+
+
+def _time_text(t):
+    # str() as written by the tagger unless it loses precision
+    text = str(t)
+    return text if float(text) == t else repr(t)
+
+
+def encode_increco(columns, strings=None):
+    """The (header, arrays) of the binary form of a ColumnarFile of an
+    increco file (or of some of its speakers), whose rows must all have
+    the same number of fields. The string fields are stored as their ids
+    in strings, a dict of the ids by string which the new strings are
+    added to, the header's string table if not given.
+    """
+    widths = set(len(row) for row in columns.rows)
+    if len(widths) > 1:
+        raise ValueError("rows with {} fields, the binary increco form "
+                         "needs the same number in each".format(
+                             sorted(widths)))
+    n_fields = widths.pop() if widths else 0
+    float_fields = [i for i in range(n_fields)
+                    if _is_float_text(columns.column(i))]
+    header_strings = strings is None
+    if header_strings:
+        strings = {}
+    values = []
+    for i in range(n_fields):
+        if i in float_fields:
+            values.append(columns.float_column(i).tolist())
+        else:
+            values.append([strings.setdefault(v, len(strings))
+                           for v in columns.column(i)])
+    rows = zip(*values)
+    update_rollback = []
+    update_retagged = []
+    update_new = []
+    retags = []
+    new_rows = []
+    for speaker_index in range(len(columns.speakers)):
+        hypothesis = []
+        for start, end in columns.speaker_updates(speaker_index):
+            update = rows[start:end]
+            # the latest earlier row the update starts by retagging
+            position = len(hypothesis)
+            for i in range(len(hypothesis) - 1,
+                           max(len(hypothesis) - len(update), 0) - 1, -1):
+                if hypothesis[i][:-1] == update[0][:-1]:
+                    position = i
+                    break
+            retagged = 0
+            while retagged < min(len(update), len(hypothesis) - position) \
+                    and hypothesis[position + retagged][:-1] == \
+                    update[retagged][:-1]:
+                retags.append(update[retagged][-1])
+                retagged += 1
+            new_rows.extend(update[retagged:])
+            update_rollback.append(len(hypothesis) - position)
+            update_retagged.append(retagged)
+            update_new.append(len(update) - retagged)
+            del hypothesis[position:]
+            hypothesis.extend(update)
+    arrays = {"speaker_offsets": np.asarray(columns.speaker_offsets,
+                                            dtype=np.int64),
+              "update_rollback": _compact_integers(update_rollback),
+              "update_retagged": _compact_integers(update_retagged),
+              "update_new": _compact_integers(update_new)}
+    named_values = [("update_times", columns.update_times, True),
+                    ("retags", retags, n_fields - 1 in float_fields)]
+    new_values = zip(*new_rows) if new_rows else [()] * n_fields
+    for i in range(n_fields):
+        named_values.append(("field/{}".format(i), new_values[i],
+                             i in float_fields))
+    decimals = {}
+    for name, values, is_float in named_values:
+        if is_float:
+            decimals[name] = _compact_floats(name, values, arrays)
+        else:
+            arrays[name] = _compact_integers(values)
+    header = {"speakers": columns.speakers,
+              "fields": n_fields,
+              "float_fields": float_fields,
+              "decimals": decimals}
+    if header_strings:
+        header["strings"] = sorted(strings, key=strings.get)
+    return header, arrays
+
+
+class _BinaryIncrecoFile(object):
+    """Writes the blocks of a binary increco file as they are added, and
+    the header when closed."""
+    def __init__(self, file_path):
+        self.file = open(file_path, "wb")
+        self.file.write(MAGIC)
+        # the header's offset and length are filled in when closed
+        self.file.write(struct.pack(PREFIX_FORMAT, BINARY_INCRECO_VERSION,
+                                    0, 0))
+        self.strings = {}
+        self.blocks = []
+
+    def add_block(self, columns):
+        """Encode and write the speakers of the ColumnarFile."""
+        header, arrays = encode_increco(columns, self.strings)
+        index = {}
+        for name, array in sorted(arrays.items()):
+            array = np.ascontiguousarray(array)
+            offset = _aligned(self.file.tell(), array.dtype.alignment)
+            self.file.write(b"\0" * (offset - self.file.tell()))
+            self.file.write(array.tostring())
+            index[name] = {"dtype": array.dtype.str,
+                           "shape": list(array.shape),
+                           "offset": offset}
+        header["arrays"] = index
+        self.blocks.append(header)
+
+    def close(self):
+        header = {"strings": sorted(self.strings, key=self.strings.get),
+                  "blocks": self.blocks}
+        header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        header_offset = self.file.tell()
+        self.file.write(header_bytes)
+        self.file.seek(len(MAGIC))
+        self.file.write(struct.pack(PREFIX_FORMAT, BINARY_INCRECO_VERSION,
+                                    header_offset, len(header_bytes)))
+        self.file.close()
+
+
+def write_binary_increco(file_path, columns):
+    """Write the binary form of the ColumnarFile of an increco file."""
+    increco_file = _BinaryIncrecoFile(file_path)
+    try:
+        increco_file.add_block(columns)
+    finally:
+        increco_file.close()
+
+
+def is_binary_increco_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class _IncrecoBlock(object):
+    """The arrays of a block of speakers of a binary increco file."""
+    def __init__(self, header, data, data_start=0):
+        arrays = {}
+        for name, info in header["arrays"].items():
+            dtype = np.dtype(str(info["dtype"]))
+            shape = tuple(info["shape"])
+            count = int(np.prod(shape))
+            if count == 0:  # may be past the end of the file
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.frombuffer(
+                data, dtype=dtype, count=count,
+                offset=data_start + info["offset"]).reshape(shape)
+        self.arrays = arrays
+        self.speakers = [s.encode("utf-8") for s in header["speakers"]]
+        self.n_fields = header["fields"]
+        self.float_fields = header["float_fields"]
+        self.decimals = header["decimals"]
+        self.speaker_offsets = arrays["speaker_offsets"]
+        self.update_times = self._floats("update_times", 0,
+                                         len(arrays["update_times"]))
+        self.update_rollback = arrays["update_rollback"]
+        self.update_retagged = arrays["update_retagged"]
+        self.update_new = arrays["update_new"]
+        # where each update's retags and new rows start
+        self.retag_offsets = np.concatenate(
+            [[0], np.cumsum(self.update_retagged, dtype=np.int64)])
+        self.row_offsets = np.concatenate(
+            [[0], np.cumsum(self.update_new, dtype=np.int64)])
+
+    def _floats(self, name, start, end):
+        """The float values start to end of the array."""
+        values = self.arrays[name][start:end]
+        if self.decimals.get(name) is None:
+            return values
+        values = values.astype(np.float64) / 10 ** self.decimals[name]
+        exceptions = self.arrays[name + "/exceptions"]
+        first, last = np.searchsorted(exceptions, [start, end])
+        values[exceptions[first:last] - start] = \
+            self.arrays[name + "/exception_values"][first:last]
+        return values
+
+    def _values(self, name, start, end, float_field, strings):
+        if float_field:
+            return self._floats(name, start, end).tolist()
+        return [strings[v] for v in self.arrays[name][start:end].tolist()]
+
+    def updates(self, speaker_index, until, strings):
+        """See BinaryIncreco.updates, speaker_index being the index of
+        the speaker in the block."""
+        first = int(self.speaker_offsets[speaker_index])
+        last = int(self.speaker_offsets[speaker_index + 1])
+        if until is not None:
+            last = first + int(np.searchsorted(
+                self.update_times[first:last], until, side="right"))
+        # decode the speaker's fields in bulk, then the updates from them
+        row_start = int(self.row_offsets[first])
+        row_end = int(self.row_offsets[last])
+        retag_start = int(self.retag_offsets[first])
+        new_rows = zip(*[self._values("field/{}".format(i), row_start,
+                                      row_end, i in self.float_fields,
+                                      strings)
+                         for i in range(self.n_fields)])
+        retags = self._values("retags", retag_start,
+                              int(self.retag_offsets[last]),
+                              self.n_fields - 1 in self.float_fields,
+                              strings)
+        times = self.update_times[first:last].tolist()
+        rollbacks = self.update_rollback[first:last].tolist()
+        n_retagged = self.update_retagged[first:last].tolist()
+        n_new = self.update_new[first:last].tolist()
+        hypothesis = []
+        updates = []
+        r = 0
+        n = 0
+        for time, rollback, retagged, new in zip(times, rollbacks,
+                                                 n_retagged, n_new):
+            position = len(hypothesis) - rollback
+            rows = [hypothesis[position + i][:-1] + (retags[r + i],)
+                    for i in range(retagged)]
+            rows.extend(new_rows[n:n + new])
+            r += retagged
+            n += new
+            del hypothesis[position:]
+            hypothesis.extend(rows)
+            updates.append((time, rows))
+        return updates
+
+
+class BinaryIncreco(object):
+    """A binary increco file, decoded one speaker at a time.
+
+    speakers -- the speaker ids in file order
+    strings -- the string table of the string fields
+    """
+    def __init__(self, file_path):
+        with open(file_path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(
+                    "{} is not a binary increco file".format(file_path))
+            version, = struct.unpack("<I", f.read(4))
+            if version == 1:
+                header_length, = struct.unpack("<Q", f.read(8))
+                header = json.loads(f.read(header_length).decode("utf-8"))
+                data_start = _aligned(f.tell())
+                header = {"strings": header.pop("strings"),
+                          "blocks": [header]}
+            elif version == BINARY_INCRECO_VERSION:
+                header_offset, header_length = struct.unpack(
+                    "<QQ", f.read(16))
+                f.seek(header_offset)
+                header = json.loads(f.read(header_length).decode("utf-8"))
+                data_start = 0
+            else:
+                raise ValueError(
+                    "{} is a version {} binary increco file, expected "
+                    "{}".format(file_path, version, BINARY_INCRECO_VERSION))
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.fstat(f.fileno()).st_size else None
+        self.blocks = [_IncrecoBlock(block, data, data_start)
+                       for block in header["blocks"]]
+        self.strings = [s.encode("utf-8") for s in header["strings"]]
+        # the block and index in it of each speaker
+        self.speakers = []
+        self._speaker_blocks = []
+        for block in self.blocks:
+            for i, speaker in enumerate(block.speakers):
+                self.speakers.append(speaker)
+                self._speaker_blocks.append((block, i))
+
+    def speaker_index(self, speaker):
+        """The index of the (first) speaker with the id."""
+        return self.speakers.index(speaker)
+
+    def updates(self, speaker_index, until=None, strings=None):
+        """The (time, rows) of each of the speaker's updates (up to those
+        at time until), rows being lists of field values (floats for the
+        float fields, strings otherwise). The string fields are looked up
+        in strings if given, a mapping of each of self.strings.
+        """
+        if strings is None:
+            strings = self.strings
+        block, index = self._speaker_blocks[speaker_index]
+        return block.updates(index, until, strings)
+
+    def speaker_text(self, speaker_index):
+        """The text lines of the speaker, in the tagger's output layout."""
+        lines = ["Speaker: " + self.speakers[speaker_index], ""]
+        for time, rows in self.updates(speaker_index):
+            if time == time:  # nan for a speaker with no "Time:" lines
+                lines.append("Time: " + _time_text(time))
+            lines.extend("\t".join(str(v) for v in row) for row in rows)
+            lines.append("")
+        lines.append("")
+        return lines
+
+    def to_text(self):
+        return "".join(line + "\n" for i in range(len(self.speakers))
+                       for line in self.speaker_text(i))
+
+
+class BinaryIncrecoWriter(object):
+    """A file-like writer of increco text which is stored in the binary
+    form a speaker at a time: the text of a speaker is encoded and written
+    as a block when the next speaker's header line is written (in a single
+    write, as by the tagger), so only the text of one speaker is held,
+    and the rest when closed."""
+    def __init__(self, file_path):
+        self.name = file_path
+        self.increco_file = _BinaryIncrecoFile(file_path)
+        self.chunks = []
+        self.closed = False
+
+    def write(self, text):
+        start = self._last_speaker_header(text)
+        if start is not None:
+            # the speakers before it are complete
+            self.chunks.append(text[:start])
+            self._flush()
+            text = text[start:]
+        self.chunks.append(text)
+
+    def _last_speaker_header(self, text):
+        """The position of the last speaker header line in the text."""
+        line_start = not self.chunks or self.chunks[-1].endswith("\n")
+        positions = []
+        for header in SPEAKER_HEADERS:
+            position = text.rfind("\n" + header)
+            if position >= 0:
+                positions.append(position + 1)
+            elif line_start and text.startswith(header):
+                positions.append(0)
+        return max(positions) if positions else None
+
+    def _flush(self):
+        text = "".join(self.chunks)
+        self.chunks = []
+        if text.strip():
+            self.increco_file.add_block(parse_columns(text))
+
+    def close(self):
+        if self.closed:
+            return
+        self._flush()
+        self.increco_file.close()
+        self.closed = True
+
+
+def open_increco_output(file_path, buffer_size=-1):
+    """A file to write increco text to, stored as binary if the path ends
+    in BINARY_INCRECO_EXTENSION."""
+    if file_path.endswith(BINARY_INCRECO_EXTENSION):
+        return BinaryIncrecoWriter(file_path)
+    return open(file_path, "w", buffer_size)
+
+
+def read_increco_columns(file_path):
+    """The ColumnarFile of a text or binary increco file."""
+    if not is_binary_increco_file(file_path):
+        return read_columns(file_path)
+    return parse_columns(BinaryIncreco(file_path).to_text())
+
+
+def convert_increco_file(source_path, target_path):
+    """Convert a text increco file to the binary form or back, according
+    to the source's format."""
+    if is_binary_increco_file(source_path):
+        with open(target_path, "w") as f:
+            f.write(BinaryIncreco(source_path).to_text())
+    else:
+        write_binary_increco(target_path, read_columns(source_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert an increco file\
+        to the binary form or back.')
+    parser.add_argument('source', type=str,
+                        help='The text or binary increco file.')
+    parser.add_argument('target', type=str,
+                        help='The file to write in the other form.')
+    args = parser.parse_args()
+    convert_increco_file(args.source, args.target)
+
+
+if __name__ == '__main__':
+    main()
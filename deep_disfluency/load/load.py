@@ -1,10 +1,7 @@
 import urllib
 import logging
 import os
-import csv
 import numpy as np
-import pandas as pd
-from copy import deepcopy
 from collections import defaultdict
 
 from deep_disfluency.utils.tools import convert_from_eval_tags_to_inc_disfluency_tags
@@ -15,6 +12,7 @@ from deep_disfluency.utils.tools import convert_to_simple_label
 from deep_disfluency.utils.tools import convert_from_full_tag_set_to_idx
 from deep_disfluency.feature_extraction.feature_utils \
     import fill_in_time_approximations
+from deep_disfluency.load.columnar import parse_columns, read_columns
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +21,7 @@ DATAPREFIX = os.path.dirname(os.path.realpath(__file__)) + os.path.sep +\
 
 
 def open_with_pandas_read_csv(filename, header=None, delim="\t"):
+    import pandas as pd
     df = pd.read_csv(filename, sep=delim, header=header)
     data = df.values
     return data
@@ -125,6 +124,58 @@ def load_tags(filepath):
     return tag_dictionary
 
 
+def _fake_timings(utterances):
+    """The 'fake' (start, end) timings of the words of each of the
+    (reference, start, end) utterances, incrementing by one each word
+    from 0 at the start of each dialogue."""
+    offsets = []
+    current_dialogue = None
+    dialogue_start = 0
+    for utt_reference, start, end in utterances:
+        if not utt_reference.split(":")[0] == current_dialogue:
+            current_dialogue = utt_reference.split(":")[0]
+            dialogue_start = start
+        offsets.append((start - dialogue_start, end - dialogue_start))
+    fake = [(t, t + 1) for t in xrange(max([0] + [e for _, e in offsets]))]
+    return [tuple(fake[start:end]) for start, end in offsets]
+
+
+def _utterance_rep_arrays(utt_reference, currentWords, currentPOS,
+                           currentTags, word_rep, pos_rep, tag_rep,
+                           representation, limit):
+    """The word, pos and tag arrays of an utterance for load_data_from_file.
+    """
+    if "0" in representation: #turn taking only
+        currentTags = [""] * len(currentTags)
+    else:
+        currentTags = convert_from_eval_tags_to_inc_disfluency_tags(currentTags, currentWords, representation=representation, limit=limit)
+    if 'trp' in representation:
+        currentTags = add_word_continuation_tags(currentTags)
+    if 'simple' in representation:
+        currentTags = map(lambda x : convert_to_simple_label(x,rep=representation), currentTags)
+    words = []
+    pos_tags = []
+    tags = []
+    for i in range(0,len(currentTags)):
+        w = word_rep.get(currentWords[i])
+        pos = pos_rep.get(currentPOS[i])
+        tag = tag_rep.get(currentTags[i]) # NB POS tags in switchboard at l[2]
+        if w == None:
+            logging.info("No word rep for :" + currentWords[i])
+            w = word_rep.get("<unk>")
+        if pos == None:
+            logging.info("No pos rep for :" + currentPOS[i])
+            pos = pos_rep.get("<unk>")
+        if tag == None:
+            logging.info("No tag rep for:" + currentTags[i])
+            print utt_reference, currentTags, words
+            raise Exception("No tag rep for:" + currentTags[i])
+        words.append(w)
+        pos_tags.append(pos)
+        tags.append(tag)
+    return np.asarray(words), np.asarray(pos_tags), np.asarray(tags)
+
+
 def load_data_from_file(f, word_rep, pos_rep, tag_rep, representation="1", limit=8, n_seq=None):
     """Loads from file into five lists of arrays of equal length:
     one for utterance iDs (IDs))
@@ -136,304 +187,152 @@ def load_data_from_file(f, word_rep, pos_rep, tag_rep, representation="1", limit
     Converts them into arrays of one-hot representations."""
      
     print "loading data", f.name
-    count_seq = 0
-    #count_step = 0
     IDs = []
     seq = []
     pos_seq = []
     targets = []
-    timings = []
 
-    reader=csv.reader(f,delimiter='\t')
-    counter = 0
-    utt_reference = ""
-    currentWords = []
-    currentPOS = []
-    currentTags = []
-    currentTimings = []
-    current_fake_time = 0 # marks the current fake time for the dialogue (i.e. end of word)
-    current_dialogue = ""
-    
-    #corpus = "" # can write to file
-    for ref,timing,word,postag,disftag in reader: #mixture of POS and Words
-        #TODO, for now 'fake' timing will increment by one each time
-        counter+=1
-        
-        if not ref == "":
-            if count_seq>0: #do not reset the first time
-                #convert to the inc tags
-                if "0" in representation: #turn taking only
-                    currentTags = [""] * len(currentTags)
-                else:
-                    currentTags = convert_from_eval_tags_to_inc_disfluency_tags(currentTags, currentWords, representation=representation, limit=limit)
-                if 'trp' in representation:
-                    currentTags = add_word_continuation_tags(currentTags)
-                if 'simple' in representation:
-                    currentTags = map(lambda x : convert_to_simple_label(x,rep=representation), currentTags)
-                #corpus+=utt_reference #write data to a file for checking
-                #convert to vectors
-                words = []
-                pos_tags = []
-                tags = []
-                for i in range(0,len(currentTags)):
-                    w = word_rep.get(currentWords[i])
-                    pos = pos_rep.get(currentPOS[i])
-                    tag = tag_rep.get(currentTags[i]) # NB POS tags in switchboard at l[2]
-                    if w == None:
-                        logging.info("No word rep for :" + currentWords[i])
-                        w = word_rep.get("<unk>")
-                    if pos == None:
-                        logging.info("No pos rep for :" + currentPOS[i])
-                        pos = pos_rep.get("<unk>")
-                    if tag == None:
-                        logging.info("No tag rep for:" + currentTags[i])
-                        print utt_reference, currentTags, words
-                        raise Exception("No tag rep for:" + currentTags[i])
-                    words.append(w)
-                    pos_tags.append(pos)
-                    tags.append(tag)
-                x = np.asarray(words)
-                p = np.asarray(pos_tags)
-                y = np.asarray(tags)
-                seq.append(x)
-                pos_seq.append(p)
-                targets.append(y)
-                IDs.append(utt_reference)
-                timings.append(tuple(currentTimings))
-                #reset the words
-                currentWords = []
-                currentPOS = []
-                currentTags = []
-                currentTimings = []
-            #set the utterance reference
-            count_seq+=1
-            utt_reference = ref
-            if not utt_reference.split(":")[0] == current_dialogue:
-                current_dialogue = utt_reference.split(":")[0]
-                current_fake_time = 0 #TODO fake for now- reset the current beginning of word time
-        currentWords.append(word)
-        currentPOS.append(postag)
-        currentTags.append(disftag)
-        currentTimings.append((current_fake_time,current_fake_time+1))
-        current_fake_time+=1
-    #flush
-    if not currentWords == []:
-        if "0" in representation: #turn taking only
-            currentTags = [""] * len(currentTags)
-        else:
-            currentTags = convert_from_eval_tags_to_inc_disfluency_tags(currentTags, currentWords, representation=representation, limit=limit)
-        if 'trp' in representation:
-            currentTags = add_word_continuation_tags(currentTags)
-        if 'simple' in representation:
-            currentTags = map(lambda x : convert_to_simple_label(x,rep=representation), currentTags)
-        words = []
-        pos_tags = []
-        tags = []
-        for i in range(0,len(currentTags)):
-            w = word_rep.get(currentWords[i])
-            pos = pos_rep.get(currentPOS[i])
-            tag = tag_rep.get(currentTags[i]) # NB POS tags in switchboard at l[2]
-            if w == None:
-                logging.info("No word rep for :" + currentWords[i])
-                w = word_rep.get("<unk>")
-            if pos == None:
-                logging.info("No pos rep for :" + currentPOS[i])
-                pos = pos_rep.get("<unk>")
-            if tag == None:
-                logging.info("No tag rep for:" + currentTags[i])
-                print utt_reference, currentTags, words
-                raise Exception("No tag rep for:" + currentTags[i])
-            words.append(w)
-            pos_tags.append(pos)
-            tags.append(tag)
-        x = np.asarray(words)
-        p = np.asarray(pos_tags)
-        y = np.asarray(tags)
+    columns = parse_columns(f.read()) # the csv corpus format
+    all_words = columns.column(2)
+    all_pos = columns.column(3)
+    all_tags = columns.column(4)
+    utterances = columns.utterances()
+    #TODO, for now 'fake' timing will increment by one each time
+    timings = _fake_timings(utterances)
+    for utt_reference, start, end in utterances:
+        x, p, y = _utterance_rep_arrays(utt_reference, all_words[start:end],
+                                        all_pos[start:end],
+                                        all_tags[start:end], word_rep,
+                                        pos_rep, tag_rep, representation,
+                                        limit)
         seq.append(x)
         pos_seq.append(p)
         targets.append(y)
         IDs.append(utt_reference)
-        timings.append(tuple(currentTimings))
-        
+
     assert len(seq) == len(targets) == len(pos_seq)
     print "loaded " + str(len(seq)) + " sequences"
     f.close()
     return (IDs,timings,seq,pos_seq,targets)
 
 def load_increco_data_from_file(increco_filename,word_2_ind,pos_2_ind):
-    """Loads increco style data from file.
+    """Loads increco style data from file (see columnar.py).
     For now returns word and pos data only"""
     all_speakers = []
-    lex_data = []
-    pos_data = []
-    frames = []
-    latest_increco = []
-    latest_pos = []
-    file = open(increco_filename)
-    started = False
-    conv_no = ""
-    prev_word = -1
-    prev_pos = -1
-    for line in file:
-        if "Time:" in line:
-            if not latest_increco == []:
-                lex_data.append(deepcopy(latest_increco))
-                pos_data.append(deepcopy(latest_pos))
+    columns = read_columns(increco_filename)
+    starts = columns.float_column(0).tolist()
+    ends = columns.float_column(1).tolist()
+    words = columns.id_column(2, word_2_ind).tolist()
+    pos_tags = columns.id_column(3, pos_2_ind).tolist()
+    for speaker_index, conv_no in enumerate(columns.speakers):
+        lex_data = []
+        pos_data = []
+        prev_word = -1
+        prev_pos = -1
+        for start, end in columns.speaker_updates(speaker_index):
             latest_increco = []
             latest_pos = []
-            continue
-        if "File:" in line:
-            if not started:
-                started = True
-            else:
-                #flush
-                if not latest_increco == []:
-                    lex_data.append(deepcopy(latest_increco))
-                    pos_data.append(deepcopy(latest_pos))
-                #fake
-                #print lex_data
-                frames = [x[-1][-1] for x in lex_data] #last word end time
-                acoustic_data = [0,] * len(lex_data) #fakes..
-                indices = [0,] * len(lex_data)
-                labels = [0,] * len(lex_data)
-                all_speakers.append((conv_no, (frames, acoustic_data, lex_data, pos_data, indices, labels)))
-                #reset
-                lex_data = []
-                pos_data = []
-                latest_increco = []
-                latest_pos = []
-                prev_word = -1
-                prev_pos = -1
-                
-            conv_no = line.strip("\n").replace("File: ","")
-            continue
-        if line.strip("\n") == "":
-            continue
-        spl = line.strip("\n").split("\t")
-        start = float(spl[0])
-        end = float(spl[1])
-        if spl[2] in word_2_ind.keys():
-            word = word_2_ind[spl[2]]
-        else:
-            word = word_2_ind["<unk>"]
-        if spl[3] in pos_2_ind.keys():
-            pos = pos_2_ind[spl[3]]
-        else:
-            pos = pos_2_ind["<unk>"]
-        latest_increco.append(([prev_word, word],start,end))
-        latest_pos.append(deepcopy([prev_pos, pos]))
-        prev_word  = word
-        prev_pos = pos
-    
-    #flush
-    if not latest_increco == []:
-        lex_data.append(latest_increco)
-        pos_data.append(latest_pos)
-    frames = [x[-1][-1] for x in lex_data] #last word end time
-    acoustic_data = [0,] * len(lex_data) #fakes..
-    indices = [0,] * len(lex_data)
-    labels = [0,] * len(lex_data)
-    all_speakers.append((conv_no, (frames, acoustic_data, lex_data, pos_data, indices, labels)))
+            for i in xrange(start, end):
+                latest_increco.append(([prev_word, words[i]], starts[i],
+                                       ends[i]))
+                latest_pos.append([prev_pos, pos_tags[i]])
+                prev_word = words[i]
+                prev_pos = pos_tags[i]
+            lex_data.append(latest_increco)
+            pos_data.append(latest_pos)
+        frames = [x[-1][-1] for x in lex_data] #last word end time
+        acoustic_data = [0,] * len(lex_data) #fakes..
+        indices = [0,] * len(lex_data)
+        labels = [0,] * len(lex_data)
+        all_speakers.append((conv_no, (frames, acoustic_data, lex_data, pos_data, indices, labels)))
     print len(all_speakers), "speakers with increco input"
     return all_speakers
 
-def load_data_from_timings_file(filename,word_2_ind,pos_2_ind):
-    """Loads from disfluency detection with timings file."""
-    all_speakers = []
-    lex_data = []
-    pos_data = []
-    frames = []
-    labels = []
-    
-    latest_increco = []
-    latest_pos = []
-    latest_labels = []
-    
-    file = open(filename)
-    started = False
-    conv_no = ""
-    prev_word = -1
-    prev_pos = -1
-    for line in file:
-        if "File:" in line:
-            if not started:
-                started = True
+
+def iter_increco_updates_from_file(increco_filename):
+    """Streams increco style ASR results from file one update at a time,
+    so memory stays flat however large the file is.
+
+    Yields (speaker, time, words) triples where words is the list of
+    (word, start, end, pos) tuples of that update, pos being None
+    for files without POS tags. Both the ASR output layout
+    (word, start, end) and the POS tagged layout (start, end, word, pos)
+    are read. Speakers are introduced by "File:" or "Speaker:" lines.
+    """
+    speaker = ""
+    time = None
+    words = []
+    increco_file = open(increco_filename)
+    for line in increco_file:
+        line = line.strip("\n")
+        if line.startswith("File:") or line.startswith("Speaker:") or \
+                line.startswith("Time:"):
+            if not words == []:
+                yield speaker, time, words
+                words = []
+            if line.startswith("Time:"):
+                time = float(line.replace("Time:", ""))
             else:
-                #flush
-                #print line
-                if not latest_increco == []:
-                    shift = -1
-                    for i in range(0,len(latest_increco)):
-                        triple = latest_increco[i]
-                        if triple[1] == triple[2]:
-                            #print "same timing!", triple
-                            shift = i
-                            break
-                    if shift >-1:
-                        latest_increco = fill_in_time_approximations(latest_increco,shift)
-                    lex_data.append(deepcopy(latest_increco))
-                    pos_data.append(deepcopy(latest_pos))
-                    #convert to the disfluency tags for this
-                    #latest_labels = convertFromEvalTagsToIncDisfluencyTags()
-                    labels.extend(deepcopy(latest_labels))
-                #fake
-                #print lex_data
-                frames = [x[-1][-1] for x in lex_data] #last word end time
-                acoustic_data = [0,] * len(lex_data) #fakes..
-                indices = [0,] * len(lex_data)
-                
-                all_speakers.append((conv_no, (frames, acoustic_data, lex_data, pos_data, indices, labels)))
-                #reset
-                lex_data = []
-                pos_data = []
-                latest_increco = []
-                latest_pos = []
-                latest_labels = []
-                prev_word = -1
-                prev_pos = -1
-                
-            conv_no = line.strip("\n").replace("File: ","")
+                speaker = line.split(":", 1)[1].strip()
+                time = None
             continue
-        if line.strip("\n") == "":
+        if line.strip() == "":
             continue
-        spl = line.strip("\n").split("\t")
-        start = float(spl[1])
-        end = float(spl[2])
-        if spl[3] in word_2_ind.keys():
-            word = word_2_ind[spl[3]]
-        else:
-            word = word_2_ind["<unk>"]
-        if spl[4] in pos_2_ind.keys():
-            pos = pos_2_ind[spl[4]]
-        else:
-            pos = pos_2_ind["<unk>"]
-        #need to convert to the right rep here
-        tag = spl[5]
-        
-        
-        latest_increco.append(([prev_word, word],start,end))
-        latest_pos.append(deepcopy([prev_pos, pos]))
-        latest_labels.append(tag)
-        prev_word  = word
-        prev_pos = pos
-    
-    #flush
-    if not latest_increco == []:
-        shift = -1
-        for i in range(0,len(latest_increco)):
-            triple = latest_increco[i]
-            if triple[1] == triple[2]:
-                shift = i
-                break
-        if shift > -1:
-            latest_increco = fill_in_time_approximations(latest_increco,shift)
-        lex_data.append(latest_increco)
-        pos_data.append(latest_pos)
-        labels.extend(latest_labels)
-    frames = [x[-1][-1] for x in lex_data] #last word end time
-    acoustic_data = [0,] * len(lex_data) #fakes..
-    indices = [0,] * len(lex_data)
-    all_speakers.append((conv_no, (frames, acoustic_data, lex_data, pos_data, indices, labels)))
+        spl = line.split("\t")
+        try:
+            start = float(spl[0])
+        except ValueError:
+            words.append((spl[0], float(spl[1]), float(spl[2]), None))
+            continue
+        pos = spl[3] if len(spl) > 3 else None
+        words.append((spl[2], start, float(spl[1]), pos))
+    if not words == []:
+        yield speaker, time, words
+    increco_file.close()
+
+def load_data_from_timings_file(filename,word_2_ind,pos_2_ind):
+    """Loads from disfluency detection with timings file
+    (see columnar.py)."""
+    all_speakers = []
+    columns = read_columns(filename)
+    starts = columns.float_column(1).tolist()
+    ends = columns.float_column(2).tolist()
+    words = columns.id_column(3, word_2_ind).tolist()
+    pos_tags = columns.id_column(4, pos_2_ind).tolist()
+    #need to convert to the right rep here
+    tags = columns.column(5)
+    for speaker_index, conv_no in enumerate(columns.speakers):
+        lex_data = []
+        pos_data = []
+        labels = []
+        prev_word = -1
+        prev_pos = -1
+        for start, end in columns.speaker_updates(speaker_index):
+            latest_increco = []
+            latest_pos = []
+            for i in xrange(start, end):
+                latest_increco.append(([prev_word, words[i]], starts[i],
+                                       ends[i]))
+                latest_pos.append([prev_pos, pos_tags[i]])
+                prev_word = words[i]
+                prev_pos = pos_tags[i]
+            shift = -1
+            for i in range(0,len(latest_increco)):
+                triple = latest_increco[i]
+                if triple[1] == triple[2]:
+                    shift = i
+                    break
+            if shift > -1:
+                latest_increco = fill_in_time_approximations(latest_increco,shift)
+            lex_data.append(latest_increco)
+            pos_data.append(latest_pos)
+            #convert to the disfluency tags for this
+            #latest_labels = convertFromEvalTagsToIncDisfluencyTags()
+            labels.extend(tags[start:end])
+        frames = [x[-1][-1] for x in lex_data] #last word end time
+        acoustic_data = [0,] * len(lex_data) #fakes..
+        indices = [0,] * len(lex_data)
+        all_speakers.append((conv_no, (frames, acoustic_data, lex_data, pos_data, indices, labels)))
     print len(all_speakers), "speakers with timings input"
     return all_speakers
     
@@ -447,76 +346,32 @@ def get_tag_data_from_corpus_file(f, representation="1", limit=8):
      
     NB this does not convert them into one-hot arrays, just outputs lists of string tags in GOLD form."""
      
-    f = open(f)
-    print "loading data", f.name
-    count_seq = 0
+    print "loading data", f
     IDs = []
     seq = []
     pos_seq = []
     targets = []
-    timings = []
-    currentTimings = []
-    current_fake_time = 0 # marks the current fake time for the dialogue (i.e. end of word)
-    current_dialogue = ""
-    
-    reader=csv.reader(f,delimiter='\t')
-    counter = 0
-    utt_reference = ""
-    currentWords = []
-    currentPOS = []
-    currentTags = []
-    current_fake_time = 0
-    
-    #corpus = "" # can write to file
-    for ref,timing,word,postag,disftag in reader: #mixture of POS and Words
-        counter+=1
-        if not ref == "":
-            if count_seq>0: #do not reset the first time
-                #convert to the inc tags
-                #currentTags = convertFromEvalTagsToIncDisfluencyTags(currentTags, currentWords, representation, limit)
-                if 'trp' in representation:
-                    currentTags = add_word_continuation_tags(currentTags)
-                if 'simple' in representation:
-                    currentTags = map(lambda x : convert_to_simple_label(x), currentTags)
-                #corpus+=utt_reference #write data to a file for checking
-                #convert to vectors
-                seq.append(tuple(currentWords))
-                pos_seq.append(tuple(currentPOS))
-                targets.append(tuple(currentTags))
-                IDs.append(utt_reference)
-                timings.append(tuple(currentTimings))
-                #reset the words
-                currentWords = []
-                currentPOS = []
-                currentTags = []
-                currentTimings = []
-            #set the utterance reference
-            count_seq+=1
-            utt_reference = ref
-            if not utt_reference.split(":")[0] == current_dialogue:
-                current_dialogue = utt_reference.split(":")[0]
-                current_fake_time = 0 #TODO fake for now- reset the current beginning of word time
-        currentWords.append(word)
-        currentPOS.append(postag)
-        currentTags.append(disftag)
-        currentTimings.append((current_fake_time,current_fake_time+1))
-        current_fake_time+=1
-    #flush
-    if not currentWords == []:
-        #currentTags = convertFromEvalTagsToIncDisfluencyTags(currentTags, currentWords, limit=8)
+
+    columns = read_columns(f) # the csv corpus format
+    all_words = columns.column(2)
+    all_pos = columns.column(3)
+    all_tags = columns.column(4)
+    utterances = columns.utterances()
+    timings = _fake_timings(utterances) #TODO fake for now
+    for utt_reference, start, end in utterances:
+        currentTags = all_tags[start:end]
+        #currentTags = convertFromEvalTagsToIncDisfluencyTags(currentTags, currentWords, representation, limit)
         if 'trp' in representation:
             currentTags = add_word_continuation_tags(currentTags)
         if 'simple' in representation:
             currentTags = map(lambda x : convert_to_simple_label(x), currentTags)
-        seq.append(tuple(currentWords))
-        pos_seq.append(tuple(currentPOS))
+        seq.append(tuple(all_words[start:end]))
+        pos_seq.append(tuple(all_pos[start:end]))
         targets.append(tuple(currentTags))
         IDs.append(utt_reference)
-        timings.append(currentTimings)
         
     assert len(seq) == len(targets) == len(pos_seq)
     print "loaded " + str(len(seq)) + " sequences"
-    f.close()
     return (IDs,timings,seq,pos_seq,targets)
 
 
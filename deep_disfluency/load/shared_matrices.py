@@ -0,0 +1,153 @@
+"""The dialogue feature matrices of a folder (as written by
+save_feature_matrices.py, one .npy file per dialogue) packed into
+memory-mapped arrays, so the training jobs of a hyperparameter sweep
+(experiments/sweep.py) share one checked copy of the data, mapped read
+only with its pages shared by the OS, rather than each job checking and
+np.loading every file again every epoch.
+
+pack_matrices writes, for a folder, the files:
+
+    <name>.ids.npy -- int64 rows of utt_index, word_idx, pos_idx, label
+    <name>.extra.npy -- float64 rows of the features between the pos_idx
+    and label (acoustic and language model features), if there are any
+    <name>.json -- the dialogue file names (in os.listdir order, the order
+    train_net reads them in), their row offsets, the row length and the
+    size and mtime of each matrix file
+
+checking on the way that every matrix has the same row length and only
+numbers in its index and label columns (the matrices of older feature
+extractions can have None for unknown words, which training fails on
+part way through its first epoch). load_shared_matrices packs a folder
+if it has changed since it was last packed and maps it as a
+SharedMatrices, whose matrices have the layout of the files: a view of
+the ids when there are no extra features, else an object array, as
+np.load gives for the files.
+"""
+import json
+import os
+
+import numpy as np
+
+
+def _stamps(folder, names):
+    stamps = []
+    for name in names:
+        stat = os.stat(os.path.join(folder, name))
+        stamps.append([stat.st_size, stat.st_mtime])
+    return stamps
+
+
+def _matrix_files(folder):
+    return [f for f in os.listdir(folder) if f.endswith(".npy")]
+
+
+def pack_matrices(folder, target_prefix):
+    """Pack the dialogue matrices of the folder into the files
+    target_prefix.ids.npy, .extra.npy and .json (see module docstring),
+    raising a ValueError if they are not all consistent numeric matrices.
+    Returns the json header."""
+    names = _matrix_files(folder)
+    ids = []
+    extra = []
+    row_length = None
+    for name in names:
+        matrix = np.load(os.path.join(folder, name), allow_pickle=True)
+        if matrix.ndim != 2 or matrix.shape[1] < 4:
+            raise ValueError("{} is not a dialogue matrix, shape {}".format(
+                name, matrix.shape))
+        if row_length is None:
+            row_length = matrix.shape[1]
+        elif matrix.shape[1] != row_length:
+            raise ValueError("{} has rows of length {}, not {}".format(
+                name, matrix.shape[1], row_length))
+        try:
+            ids.append(np.asarray(matrix[:, [0, 1, 2, -1]].tolist(),
+                                  dtype=np.int64).reshape(-1, 4))
+            if row_length > 4:
+                extra.append(np.asarray(matrix[:, 3:-1].tolist(),
+                                        dtype=np.float64))
+        except (TypeError, ValueError):
+            raise ValueError("{} has values which are not numbers, e.g. "
+                             "None for unknown words".format(name))
+    offsets = np.cumsum([0] + [len(x) for x in ids]).tolist()
+    np.save(target_prefix + ".ids.npy",
+            np.concatenate(ids) if ids else
+            np.zeros((0, 4), dtype=np.int64))
+    if row_length > 4:
+        np.save(target_prefix + ".extra.npy", np.concatenate(extra))
+    header = {"folder": os.path.abspath(folder),
+              "names": names,
+              "offsets": offsets,
+              "row_length": row_length or 4,
+              "stamps": _stamps(folder, names)}
+    # the header last, so a partly packed folder is packed again
+    with open(target_prefix + ".json", "w") as f:
+        json.dump(header, f)
+    return header
+
+
+def _is_packed(folder, target_prefix):
+    try:
+        with open(target_prefix + ".json") as f:
+            header = json.load(f)
+    except (IOError, ValueError):
+        return False
+    names = _matrix_files(folder)
+    return header["folder"] == os.path.abspath(folder) and \
+        sorted(header["names"]) == sorted(names) and \
+        header["stamps"] == _stamps(folder, header["names"])
+
+
+class SharedMatrices(object):
+    """The packed dialogue matrices of a folder, mapped read only."""
+    def __init__(self, target_prefix):
+        with open(target_prefix + ".json") as f:
+            header = json.load(f)
+        self.folder = header["folder"]
+        self.names = header["names"]
+        self.offsets = header["offsets"]
+        self.row_length = header["row_length"]
+        self.ids = np.load(target_prefix + ".ids.npy", mmap_mode="r")
+        self.extra = None
+        if self.row_length > 4:
+            self.extra = np.load(target_prefix + ".extra.npy",
+                                 mmap_mode="r")
+
+    def __len__(self):
+        return len(self.names)
+
+    def matrix(self, i):
+        """The matrix of the i-th dialogue, in the layout of its file."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if self.extra is None:
+            return self.ids[start:end]
+        matrix = np.empty((end - start, self.row_length), dtype=object)
+        matrix[:, :3] = self.ids[start:end, :3]
+        matrix[:, 3:-1] = self.extra[start:end]
+        matrix[:, -1] = self.ids[start:end, 3]
+        return matrix
+
+    def __iter__(self):
+        """The (file name, matrix) of each dialogue, made as needed."""
+        for i, name in enumerate(self.names):
+            yield name, self.matrix(i)
+
+    def verify(self, n_lm=0, n_acoustic=0):
+        """Whether the matrices' rows have the length for the numbers of
+        language model and acoustic features, as
+        verify_dialogue_data_matrices_from_folder checks."""
+        return self.row_length == 3 + n_acoustic + n_lm + 1
+
+
+def load_shared_matrices(folder, cache_dir, name=None):
+    """The SharedMatrices of the folder, packed in cache_dir (under the
+    folder's name by default) if not already packed since the folder's
+    matrices last changed."""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    target_prefix = os.path.join(
+        cache_dir, name or os.path.basename(os.path.normpath(folder)))
+    if not _is_packed(folder, target_prefix):
+        print "packing the dialogue matrices of", folder
+        pack_matrices(folder, target_prefix)
+    return SharedMatrices(target_prefix)
@@ -30,6 +30,12 @@ def init_weight(shape, name, sample='uni', seed=None):
 
 dtype = T.config.floatX  # @UndefinedVariable
 
+MISSING_W_XO = ("{0} has no W_xo.npy: it was saved before the LSTM trained "
+                "and saved its output gate's input weights W_xo, so they "
+                "were random at every load. Give an output gate seed "
+                "(lstm_output_gate_seed of the tagger) to load it with a "
+                "W_xo drawn from that seed, or retrain it.")
+
 
 class LSTM(object):
 
@@ -87,12 +93,12 @@ class LSTM(object):
         self.params = [self.W_xi, self.W_hi, self.W_ci, self.b_i,
                        self.W_xf, self.W_hf, self.W_cf, self.b_f,
                        self.W_xc, self.W_hc, self.b_c,
-                       self.W_ho, self.W_co, self.W_co, self.b_o,
+                       self.W_xo, self.W_ho, self.W_co, self.b_o,
                        self.W_hy, self.b_y, self.emb]
         self.names = ["W_xi", "W_hi", "W_ci", "b_i",
                       "W_xf", "W_hf", "W_cf", "b_f",
                       "W_xc", "W_hc", "b_c",
-                      "W_ho", "W_co", "W_co", "b_o",
+                      "W_xo", "W_ho", "W_co", "b_o",
                       "W_hy", "b_y", "embeddings"]
 
         def step_lstm(x_t, h_tm1, c_tm1):
@@ -266,9 +272,27 @@ class LSTM(object):
         """ Load the dataset into shared variables """
         return theano.shared(np.asarray(mycorpus, dtype='int32'), borrow=True)
 
-    def load_weights_from_folder(self, folder):
+    def load_weights_from_folder(self, folder, output_gate_seed=None):
+        """Load the weights saved by save.
+
+        Folders saved before W_xo was in the params and names (W_co was
+        there twice) have no W_xo.npy: those models were trained with a
+        random W_xo, drawn again at every load. They are refused with a
+        ValueError unless an output_gate_seed is given, when W_xo is
+        initialised from that seed, so the same on every load.
+        """
         for name, param in zip(self.names, self.params):
-            param.set_value(np.load(os.path.join(folder, name + ".npy")))
+            file_path = os.path.join(folder, name + ".npy")
+            if name == "W_xo" and not os.path.exists(file_path):
+                if output_gate_seed is None:
+                    raise ValueError(MISSING_W_XO.format(folder))
+                print "WARNING no W_xo in", folder, "using seed", \
+                    output_gate_seed
+                param.set_value(init_weight(param.get_value().shape, name,
+                                            seed=output_gate_seed)
+                                .get_value())
+                continue
+            param.set_value(np.load(file_path))
 
     def load_weights(self, emb=None, c0=None, h0=None):
         if emb is not None:
@@ -316,7 +340,7 @@ class LstmMiniBatch:
         self.params = [self.W_xi, self.W_hi, self.W_ci, self.b_i,
                        self.W_xf, self.W_hf, self.W_cf, self.b_f,
                        self.W_xc, self.W_hc, self.b_c,
-                       self.W_ho, self.W_co, self.W_co, self.b_o,
+                       self.W_xo, self.W_ho, self.W_co, self.b_o,
                        self.W_hy, self.b_y]
 
         def step_lstm(x_t, h_tm1, c_tm1):
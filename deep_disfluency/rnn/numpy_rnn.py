@@ -0,0 +1,227 @@
+"""Numpy-only forward passes of the Elman and LSTM taggers.
+
+These compute exactly the same outputs as the soft_max and
+soft_max_return_hidden_layer theano functions of rnn.elman.Elman and
+rnn.lstm.LSTM, but without building or compiling any theano graph, so a
+tagger can be constructed from saved weights in milliseconds. They are
+inference only (no training) and hold the weight arrays as given, so
+read-only, memory mapped arrays (see tagger.model_bundle) are used in place
+and shared between processes. The weight matrices can also be reduced
+precision QuantizedArrays (see rnn/quantization.py).
+"""
+import os
+
+import numpy as np
+
+from deep_disfluency.embeddings.load_embeddings import open_embeddings
+from deep_disfluency.rnn.quantization import QuantizedArray
+
+# the weights of each model type, as saved in a model folder
+WEIGHT_NAMES = {
+    "elman": ["embeddings", "Wx", "Wh", "W", "bh", "b", "h0"],
+    "lstm": ["embeddings", "W_xi", "W_hi", "W_ci", "b_i",
+             "W_xf", "W_hf", "W_cf", "b_f",
+             "W_xc", "W_hc", "b_c",
+             "W_xo", "W_ho", "W_co", "b_o",
+             "W_hy", "b_y", "h0", "c0"]
+}
+# the initial states, zeros if not saved (see load_weights_from_folder)
+INITIAL_STATE_NAMES = ["h0", "c0"]
+# the hidden to hidden weights, giving the size of the hidden layer
+HIDDEN_WEIGHT_NAME = {"elman": "Wh", "lstm": "W_hi"}
+# as rnn.lstm, which imports theano
+MISSING_W_XO = ("{0} has no W_xo.npy: it was saved before the LSTM trained "
+                "and saved its output gate's input weights W_xo, so they "
+                "were random at every load. Give an output gate seed "
+                "(lstm_output_gate_seed of the tagger) to load it with a "
+                "W_xo drawn from that seed, or retrain it.")
+
+
+def dot(x, W):
+    """np.dot(x, W) for a weight array or QuantizedArray W."""
+    if isinstance(W, QuantizedArray):
+        return W.rdot(x)
+    return np.dot(x, W)
+
+
+def dequantize(W):
+    if isinstance(W, QuantizedArray):
+        return W.dequantize()
+    return W
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class NumpyRNN(object):
+    """Shared input layer of the inference models.
+    The input at each step is the concatenation of the embeddings of
+    the word window and the one-hot vectors of the pos window, so its
+    product with an input weight matrix is the product of the embeddings
+    with the top rows of the matrix plus, for each pos in the window,
+    a single row of the bottom part: no one-hot matrix is built.
+    """
+
+    def __init__(self, emb, de, cs, npos):
+        self.emb = emb
+        self.de = de
+        self.cs = cs
+        self.npos = npos
+        self.pos_offsets = de * cs + np.arange(cs) * npos
+
+    def input_projection(self, W, idxs, pos_idxs):
+        idxs = np.asarray(idxs)
+        pos_idxs = np.asarray(pos_idxs)
+        n_emb = self.de * self.cs
+        x = dequantize(self.emb[idxs]).reshape((idxs.shape[0], n_emb))
+        return dot(x, W[:n_emb]) + \
+            dequantize(W[pos_idxs + self.pos_offsets]).sum(axis=1)
+
+    def load_weights(self, emb=None, c0=None, h0=None):
+        if emb is not None:
+            self.emb = emb
+        if c0 is not None:
+            self.c0 = c0
+        if h0 is not None:
+            self.h0 = h0
+
+    def soft_max(self, idxs, pos_idxs):
+        return self.soft_max_return_hidden_layer(idxs, pos_idxs)[-1]
+
+    def step_batch(self, idxs, pos_idxs, h0, c0=None):
+        """A single step for each of a batch of independent sequences,
+        idxs and pos_idxs being (batch, cs) windows and h0 (and c0)
+        (batch, nh) initial states, giving the same outputs row by row as
+        soft_max_return_hidden_layer on each window from its state.
+        """
+        raise NotImplementedError
+
+
+class NumpyElman(NumpyRNN):
+    """Inference only equivalent of rnn.elman.Elman (with na == 0)."""
+
+    def __init__(self, weights, de, cs, npos):
+        super(NumpyElman, self).__init__(weights["embeddings"], de, cs, npos)
+        self.Wx = weights["Wx"]
+        self.Wh = weights["Wh"]
+        self.W = weights["W"]
+        self.bh = weights["bh"]
+        self.b = weights["b"]
+        self.h0 = weights["h0"]
+
+    def soft_max_return_hidden_layer(self, idxs, pos_idxs):
+        x_Wx = self.input_projection(self.Wx, idxs, pos_idxs) + self.bh
+        h = np.empty((x_Wx.shape[0], self.Wh.shape[0]), dtype=x_Wx.dtype)
+        h_tm1 = self.h0
+        for t in range(x_Wx.shape[0]):
+            h_tm1 = h[t] = sigmoid(x_Wx[t] + dot(h_tm1, self.Wh))
+        return h, softmax(dot(h, self.W) + self.b)
+
+    def step_batch(self, idxs, pos_idxs, h0, c0=None):
+        h = sigmoid(self.input_projection(self.Wx, idxs, pos_idxs) +
+                    self.bh + dot(h0, self.Wh))
+        return h, softmax(dot(h, self.W) + self.b)
+
+
+class NumpyLSTM(NumpyRNN):
+    """Inference only equivalent of rnn.lstm.LSTM
+    (the peephole LSTM with a softmax output at each step).
+    """
+
+    def __init__(self, weights, de, cs, npos):
+        super(NumpyLSTM, self).__init__(weights["embeddings"], de, cs, npos)
+        for name in ["W_xi", "W_hi", "W_ci", "b_i",
+                     "W_xf", "W_hf", "W_cf", "b_f",
+                     "W_xc", "W_hc", "b_c",
+                     "W_xo", "W_ho", "W_co", "b_o",
+                     "W_hy", "b_y", "h0", "c0"]:
+            setattr(self, name, weights[name])
+
+    def soft_max_return_hidden_layer(self, idxs, pos_idxs):
+        # the input contributions to each gate for all steps at once
+        x_i = self.input_projection(self.W_xi, idxs, pos_idxs) + self.b_i
+        x_f = self.input_projection(self.W_xf, idxs, pos_idxs) + self.b_f
+        x_c = self.input_projection(self.W_xc, idxs, pos_idxs) + self.b_c
+        x_o = self.input_projection(self.W_xo, idxs, pos_idxs) + self.b_o
+        n_steps = x_i.shape[0]
+        h = np.empty((n_steps, self.W_hi.shape[0]), dtype=x_i.dtype)
+        c = np.empty_like(h)
+        h_tm1 = self.h0
+        c_tm1 = self.c0
+        for t in range(n_steps):
+            i_t = sigmoid(x_i[t] + dot(h_tm1, self.W_hi) +
+                          dot(c_tm1, self.W_ci))
+            f_t = sigmoid(x_f[t] + dot(h_tm1, self.W_hf) +
+                          dot(c_tm1, self.W_cf))
+            c_t = f_t * c_tm1 + i_t * np.tanh(x_c[t] +
+                                              dot(h_tm1, self.W_hc))
+            o_t = sigmoid(x_o[t] + dot(h_tm1, self.W_ho) +
+                          dot(c_t, self.W_co))
+            h_tm1 = h[t] = o_t * np.tanh(c_t)
+            c_tm1 = c[t] = c_t
+        return h, c, softmax(dot(h, self.W_hy) + self.b_y)
+
+    def step_batch(self, idxs, pos_idxs, h0, c0=None):
+        i = sigmoid(self.input_projection(self.W_xi, idxs, pos_idxs) +
+                    self.b_i + dot(h0, self.W_hi) + dot(c0, self.W_ci))
+        f = sigmoid(self.input_projection(self.W_xf, idxs, pos_idxs) +
+                    self.b_f + dot(h0, self.W_hf) + dot(c0, self.W_cf))
+        c = f * c0 + i * np.tanh(
+            self.input_projection(self.W_xc, idxs, pos_idxs) + self.b_c +
+            dot(h0, self.W_hc))
+        o = sigmoid(self.input_projection(self.W_xo, idxs, pos_idxs) +
+                    self.b_o + dot(h0, self.W_ho) + dot(c, self.W_co))
+        h = o * np.tanh(c)
+        return h, c, softmax(dot(h, self.W_hy) + self.b_y)
+
+
+def load_weights_from_folder(folder, model_type, output_gate_seed=None):
+    """The weights saved in a model folder (as by the theano models' save)
+    by name, as read only memory maps: the embeddings are opened with
+    open_embeddings, so all the models in a process using the same file
+    share one map, and only the rows of the words tagged are ever read.
+
+    The initial states (h0, c0) are zeros, as in the theano models, when
+    not saved. LSTM folders without the output gate's input weights W_xo
+    (saved before rnn.lstm.LSTM trained and saved them) are refused with a
+    ValueError unless an output_gate_seed is given, when W_xo is drawn
+    from it as by the theano LSTM given the same seed.
+    """
+    weights = {}
+    for name in WEIGHT_NAMES[model_type]:
+        file_path = os.path.join(folder, name + ".npy")
+        if name == "embeddings":
+            weights[name] = open_embeddings(file_path)
+        elif name in INITIAL_STATE_NAMES and not os.path.exists(file_path):
+            continue
+        elif name == "W_xo" and not os.path.exists(file_path):
+            if output_gate_seed is None:
+                raise ValueError(MISSING_W_XO.format(folder))
+            shape = np.load(os.path.join(folder, "W_xc.npy"),
+                            mmap_mode="r").shape
+            # as rnn.lstm.init_weight
+            weights[name] = np.random.RandomState(output_gate_seed).uniform(
+                low=-0.1, high=0.1, size=shape).astype(np.float32)
+        else:
+            weights[name] = np.load(file_path, mmap_mode="r")
+    hidden = weights[HIDDEN_WEIGHT_NAME[model_type]]
+    for name in INITIAL_STATE_NAMES:
+        if name in WEIGHT_NAMES[model_type] and name not in weights:
+            weights[name] = np.zeros(hidden.shape[0], dtype=hidden.dtype)
+    return weights
+
+
+def model_from_folder(folder, model_type, de, cs, npos,
+                      output_gate_seed=None):
+    """The numpy inference model of the type with the weights saved in
+    the model folder (see load_weights_from_folder)."""
+    model_class = {"elman": NumpyElman, "lstm": NumpyLSTM}[model_type]
+    return model_class(load_weights_from_folder(folder, model_type,
+                                                output_gate_seed),
+                       de=de, cs=cs, npos=npos)
@@ -0,0 +1,118 @@
+"""Reduced precision storage of the numpy inference models' weight matrices.
+
+Each 2-D weight matrix (the embeddings and the W_* matrices) is stored
+either as float16 or as int8 with a single symmetric scale per matrix
+(max(abs(W)) / 127), so a quarter of the float32 size, while the biases
+and initial states stay float32. The products are computed in float32:
+a matrix multiplied by (e.g. the hidden and output weights, or the top
+block of an input weight matrix) is converted for each product into a
+float32 scratch buffer reused by all the products of the thread, so no
+float32 copy of the weights is kept, and the rows looked up (the
+embeddings and pos rows of the input weights, by far the largest part)
+are only converted as needed.
+
+Quantized model bundles are written by tagger/quantize_bundle.py, which
+also reports the tagging accuracy against the full precision model.
+"""
+import threading
+
+import numpy as np
+
+QUANTIZATION_MODES = ["float16", "int8"]
+
+_scratch = threading.local()
+
+
+def _scratch_array(shape):
+    """A float32 array of the shape in the thread's scratch buffer, grown
+    to the largest size asked for, so only valid until the next call."""
+    size = int(np.prod(shape))
+    buffer = getattr(_scratch, "buffer", None)
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size, dtype=np.float32)
+        _scratch.buffer = buffer
+    return buffer[:size].reshape(shape)
+
+
+class QuantizedArray(object):
+    """A float16 or int8 (times scale) stand-in for a float weight array,
+    indexed as one (giving another QuantizedArray) and used in the numpy
+    models through rnn.numpy_rnn.dot and dequantize.
+    """
+    def __init__(self, data, scale=None):
+        self.data = data
+        self.scale = scale
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __getitem__(self, key):
+        return QuantizedArray(self.data[key], self.scale)
+
+    def dequantize(self):
+        """The data as a new float32 array (times the scale)."""
+        values = self.data.astype(np.float32)
+        if self.scale is not None:
+            values *= self.scale
+        return values
+
+    def rdot(self, x):
+        """np.dot(x, W), accumulated in float32, with W converted in the
+        scratch buffer and the product scaled rather than W."""
+        values = _scratch_array(self.data.shape)
+        values[...] = self.data
+        product = np.dot(np.asarray(x, dtype=np.float32), values)
+        if self.scale is not None:
+            product *= self.scale
+        return product
+
+
+def quantize_array(array, mode):
+    """The (data, scale) of the array in the mode, scale being None
+    for float16."""
+    if mode == "float16":
+        return np.asarray(array, dtype=np.float16), None
+    if mode == "int8":
+        max_abs = float(np.abs(array).max())
+        scale = np.float32(max_abs / 127 if max_abs > 0 else 1.0)
+        data = np.clip(np.round(np.asarray(array) / scale), -127, 127)
+        return data.astype(np.int8), scale
+    raise ValueError("unknown quantization mode {}, one of {}".format(
+        mode, QUANTIZATION_MODES))
+
+
+def quantize_weights(weights, mode):
+    """Quantize the 2-D arrays of the dict of weights by name, returning
+    the dict of arrays to save and the dict of the int8 scales by name.
+    """
+    quantized = {}
+    scales = {}
+    for name, array in weights.items():
+        if np.ndim(array) != 2:
+            quantized[name] = np.asarray(array, dtype=np.float32)
+            continue
+        quantized[name], scale = quantize_array(array, mode)
+        if scale is not None:
+            scales[name] = scale
+    return quantized, scales
+
+
+def quantized_weights(weights, scales):
+    """The weights as loaded from a quantized bundle, with those saved
+    in reduced precision as QuantizedArrays."""
+    loaded = {}
+    for name, array in weights.items():
+        if array.dtype in (np.float16, np.int8):
+            loaded[name] = QuantizedArray(array, scales.get(name))
+        else:
+            loaded[name] = array
+    return loaded
@@ -0,0 +1,258 @@
+"""An asyncio counterpart of the fluteline
+ASR adapter -> DeepTaggerModule -> sink pipeline.
+
+Each stream has a bounded input queue of word updates and a bounded output
+queue of tagged word updates. When a sink stops reading, the output queue
+fills, the stream's tagging task blocks on it and so stops reading its input
+queue, which in turn makes the producer's put block: backpressure all the
+way back to the ASR results rather than unbounded queues.
+The tagging calls run in an executor so the event loop stays responsive, and
+any number of streams can be multiplexed in one process without a thread per
+node.
+
+As the tagger is python 2 this uses trollius, the python 2 port of asyncio,
+so coroutines are written with yield From(...) and raise Return(...).
+
+Example:
+
+    pipeline = AsyncTaggerPipeline(SharedResourceTaggerFactory(
+        config_file="experiments/experiment_configs.csv",
+        config_number=35,
+        saved_model_dir="experiments/035/epoch_6",
+        use_timing_data=True))
+
+    @asyncio.coroutine
+    def transcribe(stream_id, watson_results):
+        stream = yield From(pipeline.open_stream(stream_id))
+        ...
+        yield From(stream.put_asr_result(data))  # blocks if tagger behind
+        ...
+        tagged = yield From(stream.get())  # None when closed
+"""
+import concurrent.futures
+import trollius as asyncio
+from trollius import From, Return
+
+from deep_disfluency.asr.ibm_watson import IBMWatsonAdapter
+from deep_tagger import DeepDisfluencyTagger
+from deep_tagger_module import WordUpdateTagger
+
+
+class SharedResourceTaggerFactory(object):
+    """Creates a tagger per stream, each a new_session() of one tagger
+    built on the first call, so they all share its RNN weights, decoder
+    tables, POS tagger, language models and timing model and only the
+    word graph, RNN state history and decoder state is made per stream.
+    The sessions must be used from a single thread, as by the default
+    executor of AsyncTaggerPipeline.
+    """
+    def __init__(self, **tagger_kwargs):
+        self.tagger_kwargs = tagger_kwargs
+        self.first_tagger = None
+
+    def __call__(self):
+        if self.first_tagger is None:
+            first = DeepDisfluencyTagger(**self.tagger_kwargs)
+            # build the lazily built components tagging uses before any
+            # session is made, else each session builds its own (the
+            # language models the decoder uses are built with it)
+            first.pos_tagger
+            self.first_tagger = first
+        return self.first_tagger.new_session()
+
+
+class _MessageCollector(object):
+    """Stands in for the output queue of a fluteline node."""
+    def __init__(self):
+        self.messages = []
+
+    def put(self, msg):
+        self.messages.append(msg)
+
+
+class AsyncTaggerStream(object):
+    """A single tagged word stream, e.g. one speaker's ASR results.
+    Word updates put in are tagged in order by its own tagger in the
+    pipeline's executor and the updated words (with their 'disf_tag' and
+    'pos_tag') can be got out in order, None signalling the end.
+    If tagging fails the stream stops and the error is raised by the get
+    after the words tagged before it, and by later puts.
+    """
+    def __init__(self, stream_id, disf_tagger, executor, max_queue_size,
+                 loop):
+        self.stream_id = stream_id
+        self.word_update_tagger = WordUpdateTagger(disf_tagger)
+        self.executor = executor
+        self.loop = loop
+        self.input = asyncio.Queue(maxsize=max_queue_size, loop=loop)
+        self.output = asyncio.Queue(maxsize=max_queue_size, loop=loop)
+        # the watson adapter only used for its update/rollback logic
+        self.asr_adapter = IBMWatsonAdapter()
+        self.asr_adapter.enter()
+        self.asr_adapter.output = _MessageCollector()
+        self.closed = False
+        self.error = None
+        self.task = asyncio.ensure_future(self._run(), loop=loop)
+
+    @asyncio.coroutine
+    def put_asr_result(self, data):
+        """Put a raw Watson transcription result in, waiting
+        while the stream's input queue is full."""
+        self.asr_adapter.consume(data)
+        word_updates = self.asr_adapter.output.messages
+        self.asr_adapter.output.messages = []
+        for word_update in word_updates:
+            yield From(self.put_word_update(word_update))
+
+    @asyncio.coroutine
+    def put_word_update(self, word_update):
+        """Put a word update dict in (as from IBMWatsonAdapter),
+        waiting while the stream's input queue is full."""
+        if self.error is not None:
+            raise self.error
+        if self.closed:
+            raise ValueError("stream {} is closed".format(self.stream_id))
+        yield From(self.input.put(word_update))
+
+    @asyncio.coroutine
+    def get(self):
+        """Get the next updated word dict, None once the stream
+        is closed and all its words have been tagged."""
+        word = yield From(self.output.get())
+        if word is None and self.error is not None:
+            raise self.error
+        raise Return(word)
+
+    @asyncio.coroutine
+    def close(self):
+        """No more input, the tagging task finishes after
+        the words already queued."""
+        if not self.closed:
+            self.closed = True
+            yield From(self.input.put(None))
+
+    @asyncio.coroutine
+    def _run(self):
+        closing = False
+        while not closing:
+            word_update = yield From(self.input.get())
+            if word_update is None:
+                break
+            # coalesce the updates already waiting so superseded
+            # revisions are never tagged
+            word_updates = [word_update]
+            while not self.input.empty():
+                word_update = self.input.get_nowait()
+                if word_update is None:
+                    closing = True
+                    break
+                word_updates.append(word_update)
+            try:
+                updated_words = yield From(self.loop.run_in_executor(
+                    self.executor,
+                    self.word_update_tagger.tag_word_updates,
+                    word_updates))
+            except Exception as e:
+                # the tagger no longer follows the word updates put in
+                self.error = e
+                break
+            for updated_word in updated_words:
+                yield From(self.output.put(updated_word))
+        if self.error is not None:
+            # release a producer waiting on the full input queue
+            while not self.input.empty():
+                self.input.get_nowait()
+        yield From(self.output.put(None))
+
+
+class AsyncTaggerPipeline(object):
+    """Multiplexes any number of AsyncTaggerStreams in one event loop.
+
+    :param tagger_factory: callable returning a new tagger for each stream,
+    e.g. a SharedResourceTaggerFactory
+    :param executor: the executor to run the tagging in. By default a
+    single thread, as the taggers of different streams share the
+    (not thread safe) RNN model, POS tagger and language models and are
+    CPU bound.
+    :param max_queue_size: bound on each stream's input and output queue
+    """
+    def __init__(self, tagger_factory, executor=None, max_queue_size=100,
+                 loop=None):
+        self.tagger_factory = tagger_factory
+        self.executor = executor or \
+            concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.max_queue_size = max_queue_size
+        self.loop = loop or asyncio.get_event_loop()
+        self.streams = {}
+
+    @asyncio.coroutine
+    def open_stream(self, stream_id):
+        """Returns a new stream, creating its tagger in the executor."""
+        if stream_id in self.streams:
+            raise ValueError("stream {} already open".format(stream_id))
+        disf_tagger = yield From(self.loop.run_in_executor(
+            self.executor, self.tagger_factory))
+        stream = AsyncTaggerStream(stream_id, disf_tagger, self.executor,
+                                   self.max_queue_size, self.loop)
+        self.streams[stream_id] = stream
+        raise Return(stream)
+
+    @asyncio.coroutine
+    def close_stream(self, stream_id):
+        """Close the stream and wait until all its words are tagged,
+        raising the stream's error if tagging failed."""
+        stream = self.streams.pop(stream_id)
+        yield From(stream.close())
+        yield From(stream.task)
+        if stream.error is not None:
+            raise stream.error
+
+    @asyncio.coroutine
+    def close(self):
+        for stream_id in list(self.streams.keys()):
+            yield From(self.close_stream(stream_id))
+
+
+if __name__ == '__main__':
+    fake_updates_raw = [
+        [('hello', 0, 1)],
+        [('hello', 0, 1), ('my', 1, 2)],
+        [('hello', 0.5, 1), ('my', 1, 2), ('name', 3, 4)],
+        [('hello', 0.5, 1), ('your', 1, 2), ('name', 3, 4)],
+        [('once', 3.4, 4), ('upon', 4.2, 4.6), ('on', 4.3, 4.8)]
+    ]
+    fake_updates_data = [
+        {'result_index': 0,
+         'results': [{'alternatives': [{'timestamps': update}]}]}
+        for update in fake_updates_raw]
+
+    pipeline = AsyncTaggerPipeline(SharedResourceTaggerFactory(
+        config_file="experiments/experiment_configs.csv",
+        config_number=35,
+        saved_model_dir="experiments/035/epoch_6",
+        use_timing_data=True), max_queue_size=2)
+
+    @asyncio.coroutine
+    def produce(stream):
+        for data in fake_updates_data:
+            yield From(stream.put_asr_result(data))
+        yield From(stream.close())
+
+    @asyncio.coroutine
+    def consume(stream):
+        while True:
+            word = yield From(stream.get())
+            if word is None:
+                break
+            print stream.stream_id, word
+
+    @asyncio.coroutine
+    def main():
+        tasks = []
+        for stream_id in ["A", "B"]:
+            stream = yield From(pipeline.open_stream(stream_id))
+            tasks.extend([produce(stream), consume(stream)])
+        yield From(asyncio.gather(*tasks))
+        yield From(pipeline.close())
+
+    pipeline.loop.run_until_complete(main())
@@ -1,15 +1,13 @@
 from __future__ import division
 import numpy as np
-import cPickle
 import os
-from copy import deepcopy
+from copy import copy, deepcopy
 import time
-from sklearn.metrics import precision_recall_fscore_support
-from sklearn.metrics import classification_report
-import gensim
-from nltk.tag import CRFTagger
 import re
 
+# NB theano, gensim, nltk and sklearn are only imported by the methods
+# which need them, so importing the tagger (e.g. to load a model bundle)
+# stays fast
 from deep_disfluency.language_model.ngram_language_model \
     import KneserNeySmoothingModel
 from deep_disfluency.utils.tools \
@@ -18,20 +16,22 @@ from deep_disfluency.utils.tools import \
     verify_dialogue_data_matrices_from_folder
 from deep_disfluency.utils.tools import \
     dialogue_data_and_indices_from_matrix
+from deep_disfluency.utils.lazy_loading import LazyPickle
 from deep_disfluency.load.load import load_tags
-from deep_disfluency.rnn.elman import Elman
-from deep_disfluency.rnn.lstm import LSTM
-from deep_disfluency.rnn.test_if_using_gpu import test_if_using_GPU
-from deep_disfluency.decoder.hmm import FirstOrderHMM
+from deep_disfluency.load.load import iter_increco_updates_from_file
+from deep_disfluency.load.increco_binary import open_increco_output
+from deep_disfluency.utils.instrumentation import Instrumentation, clock
 from deep_disfluency.decoder.noisy_channel import SourceModel
-from deep_disfluency.embeddings.load_embeddings import populate_embeddings
-from deep_disfluency.feature_extraction.feature_utils import \
-    load_data_from_disfluency_corpus_file
-from deep_disfluency.evaluation.disf_evaluation import \
+from deep_disfluency.embeddings.load_embeddings import \
+    load_pretrained_embeddings
+from deep_disfluency.evaluation.eval_utils import \
     get_tag_data_from_corpus_file
+from deep_disfluency.evaluation.eval_utils import \
+    update_hypothesis_with_new_prefix
 from utils import process_arguments, get_last_n_features
-from deep_disfluency.feature_extraction.feature_utils import \
-    sort_into_dialogue_speakers
+from model_bundle import init_tagger_from_bundle
+from session_state import DEFAULT_HORIZON, snapshot_session, \
+    restore_session, encode_snapshot, decode_snapshot
 
 
 class IncrementalTagger(object):
@@ -100,6 +100,12 @@ class DeepDisfluencyTagger(IncrementalTagger):
             word will continue it
     <tt/> - a word constituting an entire utterance
     """
+    # attribute -> the method building its default, on first use
+    LAZY_COMPONENTS = {"pos_tagger": "load_default_pos_tagger",
+                       "lm": "train_default_language_model",
+                       "pos_lm": "train_default_pos_language_model",
+                       "edit_lm": "train_default_edit_language_model"}
+
     def __init__(self, config_file=None,
                  config_number=None,
                  saved_model_dir=None,
@@ -110,15 +116,21 @@ class DeepDisfluencyTagger(IncrementalTagger):
                  timer=None,
                  timer_scaler=None,
                  use_timing_data=False,
-                 use_decoder=True):
+                 use_decoder=True,
+                 instrumentation=False,
+                 numpy_model=False,
+                 lstm_output_gate_seed=None):
 
         if not config_file:
             config_file = "experiments/experiment_configs.csv"
-            config_number = 35
+            if config_number is None:
+                config_number = 35
             print "No config file, using default", config_file, config_number
 
         config_file = os.path.join(os.path.dirname(__file__), '..', config_file)
-        saved_model_dir = os.path.join(os.path.dirname(__file__), '..', saved_model_dir)
+        if saved_model_dir:
+            saved_model_dir = os.path.join(os.path.dirname(__file__), '..',
+                                           saved_model_dir)
 
         super(DeepDisfluencyTagger, self).__init__(config_file,
                                                    config_number,
@@ -130,35 +142,35 @@ class DeepDisfluencyTagger(IncrementalTagger):
                                       hmm=True)
         #  separate manual setting
         setattr(self.args, "use_timing_data", use_timing_data)
-        print "Intializing model from args..."
-        self.model = self.init_model_from_config(self.args)
-
-        # load a model from a folder if specified
-        if saved_model_dir:
-            print "Loading saved weights from", saved_model_dir
-            self.load_model_params_from_folder(saved_model_dir,
-                                               self.args.model_type)
+        if numpy_model:
+            # inference only, no theano, the weights memory mapped
+            print "Loading numpy model from", saved_model_dir
+            self.model = self.init_numpy_model_from_folder(
+                self.args, saved_model_dir,
+                lstm_output_gate_seed=lstm_output_gate_seed)
         else:
-            print "WARNING no saved model params, needs training."
-            print "Loading original embeddings"
-            self.load_embeddings(self.args.embeddings)
+            print "Intializing model from args..."
+            self.model = self.init_model_from_config(self.args)
 
+            # load a model from a folder if specified
+            if saved_model_dir:
+                print "Loading saved weights from", saved_model_dir
+                self.load_model_params_from_folder(
+                    saved_model_dir, self.args.model_type,
+                    lstm_output_gate_seed=lstm_output_gate_seed)
+            else:
+                print "WARNING no saved model params, needs training."
+                print "Loading original embeddings"
+                self.load_embeddings(self.args.embeddings)
+
+        # the POS tagger and language models not given are only
+        # built on first use (see LAZY_COMPONENTS)
         if pos_tagger:
             print "Loading POS tagger..."
             self.pos_tagger = pos_tagger
-        elif self.args.pos:
-            print "No POS tagger specified,loading default CRF switchboard one"
-            self.pos_tagger = CRFTagger()
-            tagger_path = os.path.dirname(os.path.realpath(__file__)) +\
-                "/../feature_extraction/crfpostagger"
-            self.pos_tagger.set_model_file(tagger_path)
-
-        if self.args.n_language_model_features > 0 or \
-                'noisy_channel' in self.args.decoder_type:
-            print "training language model..."
-            self.init_language_models(language_model,
-                                      pos_language_model,
-                                      edit_language_model)
+        self.init_language_models(language_model,
+                                  pos_language_model,
+                                  edit_language_model)
 
         self.timing_model = None
         self.timing_model_scaler = None
@@ -167,22 +179,16 @@ class DeepDisfluencyTagger(IncrementalTagger):
             self.timing_model = timer
             self.timing_model_scaler = timer_scaler
         elif self.args.use_timing_data:
-            # self.timing_model = None
-            # self.timing_model_scaler = None
             print "No timer specified, using default switchboard one"
+            # unpickled (and sklearn imported) on first use
             timer_path = os.path.dirname(os.path.realpath(__file__)) +\
                 '/../decoder/timing_models/' + \
                 'LogReg_balanced_timing_classifier.pkl'
-            with open(timer_path, 'rb') as fid:
-                self.timing_model = cPickle.load(fid)
+            self.timing_model = LazyPickle(timer_path)
             timer_scaler_path = os.path.dirname(os.path.realpath(__file__)) +\
                 '/../decoder/timing_models/' + \
                 'LogReg_balanced_timing_scaler.pkl'
-            with open(timer_scaler_path, 'rb') as fid:
-                self.timing_model_scaler = cPickle.load(fid)
-                # TODO a hack
-                # self.timing_model_scaler.scale_ = \
-                #    self.timing_model_scaler.std_.copy()
+            self.timing_model_scaler = LazyPickle(timer_scaler_path)
         else:
             print "Not using timing data"
 
@@ -203,6 +209,7 @@ class DeepDisfluencyTagger(IncrementalTagger):
                                         uttseg=self.args.do_utt_segmentation)
         self.decoder = None
         if use_decoder:
+            from deep_disfluency.decoder.hmm import FirstOrderHMM
             self.decoder = FirstOrderHMM(
                                 self.hmm_dict,
                                 markov_model_file=self.args.tags,
@@ -216,78 +223,176 @@ class DeepDisfluencyTagger(IncrementalTagger):
         self.state_history = []
         self.softmax_history = []
         # self.convert_to_output_tags = get_conversion_method(self.args.tags)
+        # per stage latency timers and counters
+        self.instrumentation = Instrumentation(enabled=instrumentation)
+        self.set_instrumentation(instrumentation)
         self.reset()
 
+    @classmethod
+    def from_bundle(cls, bundle_file, use_timing_data=None,
+                    use_decoder=True, instrumentation=False):
+        """Construct a tagger from a single file model bundle
+        (see model_bundle.py) rather than the config, weights, decoder,
+        timing and language model files, with numpy versions of the RNNs
+        so no theano compilation is needed.
+
+        :param use_timing_data: override the setting saved in the bundle
+        """
+        tagger = cls.__new__(cls)
+        IncrementalTagger.__init__(tagger, None, None)
+        print "Loading model bundle", bundle_file
+        init_tagger_from_bundle(tagger, bundle_file,
+                                use_timing_data=use_timing_data,
+                                use_decoder=use_decoder)
+        tagger.state_history = []
+        tagger.softmax_history = []
+        tagger.instrumentation = Instrumentation(enabled=instrumentation)
+        tagger.set_instrumentation(instrumentation)
+        tagger.reset()
+        return tagger
+
+    def new_session(self):
+        """A new tagger for another word stream, sharing this one's
+        RNN weights, maps, POS tagger, language models, timing model and
+        decoder tables (none of which are written to when tagging) but with
+        its own word graph, RNN state history, decoder state and
+        instrumentation. The sessions must be used from one thread,
+        as the RNN's initial state is loaded into the shared model.
+        """
+        session = copy(self)
+        if self.decoder:
+            session.decoder = copy(self.decoder)
+            if self.decoder.noisy_channel_source_model:
+                session.decoder.noisy_channel_source_model = \
+                    copy(self.decoder.noisy_channel_source_model)
+        session.instrumentation = Instrumentation(
+            enabled=self.instrumentation.enabled)
+        session.set_instrumentation(self.instrumentation.enabled)
+        session.reset()
+        return session
+
+    def get_session_snapshot(self, horizon=DEFAULT_HORIZON):
+        """A compact (compressed) snapshot of this session's state
+        back to horizon words, without the models (see session_state.py).
+        """
+        return encode_snapshot(snapshot_session(self, horizon))
+
+    def restore_session_snapshot(self, snapshot):
+        """Continue the session a snapshot was taken of. The tagger must
+        have the same model, e.g. be a new_session() of one that does.
+        """
+        restore_session(self, decode_snapshot(snapshot))
+
+    def set_instrumentation(self, enabled=True):
+        """Switch the per stage latency instrumentation on or off.
+        When off the components only test for None in the hot path.
+        """
+        self.instrumentation.enabled = enabled
+        stats = self.instrumentation if enabled else None
+        if self.decoder:
+            self.decoder.instrumentation = stats
+            if self.decoder.noisy_channel_source_model:
+                self.decoder.noisy_channel_source_model.instrumentation = \
+                    stats
+
+    def get_instrumentation_report(self):
+        """Return a dict of the per stage latency summaries
+        (count, total, mean, p50, p95, p99, max in seconds)
+        and the counters since the last reset.
+        """
+        return self.instrumentation.report()
+
+    def reset_instrumentation(self):
+        self.instrumentation.reset()
+
+    def __getattr__(self, name):
+        # only called for attributes not set yet, so the lazily built
+        # components cost nothing once they exist
+        if name in self.LAZY_COMPONENTS:
+            value = getattr(self, self.LAZY_COMPONENTS[name])()
+            setattr(self, name, value)
+            return value
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, name))
+
     def init_language_models(self, language_model=None,
                              pos_language_model=None,
                              edit_language_model=None):
-        clean_model_dir = os.path.dirname(os.path.realpath(__file__)) +\
-            "/../data/lm_corpora"
+        """Use the given language models, the default switchboard ones
+        being trained on first use of those not given. NB only the noisy
+        channel decoder uses them, the edit term language model is not
+        used for tagging so is never trained unless asked for.
+        """
         if language_model:
             self.lm = language_model
-        else:
-            print "No language model specified, using default switchboard one"
-            lm_corpus_file = open(clean_model_dir +
-                                  "/swbd_disf_train_1_clean.text")
-            lines = [line.strip("\n").split(",")[1] for line in lm_corpus_file
-                     if "POS," not in line and not line.strip("\n") == ""]
-            split = int(0.9 * len(lines))
-            lm_corpus = "\n".join(lines[:split])
-            heldout_lm_corpus = "\n".join(lines[split:])
-            lm_corpus_file.close()
-            self.lm = KneserNeySmoothingModel(
-                                        order=3,
-                                        discount=0.7,
-                                        partial_words=self.args.partial_words,
-                                        train_corpus=lm_corpus,
-                                        heldout_corpus=heldout_lm_corpus,
-                                        second_corpus=None)
         if pos_language_model:
             self.pos_lm = pos_language_model
-        elif self.args.pos:
-            print "No pos language model specified, \
-            using default switchboard one"
-            lm_corpus_file = open(clean_model_dir +
-                                  "/swbd_disf_train_1_clean.text")
-            lines = [line.strip("\n").split(",")[1] for line in lm_corpus_file
-                     if "POS," in line and not line.strip("\n") == ""]
-            split = int(0.9 * len(lines))
-            lm_corpus = "\n".join(lines[:split])
-            heldout_lm_corpus = "\n".join(lines[split:])
-            lm_corpus_file.close()
-            self.pos_lm = KneserNeySmoothingModel(
-                                        order=3,
-                                        discount=0.7,
-                                        partial_words=self.args.partial_words,
-                                        train_corpus=lm_corpus,
-                                        heldout_corpus=heldout_lm_corpus,
-                                        second_corpus=None)
         if edit_language_model:
             self.edit_lm = edit_language_model
-        else:
-            edit_lm_corpus_file = open(clean_model_dir +
-                                       "/swbd_disf_train_1_edit.text")
-            edit_lines = [line.strip("\n").split(",")[1]
-                          for line in edit_lm_corpus_file
-                          if "POS," not in line and not line.strip("\n") == ""]
-            edit_split = int(0.9 * len(edit_lines))
-            edit_lm_corpus = "\n".join(edit_lines[:edit_split])
-            heldout_edit_lm_corpus = "\n".join(edit_lines[edit_split:])
-            edit_lm_corpus_file.close()
-            self.edit_lm = KneserNeySmoothingModel(
-                                        train_corpus=edit_lm_corpus,
-                                        heldout_corpus=heldout_edit_lm_corpus,
-                                        order=2,
-                                        discount=0.7)
-            # TODO an object for getting the lm features incrementally
-            # in the language model
 
-    def init_model_from_config(self, args):
-        # for feat, val in args._get_kwargs():
-        #     print feat, val, type(val)
-        if not test_if_using_GPU():
-            print "Warning: not using GPU, might be a bit slow"
-            print "\tAdjust Theano config file ($HOME/.theanorc)"
+    def load_lm_corpus(self, corpus_name, pos=False):
+        """Returns the training and heldout corpus strings
+        for a language model from the clean switchboard corpus file.
+        """
+        clean_model_dir = os.path.dirname(os.path.realpath(__file__)) +\
+            "/../data/lm_corpora"
+        with open(clean_model_dir + "/" + corpus_name) as lm_corpus_file:
+            lines = [line.strip("\n").split(",")[1] for line in lm_corpus_file
+                     if ("POS," in line) == pos and
+                     not line.strip("\n") == ""]
+        split = int(0.9 * len(lines))
+        return "\n".join(lines[:split]), "\n".join(lines[split:])
+
+    def train_default_language_model(self):
+        print "No language model specified, using default switchboard one"
+        lm_corpus, heldout_lm_corpus = self.load_lm_corpus(
+            "swbd_disf_train_1_clean.text")
+        return KneserNeySmoothingModel(
+                                    order=3,
+                                    discount=0.7,
+                                    partial_words=self.args.partial_words,
+                                    train_corpus=lm_corpus,
+                                    heldout_corpus=heldout_lm_corpus,
+                                    second_corpus=None)
+
+    def train_default_pos_language_model(self):
+        if not self.args.pos:
+            return None
+        print "No pos language model specified, \
+        using default switchboard one"
+        lm_corpus, heldout_lm_corpus = self.load_lm_corpus(
+            "swbd_disf_train_1_clean.text", pos=True)
+        return KneserNeySmoothingModel(
+                                    order=3,
+                                    discount=0.7,
+                                    partial_words=self.args.partial_words,
+                                    train_corpus=lm_corpus,
+                                    heldout_corpus=heldout_lm_corpus,
+                                    second_corpus=None)
+
+    def train_default_edit_language_model(self):
+        # TODO an object for getting the lm features incrementally
+        # in the language model
+        edit_lm_corpus, heldout_edit_lm_corpus = self.load_lm_corpus(
+            "swbd_disf_train_1_edit.text")
+        return KneserNeySmoothingModel(
+                                    train_corpus=edit_lm_corpus,
+                                    heldout_corpus=heldout_edit_lm_corpus,
+                                    order=2,
+                                    discount=0.7)
+
+    def load_default_pos_tagger(self):
+        if not self.args.pos:
+            return None
+        print "No POS tagger specified,loading default CRF switchboard one"
+        from nltk.tag import CRFTagger
+        pos_tagger = CRFTagger()
+        tagger_path = os.path.dirname(os.path.realpath(__file__)) +\
+            "/../feature_extraction/crfpostagger"
+        pos_tagger.set_model_file(tagger_path)
+        return pos_tagger
+
+    def load_index_maps(self, args):
         print "loading tag to index maps..."
         label_path = os.path.dirname(os.path.realpath(__file__)) +\
             "/../data/tag_representations/{}_tags.csv".format(args.tags)
@@ -299,12 +404,43 @@ class DeepDisfluencyTagger(IncrementalTagger):
         self.word_to_index_map = load_tags(word_path)
         self.pos_to_index_map = load_tags(pos_path)
         self.model_type = args.model_type
+        self.window_size = args.window
+
+    def init_numpy_model_from_folder(self, args, saved_model_dir,
+                                     lstm_output_gate_seed=None):
+        """The numpy inference version of the RNN (see rnn/numpy_rnn.py)
+        with the weights saved in the folder memory mapped. LSTMs saved
+        without their W_xo need an lstm_output_gate_seed.
+        """
+        from deep_disfluency.rnn.numpy_rnn import model_from_folder
+        self.load_index_maps(args)
+        if args.n_language_model_features + args.n_acoustic_features > 0:
+            raise NotImplementedError("No numpy model for models with extra\
+             (acoustic/language model) input features")
+        model = model_from_folder(saved_model_dir, self.model_type,
+                                  de=args.emb_dimension,
+                                  cs=self.window_size,
+                                  npos=len(self.pos_to_index_map),
+                                  output_gate_seed=lstm_output_gate_seed)
+        self.initial_h0_state = model.h0
+        self.initial_c0_state = getattr(model, "c0", None)
+        return model
+
+    def init_model_from_config(self, args):
+        from deep_disfluency.rnn.elman import Elman
+        from deep_disfluency.rnn.lstm import LSTM
+        from deep_disfluency.rnn.test_if_using_gpu import test_if_using_GPU
+        # for feat, val in args._get_kwargs():
+        #     print feat, val, type(val)
+        if not test_if_using_GPU():
+            print "Warning: not using GPU, might be a bit slow"
+            print "\tAdjust Theano config file ($HOME/.theanorc)"
+        self.load_index_maps(args)
         vocab_size = len(self.word_to_index_map.keys())
         emb_dimension = args.emb_dimension
         n_hidden = args.n_hidden
         n_extra = args.n_language_model_features + args.n_acoustic_features
         n_classes = len(self.tag_to_index_map.keys())
-        self.window_size = args.window
         n_pos = len(self.pos_to_index_map.keys())
         update_embeddings = args.update_embeddings
         lr = args.lr
@@ -339,30 +475,34 @@ class DeepDisfluencyTagger(IncrementalTagger):
                 self.model_type))
         return model
 
-    def load_model_params_from_folder(self, model_folder, model_type):
-        if model_type in ["lstm", "elman"]:
+    def load_model_params_from_folder(self, model_folder, model_type,
+                                      lstm_output_gate_seed=None):
+        """Load the RNN's weights saved in the folder. LSTMs saved without
+        their W_xo need an lstm_output_gate_seed (see rnn/lstm.py)."""
+        if model_type == "lstm":
+            self.model.load_weights_from_folder(
+                model_folder, output_gate_seed=lstm_output_gate_seed)
+            self.initial_h0_state = self.model.h0.get_value()
+            self.initial_c0_state = self.model.c0.get_value()
+        elif model_type == "elman":
             self.model.load_weights_from_folder(model_folder)
             self.initial_h0_state = self.model.h0.get_value()
-            if model_type == "lstm":
-                self.initial_c0_state = self.model.c0.get_value()
         else:
             raise NotImplementedError('No weight loading for {0}'.format(
                 model_type))
 
     def load_embeddings(self, embeddings_name):
-        # load pre-trained embeddings
+        # load pre-trained embeddings, assigned to the vocabulary and the
+        # gaps filled in, from the cache file if they have been before
         embeddings_dir = os.path.dirname(os.path.realpath(__file__)) +\
                                 "/../embeddings/"
-        pretrained = gensim.models.Word2Vec.load(embeddings_dir +
-                                                 embeddings_name)
-        print "emb shape", pretrained[pretrained.index2word[0]].shape
-        # print pretrained[0].shape
-        # assign and fill in the gaps
-        emb = populate_embeddings(self.args.emb_dimension,
-                                  len(self.word_to_index_map.items()),
-                                  self.word_to_index_map,
-                                  pretrained)
-        self.model.load_weights(emb=emb)
+        emb = load_pretrained_embeddings(self.args.emb_dimension,
+                                         len(self.word_to_index_map.items()),
+                                         self.word_to_index_map,
+                                         embeddings_dir + embeddings_name)
+        print "emb shape", emb.shape
+        # copied into the (trainable) model's own array
+        self.model.load_weights(emb=np.asarray(emb))
 
     def standardize_word_and_pos(self, word, pos=None,
                                  proper_name_pos_tags=["NNP", "NNPS",
@@ -395,28 +535,68 @@ class DeepDisfluencyTagger(IncrementalTagger):
         :param rollback: the number of words to rollback
         in the case of changed word hypotheses from an ASR
         """
+        step = self.start_word(word, pos=pos, timing=timing,
+                               rollback=rollback)
+        return self.finish_word(step, self.rnn_step(step),
+                                diff_only=diff_only)
+
+    def pos_tag_word(self, word):
+        """The POS tag of a new word in the context of the last words
+        of the word graph.
+        """
+        test_words = [unicode(x) for x in
+                      get_last_n_features(
+                                          "words",
+                                          self.word_graph,
+                                          len(self.word_graph)-1,
+                                          n=4
+                                          )
+                      ] + [unicode(word.lower())]
+        return self.pos_tagger.tag(test_words)[-1][1]
+
+    def start_word(self, word, pos=None, timing=None, rollback=0,
+                   processed=False):
+        """The first stage of tag_new_word: rollback, POS tag the word if
+        needed and add it to the word graph, returning the step's RNN
+        input windows and initial state in a dict for rnn_step and
+        finish_word. The stages are separate so the RNN steps of many
+        sessions can be computed together (see tagging_daemon.py).
+
+        :param processed: whether the word and pos are already POS tagged
+        and standardized (by a tagger with the same maps, see
+        multi_model_tagger.py), so that is skipped
+        """
+        stats = self.instrumentation if self.instrumentation.enabled \
+            else None
+        start_time = t = None
+        if stats:
+            start_time = t = clock()
+            stats.increment("words")
+            if rollback > 0:
+                stats.increment("rollbacks")
+                stats.increment("rollback_depth", rollback)
         self.rollback(rollback)
-        if pos is None and self.args.pos:
+        if stats:
+            t = stats.lap("rollback", t)
+        if pos is None and self.args.pos and not processed:
             # if no pos tag provided but there is a pos-tagger, tag word
-            test_words = [unicode(x) for x in
-                          get_last_n_features(
-                                              "words",
-                                              self.word_graph,
-                                              len(self.word_graph)-1,
-                                              n=4
-                                              )
-                          ] + [unicode(word.lower())]
-            pos = self.pos_tagger.tag(test_words)[-1][1]
+            pos = self.pos_tag_word(word)
             # print "tagging", word, "as", pos
+            if stats:
+                t = stats.lap("pos_tagging", t)
         # 0. Add new word to word graph
-        word, pos = self.standardize_word_and_pos(word, pos)
+        if not processed:
+            word, pos = self.standardize_word_and_pos(word, pos)
+            if stats:
+                t = stats.lap("standardize", t)
         # print "New word:", word, pos
         self.word_graph.append((word, pos, timing))
-        # 1. load the saved internal rnn state
+        # 1. get the saved internal rnn state
         # TODO these nets aren't (necessarily) trained statefully
         # The internal state in training self.args.bs words back
         # are the inital ones in training, however here
         # They are the actual state reached.
+        c0_state = None
         if self.state_history == []:
             c0_state = self.initial_c0_state
             h0_state = self.initial_h0_state
@@ -427,16 +607,7 @@ class DeepDisfluencyTagger(IncrementalTagger):
             elif self.model_type == "elman":
                 h0_state = self.state_history[-1][-1]
 
-        if self.model_type == "lstm":
-            self.model.load_weights(c0=c0_state,
-                                    h0=h0_state)
-        elif self.model_type == "elman":
-            self.model.load_weights(h0=h0_state)
-        else:
-            raise NotImplementedError("no history loading for\
-                             {0} model".format(self.model_type))
-
-        # 2. do the softmax output with converted inputs
+        # 2. the converted inputs
         word_window = [self.word_to_index_map[x] for x in
                        get_last_n_features("words", self.word_graph,
                                            len(self.word_graph)-1,
@@ -448,16 +619,45 @@ class DeepDisfluencyTagger(IncrementalTagger):
                                           n=self.window_size)
                       ]
         # print "word_window, pos_window", word_window, pos_window
+        return {"word": word, "timing": timing,
+                "word_window": word_window, "pos_window": pos_window,
+                "c0": c0_state, "h0": h0_state,
+                "start_time": start_time, "t": t}
+
+    def rnn_step(self, step):
+        """The RNN's output for a step from start_word: the hidden
+        (and for the LSTM cell) states and the softmax.
+        """
         if self.model_type == "lstm":
-            h_t, c_t, s_t = self.model.\
-                soft_max_return_hidden_layer([word_window], [pos_window])
+            self.model.load_weights(c0=step["c0"],
+                                    h0=step["h0"])
+        elif self.model_type == "elman":
+            self.model.load_weights(h0=step["h0"])
+        else:
+            raise NotImplementedError("no history loading for\
+                             {0} model".format(self.model_type))
+        return self.model.soft_max_return_hidden_layer(
+            [step["word_window"]], [step["pos_window"]])
+
+    def finish_word(self, step, rnn_output, diff_only=True):
+        """The last stage of tag_new_word: save the RNN's output
+        (as from rnn_step) for the step and decode, returning the
+        output tags as tag_new_word.
+        """
+        stats = self.instrumentation if self.instrumentation.enabled \
+            else None
+        word = step["word"]
+        timing = step["timing"]
+        start_time = step["start_time"]
+        t = step["t"]
+        if self.model_type == "lstm":
+            h_t, c_t, s_t = rnn_output
             self.softmax_history.append(s_t)
             if len(self.state_history) == 20:  # just saving history
                 self.state_history.pop(0)  # pop first one
             self.state_history.append((c_t, h_t))
         elif self.model_type == "elman":
-            h_t, s_t = self.model.soft_max_return_hidden_layer([word_window],
-                                                               [pos_window])
+            h_t, s_t = rnn_output
             self.softmax_history.append(s_t)
             if len(self.state_history) == 20:
                 self.state_history.pop(0)  # pop first one
@@ -465,6 +665,8 @@ class DeepDisfluencyTagger(IncrementalTagger):
         else:
             raise NotImplementedError("no softmax implemented for\
                                  {0} model".format(self.model_type))
+        if stats:
+            t = stats.lap("rnn", t)
         softmax = np.concatenate(self.softmax_history)
 
         # 3. do the decoding on the softmax
@@ -480,6 +682,8 @@ class DeepDisfluencyTagger(IncrementalTagger):
                             1)), 1)
         else:
             adjustsoftmax = softmax
+        if stats:
+            t = stats.lap("softmax_concat", t)
         last_n_timings = None if ((not self.args.use_timing_data) or
                                   not timing) \
             else get_last_n_features("timings", self.word_graph,
@@ -499,6 +703,8 @@ class DeepDisfluencyTagger(IncrementalTagger):
                 changed_suffix_only=True,
                 timing_data=last_n_timings,
                 words=[word])
+        if stats:
+            t = stats.lap("decoder", t)
         # print "new tags", new_tags
         prev_output_tags = deepcopy(self.output_tags)
         self.output_tags = self.output_tags[:len(self.output_tags) -
@@ -550,14 +756,19 @@ class DeepDisfluencyTagger(IncrementalTagger):
                         start=len(self.output_tags) -
                         (len(new_tags)),
                         representation=self.args.tags)
+        output = self.output_tags
         if diff_only:
+            output = self.output_tags[len(prev_output_tags):]
             for i, old_new in enumerate(zip(prev_output_tags,
                                             self.output_tags)):
                 old, new = old_new
                 if old != new:
-                    return self.output_tags[i:]
-            return self.output_tags[len(prev_output_tags):]
-        return self.output_tags
+                    output = self.output_tags[i:]
+                    break
+        if stats:
+            stats.lap("tag_conversion", t)
+            stats.lap("total", start_time)
+        return output
 
     def tag_utterance(self, utterance):
         """Tags entire utterance, only possible on models
@@ -608,6 +819,8 @@ class DeepDisfluencyTagger(IncrementalTagger):
 
     def evaluate_fast_from_matrices(self, validation_matrices, tag_file,
                                     idx_to_label_dict):
+        from sklearn.metrics import precision_recall_fscore_support
+        from sklearn.metrics import classification_report
         output = []
         true_y = []
         for v in validation_matrices:
@@ -644,14 +857,27 @@ class DeepDisfluencyTagger(IncrementalTagger):
     def train_net(self, train_dialogues_filepath=None,
                   validation_dialogues_filepath=None,
                   model_dir=None,
-                  tag_accuracy_file_path=None):
+                  tag_accuracy_file_path=None,
+                  train_matrices=None,
+                  validation_matrices=None):
         """Train the internal deep learning model
         from a list of dialogue matrices.
+
+        The matrices are loaded from the folders unless given as
+        train_matrices and validation_matrices, iterables of
+        (file name, matrix) already verified for this configuration,
+        e.g. the SharedMatrices of load/shared_matrices.py.
+        The best epoch is returned and it, the best validation score, the
+        number of epochs run and why training stopped are kept in
+        self.training_results.
         """
         tag_accuracy_file = open(tag_accuracy_file_path, "a")
         print "Verifying files..."
-        for filepath in [train_dialogues_filepath,
-                         validation_dialogues_filepath]:
+        for filepath, matrices in [
+                (train_dialogues_filepath, train_matrices),
+                (validation_dialogues_filepath, validation_matrices)]:
+            if matrices is not None:
+                continue
             if not verify_dialogue_data_matrices_from_folder(
                             filepath,
                             word_dict=self.word_to_index_map,
@@ -666,10 +892,11 @@ class DeepDisfluencyTagger(IncrementalTagger):
             self.args.n_acoustic_features
         # validation matrices filepath much smaller so can store these
         # and preprocess them all:
-        validation_matrices = [np.load(
-                                    validation_dialogues_filepath + "/" + fp)
-                               for fp in os.listdir(
-                                validation_dialogues_filepath)]
+        if validation_matrices is None:
+            validation_matrices = [(fp, np.load(
+                                    validation_dialogues_filepath + "/" + fp))
+                                   for fp in os.listdir(
+                                    validation_dialogues_filepath)]
         validation_matrices = [dialogue_data_and_indices_from_matrix(
                                   d_matrix,
                                   n_extra,
@@ -679,7 +906,7 @@ class DeepDisfluencyTagger(IncrementalTagger):
                                   tag_rep=self.args.tags,
                                   tag_to_idx_map=self.tag_to_index_map,
                                   in_utterances=self.args.utts_presegmented)
-                               for d_matrix in validation_matrices
+                               for _, d_matrix in validation_matrices
                                ]
         idx_2_label_dict = {v: k for k, v in self.tag_to_index_map.items()}
         if not os.path.exists(model_dir):
@@ -687,6 +914,8 @@ class DeepDisfluencyTagger(IncrementalTagger):
         start = 1  # by default start from the first epoch
         best_score = 0
         best_epoch = 0
+        stop_reason = "max_epochs"
+        e = start - 1
         print "Net training started..."
         for e in range(start, self.args.n_epochs + 1):
             tic = time.time()
@@ -697,14 +926,16 @@ class DeepDisfluencyTagger(IncrementalTagger):
             # TODO IO is slow, where the memory allows do in one
             load_separately = True
             test = False
+            if train_matrices is None:
+                dialogues = ((f, np.load(train_dialogues_filepath + "/" + f))
+                             for f in os.listdir(train_dialogues_filepath))
+            else:
+                dialogues = train_matrices
             if load_separately:
-                for i, dialogue_f in enumerate(
-                                        os.listdir(train_dialogues_filepath)):
+                for i, (dialogue_f, d_matrix) in enumerate(dialogues):
                     if test and i > 3:
                         break
                     print dialogue_f
-                    d_matrix = np.load(train_dialogues_filepath + "/" +
-                                       dialogue_f)
                     word_idx, pos_idx, extra, y, indices = \
                         dialogue_data_and_indices_from_matrix(
                                           d_matrix,
@@ -756,6 +987,7 @@ class DeepDisfluencyTagger(IncrementalTagger):
             # stopping criteria = if no improvement in 10 epochs
             if e - best_epoch >= 10:
                 print "stopping, no improvement in 10 epochs"
+                stop_reason = "no_improvement"
                 break
             if self.args.decay and (e - best_epoch) > 1:
                 # just a steady decay if things aren't improving for 2 epochs
@@ -765,12 +997,17 @@ class DeepDisfluencyTagger(IncrementalTagger):
                 print "learning rate decayed, now ", lr
             if lr < 1e-5:
                 print "stopping, below learning rate threshold"
+                stop_reason = "learning_rate"
                 break
             print '[learning and testing] epoch %i >>' % (e),\
                 'completed in %.2f (sec) <<\r' % (time.time()-tic)
 
         print 'BEST RESULT: epoch', best_epoch, 'valid score', best_score
         tag_accuracy_file.close()
+        self.training_results = {"best_epoch": best_epoch,
+                                 "best_score": best_score,
+                                 "epochs": e,
+                                 "stop_reason": stop_reason}
         return best_epoch
 
     def get_output_tags(self, with_words=False):
@@ -810,16 +1047,20 @@ class DeepDisfluencyTagger(IncrementalTagger):
         KB3_1:7    6.00    7.10    pause    NN    <f/><cc/>
 
 
+        A target_file_path ending in ".incb" is written in the compact
+        binary form of this format (see load/increco_binary.py).
+
         :param source_file_path: str, file path to the input file
         :param target_file_path: str, file path to output in the above format
         :param is_asr_results_file: bool, whether the input is increco style
         """
+        if is_asr_results_file:
+            return self.incremental_output_from_asr_file(source_file_path,
+                                                         target_file_path)
         if target_file_path:
-            target_file = open(target_file_path, "w")
+            target_file = open_increco_output(target_file_path)
         if not self.args.do_utt_segmentation:
             print "not doing utt seg, using pre-segmented file"
-        if is_asr_results_file:
-            return NotImplementedError
         if 'timings' in source_file_path:
             print "input file has timings"
             if not is_asr_results_file:
@@ -880,6 +1121,77 @@ class DeepDisfluencyTagger(IncrementalTagger):
                         target_file.write("\n")
                     target_file.write("\n")
             target_file.write("\n")
+        if target_file_path:
+            target_file.close()
+
+    def incremental_output_from_asr_file(self, source_file_path,
+                                         target_file_path=None,
+                                         buffer_size=65536):
+        """Return the incremental output in an increco style (see
+        incremental_output_from_file) from an ASR increco style input,
+        with or without POS tags, e.g.:
+
+        File: 4548A
+        Time: 0.98
+        uh    0.12    0.45
+        yeah    0.45    0.98
+
+        The input is streamed one update at a time, the rollback of each
+        update is computed against the current hypothesis and passed to
+        tag_new_word, so the whole file is never held in memory.
+        Each update's changed output is written as a single block
+        through a buffered writer (or in the binary form for a
+        target_file_path ending in ".incb").
+
+        :param source_file_path: str, file path to the input file
+        :param target_file_path: str, file path to output in the above format
+        :param buffer_size: int, size of the output file buffer in bytes
+        """
+        target_file = None
+        if target_file_path:
+            target_file = open_increco_output(target_file_path, buffer_size)
+        current_speaker = None
+        hypothesis = []
+        for speaker, update_time, words in \
+                iter_increco_updates_from_file(source_file_path):
+            if speaker != current_speaker:
+                print speaker
+                current_speaker = speaker
+                hypothesis = []
+                self.reset()  # reset at the beginning of each dialogue
+                if target_file:
+                    target_file.write("Speaker: " + str(speaker) + "\n\n")
+            new_words, rollback = update_hypothesis_with_new_prefix(
+                hypothesis, words)
+            if new_words == []:
+                continue
+            first_new = len(hypothesis) - len(new_words)
+            changed_start = first_new
+            for i in range(first_new, len(hypothesis)):
+                word, start, end, pos = hypothesis[i]
+                timing = None
+                if self.args.use_timing_data:
+                    timing = end - (hypothesis[i-1][2] if i > 0 else 0)
+                diff = self.tag_new_word(word, pos, timing,
+                                         diff_only=True,
+                                         rollback=rollback)
+                rollback = 0
+                changed_start = min(changed_start,
+                                    len(self.output_tags) - len(diff))
+            if not target_file:
+                continue
+            if update_time is None:
+                update_time = hypothesis[-1][2]
+            block = ["Time: " + str(update_time)]
+            for i in range(changed_start, len(hypothesis)):
+                word, start, end, _ = hypothesis[i]
+                pos = self.word_graph[self.window_size - 1 + i][1]
+                block.append("\t".join([str(start), str(end), word,
+                                        str(pos), self.output_tags[i]]))
+            target_file.write("\n".join(block) + "\n\n")
+        if target_file:
+            target_file.write("\n")
+            target_file.close()
 
     def train_decoder(self, tag_file):
         raise NotImplementedError
@@ -3,6 +3,107 @@ from deep_tagger import DeepDisfluencyTagger
 import fluteline
 
 
+def coalesce_word_updates(word_updates, latest_word_ID):
+    """Collapse a burst of word updates into their net effect on a word
+    graph whose latest word id is latest_word_ID.
+
+    An update with an id at or before the latest one revokes that word and
+    all those after it, so updates superseded later in the burst need
+    never be tagged. Returns the pair (rollback, suffix) where rollback is
+    the number of words to revoke from the word graph before the suffix
+    of word updates is added.
+    """
+    base_id = None  # the first id of the suffix
+    suffix = []
+    latest = latest_word_ID
+    for word_update in word_updates:
+        word_id = word_update['id']
+        if base_id is None or word_id < base_id:
+            base_id = word_id
+            suffix = [word_update]
+        else:
+            # keep the words before this one and replace the rest
+            suffix = suffix[:word_id - base_id] + [word_update]
+        latest = word_id
+    if base_id is None:
+        return 0, []
+    rollback = max(0, (latest_word_ID - base_id) + 1)
+    return rollback, suffix
+
+
+class WordUpdateTagger(object):
+    """Keeps the word graph of id-indexed word update dicts from an ASR
+    adapter in line with a DeepDisfluencyTagger, rolling the tagger back
+    when an update revises earlier words.
+    Not itself concurrent, used by DeepTaggerModule and the asyncio
+    streams in async_tagger.
+    """
+    def __init__(self, disf_tagger):
+        self.disf_tagger = disf_tagger
+        self.reset()
+
+    def reset(self):
+        self.disf_tagger.reset()
+        self.latest_word_ID = -1
+        self.word_graph = []
+
+    def tag_word_update(self, word_update):
+        """Tags an update like:
+
+            {'id': 1,
+            'start_time': 0.44,
+            'end_time': 0.77,
+            'word': 'hello'}
+
+        Add it to the tagger's word graph either at the end, or
+        rolling back first and then add it.
+        Returns the list of word dicts whose tags have been updated,
+        with their 'disf_tag' and 'pos_tag' set.
+        """
+        return self.tag_word_updates([word_update])
+
+    def tag_word_updates(self, word_updates):
+        """Tags a burst of updates in one go, only tagging the words
+        which are not superseded by later updates in the burst.
+        Returns the list of word dicts whose tags have been updated,
+        each once and in id order.
+        """
+        backwards, suffix = coalesce_word_updates(word_updates,
+                                                  self.latest_word_ID)
+        stats = self.disf_tagger.instrumentation
+        if stats.enabled:
+            stats.increment("word_updates", len(word_updates))
+            stats.increment("word_updates_coalesced",
+                            len(word_updates) - len(suffix))
+        if suffix == []:
+            return []
+        # TODO should be consistent
+        self.word_graph = self.word_graph[:len(self.word_graph) - backwards]
+        first_changed_id = None
+        for word_update in suffix:
+            self.latest_word_ID = word_update['id']
+            self.word_graph.append(word_update)
+            timing = word_update['end_time'] - word_update['start_time']
+            word = word_update['word']
+            # the tagger does the rollback itself before tagging
+            new_tags = self.disf_tagger.tag_new_word(word, timing=timing,
+                                                     rollback=backwards)
+            backwards = 0
+            start_id = self.latest_word_ID - (len(new_tags) - 1)
+            if first_changed_id is None or start_id < first_changed_id:
+                first_changed_id = start_id
+        updated = []
+        for idx in range(first_changed_id, self.latest_word_ID + 1):
+            # update the disf tag and pos tag for new tag updates
+            self.word_graph[idx]['disf_tag'] = \
+                self.disf_tagger.output_tags[idx]
+            pos_idx = idx + (self.disf_tagger.window_size-1)
+            self.word_graph[idx]['pos_tag'] = \
+                self.disf_tagger.word_graph[pos_idx][1]
+            updated.append(self.word_graph[idx])
+        return updated
+
+
 class DeepTaggerModule(fluteline.Consumer):
     """A fluteline incremental concurrent Consumer module which
     consumes update increments as word dictionaries, e.g.:
@@ -23,25 +124,66 @@ class DeepTaggerModule(fluteline.Consumer):
             'disf_tag' : '<f/>'}
 
     These will be updated as diffs.
+
+    If coalesce_updates is on, the updates which arrive while others are
+    waiting in the input queue are buffered and tagged together once the
+    queue is empty (or max_coalesced_updates are waiting), and those
+    superseded by later revisions are never tagged, so the tagger catches
+    up faster with bursts of interim ASR results. Any buffered updates
+    are tagged when the module stops.
+
+    A loaded disf_tagger can be passed in to be used instead of loading
+    one from the config.
+
+    If instrumentation is on, per stage latencies and counters of the
+    tagger can be queried with get_latency_report() to monitor per word
+    latency in production.
+
+    If a monitor is given (e.g. an
+    evaluation.streaming_eval.StreamingIncrementalEval), each burst of
+    updated words is also passed to its add_word_updates, to monitor the
+    quality of the output against a gold standard as it is produced.
     """
     def __init__(self,
                  config_file="experiments/experiment_configs.csv",
                  config_number=35,
                  saved_model_dir="experiments/035/epoch_6",
-                 use_timing_data=True):
+                 use_timing_data=True,
+                 instrumentation=False,
+                 coalesce_updates=True,
+                 monitor=None,
+                 max_coalesced_updates=50,
+                 disf_tagger=None):
         super(DeepTaggerModule, self).__init__()
-        self.disf_tagger = DeepDisfluencyTagger(
-            config_file=config_file,
-            config_number=config_number,
-            saved_model_dir=saved_model_dir,
-            use_timing_data=use_timing_data
-        )
+        self.coalesce_updates = coalesce_updates
+        self.max_coalesced_updates = max_coalesced_updates
+        self.pending_word_updates = []
+        self.monitor = monitor
+        if disf_tagger is None:
+            disf_tagger = DeepDisfluencyTagger(
+                config_file=config_file,
+                config_number=config_number,
+                saved_model_dir=saved_model_dir,
+                use_timing_data=use_timing_data,
+                instrumentation=instrumentation
+            )
+        self.disf_tagger = disf_tagger
+        self.word_update_tagger = WordUpdateTagger(self.disf_tagger)
         print "Deep Tagger Module ready"
-        self.latest_word_ID = -1
-        self.word_graph = []
 
     # def enter(self):
 
+    def set_instrumentation(self, enabled=True):
+        self.disf_tagger.set_instrumentation(enabled)
+
+    def get_latency_report(self):
+        """Per stage latency summaries (seconds) and counters
+        of the tagger since the last reset."""
+        return self.disf_tagger.get_instrumentation_report()
+
+    def reset_latency_stats(self):
+        self.disf_tagger.reset_instrumentation()
+
     def consume(self, word_update):
         """ Will get an update like:
 
@@ -53,33 +195,38 @@ class DeepTaggerModule(fluteline.Consumer):
         Add it to the tagger's word graph either at the end, or
         rolling back first and then add it.
         """
+        if not self.coalesce_updates:
+            self.tag_word_updates([word_update])
+            return
+        self.pending_word_updates.append(word_update)
+        # only the public empty() of fluteline's queue is used to look
+        # ahead: if more messages are waiting, the update is kept until
+        # they have been consumed (a stop message is left to the node and
+        # the buffer is tagged in exit())
+        if self.input.empty() or \
+                len(self.pending_word_updates) >= self.max_coalesced_updates:
+            self.flush_word_updates()
+
+    def flush_word_updates(self):
+        """Tag the buffered word updates together and output the
+        updated words."""
+        word_updates = self.pending_word_updates
+        self.pending_word_updates = []
+        if word_updates:
+            self.tag_word_updates(word_updates)
+
+    def tag_word_updates(self, word_updates):
         try:
-            # print "RECEIVING", word_update
-            if word_update['id'] <= self.latest_word_ID:
-                # rollback needed
-                # TODO should be consistent
-                backwards = (self.latest_word_ID - word_update['id']) + 1
-                self.disf_tagger.rollback(backwards)
-                self.word_graph = self.word_graph[:
-                                                  len(self.word_graph) -
-                                                  backwards]
-            self.latest_word_ID = word_update['id']
-            self.word_graph.append(word_update)
-            timing = word_update['end_time'] - word_update['start_time']
-            word = word_update['word']
-            new_tags = self.disf_tagger.tag_new_word(word, timing=timing)
-            start_id = self.latest_word_ID - (len(new_tags) - 1)
-            word_update_indices = range(start_id, self.latest_word_ID+1)
-            # print "\nnew tags:"
-            for idx, new_tag in zip(word_update_indices, new_tags):
-                # update the disf tag and pos tag for new tag updates
-                self.word_graph[idx]['disf_tag'] = new_tag
-                pos_idx = idx + (self.disf_tagger.window_size-1)
-                self.word_graph[idx]['pos_tag'] = \
-                    self.disf_tagger.word_graph[pos_idx][1]
-                # print self.word_graph[idx]
+            # print "RECEIVING", word_updates
+            updated_words = \
+                self.word_update_tagger.tag_word_updates(word_updates)
+            if self.monitor is not None:
+                self.monitor.add_word_updates(updated_words)
+            for updated_word in updated_words:
                 # output the new tags for the updated word
-                self.output.put(self.word_graph[idx])
+                self.output.put(updated_word)
         except:
             print "Disfluency tagger failed to update with new word"
 
+    def exit(self):
+        self.flush_word_updates()
@@ -0,0 +1,421 @@
+"""A single file, versioned, memory mappable bundle of everything a
+DeepDisfluencyTagger needs at inference time:
+
+    - the config args and the tag, word and pos to index maps
+    - the RNN weights (including the initial hidden/cell states)
+    - the Markov model transition counts of the HMM decoder
+    - the timing model (logistic regression) and its scaler coefficients
+    - the n-gram count tables of the language models the tagger has built
+    - the CRF POS tagger model
+
+The RNN weight matrices can be stored in reduced precision (float16 or
+int8, with an "rnn_scale/" array per int8 matrix), see quantize_bundle.py.
+
+File layout:
+
+    b"DDBUNDLE" | uint32 version | uint64 header length | JSON header |
+    padding | array data, each array aligned to ALIGNMENT bytes
+
+The JSON header holds the small metadata plus, for each array, its dtype,
+shape and byte offset. Loading memory maps the file read only and the
+arrays are numpy views on the map, so nothing is copied or unpickled for
+them: tagger construction is dominated by rebuilding the language model
+dicts, and processes forked from (or just opening) the same bundle share
+the RNN weights' pages through the OS page cache.
+
+Export a bundle from a trained model with e.g.:
+
+    python model_bundle.py -c 35 -m experiments/035/epoch_6 -t \
+        -o lstm_035_timing.ddb
+
+then construct a tagger from it with
+DeepDisfluencyTagger.from_bundle("lstm_035_timing.ddb").
+"""
+from __future__ import division
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+
+from deep_disfluency.rnn.numpy_rnn import WEIGHT_NAMES
+from deep_disfluency.rnn.quantization import quantized_weights
+
+MAGIC = b"DDBUNDLE"
+BUNDLE_VERSION = 1
+ALIGNMENT = 64
+
+# the attributes of a KneserNeySmoothingModel needed for ngram_prob
+LM_SCALAR_ATTRIBUTES = ["order", "discount", "partial_words",
+                        "unigram_denominator", "vocab_size",
+                        "bigram_types", "trigram_types"]
+LM_MAP_ATTRIBUTES = ["ngram_numerator_map", "ngram_denominator_map",
+                     "ngram_non_zero_map"]
+
+RNN_WEIGHT_NAMES = WEIGHT_NAMES
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_bundle(file_path, header, arrays):
+    """Write the JSON-able header dict and the dict of name -> numpy
+    array to a bundle file.
+    """
+    arrays = [(name, np.ascontiguousarray(array))
+              for name, array in sorted(arrays.items())]
+    index = {}
+    offset = 0
+    for name, array in arrays:
+        index[name] = {"dtype": array.dtype.str,
+                       "shape": list(array.shape),
+                       "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = dict(header)
+    header["arrays"] = index
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    prefix_length = len(MAGIC) + struct.calcsize("<IQ")
+    data_start = _aligned(prefix_length + len(header_bytes))
+    with open(file_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<IQ", BUNDLE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, array in arrays:
+            f.write(b"\0" * (data_start + index[name]["offset"] - f.tell()))
+            f.write(array.tostring())
+
+
+def read_bundle(file_path):
+    """Returns the header dict and a dict of name -> read only numpy
+    array backed by a memory map of the bundle file.
+    """
+    with open(file_path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a model bundle".format(file_path))
+        version, header_length = struct.unpack(
+            "<IQ", f.read(struct.calcsize("<IQ")))
+        if version != BUNDLE_VERSION:
+            raise ValueError("{} is a version {} bundle, expected {}".format(
+                file_path, version, BUNDLE_VERSION))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+        data_start = _aligned(f.tell())
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arrays = {}
+    for name, info in header["arrays"].items():
+        dtype = np.dtype(str(info["dtype"]))
+        shape = tuple(info["shape"])
+        count = int(np.prod(shape)) if shape else 1
+        arrays[name] = np.frombuffer(
+            data, dtype=dtype, count=count,
+            offset=data_start + info["offset"]).reshape(shape)
+    return header, arrays
+
+
+def _string_array(strings):
+    """Newline separated (utf-8) strings as a uint8 array."""
+    data = "\n".join(strings)
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _strings_from_array(array):
+    if array.size == 0:
+        return []
+    return array.tostring().split("\n")
+
+
+def _model_weights(tagger):
+    """The current values of the tagger's RNN weights by name."""
+    model = tagger.model
+    weights = {}
+    for name in RNN_WEIGHT_NAMES[tagger.model_type]:
+        param = model.emb if name == "embeddings" else getattr(model, name)
+        weights[name] = np.asarray(param.get_value())
+    weights["h0"] = np.asarray(tagger.initial_h0_state)
+    if tagger.model_type == "lstm":
+        weights["c0"] = np.asarray(tagger.initial_c0_state)
+    return weights
+
+
+def export_tagger_bundle(tagger, file_path):
+    """Save all the inference time state of the DeepDisfluencyTagger
+    to a single bundle file.
+    """
+    if tagger.model_type not in RNN_WEIGHT_NAMES:
+        raise NotImplementedError("No bundle export for {0}".format(
+            tagger.model_type))
+    if tagger.args.n_language_model_features + \
+            tagger.args.n_acoustic_features > 0:
+        raise NotImplementedError("No bundle export for models with extra\
+         (acoustic/language model) input features")
+    header = {"args": vars(tagger.args),
+              "tag_to_index_map": tagger.tag_to_index_map,
+              "word_to_index_map": tagger.word_to_index_map,
+              "pos_to_index_map": tagger.pos_to_index_map,
+              "hmm_dict": tagger.hmm_dict}
+    arrays = {}
+    for name, value in _model_weights(tagger).items():
+        arrays["rnn/" + name] = value
+
+    if tagger.decoder:
+        markov_model = tagger.decoder.markov_model
+        header["markov_model"] = {"tags": markov_model.tags}
+        arrays["markov_model/counts"] = markov_model.counts
+
+    if tagger.timing_model:
+        timer = tagger.timing_model
+        scaler = tagger.timing_model_scaler
+        header["timing_model"] = {
+            "multi_class": getattr(timer, "multi_class", "ovr"),
+            "classes": np.asarray(timer.classes_).tolist()}
+        arrays["timing_model/coef"] = timer.coef_
+        arrays["timing_model/intercept"] = timer.intercept_
+        arrays["timing_model/mean"] = scaler.mean_
+        # older sklearn scalers only have std_
+        arrays["timing_model/scale"] = getattr(scaler, "scale_", None) \
+            if getattr(scaler, "scale_", None) is not None else scaler.std_
+
+    header["language_models"] = {}
+    for lm_name in ["lm", "pos_lm", "edit_lm"]:
+        # only those built, the others are built on first use if needed
+        lm = tagger.__dict__.get(lm_name)
+        if lm is None:
+            continue
+        header["language_models"][lm_name] = dict(
+            (attr, getattr(lm, attr)) for attr in LM_SCALAR_ATTRIBUTES)
+        for map_name in LM_MAP_ATTRIBUTES:
+            items = sorted((k, v) for k, v in getattr(lm, map_name).items()
+                           if v)
+            prefix = "{}/{}/".format(lm_name, map_name)
+            arrays[prefix + "keys"] = _string_array([k for k, _ in items])
+            arrays[prefix + "counts"] = np.asarray([v for _, v in items],
+                                                   dtype=np.int64)
+
+    pos_tagger = tagger.pos_tagger
+    if pos_tagger is not None:
+        arrays["pos_tagger/crf_model"] = pos_tagger_model(pos_tagger)
+    write_bundle(file_path, header, arrays)
+
+
+def pos_tagger_model(pos_tagger):
+    """The CRF model bytes of a CRFTagger, those it was loaded from if
+    from a bundle, else read from its model file."""
+    crf_model = getattr(pos_tagger, "crf_model", None)
+    if crf_model is None:
+        with open(pos_tagger._model_file, "rb") as f:
+            crf_model = np.frombuffer(f.read(), dtype=np.uint8)
+    return crf_model
+
+
+class BundledLogisticRegression(object):
+    """The predict_proba of a fitted sklearn LogisticRegression
+    from its coefficients.
+    """
+    def __init__(self, coef, intercept, classes, multi_class="ovr"):
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.classes_ = np.asarray(classes)
+        self.multi_class = multi_class
+
+    def decision_function(self, X):
+        scores = np.dot(X, self.coef_.T) + self.intercept_
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X)
+        if self.multi_class == "multinomial":
+            if scores.ndim == 1:
+                scores = np.vstack([-scores, scores]).T
+            scores = scores - scores.max(axis=1, keepdims=True)
+            prob = np.exp(scores)
+            return prob / prob.sum(axis=1, keepdims=True)
+        prob = 1.0 / (1.0 + np.exp(-scores))
+        if prob.ndim == 1:
+            return np.vstack([1 - prob, prob]).T
+        return prob / prob.sum(axis=1, keepdims=True)
+
+
+class BundledStandardScaler(object):
+    """The transform of a fitted sklearn StandardScaler."""
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+def load_language_model(header, arrays, lm_name):
+    from deep_disfluency.language_model.ngram_language_model import \
+        KneserNeySmoothingModel
+    attrs = header["language_models"][lm_name]
+    lm = KneserNeySmoothingModel(order=attrs["order"],
+                                 discount=attrs["discount"],
+                                 partial_words=attrs["partial_words"],
+                                 verbose=False)
+    for attr in LM_SCALAR_ATTRIBUTES:
+        setattr(lm, attr, attrs[attr])
+    for map_name in LM_MAP_ATTRIBUTES:
+        prefix = "{}/{}/".format(lm_name, map_name)
+        keys = _strings_from_array(arrays[prefix + "keys"])
+        setattr(lm, map_name, defaultdict(
+            int, zip(keys, arrays[prefix + "counts"].tolist())))
+    return lm
+
+
+def load_pos_tagger(crf_model):
+    """A CRFTagger opened on the CRF model bytes, directly from memory
+    if this python-crfsuite supports it, otherwise via a temporary file,
+    removed once opened (crfsuite reads the whole model in). The bytes
+    are kept as its crf_model so it can be exported again.
+    """
+    from nltk.tag import CRFTagger
+    pos_tagger = CRFTagger()
+    pos_tagger.crf_model = crf_model
+    try:
+        pos_tagger._tagger.open_inmemory(crf_model.tostring())
+        pos_tagger._model_file = "<bundle>"
+    except AttributeError:
+        fd, model_file = tempfile.mkstemp(suffix=".crfsuite")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(crf_model.tostring())
+            pos_tagger.set_model_file(model_file)
+        finally:
+            os.remove(model_file)
+    return pos_tagger
+
+
+def load_markov_model(header, arrays):
+    from deep_disfluency.decoder.markov_model import MarkovTransitionModel
+    return MarkovTransitionModel(header["markov_model"]["tags"],
+                                 arrays["markov_model/counts"])
+
+
+def _str_keys(d):
+    """JSON gives back unicode, the tagger's maps are of str and, as from
+    load_tags, give 0 for unseen keys (e.g. the "<s>" padding)."""
+    return defaultdict(int, ((str(k), v) for k, v in d.items()))
+
+
+def init_tagger_from_bundle(tagger, file_path, use_timing_data=None,
+                            use_decoder=True):
+    """Populate a (not yet initialized) DeepDisfluencyTagger from the
+    bundle file, using the numpy inference versions of the RNNs.
+    """
+    from deep_disfluency.rnn.numpy_rnn import NumpyElman, NumpyLSTM
+    from deep_disfluency.decoder.hmm import FirstOrderHMM
+    from deep_disfluency.decoder.noisy_channel import SourceModel
+    from utils import SimpleArgs
+
+    header, arrays = read_bundle(file_path)
+    tagger.bundle_file = file_path
+    tagger.args = SimpleArgs()
+    for key, value in header["args"].items():
+        if isinstance(value, unicode):
+            value = str(value)
+        setattr(tagger.args, str(key), value)
+    if use_timing_data is not None:
+        tagger.args.use_timing_data = use_timing_data
+    tagger.tag_to_index_map = _str_keys(header["tag_to_index_map"])
+    tagger.word_to_index_map = _str_keys(header["word_to_index_map"])
+    tagger.pos_to_index_map = _str_keys(header["pos_to_index_map"])
+    tagger.hmm_dict = _str_keys(header["hmm_dict"])
+    tagger.model_type = tagger.args.model_type
+    tagger.window_size = tagger.args.window
+
+    weights = dict((name[len("rnn/"):], array)
+                   for name, array in arrays.items()
+                   if name.startswith("rnn/"))
+    if header.get("quantization"):
+        # reduced precision matrices, see quantize_bundle.py
+        scales = dict((name[len("rnn_scale/"):], array)
+                      for name, array in arrays.items()
+                      if name.startswith("rnn_scale/"))
+        weights = quantized_weights(weights, scales)
+    model_class = {"elman": NumpyElman, "lstm": NumpyLSTM}[tagger.model_type]
+    tagger.model = model_class(weights,
+                               de=tagger.args.emb_dimension,
+                               cs=tagger.window_size,
+                               npos=len(tagger.pos_to_index_map))
+    tagger.initial_h0_state = weights["h0"]
+    tagger.initial_c0_state = weights.get("c0")
+
+    tagger.pos_tagger = None
+    if "pos_tagger/crf_model" in arrays:
+        tagger.pos_tagger = load_pos_tagger(arrays["pos_tagger/crf_model"])
+    for lm_name in ["lm", "pos_lm", "edit_lm"]:
+        if lm_name in header["language_models"]:
+            setattr(tagger, lm_name,
+                    load_language_model(header, arrays, lm_name))
+
+    tagger.timing_model = None
+    tagger.timing_model_scaler = None
+    if tagger.args.use_timing_data:
+        if "timing_model" not in header:
+            raise ValueError("{} has no timing model".format(file_path))
+        timer = header["timing_model"]
+        tagger.timing_model = BundledLogisticRegression(
+            arrays["timing_model/coef"], arrays["timing_model/intercept"],
+            timer["classes"], timer["multi_class"])
+        tagger.timing_model_scaler = BundledStandardScaler(
+            arrays["timing_model/mean"], arrays["timing_model/scale"])
+
+    noisy_channel = None
+    if 'noisy_channel' in tagger.args.decoder_type:
+        noisy_channel = SourceModel(tagger.lm,
+                                    getattr(tagger, "pos_lm", None),
+                                    uttseg=tagger.args.do_utt_segmentation)
+    tagger.decoder = None
+    if use_decoder:
+        markov_model = None
+        if "markov_model" in header:
+            markov_model = load_markov_model(header, arrays)
+        tagger.decoder = FirstOrderHMM(
+            tagger.hmm_dict,
+            markov_model=markov_model,
+            markov_model_file=tagger.args.tags,
+            timing_model=tagger.timing_model,
+            timing_model_scaler=tagger.timing_model_scaler,
+            constraint_only=True,
+            noisy_channel=noisy_channel)
+
+
+def main():
+    THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(THIS_DIR + "/../../")
+    from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+    parser = argparse.ArgumentParser(description='Export a trained\
+        disfluency tagger to a single file model bundle.')
+    parser.add_argument('-c', '--config-number', type=int, required=True,
+                        help='The config number in the config file.')
+    parser.add_argument('-f', '--config-file', type=str,
+                        default="experiments/experiment_configs.csv",
+                        help='The config file relative to deep_disfluency.')
+    parser.add_argument('-m', '--model-dir', type=str, required=True,
+                        help='The saved model weights folder relative to\
+                         deep_disfluency, e.g. experiments/035/epoch_6.')
+    parser.add_argument('-t', '--use-timing-data', action='store_true',
+                        help='Include the timing model.')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='The bundle file to write.')
+    args = parser.parse_args()
+    tagger = DeepDisfluencyTagger(config_file=args.config_file,
+                                  config_number=args.config_number,
+                                  saved_model_dir=args.model_dir,
+                                  use_timing_data=args.use_timing_data)
+    export_tagger_bundle(tagger, args.output)
+    print "saved bundle to", args.output, \
+        "({0:.1f}MB)".format(os.path.getsize(args.output) / (1024 * 1024))
+
+
+if __name__ == '__main__':
+    main()
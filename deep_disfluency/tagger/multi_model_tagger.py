@@ -0,0 +1,255 @@
+"""Several DeepDisfluencyTaggers (e.g. the joint model of config 35, the
+disfluency only model of 37 and the utterance segmentation only model of
+38) tagging the same word stream, sharing the front-end stages of tagging:
+
+    - the POS tagger, run once per word
+    - the standardization of the word and POS tag (their vocabularies must
+    be the same)
+    - the language models of the noisy channel decoders, trained or loaded
+    once, with the n-gram probabilities of each word computed once for all
+    the decoders using them
+    - the timing model, loaded once, with the timing classifier's
+    probabilities for a word computed once for all the decoders using it
+
+Each processed word is then fanned out to the taggers' own RNNs and
+decoders, so running N models costs the front-end once plus N times the
+RNN step and decoding:
+
+    tagger = MultiModelTagger.from_configs(
+        [("joint", 35, "experiments/035/epoch_6"),
+         ("disf", 37, "experiments/037/epoch_6"),
+         ("uttseg", 38, "experiments/038/epoch_8")],
+        use_timing_data=True)
+    diffs = tagger.tag_new_word("john", timing=0.33)
+    print diffs["joint"], diffs["disf"], diffs["uttseg"]
+
+The POS tags are those the first (lead) tagger would give, in the context
+of its word graph.
+"""
+from collections import OrderedDict
+
+from deep_disfluency.utils.instrumentation import Instrumentation, clock
+from deep_tagger import DeepDisfluencyTagger
+
+
+class LastInputCache(object):
+    """Stands in for a (timing) classifier or scaler shared by several
+    decoders, computing its transform and predict_proba for an input only
+    once when they are called for the same input one after another.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.last = {}
+
+    def _cached(self, method, X):
+        key = (X.shape, X.tostring())
+        last = self.last.get(method)
+        if last is not None and last[0] == key:
+            return last[1]
+        result = getattr(self.model, method)(X)
+        self.last[method] = (key, result)
+        return result
+
+    def transform(self, X):
+        return self._cached("transform", X)
+
+    def predict_proba(self, X):
+        return self._cached("predict_proba", X)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+class NgramProbCache(object):
+    """Stands in for a language model shared by several noisy channel
+    source models, computing the probability of each n-gram only once
+    when they consume the same words. Holds at most max_size n-grams,
+    cleared when full, as those of the last words are the ones asked for
+    again.
+    """
+    def __init__(self, lm, max_size=100000):
+        self.lm = lm
+        self.max_size = max_size
+        self.probs = {}
+
+    def ngram_prob(self, ngram, order, *args):
+        key = (tuple(ngram), order) + args
+        prob = self.probs.get(key)
+        if prob is None:
+            if len(self.probs) >= self.max_size:
+                self.probs = {}
+            prob = self.lm.ngram_prob(ngram, order, *args)
+            self.probs[key] = prob
+        return prob
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.lm, name)
+
+
+def _model_key(model):
+    # the default timing models are LazyPickles of the same files
+    return getattr(model, "_file_path", None) or id(model)
+
+
+class MultiModelTagger(object):
+    """Tags each word with all of the given taggers, sharing their
+    front-end (see above).
+
+    :param taggers: a list of (name, DeepDisfluencyTagger) pairs, or a
+    dict, all with the same word and POS maps and use of POS tags
+    :param instrumentation: whether to record the latency of the shared
+    stages (each tagger keeps its own instrumentation)
+    """
+    def __init__(self, taggers, instrumentation=False):
+        self.taggers = OrderedDict(taggers)
+        if not self.taggers:
+            raise ValueError("no taggers given")
+        self.lead = self.taggers.values()[0]
+        for name, tagger in self.taggers.items():
+            if tagger.args.pos != self.lead.args.pos or \
+                    tagger.word_to_index_map != self.lead.word_to_index_map \
+                    or tagger.pos_to_index_map != \
+                    self.lead.pos_to_index_map:
+                raise ValueError(
+                    "tagger {} has a different vocabulary from {}".format(
+                        name, self.taggers.keys()[0]))
+        self.share_components()
+        self.instrumentation = Instrumentation(enabled=instrumentation)
+
+    @classmethod
+    def from_configs(cls, configs,
+                     config_file="experiments/experiment_configs.csv",
+                     pos_tagger=None,
+                     language_model=None, pos_language_model=None,
+                     timer=None, timer_scaler=None, use_timing_data=False,
+                     use_decoder=True, instrumentation=False):
+        """Build the taggers of a list of (name, config number, saved model
+        folder) triples from the config file, each using the POS tagger,
+        language models and timing model given or built by those before.
+        The config file is relative to the deep_disfluency folder.
+        """
+        taggers = []
+        for name, config_number, saved_model_dir in configs:
+            tagger = DeepDisfluencyTagger(
+                config_file=config_file,
+                config_number=config_number,
+                saved_model_dir=saved_model_dir,
+                pos_tagger=pos_tagger,
+                language_model=language_model,
+                pos_language_model=pos_language_model,
+                timer=timer,
+                timer_scaler=timer_scaler,
+                use_timing_data=use_timing_data,
+                use_decoder=use_decoder,
+                instrumentation=instrumentation)
+            pos_tagger = pos_tagger or tagger.__dict__.get("pos_tagger")
+            language_model = language_model or tagger.__dict__.get("lm")
+            pos_language_model = pos_language_model or \
+                tagger.__dict__.get("pos_lm")
+            timer = timer or tagger.timing_model
+            timer_scaler = timer_scaler or tagger.timing_model_scaler
+            taggers.append((name, tagger))
+        return cls(taggers, instrumentation=instrumentation)
+
+    def share_components(self):
+        """Give the taggers which haven't built their POS tagger or
+        language models yet those of another, and wrap each distinct
+        timing model and scaler in a LastInputCache, and each distinct
+        language model of the noisy channel source models in an
+        NgramProbCache, shared by the decoders using it.
+        """
+        taggers = self.taggers.values()
+        for name in DeepDisfluencyTagger.LAZY_COMPONENTS:
+            built = [t.__dict__[name] for t in taggers if name in t.__dict__]
+            if not built:
+                continue
+            for tagger in taggers:
+                tagger.__dict__.setdefault(name, built[0])
+        caches = {}
+        for tagger in taggers:
+            if tagger.timing_model is None:
+                continue
+            for attr in ["timing_model", "timing_model_scaler"]:
+                model = getattr(tagger, attr)
+                if not isinstance(model, LastInputCache):
+                    key = (attr, _model_key(model))
+                    if key not in caches:
+                        caches[key] = LastInputCache(model)
+                    setattr(tagger, attr, caches[key])
+                if tagger.decoder:
+                    setattr(tagger.decoder, attr, getattr(tagger, attr))
+        for tagger in taggers:
+            source = tagger.decoder.noisy_channel_source_model \
+                if tagger.decoder else None
+            if source is None:
+                continue
+            for attr in ["lm", "pos_lm"]:
+                lm = getattr(source, attr)
+                if lm is None or isinstance(lm, NgramProbCache):
+                    continue
+                key = (attr, id(lm))
+                if key not in caches:
+                    caches[key] = NgramProbCache(lm)
+                setattr(source, attr, caches[key])
+
+    def new_session(self):
+        """A new multi model tagger for another word stream (see
+        DeepDisfluencyTagger.new_session), sharing the models."""
+        return MultiModelTagger(
+            [(name, tagger.new_session())
+             for name, tagger in self.taggers.items()],
+            instrumentation=self.instrumentation.enabled)
+
+    def tag_new_word(self, word, pos=None, timing=None, diff_only=True,
+                     rollback=0):
+        """Tag a new word with each tagger, returning a dict of their
+        names to their outputs as DeepDisfluencyTagger.tag_new_word.
+        """
+        stats = self.instrumentation if self.instrumentation.enabled \
+            else None
+        if stats:
+            start_time = t = clock()
+            stats.increment("words")
+        for tagger in self.taggers.values():
+            tagger.rollback(rollback)
+        if pos is None and self.lead.args.pos:
+            pos = self.lead.pos_tag_word(word)
+            if stats:
+                t = stats.lap("pos_tagging", t)
+        word, pos = self.lead.standardize_word_and_pos(word, pos)
+        if stats:
+            t = stats.lap("standardize", t)
+        output = OrderedDict()
+        for name, tagger in self.taggers.items():
+            step = tagger.start_word(word, pos=pos, timing=timing,
+                                     processed=True)
+            output[name] = tagger.finish_word(step, tagger.rnn_step(step),
+                                              diff_only=diff_only)
+        if stats:
+            stats.lap("models", t)
+            stats.lap("total", start_time)
+        return output
+
+    def rollback(self, backwards):
+        for tagger in self.taggers.values():
+            tagger.rollback(backwards)
+
+    def reset(self):
+        for tagger in self.taggers.values():
+            tagger.reset()
+
+    def get_output_tags(self, with_words=False):
+        return OrderedDict(
+            (name, tagger.get_output_tags(with_words=with_words))
+            for name, tagger in self.taggers.items())
+
+    def get_instrumentation_report(self):
+        """The shared stages' report and each tagger's, by name."""
+        report = {"front_end": self.instrumentation.report()}
+        for name, tagger in self.taggers.items():
+            report[name] = tagger.get_instrumentation_report()
+        return report
@@ -0,0 +1,164 @@
+"""Write a reduced precision (float16 or int8) copy of a model bundle and
+report its tagging accuracy against the full precision one.
+
+The RNN weight matrices of the bundle (see model_bundle.py) are stored as
+float16 or per matrix symmetric int8 (see rnn/quantization.py), about a
+half or a quarter of their float32 size; the rest of the bundle is copied
+unchanged. The report tags a held-out corpus file word by word with both
+bundles' taggers and gives, for the relaxed word level tags of the final
+output, the precision, recall and F-score of each against the gold tags,
+plus how many of the words the two tag the same, e.g.:
+
+    python quantize_bundle.py -b lstm_035_timing.ddb \
+        -o lstm_035_timing_int8.ddb -q int8 --max-words 20000
+"""
+from __future__ import division
+import argparse
+import os
+
+import numpy as np
+
+from deep_disfluency.evaluation.eval_utils import \
+    get_tag_data_from_corpus_file, p_r_f
+from deep_disfluency.rnn.quantization import QUANTIZATION_MODES, \
+    quantize_weights
+from model_bundle import read_bundle, write_bundle
+
+# as disf_evaluation.RELAXED_TAGS with the utterance segmentation
+REPORT_TAGS = ["<rps", "<e", "t/>"]
+HELDOUT_FILE = os.path.dirname(os.path.realpath(__file__)) + \
+    "/../data/disfluency_detection/switchboard/" + \
+    "swbd_disf_heldout_data_timings.csv"
+
+
+def quantize_bundle(bundle_file, output_file, mode):
+    """Write the bundle with its RNN weight matrices in the quantization
+    mode to output_file, returning the bytes of the RNN weights before
+    and after.
+    """
+    header, arrays = read_bundle(bundle_file)
+    if header.get("quantization"):
+        raise ValueError("{} is already quantized ({})".format(
+            bundle_file, header["quantization"]))
+    weights = dict((name[len("rnn/"):], array)
+                   for name, array in arrays.items()
+                   if name.startswith("rnn/"))
+    quantized, scales = quantize_weights(weights, mode)
+    for name in weights:
+        arrays["rnn/" + name] = quantized[name]
+    for name, scale in scales.items():
+        arrays["rnn_scale/" + name] = np.asarray(scale, dtype=np.float32)
+    del header["arrays"]
+    header["quantization"] = mode
+    write_bundle(output_file, header, arrays)
+    return sum(a.nbytes for a in weights.values()), \
+        sum(a.nbytes for a in quantized.values())
+
+
+def tag_corpus_file(tagger, corpus_file, max_words=None):
+    """Tag the dialogues of a corpus file word by word (as
+    incremental_output_from_file), returning the lists of the words'
+    final output tags and of their gold tags.
+    """
+    IDs, timings, words, pos_tags, labels = \
+        get_tag_data_from_corpus_file(corpus_file)
+    output_tags = []
+    gold_tags = []
+    for dialogue_timings, dialogue_words, dialogue_pos, dialogue_labels in \
+            zip(timings, words, pos_tags, labels):
+        if max_words is not None and len(output_tags) >= max_words:
+            break
+        n = len(dialogue_words) if max_words is None else \
+            min(len(dialogue_words), max_words - len(output_tags))
+        tagger.reset()
+        current_time = 0
+        for word, pos, (_, end) in zip(dialogue_words[:n],
+                                       dialogue_pos[:n],
+                                       dialogue_timings[:n]):
+            timing = None
+            if tagger.args.use_timing_data:
+                timing = end - current_time
+            tagger.tag_new_word(word, pos, timing)
+            current_time = end
+        output_tags.extend(tagger.get_output_tags())
+        gold_tags.extend(dialogue_labels[:n])
+    return output_tags, gold_tags
+
+
+def relaxed_tag_accuracy(output_tags, gold_tags, tags=REPORT_TAGS):
+    """The (precision, recall, F-score) of each tag at the word level,
+    a word being correct when the tag is in both its output and gold tags.
+    """
+    accuracy = {}
+    for tag in tags:
+        tps = fps = fns = 0
+        for output, gold in zip(output_tags, gold_tags):
+            if tag in output:
+                if tag in gold:
+                    tps += 1
+                else:
+                    fps += 1
+            elif tag in gold:
+                fns += 1
+        accuracy[tag] = p_r_f(tps, fps, fns)
+    return accuracy
+
+
+def accuracy_report(full_tagger, quantized_tagger, corpus_file,
+                    max_words=None):
+    """The relaxed tag accuracy of both taggers on the corpus file and
+    the share of words they tag the same."""
+    full_tags, gold_tags = tag_corpus_file(full_tagger, corpus_file,
+                                           max_words)
+    quantized_tags, _ = tag_corpus_file(quantized_tagger, corpus_file,
+                                        max_words)
+    same = sum(1 for a, b in zip(full_tags, quantized_tags) if a == b)
+    return {"words": len(gold_tags),
+            "agreement": same / max(len(gold_tags), 1),
+            "full": relaxed_tag_accuracy(full_tags, gold_tags),
+            "quantized": relaxed_tag_accuracy(quantized_tags, gold_tags)}
+
+
+def print_report(report, mode):
+    print "{} words, {:.2%} tagged the same".format(report["words"],
+                                                   report["agreement"])
+    print "{:<6} {:>22} {:>22}".format("tag", "full p/r/f", mode + " p/r/f")
+    for tag in REPORT_TAGS:
+        print "{:<6} {:>22} {:>22}".format(
+            tag, "/".join("{:.3f}".format(x) for x in report["full"][tag]),
+            "/".join("{:.3f}".format(x) for x in report["quantized"][tag]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a reduced precision\
+        copy of a model bundle and compare its accuracy.')
+    parser.add_argument('-b', '--bundle', type=str, required=True,
+                        help='The full precision model bundle.')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='The quantized bundle file to write.')
+    parser.add_argument('-q', '--quantization', type=str, default="int8",
+                        choices=QUANTIZATION_MODES,
+                        help='The weight matrix precision.')
+    parser.add_argument('-e', '--eval-file', type=str, default=HELDOUT_FILE,
+                        help='The corpus file for the accuracy report.')
+    parser.add_argument('--max-words', type=int, default=None,
+                        help='Only report on this many words.')
+    parser.add_argument('--no-report', action='store_true',
+                        help='Only write the quantized bundle.')
+    args = parser.parse_args()
+    before, after = quantize_bundle(args.bundle, args.output,
+                                    args.quantization)
+    print "RNN weights {:.2f}MB -> {:.2f}MB, saved {} ({:.1f}MB)".format(
+        before / (1024 * 1024), after / (1024 * 1024), args.output,
+        os.path.getsize(args.output) / (1024 * 1024))
+    if args.no_report:
+        return
+    from deep_tagger import DeepDisfluencyTagger
+    report = accuracy_report(DeepDisfluencyTagger.from_bundle(args.bundle),
+                             DeepDisfluencyTagger.from_bundle(args.output),
+                             args.eval_file, args.max_words)
+    print_report(report, args.quantization)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Compact snapshots of the per-session state of a DeepDisfluencyTagger,
+without any of its models, for moving live sessions between workers and
+resuming them after a worker restart.
+
+Only the state within the last horizon words (by default the 20 RNN states
+the tagger keeps, so the furthest it can roll back anyway) is saved:
+
+    - the RNN hidden (and cell) state history
+    - the end of the word graph (covering the RNN's input window)
+    - the softmax history, the decoder's viterbi, backpointer, converted,
+    timing distribution and best tag sequence lists and the noisy channel
+    source model's graphs and trees back to the horizon
+    - the output tags back to the horizon
+
+Everything before the horizon is committed: the snapshot records how many
+words and output tags there are and the committed offset, from which on
+the tags are kept. On restore the lists get their full length back with
+placeholders (COMMITTED) before the offset, so all indices stay the same,
+and the decoder backpointers before it all point back to the placeholder
+tag so the best sequence before the horizon can no longer change. Restored
+sessions therefore can't be rolled back beyond the committed offset and
+their get_output_tags() has the placeholder for the committed tags, which
+the client has already received.
+
+The snapshots are pickled (protocol 2) and zlib compressed, so must only be
+loaded from trusted sources, e.g. the workers of the same deployment.
+"""
+import cPickle
+import zlib
+from copy import deepcopy
+from itertools import islice, izip
+
+import numpy as np
+
+SNAPSHOT_VERSION = 2
+DEFAULT_HORIZON = 20
+COMMITTED = ""  # placeholder for the words, tags etc. before the horizon
+
+
+class CommittedBackpointer(object):
+    """Stands in for a decoder backpointer dict before the horizon,
+    pointing every tag back to the committed placeholder tag."""
+
+    def __getitem__(self, tag):
+        return COMMITTED
+
+    def get(self, tag, default=None):
+        return COMMITTED
+
+
+def _tail(sequence, keep):
+    return {"length": len(sequence),
+            "tail": list(sequence[max(0, len(sequence) - keep):])}
+
+
+def _restore(tail, filler):
+    return [filler] * (tail["length"] - len(tail["tail"])) + tail["tail"]
+
+
+def _model_signature(tagger):
+    """What a snapshot's tagger has to match to be restored into."""
+    decoder = tagger.decoder
+    return {"model_type": tagger.model_type,
+            "tags": tagger.args.tags,
+            "window_size": tagger.window_size,
+            "decoder": decoder is not None,
+            "noisy_channel": bool(
+                decoder and decoder.noisy_channel_source_model)}
+
+
+def snapshot_session(tagger, horizon=DEFAULT_HORIZON):
+    """A dict of the session state of the tagger back to horizon words."""
+    if horizon < 1:
+        raise ValueError("the horizon must be at least one word")
+    n_words = len(tagger.output_tags)
+    state = {"version": SNAPSHOT_VERSION,
+             "model": _model_signature(tagger),
+             "horizon": horizon,
+             "n_words": n_words,
+             "committed": max(0, n_words - horizon),
+             "word_graph": _tail(tagger.word_graph,
+                                 horizon + tagger.window_size - 1),
+             "output_tags": _tail(tagger.output_tags, horizon),
+             "state_history": list(tagger.state_history[-horizon:]),
+             "softmax_history": _tail(tagger.softmax_history, horizon)}
+    decoder = tagger.decoder
+    if decoder:
+        state["decoder"] = dict(
+            (name, _tail(getattr(decoder, name), horizon))
+            for name in ["viterbi", "backpointer", "converted",
+                         "timing_distributions"])
+        # NB starting with the start tag, so one longer
+        state["decoder"]["best_tagsequence"] = \
+            _tail(decoder.best_tagsequence, horizon + 1)
+        state["decoder"]["history_length"] = len(decoder.history)
+        source = decoder.noisy_channel_source_model
+        if source:
+            state["decoder"]["noisy_channel"] = \
+                _tail(decoder.noisy_channel, horizon)
+            state["source_model"] = {
+                "word_graph": _tail(source.word_graph,
+                                    horizon + source.lm.order - 1),
+                "pos_graph": None if source.pos_graph is None else
+                _tail(source.pos_graph, horizon + source.pos_lm.order - 1),
+                "word_tree": _tail(source.word_tree, horizon + 1),
+                "pos_tree": _tail(source.pos_tree, horizon + 1)}
+    return state
+
+
+def restore_session(tagger, state):
+    """Set the session state of the tagger (e.g. a new_session() of a
+    tagger with the same model) to that of the snapshot dict."""
+    if state["version"] != SNAPSHOT_VERSION:
+        raise ValueError("unsupported snapshot version {}".format(
+            state["version"]))
+    if state["model"] != _model_signature(tagger):
+        raise ValueError("snapshot of a different model: {} not {}".format(
+            state["model"], _model_signature(tagger)))
+    tagger.word_graph = _restore(state["word_graph"],
+                                 (COMMITTED, COMMITTED, None))
+    tagger.output_tags = _restore(state["output_tags"], COMMITTED)
+    tagger.state_history = list(state["state_history"])
+    softmax_tail = state["softmax_history"]["tail"]
+    tagger.softmax_history = _restore(
+        state["softmax_history"],
+        np.zeros_like(softmax_tail[0]) if softmax_tail else None)
+    decoder = tagger.decoder
+    if not decoder:
+        return
+    # the placeholders are shared, they are never written to
+    decoder_state = state["decoder"]
+    decoder.viterbi = _restore(decoder_state["viterbi"], {})
+    decoder.backpointer = _restore(decoder_state["backpointer"],
+                                   CommittedBackpointer())
+    decoder.converted = _restore(decoder_state["converted"], {})
+    decoder.timing_distributions = _restore(
+        decoder_state["timing_distributions"], None)
+    decoder.best_tagsequence = _restore(decoder_state["best_tagsequence"],
+                                        COMMITTED)
+    # the history is a copy of the last steps of the lists, most recent first
+    decoder.history = [
+        {"viterbi": deepcopy(v), "backpointer": deepcopy(b),
+         "converted": deepcopy(c)}
+        for v, b, c in islice(izip(reversed(decoder.viterbi),
+                                   reversed(decoder.backpointer),
+                                   reversed(decoder.converted)),
+                              decoder_state["history_length"])]
+    source = decoder.noisy_channel_source_model
+    if source:
+        decoder.noisy_channel = _restore(decoder_state["noisy_channel"], {})
+        source_state = state["source_model"]
+        source.word_graph = _restore(source_state["word_graph"], COMMITTED)
+        source.pos_graph = None if source_state["pos_graph"] is None else \
+            _restore(source_state["pos_graph"], COMMITTED)
+        source.word_tree = _restore(source_state["word_tree"], {})
+        source.pos_tree = _restore(source_state["pos_tree"], {})
+
+
+def encode_snapshot(state):
+    return zlib.compress(cPickle.dumps(state, 2), 1)
+
+
+def decode_snapshot(data):
+    return cPickle.loads(zlib.decompress(data))
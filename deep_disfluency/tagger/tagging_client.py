@@ -0,0 +1,163 @@
+"""A client of the tagging daemon (tagging_daemon.py) and a load generator
+standing in for many concurrent ASR streams.
+
+    client = TaggingClient("/tmp/deep_disfluency.sock")
+    client.open_session(1)
+    result = client.tag_word(1, 0, "john", timing=0.33)
+    print result["start"], result["tags"]
+    client.close_session(1)
+
+The load generator runs each stream in its own thread with its own
+connection, sending the words of a test file (or a made up dialogue)
+at a given rate and with occasional rollbacks, and prints the round trip
+latency of the words and the daemon's queueing vs compute report:
+
+    python tagging_client.py -s /tmp/deep_disfluency.sock -n 32 -r 5
+"""
+from __future__ import division
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+
+from deep_disfluency.utils.instrumentation import Instrumentation, clock
+import tagging_protocol as protocol
+
+DEFAULT_WORDS = ["john", "likes", "uh", "loves", "mary", "i", "mean",
+                 "i", "i", "think", "it", "is", "a", "good", "idea",
+                 "you", "know", "well", "we", "we", "went", "there"]
+
+
+class TaggingClient(object):
+    """A blocking connection to the daemon, one request at a time."""
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+
+    def request(self, msg_type, **fields):
+        protocol.write_frame(self.sock,
+                             protocol.encode_message(msg_type, **fields))
+        payload = protocol.read_frame(self.sock)
+        if payload is None:
+            raise IOError("the daemon closed the connection")
+        message = protocol.decode_message(payload)
+        if message["type"] == protocol.ERROR:
+            raise RuntimeError(message["message"])
+        return message
+
+    def open_session(self, session_id):
+        self.request(protocol.OPEN, session=session_id)
+
+    def close_session(self, session_id):
+        self.request(protocol.CLOSE, session=session_id)
+
+    def tag_word(self, session_id, word_id, word, timing=None, pos=None,
+                 rollback=0):
+        """Returns the TAGS message: the changed output tags from
+        index start on, with the daemon's queue_us and compute_us."""
+        return self.request(protocol.WORD, session=session_id,
+                            word_id=word_id, word=word, timing=timing,
+                            pos=pos, rollback=rollback)
+
+    def rollback(self, session_id, n):
+        self.request(protocol.ROLLBACK, session=session_id, rollback=n)
+
+    def stats(self):
+        return json.loads(self.request(protocol.STATS)["json"])
+
+    def close(self):
+        self.sock.close()
+
+
+def words_from_file(file_path):
+    """The words of a disfluency detection corpus file
+    (as read by get_tag_data_from_corpus_file)."""
+    from deep_disfluency.evaluation.eval_utils import \
+        get_tag_data_from_corpus_file
+    seq = get_tag_data_from_corpus_file(file_path)[2]
+    return [w for words in seq for w in words]
+
+
+def run_stream(socket_path, session_id, words, rate, rollback_prob,
+               stats):
+    """Send the words of one stream at rate words per second
+    (as fast as possible if 0), recording the round trips in stats."""
+    client = TaggingClient(socket_path)
+    client.open_session(session_id)
+    rng = random.Random(session_id)
+    next_time = clock()
+    tagged = 0
+    for word_id, word in enumerate(words):
+        rollback = 0
+        if tagged and rng.random() < rollback_prob:
+            rollback = 1  # an ASR revision of the last word
+        if rate:
+            next_time += 1.0 / rate
+            time.sleep(max(0, next_time - clock()))
+        t = clock()
+        result = client.tag_word(session_id, word_id, word,
+                                 timing=rng.uniform(0.1, 0.5),
+                                 rollback=rollback)
+        stats.record("round_trip", clock() - t)
+        stats.record("daemon_queueing", result["queue_us"] / 1e6)
+        stats.record("daemon_compute", result["compute_us"] / 1e6)
+        tagged += 1 - rollback
+    client.close_session(session_id)
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Put load on the\
+        tagging daemon with concurrent streams.')
+    parser.add_argument('-s', '--socket', type=str,
+                        default="/tmp/deep_disfluency.sock",
+                        help='The daemon\'s socket file.')
+    parser.add_argument('-n', '--streams', type=int, default=8,
+                        help='Number of concurrent streams.')
+    parser.add_argument('-w', '--words', type=int, default=200,
+                        help='Words per stream.')
+    parser.add_argument('-r', '--rate', type=float, default=5.0,
+                        help='Words per second per stream, 0 for as\
+                        fast as possible.')
+    parser.add_argument('--rollback-prob', type=float, default=0.1,
+                        help='Probability of a word revising the last.')
+    parser.add_argument('-f', '--file', type=str, default=None,
+                        help='Corpus file to take the words from.')
+    args = parser.parse_args()
+    words = words_from_file(args.file) if args.file else DEFAULT_WORDS
+    streams = []
+    stats = []
+    for i in range(args.streams):
+        offset = (i * 37) % len(words)
+        stream_words = [words[(offset + j) % len(words)]
+                        for j in range(args.words)]
+        stream_stats = Instrumentation()
+        stats.append(stream_stats)
+        streams.append(threading.Thread(
+            target=run_stream, args=(args.socket, i + 1, stream_words,
+                                     args.rate, args.rollback_prob,
+                                     stream_stats)))
+    start = clock()
+    for stream in streams:
+        stream.start()
+    for stream in streams:
+        stream.join()
+    elapsed = clock() - start
+    total = Instrumentation()
+    for stream_stats in stats:
+        total.merge(stream_stats)
+    n_words = args.streams * args.words
+    print "{} streams, {} words in {:.2f}s ({:.1f} words/s)".format(
+        args.streams, n_words, elapsed, n_words / elapsed)
+    total.print_report()
+    client = TaggingClient(args.socket)
+    print "daemon:"
+    print json.dumps(client.stats(), indent=1, sort_keys=True)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""A local tagging daemon serving many concurrent word streams over a
+Unix domain socket, with the framed protocol of tagging_protocol.py.
+
+Each connection can open any number of sessions, each with its own tagger
+state from DeepDisfluencyTagger.new_session(), all sharing one model.
+A thread per connection reads the requests into a single queue and one
+batching thread serves them: it gathers the requests arriving within
+batch_window seconds of the first (up to max_batch_size), then tags the
+new words of all the sessions in the batch together, computing their RNN
+steps in one call where the model is one of the numpy RNNs (e.g. when the
+tagger is built from a model bundle). Only one word per session can be in
+a step, so a session's later words in the batch wait for the next step.
+The decoding is still per session.
+
+The daemon's instrumentation separates the time each word waited for its
+batch to start ("queueing") from the time the batch took up to the word's
+result ("compute"), which are also sent back with each result.
+
+Run with e.g.:
+
+    python tagging_daemon.py -s /tmp/deep_disfluency.sock \
+        -b lstm_035_timing.ddb -w 2
+
+and put load on it with tagging_client.py.
+"""
+from __future__ import division
+import argparse
+import json
+import os
+import Queue
+import SocketServer
+import socket
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from deep_disfluency.utils.instrumentation import Instrumentation, clock
+from deep_tagger import DeepDisfluencyTagger
+import tagging_protocol as protocol
+
+# internal request type for a closed connection
+_DISCONNECT = 0
+
+
+def batched_rnn_steps(taggers, steps):
+    """The rnn_step output of each tagger for its step, computing those
+    of the taggers sharing a numpy model in a single step_batch call.
+    """
+    outputs = [None] * len(steps)
+    groups = defaultdict(list)
+    for i, tagger in enumerate(taggers):
+        if hasattr(tagger.model, "step_batch"):
+            groups[id(tagger.model)].append(i)
+        else:
+            outputs[i] = tagger.rnn_step(steps[i])
+    for indices in groups.values():
+        tagger = taggers[indices[0]]
+        group_steps = [steps[i] for i in indices]
+        result = tagger.model.step_batch(
+            np.asarray([s["word_window"] for s in group_steps]),
+            np.asarray([s["pos_window"] for s in group_steps]),
+            np.asarray([s["h0"] for s in group_steps]),
+            np.asarray([s["c0"] for s in group_steps])
+            if tagger.model_type == "lstm" else None)
+        for row, i in enumerate(indices):
+            outputs[i] = tuple(r[row:row + 1] for r in result)
+    return outputs
+
+
+class _Connection(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def send(self, msg_type, **fields):
+        payload = protocol.encode_message(msg_type, **fields)
+        with self.lock:
+            try:
+                protocol.write_frame(self.sock, payload)
+            except socket.error:
+                pass  # the client has gone, its sessions get closed
+
+
+class _RequestHandler(SocketServer.BaseRequestHandler):
+    """Reads a connection's requests into the daemon's queue."""
+
+    def handle(self):
+        requests = self.server.tagging_daemon.requests
+        connection = _Connection(self.request)
+        try:
+            while True:
+                payload = protocol.read_frame(self.request)
+                if payload is None:
+                    break
+                requests.put((connection, protocol.decode_message(payload),
+                              clock()))
+        except (protocol.ProtocolError, socket.error) as e:
+            connection.send(protocol.ERROR, session=0, message=str(e))
+        finally:
+            requests.put((connection, {"type": _DISCONNECT}, clock()))
+
+
+class _UnixServer(SocketServer.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class TaggingDaemon(object):
+    """Serves tagging sessions on a Unix domain socket.
+
+    :param socket_path: the socket file to listen on
+    :param tagger: an already built DeepDisfluencyTagger to share
+    :param bundle_file: otherwise a model bundle to build it from
+    :param batch_window: seconds to gather requests for after the first
+    :param max_batch_size: the most requests served together
+    :param tagger_kwargs: otherwise the DeepDisfluencyTagger arguments
+    """
+    def __init__(self, socket_path, tagger=None, bundle_file=None,
+                 batch_window=0.002, max_batch_size=64, **tagger_kwargs):
+        if tagger is None:
+            if bundle_file:
+                tagger = DeepDisfluencyTagger.from_bundle(bundle_file,
+                                                          **tagger_kwargs)
+            else:
+                tagger = DeepDisfluencyTagger(**tagger_kwargs)
+        self.prototype = tagger
+        if self.prototype.args.pos:
+            getattr(self.prototype, "pos_tagger")  # not per session
+        self.socket_path = socket_path
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.requests = Queue.Queue()
+        self.sessions = {}
+        self.instrumentation = Instrumentation()
+        self.running = False
+        self.server = None
+        self.threads = []
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = _UnixServer(self.socket_path, _RequestHandler)
+        self.server.tagging_daemon = self
+        self.running = True
+        self.threads = [threading.Thread(target=self.server.serve_forever),
+                        threading.Thread(target=self._batch_loop)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while self.running:
+                self.threads[-1].join(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _batch_loop(self):
+        while self.running:
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except Queue.Empty:
+                continue
+            deadline = batch[0][2] + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - clock()
+                try:
+                    if remaining > 0:
+                        batch.append(self.requests.get(timeout=remaining))
+                    else:
+                        batch.append(self.requests.get_nowait())
+                except Queue.Empty:
+                    break
+            self.process_batch(batch)
+
+    def process_batch(self, batch):
+        """Serve the (connection, message, arrival time) requests in
+        order per session, tagging one word per session at a time.
+        A disconnect closes all the connection's sessions, so it waits
+        for the connection's words before it."""
+        stats = self.instrumentation
+        compute_start = clock()
+        stats.increment("batches")
+        pending = batch
+        while pending:
+            words = []
+            deferred = []
+            blocked = set()
+            busy = set()  # connections with words in or after this step
+            for request in pending:
+                connection, message, _ = request
+                key = (connection, message.get("session"))
+                if key in blocked or (message["type"] == _DISCONNECT and
+                                      connection in busy):
+                    deferred.append(request)
+                    busy.add(connection)
+                elif message["type"] == protocol.WORD:
+                    blocked.add(key)
+                    busy.add(connection)
+                    words.append(request)
+                else:
+                    self._serve_request(connection, message)
+            if words:
+                self._tag_words(words, compute_start)
+            pending = deferred
+
+    def _session(self, key):
+        try:
+            return self.sessions[key]
+        except KeyError:
+            raise KeyError("no open session {}".format(key[1]))
+
+    def _serve_request(self, connection, message):
+        msg_type = message["type"]
+        key = (connection, message.get("session"))
+        try:
+            if msg_type == protocol.OPEN:
+                if key in self.sessions:
+                    raise ValueError("session {} already open".format(
+                        key[1]))
+                self.sessions[key] = self.prototype.new_session()
+            elif msg_type == protocol.CLOSE:
+                self._session(key)
+                del self.sessions[key]
+            elif msg_type == protocol.ROLLBACK:
+                self._session(key).rollback(message["rollback"])
+            elif msg_type == protocol.STATS:
+                connection.send(protocol.STATS_REPLY, json=json.dumps(
+                    {"sessions": len(self.sessions),
+                     "report": self.instrumentation.report()}))
+                return
+            elif msg_type == _DISCONNECT:
+                for k in [k for k in self.sessions if k[0] is connection]:
+                    del self.sessions[k]
+                return
+            else:
+                raise ValueError("unexpected message type {}".format(
+                    msg_type))
+        except Exception as e:
+            connection.send(protocol.ERROR, session=key[1] or 0,
+                            message="{}: {}".format(type(e).__name__, e))
+            return
+        connection.send(protocol.OK, session=key[1])
+
+    def _tag_words(self, words, compute_start):
+        stats = self.instrumentation
+        t = clock()
+        taggers = []
+        steps = []
+        started = []
+        for request in words:
+            connection, message, _ = request
+            try:
+                tagger = self._session((connection, message["session"]))
+                steps.append(tagger.start_word(message["word"],
+                                               pos=message["pos"],
+                                               timing=message["timing"],
+                                               rollback=message["rollback"]))
+            except Exception as e:
+                connection.send(protocol.ERROR, session=message["session"],
+                                message="{}: {}".format(type(e).__name__, e))
+                continue
+            taggers.append(tagger)
+            started.append(request)
+        if not started:
+            return
+        rnn_outputs = batched_rnn_steps(taggers, steps)
+        stats.increment("rnn_batches")
+        stats.increment("batched_words", len(started))
+        t = stats.lap("batch_rnn", t)
+        for tagger, step, rnn_output, request in zip(taggers, steps,
+                                                     rnn_outputs, started):
+            connection, message, arrival_time = request
+            try:
+                tags = tagger.finish_word(step, rnn_output)
+            except Exception as e:
+                connection.send(protocol.ERROR, session=message["session"],
+                                message="{}: {}".format(type(e).__name__, e))
+                continue
+            now = clock()
+            queueing = compute_start - arrival_time
+            compute = now - compute_start
+            stats.record("queueing", queueing)
+            stats.record("compute", compute)
+            connection.send(protocol.TAGS, session=message["session"],
+                            word_id=message["word_id"],
+                            start=len(tagger.output_tags) - len(tags),
+                            queue_us=int(max(queueing, 0) * 1e6),
+                            compute_us=int(compute * 1e6),
+                            tags=tags)
+        stats.lap("batch_decode", t)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve disfluency tagging\
+        sessions on a Unix domain socket.')
+    parser.add_argument('-s', '--socket', type=str,
+                        default="/tmp/deep_disfluency.sock",
+                        help='The socket file.')
+    parser.add_argument('-b', '--bundle', type=str, default=None,
+                        help='Model bundle file.')
+    parser.add_argument('-c', '--config_number', type=int, default=35,
+                        help='Otherwise the config number of the model.')
+    parser.add_argument('-m', '--model_dir', type=str,
+                        default="experiments/035/epoch_6",
+                        help='Its saved model folder.')
+    parser.add_argument('-t', '--timing', action='store_true',
+                        default=False,
+                        help='Whether to use the timing model.')
+    parser.add_argument('-w', '--window', type=float, default=2.0,
+                        help='Batching window in ms.')
+    parser.add_argument('--max-batch', type=int, default=64,
+                        help='Maximum number of requests per batch.')
+    args = parser.parse_args()
+    if args.bundle:
+        tagger = DeepDisfluencyTagger.from_bundle(
+            args.bundle, use_timing_data=args.timing or None)
+    else:
+        tagger = DeepDisfluencyTagger(
+            config_file="experiments/experiment_configs.csv",
+            config_number=args.config_number,
+            saved_model_dir=args.model_dir,
+            use_timing_data=args.timing)
+    daemon = TaggingDaemon(args.socket, tagger=tagger,
+                           batch_window=args.window / 1000.0,
+                           max_batch_size=args.max_batch)
+    print "Serving on", args.socket
+    daemon.serve_forever()
+    daemon.instrumentation.print_report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""The framed binary protocol of the tagging daemon (tagging_daemon.py).
+
+Each frame is a uint32 (big endian) payload length followed by the payload,
+whose first byte is the message type. Then come the type's fixed fields
+(FORMATS below), then its string fields, each a uint32 length and utf-8
+bytes, and for TAGS a uint32 count followed by that many strings.
+
+Requests (client -> daemon):
+
+    OPEN      session                       start a session
+    CLOSE     session                       end it
+    WORD      session, word_id, rollback, timing (NaN for none), word, pos
+              ("" for none): roll back rollback words then tag the word
+    ROLLBACK  session, rollback             revoke the last rollback words
+    STATS     -                             the daemon's latency report
+
+Responses (daemon -> client):
+
+    OK        session                       to OPEN, CLOSE and ROLLBACK
+    TAGS      session, word_id, start, queue_us, compute_us, tags:
+              the output tags from index start on changed by the word,
+              the microseconds the word waited for its batch and the
+              microseconds the batch took to compute
+    STATS_REPLY  json                       to STATS
+    ERROR     session, message
+
+Session ids are per connection.
+"""
+import math
+import struct
+
+OPEN = 1
+CLOSE = 2
+WORD = 3
+ROLLBACK = 4
+STATS = 5
+OK = 0x80
+TAGS = 0x81
+STATS_REPLY = 0x82
+ERROR = 0xff
+
+# type: (struct format, fixed fields, string fields, string list field)
+FORMATS = {
+    OPEN: ("!I", ["session"], [], None),
+    CLOSE: ("!I", ["session"], [], None),
+    WORD: ("!IIHd", ["session", "word_id", "rollback", "timing"],
+           ["word", "pos"], None),
+    ROLLBACK: ("!IH", ["session", "rollback"], [], None),
+    STATS: ("", [], [], None),
+    OK: ("!I", ["session"], [], None),
+    TAGS: ("!IIIII", ["session", "word_id", "start", "queue_us",
+                      "compute_us"], [], "tags"),
+    STATS_REPLY: ("", [], ["json"], None),
+    ERROR: ("!I", ["session"], ["message"], None),
+}
+
+_FRAME_HEADER = struct.Struct("!I")
+_LENGTH = struct.Struct("!I")
+_TYPE = struct.Struct("!B")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _pack_string(s):
+    if isinstance(s, unicode):
+        s = s.encode("utf-8")
+    return _LENGTH.pack(len(s)) + s
+
+
+def _unpack_string(payload, offset):
+    (length,) = _LENGTH.unpack_from(payload, offset)
+    offset += _LENGTH.size
+    return payload[offset:offset + length].decode("utf-8"), offset + length
+
+
+def encode_message(msg_type, **fields):
+    """The payload of a message of type msg_type with the given fields.
+    A timing or pos of None is sent as NaN or "".
+    """
+    fmt, fixed, strings, string_list = FORMATS[msg_type]
+    if fields.get("timing", 0) is None:
+        fields["timing"] = float("nan")
+    parts = [_TYPE.pack(msg_type)]
+    if fixed:
+        parts.append(struct.pack(fmt, *[fields[f] for f in fixed]))
+    for f in strings:
+        parts.append(_pack_string(fields.get(f) or ""))
+    if string_list:
+        values = fields[string_list]
+        parts.append(_LENGTH.pack(len(values)))
+        parts.extend(_pack_string(v) for v in values)
+    return "".join(parts)
+
+
+def decode_message(payload):
+    """A dict of the fields of a message payload, with its "type"."""
+    (msg_type,) = _TYPE.unpack_from(payload, 0)
+    if msg_type not in FORMATS:
+        raise ProtocolError("unknown message type {}".format(msg_type))
+    fmt, fixed, strings, string_list = FORMATS[msg_type]
+    message = {"type": msg_type}
+    offset = _TYPE.size
+    if fixed:
+        message.update(zip(fixed, struct.unpack_from(fmt, payload, offset)))
+        offset += struct.calcsize(fmt)
+    for f in strings:
+        message[f], offset = _unpack_string(payload, offset)
+    if string_list:
+        (n,) = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+        values = []
+        for _ in range(n):
+            value, offset = _unpack_string(payload, offset)
+            values.append(value)
+        message[string_list] = values
+    if msg_type == WORD:
+        if math.isnan(message["timing"]):
+            message["timing"] = None
+        message["pos"] = message["pos"] or None
+    return message
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return "".join(chunks)
+
+
+def read_frame(sock):
+    """The next payload from the socket, None when it is closed."""
+    header = _recv_exactly(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = _FRAME_HEADER.unpack(header)
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        raise ProtocolError("connection closed mid frame")
+    return payload
+
+
+def write_frame(sock, payload):
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
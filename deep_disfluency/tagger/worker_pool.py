@@ -0,0 +1,360 @@
+"""Preforked tagging worker processes sharing one copy of the models.
+
+The supervisor (TaggerWorkerPool) builds a single DeepDisfluencyTagger in
+the parent process, including all the components its sessions will use
+(the POS tagger and the language models are otherwise built lazily), and
+puts its read only state in forms that forked processes can share without
+copying:
+
+    - the RNN weights and embeddings are numpy arrays (memory mapped from
+    the file if the tagger is built from a model bundle), whose buffers are
+    never written to
+    - the language models' count maps are replaced by numpy backed
+    CountTables (see language_model/count_table.py) and their training only
+    tables dropped
+    - all the objects are moved to the oldest garbage collector generation,
+    which the workers don't collect, so their headers aren't written to.
+    The remaining python containers (the word/tag index maps and the
+    decoder's transition tables) are small.
+
+It then forks n_workers processes, each of which creates a tagger per
+session with DeepDisfluencyTagger.new_session(), so the only memory a
+worker adds is its interpreter's and its sessions' state. Sessions are
+routed to the least loaded worker when opened and all their calls go to
+that worker over its pipe (a Unix socket pair).
+
+Example:
+
+    pool = TaggerWorkerPool(n_workers=4,
+                            bundle_file="lstm_035_timing.ddb")
+    pool.open_session("A")
+    pool.tag_new_word("A", "john", timing=0.33)
+    pool.tag_new_word("A", "likes", timing=0.2)
+    print pool.get_output_tags("A", with_words=True)
+    print pool.memory_report()
+    pool.close()
+
+Calls for sessions on different workers can be made concurrently from
+different threads.
+"""
+import gc
+import multiprocessing
+import os
+import threading
+import traceback
+
+from deep_disfluency.language_model.count_table import \
+    freeze_language_model
+from deep_disfluency.utils.lazy_loading import LazyPickle
+from deep_tagger import DeepDisfluencyTagger
+from session_state import DEFAULT_HORIZON
+
+# the workers' oldest generation is collected after this many
+# collections of the middle one, i.e. never in practice
+FROZEN_GENERATION_THRESHOLD = 1 << 30
+
+
+class WorkerError(Exception):
+    """A call to a worker failed, either in the tagger (with the worker's
+    traceback as message) or because the worker process died."""
+    pass
+
+
+def share_tagger_state(tagger):
+    """Build (or unpickle) the tagger's lazily loaded components it will
+    use and convert its language models to shareable CountTables in
+    place, then move everything to the oldest gc generation.
+    """
+    if tagger.args.pos:
+        getattr(tagger, "pos_tagger")  # built on first access
+    for name in ["timing_model", "timing_model_scaler"]:
+        model = getattr(tagger, name)
+        if isinstance(model, LazyPickle):
+            model.load()  # else unpickled again by each worker
+    for lm_name in ["lm", "pos_lm", "edit_lm"]:
+        lm = tagger.__dict__.get(lm_name)
+        if lm is not None:
+            freeze_language_model(lm)
+    gc.collect()
+    if hasattr(gc, "freeze"):  # python 3.7+
+        gc.freeze()
+
+
+def process_memory(pid="self"):
+    """The rss, pss, shared and private memory (in kB) of a process
+    from /proc, or None where that is unavailable (i.e. not Linux).
+    """
+    totals = {}
+    for file_name in ["smaps_rollup", "smaps"]:
+        file_path = "/proc/{}/{}".format(pid, file_name)
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    key = parts[0][:-1]
+                    totals[key] = totals.get(key, 0) + int(parts[1])
+        break
+    if not totals:
+        return None
+    return {"rss": totals.get("Rss", 0),
+            "pss": totals.get("Pss", 0),
+            "shared": totals.get("Shared_Clean", 0) +
+            totals.get("Shared_Dirty", 0),
+            "private": totals.get("Private_Clean", 0) +
+            totals.get("Private_Dirty", 0)}
+
+
+def worker_loop(prototype, conn):
+    """Serve the calls of the supervisor until told to stop.
+    Each message is a tuple (operation, session_id, args...) and is
+    replied to with ("ok", result) or ("error", traceback string).
+    """
+    threshold = gc.get_threshold()
+    gc.set_threshold(threshold[0], threshold[1],
+                     FROZEN_GENERATION_THRESHOLD)
+    sessions = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break  # the supervisor has gone
+        operation, session_id, args = message[0], message[1], message[2:]
+        if operation == "stop":
+            conn.send(("ok", None))
+            break
+        try:
+            if operation == "open":
+                if session_id in sessions:
+                    raise ValueError("session {} already open".format(
+                        session_id))
+                tagger = prototype.new_session()
+                if args and args[0] is not None:
+                    tagger.restore_session_snapshot(args[0])
+                sessions[session_id] = tagger
+                result = None
+            elif operation == "close":
+                del sessions[session_id]
+                result = None
+            elif operation == "tag":
+                word, pos, timing, rollback = args
+                result = sessions[session_id].tag_new_word(
+                    word, pos=pos, timing=timing, rollback=rollback)
+            elif operation == "tag_words":
+                tagger = sessions[session_id]
+                result = [tagger.tag_new_word(word, pos=pos, timing=timing,
+                                              rollback=rollback)
+                          for word, pos, timing, rollback in args[0]]
+            elif operation == "output":
+                result = sessions[session_id].get_output_tags(
+                    with_words=args[0])
+            elif operation == "snapshot":
+                result = sessions[session_id].get_session_snapshot(*args)
+            elif operation == "reset":
+                result = sessions[session_id].reset()
+            elif operation == "memory":
+                result = process_memory()
+                if result is not None:
+                    result["sessions"] = len(sessions)
+            else:
+                raise ValueError("unknown operation {}".format(operation))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+            continue
+        conn.send(("ok", result))
+    conn.close()
+
+
+class _Worker(object):
+
+    def __init__(self, prototype):
+        self.conn, child_conn = multiprocessing.Pipe()
+        # forked, so the prototype tagger is inherited and not pickled
+        self.process = multiprocessing.Process(target=worker_loop,
+                                               args=(prototype, child_conn))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+        self.sessions = set()
+
+    def call(self, message):
+        with self.lock:
+            try:
+                self.conn.send(message)
+                status, result = self.conn.recv()
+            except (EOFError, IOError, OSError) as e:
+                raise WorkerError("worker {} died: {}".format(
+                    self.process.pid, e))
+        if status == "error":
+            raise WorkerError(result)
+        return result
+
+    def stop(self):
+        if self.process.is_alive():
+            try:
+                self.call(("stop", None))
+            except WorkerError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.conn.close()
+
+
+class TaggerWorkerPool(object):
+    """Supervises n_workers forked tagging processes and routes sessions
+    (independent word streams) to them.
+
+    :param n_workers: the number of worker processes, by default
+    the number of cpus
+    :param tagger: an already built DeepDisfluencyTagger to share
+    :param bundle_file: otherwise a model bundle to build it from
+    (the most memory efficient, as its weights are memory mapped)
+    :param tagger_kwargs: otherwise the DeepDisfluencyTagger arguments
+    """
+    def __init__(self, n_workers=None, tagger=None, bundle_file=None,
+                 **tagger_kwargs):
+        if tagger is None:
+            if bundle_file:
+                tagger = DeepDisfluencyTagger.from_bundle(bundle_file,
+                                                          **tagger_kwargs)
+            else:
+                tagger = DeepDisfluencyTagger(**tagger_kwargs)
+        self.prototype = tagger
+        share_tagger_state(self.prototype)
+        self.lock = threading.Lock()
+        self.session_workers = {}
+        self.workers = [_Worker(self.prototype)
+                        for _ in range(n_workers or
+                                       multiprocessing.cpu_count())]
+
+    def _restart_worker(self, index):
+        """Replace a dead worker, whose sessions are lost."""
+        worker = self.workers[index]
+        with self.lock:
+            for session_id in worker.sessions:
+                self.session_workers.pop(session_id, None)
+            worker.stop()
+            self.workers[index] = _Worker(self.prototype)
+
+    def _call(self, index, message):
+        worker = self.workers[index]
+        try:
+            return worker.call(message)
+        except WorkerError:
+            if not worker.process.is_alive():
+                self._restart_worker(index)
+            raise
+
+    def _session_call(self, session_id, operation, *args):
+        index = self.session_workers.get(session_id)
+        if index is None:
+            raise KeyError("no open session {}".format(session_id))
+        return self._call(index, (operation, session_id) + args)
+
+    def open_session(self, session_id, snapshot=None):
+        """Start a new session on the worker with the fewest sessions,
+        continuing from a snapshot (see snapshot_session) if given."""
+        with self.lock:
+            if session_id in self.session_workers:
+                raise ValueError("session {} already open".format(
+                    session_id))
+            index = min(range(len(self.workers)),
+                        key=lambda i: len(self.workers[i].sessions))
+            self.session_workers[session_id] = index
+            self.workers[index].sessions.add(session_id)
+        try:
+            self._call(index, ("open", session_id, snapshot))
+        except WorkerError:
+            with self.lock:
+                self.session_workers.pop(session_id, None)
+                self.workers[index].sessions.discard(session_id)
+            raise
+
+    def close_session(self, session_id):
+        index = self.session_workers.get(session_id)
+        if index is None:
+            return
+        try:
+            self._call(index, ("close", session_id))
+        finally:
+            with self.lock:
+                self.session_workers.pop(session_id, None)
+                self.workers[index].sessions.discard(session_id)
+
+    def tag_new_word(self, session_id, word, pos=None, timing=None,
+                     rollback=0):
+        """As DeepDisfluencyTagger.tag_new_word on the session's tagger,
+        returning the diff of the output tags."""
+        return self._session_call(session_id, "tag", word, pos, timing,
+                                  rollback)
+
+    def tag_words(self, session_id, words):
+        """Tag a list of (word, pos, timing, rollback) tuples in one
+        round trip, returning the list of their diffs."""
+        return self._session_call(session_id, "tag_words", list(words))
+
+    def get_output_tags(self, session_id, with_words=False):
+        return self._session_call(session_id, "output", with_words)
+
+    def snapshot_session(self, session_id, horizon=DEFAULT_HORIZON):
+        """A snapshot of the session's state (see session_state.py)
+        from which it can be continued in this or another pool, e.g.
+        after its worker has died or to move it to a less loaded one."""
+        return self._session_call(session_id, "snapshot", horizon)
+
+    def reset_session(self, session_id):
+        return self._session_call(session_id, "reset")
+
+    def memory_report(self):
+        """The memory (see process_memory) of the supervisor and each
+        worker, with the number of sessions on each."""
+        report = {"supervisor": process_memory(), "workers": []}
+        for index in range(len(self.workers)):
+            report["workers"].append(self._call(index, ("memory", None)))
+        return report
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+        self.session_workers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Tag a few sessions with\
+        preforked workers and report their memory.')
+    parser.add_argument('-b', '--bundle', type=str, default=None,
+                        help='Model bundle file, otherwise the default\
+                        config 35 tagger is used.')
+    parser.add_argument('-n', '--workers', type=int, default=2)
+    parser.add_argument('-s', '--sessions', type=int, default=4)
+    args = parser.parse_args()
+    if args.bundle:
+        pool = TaggerWorkerPool(args.workers, bundle_file=args.bundle)
+    else:
+        pool = TaggerWorkerPool(
+            args.workers,
+            config_file="experiments/experiment_configs.csv",
+            config_number=35,
+            saved_model_dir="experiments/035/epoch_6",
+            use_timing_data=True)
+    with pool:
+        words = [("john", None, 0.33, 0), ("likes", None, 0.2, 0),
+                 ("uh", None, 0.1, 0), ("loves", None, 0.3, 0),
+                 ("mary", None, 0.4, 0)]
+        for session_id in range(args.sessions):
+            pool.open_session(session_id)
+            pool.tag_words(session_id, words)
+            print session_id, pool.get_output_tags(session_id,
+                                                   with_words=True)
+        print pool.memory_report()
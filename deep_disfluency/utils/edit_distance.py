@@ -0,0 +1,184 @@
+"""Levenshtein (edit) distance and word error rate between token
+sequences, shared by the evaluation (eval_utils.alignment_cost) and the
+ASR feature extraction (feature_utils.wer).
+
+The dynamic programming table is filled a row at a time with numpy: the
+substitution and deletion costs of a row come from the row above in one
+vectorized step, and the insertions along the row are then a running
+minimum, as cost[j] = min over k <= j of (cost[k] + j - k) is
+j + the running minimum of (cost[k] - k). So an n by m table takes n
+numpy operations on rows of length m rather than n * m Python steps, and
+costs are int32 so there is no length limit. Only the last row is kept.
+
+A band restricts the table to the cells within band of its diagonal
+(|i - j| <= band, the band being widened to at least |n - m| so the last
+cell is reached), giving an upper bound on the distance which is exact
+whenever the distance is at most the band, as an alignment's path never
+strays further from the diagonal than its number of edits.
+
+edit_distances scores many (reference, hypothesis) pairs at once, the
+pairs of similar lengths being stacked into one array per row step.
+edit_distance_table keeps every row, for the word aligner's backtrace.
+"""
+from __future__ import division
+
+import numpy as np
+
+INFINITE_COST = np.iinfo(np.int32).max // 2
+BATCH_SIZE = 256
+
+
+def _encode(sequences):
+    """The sequences as int32 arrays of the same ids for equal tokens."""
+    vocab = {}
+    return [np.array([vocab.setdefault(t, len(vocab)) for t in s],
+                     dtype=np.int32) for s in sequences]
+
+
+def _band_limits(i, m, band):
+    """The first and last column of row i of a table with m + 1 columns
+    within the band."""
+    if band is None:
+        return 0, m
+    return max(0, i - band), min(m, i + band)
+
+
+def _next_row(previous, ref_token, hyp, i, subcost, lo, hi):
+    """Row i of the table from row i - 1, for columns lo to hi."""
+    row = np.full(len(previous), INFINITE_COST, dtype=np.int32)
+    if lo == 0:
+        row[0] = i
+    first = max(lo, 1)
+    if first <= hi:
+        substitution = previous[first - 1:hi] + \
+            np.where(hyp[first - 1:hi] == ref_token, 0, subcost)
+        deletion = previous[first:hi + 1] + 1
+        row[first:hi + 1] = np.minimum(substitution, deletion)
+    # insertions: the running minimum of cost[k] - k along the row
+    offsets = np.arange(lo, hi + 1, dtype=np.int32)
+    row[lo:hi + 1] = np.minimum.accumulate(row[lo:hi + 1] - offsets) + \
+        offsets
+    np.minimum(row, INFINITE_COST, out=row)
+    return row
+
+
+def edit_distance(r, h, subcost=1, band=None):
+    """The Levenshtein distance between the token sequences r and h,
+    with the substitution cost subcost and insertions and deletions
+    costing 1, optionally only over the cells within band of the
+    diagonal (see module docstring).
+
+    >>> edit_distance("who is there".split(), "is there".split())
+    1
+    >>> edit_distance("who is there".split(), "".split())
+    3
+    >>> edit_distance("".split(), "who is there".split())
+    3
+    """
+    ref, hyp = _encode([r, h])
+    n, m = len(ref), len(hyp)
+    if band is not None:
+        band = max(band, abs(n - m))
+    lo, hi = _band_limits(0, m, band)
+    row = np.full(m + 1, INFINITE_COST, dtype=np.int32)
+    row[lo:hi + 1] = np.arange(lo, hi + 1)
+    for i in range(1, n + 1):
+        lo, hi = _band_limits(i, m, band)
+        row = _next_row(row, ref[i - 1], hyp, i, subcost, lo, hi)
+    return int(row[m])
+
+
+def edit_distance_table(r, h, subcost=1, band=None):
+    """The whole (len(r) + 1) by (len(h) + 1) int32 table of edit_distance,
+    cell [i, j] being the distance between r[:i] and h[:j], or
+    INFINITE_COST for cells outside the band. For the backtrace of an
+    alignment (see feature_extraction/word_alignment.py).
+    """
+    ref, hyp = _encode([r, h])
+    n, m = len(ref), len(hyp)
+    if band is not None:
+        band = max(band, abs(n - m))
+    table = np.full((n + 1, m + 1), INFINITE_COST, dtype=np.int32)
+    lo, hi = _band_limits(0, m, band)
+    table[0, lo:hi + 1] = np.arange(lo, hi + 1)
+    for i in range(1, n + 1):
+        lo, hi = _band_limits(i, m, band)
+        table[i] = _next_row(table[i - 1], ref[i - 1], hyp, i, subcost,
+                             lo, hi)
+    return table
+
+
+def edit_distances(pairs, subcost=1, band=None):
+    """The edit_distance of each (reference, hypothesis) pair as an int32
+    array, computed in batches of pairs of similar lengths.
+    """
+    pairs = list(pairs)
+    distances = np.zeros(len(pairs), dtype=np.int32)
+    if band is not None:
+        for k, (r, h) in enumerate(pairs):
+            distances[k] = edit_distance(r, h, subcost, band)
+        return distances
+    encoded = _encode([s for pair in pairs for s in pair])
+    refs = encoded[0::2]
+    hyps = encoded[1::2]
+    order = sorted(range(len(pairs)),
+                   key=lambda k: (len(refs[k]), len(hyps[k])))
+    for start in range(0, len(order), BATCH_SIZE):
+        batch = order[start:start + BATCH_SIZE]
+        n = max(len(refs[k]) for k in batch)
+        m = max(len(hyps[k]) for k in batch)
+        # padded with ids matching nothing, beyond which cells are unused
+        ref = np.full((len(batch), n), -1, dtype=np.int32)
+        hyp = np.full((len(batch), m), -2, dtype=np.int32)
+        for b, k in enumerate(batch):
+            ref[b, :len(refs[k])] = refs[k]
+            hyp[b, :len(hyps[k])] = hyps[k]
+        ref_lengths = np.array([len(refs[k]) for k in batch])
+        hyp_lengths = np.array([len(hyps[k]) for k in batch])
+        rows = np.arange(len(batch))
+        offsets = np.arange(m + 1, dtype=np.int32)
+        row = np.tile(offsets, (len(batch), 1))
+        result = np.zeros(len(batch), dtype=np.int32)
+        done = ref_lengths == 0
+        result[done] = row[rows[done], hyp_lengths[done]]
+        for i in range(1, n + 1):
+            substitution = row[:, :-1] + \
+                np.where(hyp == ref[:, i - 1:i], 0, subcost)
+            deletion = row[:, 1:] + 1
+            row = np.empty_like(row)
+            row[:, 0] = i
+            row[:, 1:] = np.minimum(substitution, deletion)
+            row = np.minimum.accumulate(row - offsets, axis=1) + offsets
+            done = ref_lengths == i
+            result[done] = row[rows[done], hyp_lengths[done]]
+        distances[batch] = result
+    return distances
+
+
+def wer(r, h, macro=False):
+    """
+        Calculation of WER with Levenshtein distance.
+
+        >>> wer("who is there".split(), "is there".split())
+        33.3333333
+        >>> wer("who is there".split(), "".split())
+        100.0
+        >>> wer("".split(), "who is there".split())
+        100.0
+
+        macro :: Return the overall cost, else the WER
+    """
+    cost = edit_distance(r, h)
+    if macro:
+        return cost
+    wer = 1 if len(r) == 0 and 0 < len(h) else cost/float(len(r))
+    return 100 * float(wer)
+
+
+def corpus_wer(pairs):
+    """The WER (as a percentage) over all the (reference, hypothesis)
+    pairs, i.e. their total edit distance over their total reference
+    length."""
+    pairs = list(pairs)
+    cost = edit_distances(pairs).sum()
+    return 100 * float(cost) / max(sum(len(r) for r, _ in pairs), 1)
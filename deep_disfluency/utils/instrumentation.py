@@ -0,0 +1,185 @@
+"""Low overhead latency instrumentation for the incremental tagging pipeline.
+
+An Instrumentation object holds a set of named stage timers, each one a
+log-bucketed LatencyHistogram giving count/mean/p50/p95/p99/max, and a set
+of named integer counters. Components hold a reference to it in their
+instrumentation attribute, which is None when instrumentation is switched
+off, so the disabled cost is a single attribute test per stage.
+"""
+from __future__ import division
+import ctypes
+import ctypes.util
+import math
+import os
+import sys
+import time
+import timeit
+from collections import defaultdict
+
+CLOCK_MONOTONIC = 1  # from linux <time.h>
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _clock_gettime_monotonic():
+    """clock_gettime(CLOCK_MONOTONIC) through ctypes for python 2 on linux,
+    None if it is not available."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1",
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    timespec = _Timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "clock_gettime: " + os.strerror(errno))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return monotonic
+
+
+# Python 3.3+ has a monotonic clock, python 2 on linux calls
+# clock_gettime(CLOCK_MONOTONIC). Elsewhere python 2 falls back to
+# timeit.default_timer, which is the wall clock (time.time) on unix and
+# can jump with system clock changes, so CLOCK_IS_MONOTONIC is False and
+# the histograms record any negative interval as zero.
+clock = getattr(time, "monotonic", None) or _clock_gettime_monotonic()
+CLOCK_IS_MONOTONIC = clock is not None
+if clock is None:
+    clock = timeit.default_timer
+
+# histogram buckets grow geometrically by this ratio from MIN_LATENCY
+# seconds, giving ~5% resolution on the percentiles from 1us up to ~10h
+BUCKET_RATIO = 1.1
+MIN_LATENCY = 1e-6
+N_BUCKETS = 256
+
+PERCENTILES = [50, 95, 99]
+
+
+class LatencyHistogram(object):
+    """A fixed size histogram of latencies (in seconds) with geometric
+    buckets, recording in constant time and memory.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds < 0:
+            # the fallback clock went backwards
+            seconds = 0.0
+        if seconds <= MIN_LATENCY:
+            bucket = 0
+        else:
+            bucket = min(N_BUCKETS - 1,
+                         int(math.log(seconds / MIN_LATENCY,
+                                      BUCKET_RATIO)) + 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """The upper bound of the bucket containing the p-th percentile,
+        capped at the maximum latency observed.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        cumulative = 0
+        for bucket, n in enumerate(self.counts):
+            cumulative += n
+            if n and cumulative >= rank:
+                return min(self.max, MIN_LATENCY * BUCKET_RATIO ** bucket)
+        return self.max
+
+    def merge(self, other):
+        for bucket, n in enumerate(other.counts):
+            self.counts[bucket] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        summary = {"count": self.count,
+                   "total": self.total,
+                   "mean": self.total / self.count if self.count else 0.0,
+                   "max": self.max}
+        for p in PERCENTILES:
+            summary["p{}".format(p)] = self.percentile(p)
+        return summary
+
+
+class Instrumentation(object):
+    """Per stage timers, counters and latency histograms for one tagger
+    (or one tagging session).
+
+    Typical use within a component with an instrumentation attribute
+    (None when switched off):
+
+        stats = self.instrumentation
+        if stats:
+            t = clock()
+        ... do the stage ...
+        if stats:
+            t = stats.lap("stage", t)
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.timers = defaultdict(LatencyHistogram)
+        self.counters = defaultdict(int)
+
+    def record(self, stage, seconds):
+        self.timers[stage].record(seconds)
+
+    def lap(self, stage, start):
+        """Record the time since start against the stage and
+        return the current time so stages can be chained."""
+        now = clock()
+        self.timers[stage].record(now - start)
+        return now
+
+    def increment(self, counter, n=1):
+        self.counters[counter] += n
+
+    def merge(self, other):
+        for stage, histogram in other.timers.items():
+            self.timers[stage].merge(histogram)
+        for counter, n in other.counters.items():
+            self.counters[counter] += n
+
+    def report(self):
+        """Returns a dict with the summary of each stage timer
+        and the counter values."""
+        return {"timers": dict((stage, histogram.summary())
+                               for stage, histogram in self.timers.items()),
+                "counters": dict(self.counters)}
+
+    def print_report(self, unit=1000.0, unit_name="ms"):
+        print "stage\tcount\tmean\tp50\tp95\tp99\tmax ({})".format(unit_name)
+        for stage in sorted(self.timers.keys()):
+            s = self.timers[stage].summary()
+            print "\t".join([stage, str(s["count"])] +
+                            ["{0:.3f}".format(s[k] * unit)
+                             for k in ["mean", "p50", "p95", "p99", "max"]])
+        for counter in sorted(self.counters.keys()):
+            print counter, self.counters[counter]
@@ -0,0 +1,24 @@
+"""Deferred loading of the tagger's heavier components."""
+import cPickle
+
+
+class LazyPickle(object):
+    """Stands in for the object pickled in file_path, only unpickling it
+    (and so importing the modules its class needs, e.g. sklearn) on the
+    first access to one of its attributes.
+    """
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._obj = None
+
+    def load(self):
+        if self._obj is None:
+            with open(self._file_path, "rb") as fid:
+                self._obj = cPickle.load(fid)
+        return self._obj
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            # no lazy loading for copy/pickle protocol lookups
+            raise AttributeError(name)
+        return getattr(self.load(), name)
@@ -0,0 +1,370 @@
+"""Run a pipeline of stages, e.g. the corpus creation, feature extraction,
+training and testing of experiments/EACL_2017.py, as a dependency graph
+of content-hashed artifacts, only running the stages which are out of
+date and independent ones concurrently.
+
+A Stage declares the files or folders it reads (inputs) and writes
+(outputs), its parameters and a module level function making its outputs
+from its arguments, whose return value is kept as the stage's result.
+A stage depends on the stages writing any of its inputs (or files within
+them) and on those whose results it uses (see StageResult). It is out of
+date when its key, the hash of its function, arguments, parameters and
+the contents of its inputs, differs from that of its last successful run,
+or its outputs have changed or gone since. The keys, results and output
+hashes are kept in a JSON manifest, along with the hashes of the files
+read so far by their size and modification time, so unchanged files are
+not read again.
+
+The key of a stage is only worked out once the stages it depends on are
+done, so a stage whose inputs are written again with the same contents
+is not run again, and the stages upstream of a change are untouched,
+e.g. testing again after changing only the decoder does not retrain the
+models, as none of the training's inputs or parameters have changed.
+
+    pipeline = Pipeline("experiments/pipeline_manifest.json", n_jobs=4)
+    pipeline.add(Stage("train_035", train_model, [35, ...],
+                       inputs=[...], outputs=[model_dir]))
+    pipeline.add(Stage("test_035", test_model,
+                       [35, StageResult("train_035"), ...],
+                       inputs=[...],
+                       outputs=[StageResult("train_035",
+                                            model_dir + "/epoch_{0}/...")]))
+    pipeline.run()
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import Queue
+import traceback
+
+# files which never change what a stage does
+IGNORED_SUFFIXES = (".pyc", ".speakers.json")
+
+# how often to check the worker processes are still alive when waiting
+# for a stage to finish
+POLL_SECONDS = 1.0
+
+
+class StageResult(object):
+    """A placeholder, in a stage's arguments, inputs or outputs, for the
+    result of another stage formatted into template, filled in when the
+    stage is run."""
+    def __init__(self, stage_name, template="{0}"):
+        self.stage_name = stage_name
+        self.template = template
+
+    def resolve(self, results):
+        return self.template.format(results[self.stage_name])
+
+
+class Stage(object):
+    """A step of a Pipeline.
+
+    name -- unique name of the stage
+    action -- module level function run with args (in a worker process
+    if the pipeline has more than one), returning a JSON serializable
+    result
+    inputs -- the paths of the files and folders the action reads
+    outputs -- the paths of the files and folders the action writes
+    params -- JSON serializable values the action depends on other than
+    its arguments (e.g. a config), part of the stage's key
+    """
+    def __init__(self, name, action, args=(), inputs=(), outputs=(),
+                 params=None):
+        self.name = name
+        self.action = action
+        self.args = list(args)
+        self.inputs = [_normalize(p) for p in inputs]
+        self.outputs = [_normalize(p) for p in outputs]
+        self.params = params
+
+    def result_stages(self):
+        """The names of the stages whose results this one uses."""
+        return set(x.stage_name for x in self.args + self.inputs +
+                   self.outputs if isinstance(x, StageResult))
+
+
+def _normalize(path):
+    if isinstance(path, StageResult):
+        return StageResult(path.stage_name, _normalize(path.template))
+    return os.path.normpath(os.path.abspath(path))
+
+
+def _within(path, folder):
+    return path == folder or path.startswith(folder + os.sep)
+
+
+def _run_action(name, action, args, finished):
+    # in the worker, reporting failures rather than raising them
+    try:
+        outcome = name, True, action(*args)
+    except BaseException:
+        outcome = name, False, traceback.format_exc()
+    finished.put(outcome)
+
+
+def _wait_for_stage(finished, workers):
+    """The (name, ok, result) of the next stage to finish, where a stage
+    whose worker process exits without reporting (e.g. killed, or crashed
+    in native code) fails with its exit code."""
+    while True:
+        try:
+            return finished.get(True, POLL_SECONDS)
+        except Queue.Empty:
+            pass
+        for name, process in workers.items():
+            if process.exitcode is not None:
+                try:  # it may have reported just before exiting
+                    return finished.get_nowait()
+                except Queue.Empty:
+                    return name, False, \
+                        "worker process exited with code {0}".format(
+                            process.exitcode)
+
+
+class Pipeline(object):
+    """A dependency graph of Stages (see module docstring), run with up
+    to n_jobs at once (None for one per cpu), with its manifest at
+    manifest_path."""
+    def __init__(self, manifest_path, n_jobs=1):
+        self.manifest_path = os.path.abspath(manifest_path)
+        self.n_jobs = n_jobs
+        self.stages = []
+        self.manifest = {"stages": {}, "files": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def add(self, stage):
+        if any(s.name == stage.name for s in self.stages):
+            raise ValueError("duplicate stage " + stage.name)
+        self.stages.append(stage)
+        return stage
+
+    def dependencies(self):
+        """The names of the stages each stage depends on.
+
+        A stage writing within a folder it also reads (e.g. a test writing
+        its output into the folder of the model it tests) is a fellow
+        reader of that folder rather than a writer of it, so the other
+        readers of the folder do not depend on it.
+        """
+        writers = [(s, path) for s in self.stages for path in s.outputs
+                   if not isinstance(path, StageResult)]
+        deps = {}
+        for stage in self.stages:
+            names = stage.result_stages()
+            for path in stage.inputs:
+                if isinstance(path, StageResult):
+                    continue
+                names.update(
+                    writer.name for writer, output in writers
+                    if _within(path, output) or
+                    (_within(output, path) and output != path and
+                     not any(_within(path, p) for p in writer.inputs
+                             if not isinstance(p, StageResult))))
+            names.discard(stage.name)
+            deps[stage.name] = names
+        return deps
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.manifest_path)
+
+    def _file_digest(self, path):
+        stat = os.stat(path)
+        cached = self.manifest["files"].get(path)
+        if cached and cached[0] == stat.st_size and \
+                cached[1] == stat.st_mtime:
+            return cached[2]
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.manifest["files"][path] = [stat.st_size, stat.st_mtime,
+                                        digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path_digest(self, path, exclude=()):
+        """The hash of a file's contents or of the relative paths and
+        contents of a folder's files other than those within any of the
+        exclude paths, or None if there is no such path."""
+        if not os.path.exists(path):
+            return None
+        if not os.path.isdir(path):
+            return self._file_digest(path)
+        exclude = [p for p in exclude if _within(p, path) and p != path]
+        digest = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs
+                             if not any(_within(os.path.join(root, d), p)
+                                        for p in exclude))
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                if name.endswith(IGNORED_SUFFIXES) or \
+                        any(_within(filename, p) for p in exclude):
+                    continue
+                digest.update(os.path.relpath(filename, path) + "\0")
+                digest.update(self._file_digest(filename) + "\n")
+        return digest.hexdigest()
+
+    def _results(self, results):
+        known = dict((name, entry["result"]) for name, entry in
+                     self.manifest["stages"].items())
+        known.update(results)
+        return known
+
+    def _resolve(self, value, results):
+        if isinstance(value, StageResult):
+            return value.resolve(results)
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._resolve(v, results) for v in value)
+        return value
+
+    def _outputs_of_others(self, keep, results):
+        """The outputs, where known, of the stages other than those in
+        keep, which are left out of the hashes of folders containing
+        them."""
+        paths = []
+        for other in self.stages:
+            if other.name in keep:
+                continue
+            for path in other.outputs:
+                try:
+                    paths.append(self._resolve(path, results))
+                except KeyError:  # its result is not known yet
+                    pass
+        return paths
+
+    def _stage_key(self, stage, results, exclude):
+        inputs = self._resolve(stage.inputs, results)
+        key = [stage.action.__module__ + "." + stage.action.__name__,
+               self._resolve(stage.args, results), stage.params,
+               [(path, self.path_digest(path, exclude)) for path in inputs]]
+        return hashlib.sha1(json.dumps(key, sort_keys=True,
+                                       default=repr)).hexdigest()
+
+    def _output_digests(self, stage, results, exclude):
+        return dict((path, self.path_digest(path, exclude))
+                    for path in self._resolve(stage.outputs, results))
+
+    def _ancestors(self, name, deps):
+        ancestors = set()
+        todo = list(deps[name])
+        while todo:
+            dep = todo.pop()
+            if dep not in ancestors:
+                ancestors.add(dep)
+                todo.extend(deps.get(dep, ()))
+        return ancestors
+
+    def run(self, force=False):
+        """Run the stages which are out of date (or all if force), in
+        dependency order, returning the names of the stages which were
+        run, were up to date and failed (or could not run as a stage they
+        depend on failed).
+        """
+        deps = self.dependencies()
+        names = set(s.name for s in self.stages)
+        for name, stage_deps in deps.items():
+            missing = [d for d in stage_deps if d not in names and
+                       d not in self.manifest["stages"]]
+            if missing:
+                raise ValueError("{} needs the results of {}".format(
+                    name, ", ".join(sorted(missing))))
+        stages = dict((s.name, s) for s in self.stages)
+        ancestors = dict((name, self._ancestors(name, deps))
+                         for name in names)
+        if any(name in ancestors[name] for name in names):
+            raise ValueError("the stages have a dependency cycle")
+        pending = [s.name for s in self.stages]
+        ran, up_to_date, failed = [], [], []
+        results = {}
+        keys = {}
+        n_jobs = self.n_jobs or multiprocessing.cpu_count()
+        # each stage runs in a process of its own if running in parallel
+        parallel = n_jobs != 1 and len(pending) > 1
+        finished = multiprocessing.Queue() if parallel else Queue.Queue()
+        workers = {}
+        ready = []
+        running = 0
+        try:
+            while pending or running:
+                # start every stage whose dependencies are done
+                started = True
+                while started:
+                    started = False
+                    for name in list(pending):
+                        stage_deps = [d for d in deps[name] if d in names]
+                        if any(d in failed for d in stage_deps):
+                            pending.remove(name)
+                            failed.append(name)
+                            continue
+                        if any(d in pending or d not in results
+                               for d in stage_deps):
+                            continue
+                        pending.remove(name)
+                        stage = stages[name]
+                        known = self._results(results)
+                        # the inputs only include what its ancestors
+                        # wrote in them, not e.g. its own outputs
+                        keys[name] = self._stage_key(
+                            stage, known,
+                            self._outputs_of_others(ancestors[name], known))
+                        entry = self.manifest["stages"].get(name)
+                        if not force and entry is not None and \
+                                entry["key"] == keys[name] and \
+                                None not in entry["outputs"].values() and \
+                                entry["outputs"] == self._output_digests(
+                                    stage, known,
+                                    self._outputs_of_others([name], known)):
+                            print "up to date:", name
+                            up_to_date.append(name)
+                            results[name] = entry["result"]
+                            started = True
+                            continue
+                        ready.append((name, stage.action,
+                                      self._resolve(stage.args, known),
+                                      finished))
+                while ready and running < n_jobs:
+                    args = ready.pop(0)
+                    print "running:", args[0]
+                    if parallel:
+                        workers[args[0]] = multiprocessing.Process(
+                            target=_run_action, args=args)
+                        workers[args[0]].start()
+                    else:
+                        _run_action(*args)
+                    running += 1
+                if not running:
+                    break
+                name, ok, result = _wait_for_stage(finished, workers)
+                running -= 1
+                if name in workers:
+                    workers.pop(name).join()
+                if not ok:
+                    print "failed:", name
+                    print result
+                    failed.append(name)
+                    self.manifest["stages"].pop(name, None)
+                    self._save_manifest()
+                    continue
+                ran.append(name)
+                results[name] = result
+                known = self._results(results)
+                self.manifest["stages"][name] = {
+                    "key": keys[name],
+                    "result": result,
+                    "outputs": self._output_digests(
+                        stages[name], known,
+                        self._outputs_of_others([name], known))}
+                self._save_manifest()
+        finally:
+            for process in workers.values():
+                process.terminate()
+                process.join()
+        self._save_manifest()
+        return ran, up_to_date, failed
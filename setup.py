@@ -159,6 +159,7 @@ setup(
         'python-crfsuite',
         'fluteline',
         'watson-streaming',
+        'trollius',
     ],  # Optional
 
     # List additional groups of dependencies here (e.g. development
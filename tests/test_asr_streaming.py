@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from deep_disfluency.evaluation.eval_utils import \
+    load_incremental_outputs_from_increco_file
+from deep_disfluency.load.load import iter_increco_updates_from_file
+from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+
+# the second update of 4548A revises its last word, the third rolls
+# back two words
+POS_INCRECO = """File: 4548A
+Time: 0.98
+0.04\t0.17\twell\tUH
+0.17\t0.67\tactually\tRB
+0.67\t0.98\tuh\tUH
+
+Time: 1.5
+0.67\t0.98\tum\tUH
+0.98\t1.5\ti\tPRP
+
+Time: 2.22
+0.67\t0.98\tuh\tUH
+0.98\t1.3\ti\tPRP
+1.3\t1.6\ti\tPRP
+1.6\t2.22\tthink\tVBP
+
+File: 4548B
+Time: 0.5
+0.1\t0.5\tyeah\tUH
+
+"""
+
+ASR_INCRECO = """File: 4548A
+Time: 0.98
+well\t0.04\t0.17
+actually\t0.17\t0.67
+"""
+
+
+class IncrecoUpdatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_iter_increco_updates(self):
+        updates = list(iter_increco_updates_from_file(
+            self.write("pos_increco.text", POS_INCRECO)))
+        self.assertEqual([("4548A", 0.98), ("4548A", 1.5), ("4548A", 2.22),
+                          ("4548B", 0.5)],
+                         [(speaker, time) for speaker, time, _ in updates])
+        self.assertEqual([("um", 0.67, 0.98, "UH"), ("i", 0.98, 1.5, "PRP")],
+                         updates[1][2])
+        self.assertEqual(
+            [("4548A", 0.98, [("well", 0.04, 0.17, None),
+                              ("actually", 0.17, 0.67, None)])],
+            list(iter_increco_updates_from_file(
+                self.write("increco.text", ASR_INCRECO))))
+
+    def test_tagged_with_rollback(self):
+        # the output for the final hypothesis is that of tagging it from
+        # the start, whatever was rolled back on the way
+        tagger = DeepDisfluencyTagger(
+            config_file="experiments/experiment_configs.csv",
+            config_number=21, saved_model_dir="experiments/021/epoch_40",
+            numpy_model=True)
+        target = os.path.join(self.folder, "output_increco.text")
+        tagger.incremental_output_from_file(
+            self.write("pos_increco.text", POS_INCRECO), target,
+            is_asr_results_file=True)
+        output = load_incremental_outputs_from_increco_file(target)
+        final = [("well", "UH"), ("actually", "RB"), ("uh", "UH"),
+                 ("i", "PRP"), ("i", "PRP"), ("think", "VBP")]
+        tagger.reset()
+        for word, pos in final:
+            tagger.tag_new_word(word, pos)
+        hypothesis = []
+        for words, tags in zip(output["4548A"][1], output["4548A"][2]):
+            first = words[0][1]
+            hypothesis = [x for x in hypothesis if x[1] < first] + \
+                [(w[0], w[1], t) for w, t in zip(words, tags)]
+        self.assertEqual([word for word, _ in final],
+                         [x[0] for x in hypothesis])
+        self.assertEqual(tagger.output_tags, [x[2] for x in hypothesis])
+        self.assertEqual(1, len(output["4548B"][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from deep_disfluency.utils.instrumentation import Instrumentation
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+    from deep_disfluency.tagger.async_tagger import AsyncTaggerPipeline
+except ImportError:
+    asyncio = None
+
+
+class FailingDisfluencyTagger(object):
+    """Tags every word '<f/>' with the POS tag 'NN' and fails on the word
+    fail_on."""
+    window_size = 1
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.instrumentation = Instrumentation()
+        self.reset()
+
+    def reset(self):
+        self.output_tags = []
+        self.word_graph = []
+
+    def tag_new_word(self, word, timing=None, rollback=0):
+        if word == self.fail_on:
+            raise ValueError("cannot tag " + word)
+        if rollback:
+            self.output_tags = self.output_tags[:-rollback]
+            self.word_graph = self.word_graph[:-rollback]
+        self.output_tags.append("<f/>")
+        self.word_graph.append((word, "NN"))
+        return ["<f/>"]
+
+
+def word_update(word_id, word):
+    return {'id': word_id, 'word': word,
+            'start_time': word_id * 0.5, 'end_time': word_id * 0.5 + 0.4}
+
+
+@unittest.skipIf(asyncio is None, "trollius is not installed")
+class AsyncTaggerStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_stream(self, words, fail_on=None):
+        pipeline = AsyncTaggerPipeline(
+            lambda: FailingDisfluencyTagger(fail_on), loop=self.loop)
+
+        @asyncio.coroutine
+        def run():
+            stream = yield From(pipeline.open_stream("A"))
+            for i, word in enumerate(words):
+                yield From(stream.put_word_update(word_update(i, word)))
+                # one at a time so each is tagged on its own
+                tagged = yield From(stream.get())
+                self.assertEqual(word, tagged['word'])
+            yield From(pipeline.close_stream("A"))
+            raise Return(stream)
+        return self.loop.run_until_complete(run())
+
+    def test_words_tagged(self):
+        stream = self.run_stream(["i", "want", "tea"])
+        self.assertIsNone(stream.error)
+
+    def test_error_raised_to_caller(self):
+        with self.assertRaises(ValueError):
+            self.run_stream(["i", "want", "tea"], fail_on="want")
+
+    def test_error_raised_by_later_puts(self):
+        pipeline = AsyncTaggerPipeline(
+            lambda: FailingDisfluencyTagger("want"), loop=self.loop)
+
+        @asyncio.coroutine
+        def run():
+            stream = yield From(pipeline.open_stream("A"))
+            yield From(stream.put_word_update(word_update(0, "i")))
+            self.assertEqual("i", (yield From(stream.get()))['word'])
+            yield From(stream.put_word_update(word_update(1, "want")))
+            yield From(stream.task)
+            with self.assertRaises(ValueError):
+                yield From(stream.get())
+            with self.assertRaises(ValueError):
+                yield From(stream.put_word_update(word_update(2, "tea")))
+        self.loop.run_until_complete(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+
+# benchmark.py is a script in the experiments folder
+EXPERIMENTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "deep_disfluency", "experiments")
+sys.path.insert(0, EXPERIMENTS_DIR)
+try:
+    from benchmark import DEFAULT_DATA, IMPORT_PROFILE_MODULES, \
+        load_benchmark_dialogues, profile_import, tag_in_bulk, \
+        tag_incrementally
+finally:
+    sys.path.remove(EXPERIMENTS_DIR)
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_load_benchmark_dialogues(self):
+        dialogues = load_benchmark_dialogues(DEFAULT_DATA, 500)
+        self.assertEqual(500, sum(len(words) for _, words, _, _
+                                  in dialogues))
+        for _, words, pos_tags, timings in dialogues:
+            self.assertEqual(len(words), len(pos_tags))
+            self.assertEqual(len(words), len(timings))
+
+    def test_tagging_modes(self):
+        tagger = DeepDisfluencyTagger(
+            config_file="experiments/experiment_configs.csv",
+            config_number=21, saved_model_dir="experiments/021/epoch_40",
+            numpy_model=True)
+        dialogues = load_benchmark_dialogues(DEFAULT_DATA, 200)
+        self.assertEqual(200, tag_incrementally(tagger, dialogues))
+        self.assertEqual(len(dialogues[-1][1]), len(tagger.output_tags))
+        self.assertEqual(200, tag_in_bulk(tagger, dialogues))
+
+    def test_profile_import(self):
+        result = profile_import("deep_disfluency.utils.edit_distance")
+        self.assertEqual([], result["heavy_dependencies"])
+        self.assertTrue(result["seconds"] > 0)
+        self.assertIn("error", profile_import("deep_disfluency.no_such"))
+        self.assertIn("deep_disfluency.tagger.deep_tagger",
+                      IMPORT_PROFILE_MODULES)
+
+
+if __name__ == '__main__':
+    unittest.main()
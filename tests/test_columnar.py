@@ -0,0 +1,100 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+from deep_disfluency.load.columnar import build_speaker_index, \
+    load_speaker_index, parse_columns, read_columns, read_speaker
+
+INCRECO = """Speaker: 4519A
+
+Time: 2.722875
+2.557375\t2.722875\tyour\tPRP$\t<f/><ct/>
+
+Time: 3.011125
+2.722875\t3.011125\tturn\tNN\t<f/><tc/>
+
+Time: 3.5
+
+Speaker: 4519B
+
+Time: 1.0
+0.5\t1.0\twell\tUH\t<e/><tc/>
+1.0\t1.5\ti\tPRP\t<f/><cc/>
+"""
+
+CORPUS = """KB3_1:1\t0.00\tyes\t<f/>
+\t1.12\tbecause\t<f/>
+KB3_1:2\t2.00\ttheres\t<f/>
+"""
+
+
+class ParseColumnsTest(unittest.TestCase):
+
+    def test_increco(self):
+        columns = parse_columns(INCRECO)
+        self.assertEqual(["4519A", "4519B"], columns.speakers)
+        self.assertEqual(4, len(columns))
+        # the empty update at 3.5 is dropped
+        self.assertEqual([2.722875, 3.011125, 1.0],
+                         columns.update_times.tolist())
+        self.assertEqual([(0, 1), (1, 2)], columns.speaker_updates(0))
+        self.assertEqual([(2, 4)], columns.speaker_updates(1))
+        self.assertEqual((2, 4), columns.speaker_rows(1))
+        self.assertEqual(["your", "turn", "well", "i"], columns.column(2))
+        self.assertEqual([2.722875, 3.011125, 1.0, 1.5],
+                         columns.float_column(1).tolist())
+        self.assertEqual([0, 1, 2, 2], columns.id_column(
+            3, {"PRP$": 0, "NN": 1, "<unk>": 2}).tolist())
+
+    def test_no_headers(self):
+        columns = parse_columns(CORPUS)
+        self.assertEqual([""], columns.speakers)
+        self.assertTrue(math.isnan(columns.update_times[0]))
+        self.assertEqual([(0, 3)], columns.speaker_updates(0))
+        self.assertEqual([("KB3_1:1", 0, 2), ("KB3_1:2", 2, 3)],
+                         columns.utterances())
+
+    def test_ragged_and_quoted_rows(self):
+        columns = parse_columns('a\tb\tc\n"x\ty"\tz\n')
+        self.assertEqual([["a", "b", "c"], ["x\ty", "z"]], columns.rows)
+        self.assertEqual(["c", None], columns.column(2))
+        self.assertEqual(["c", "z"], columns.column(-1))
+
+    def test_empty(self):
+        columns = parse_columns("")
+        self.assertEqual(0, len(columns))
+        self.assertEqual([], columns.utterances())
+
+
+class SpeakerIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, "output_increco.text")
+        with open(self.filename, "w") as f:
+            f.write(INCRECO)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_read_speaker(self):
+        whole = read_columns(self.filename)
+        for i, speaker in enumerate(whole.speakers):
+            columns = read_speaker(self.filename, speaker)
+            self.assertEqual([speaker], columns.speakers)
+            start, end = whole.speaker_rows(i)
+            self.assertEqual(whole.rows[start:end], columns.rows)
+
+    def test_rebuilt_when_changed(self):
+        index = build_speaker_index(self.filename)
+        self.assertEqual(index, load_speaker_index(self.filename))
+        with open(self.filename, "a") as f:
+            f.write("Speaker: 4519C\n\nTime: 1.0\n0\t1\tyes\tUH\t<f/>\n")
+        self.assertEqual(["yes"],
+                         read_speaker(self.filename, "4519C").column(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import threading
+import unittest
+
+from deep_disfluency.utils.instrumentation import Instrumentation
+
+try:
+    import fluteline
+    from deep_disfluency.tagger.deep_tagger_module import \
+        DeepTaggerModule, WordUpdateTagger, coalesce_word_updates
+except ImportError:
+    fluteline = None
+
+
+class FakeDisfluencyTagger(object):
+    """Tags every word '<f/>' with the POS tag 'NN', recording the words
+    it was asked to tag."""
+    window_size = 1
+
+    def __init__(self):
+        self.instrumentation = Instrumentation()
+        self.reset()
+
+    def reset(self):
+        self.tagged = []
+        self.output_tags = []
+        self.word_graph = []
+
+    def tag_new_word(self, word, timing=None, rollback=0):
+        if rollback:
+            self.output_tags = self.output_tags[:-rollback]
+            self.word_graph = self.word_graph[:-rollback]
+        self.tagged.append(word)
+        self.output_tags.append("<f/>")
+        self.word_graph.append((word, "NN"))
+        return ["<f/>"]
+
+
+class Collector(fluteline.Consumer if fluteline else object):
+
+    def __init__(self):
+        super(Collector, self).__init__()
+        self.received = []
+
+    def consume(self, msg):
+        self.received.append(dict(msg))
+
+
+def word_update(word_id, word):
+    return {'id': word_id, 'word': word,
+            'start_time': word_id * 0.5, 'end_time': word_id * 0.5 + 0.4}
+
+
+@unittest.skipIf(fluteline is None, "fluteline is not installed")
+class CoalesceWordUpdatesTest(unittest.TestCase):
+
+    def test_superseded_updates_dropped(self):
+        updates = [word_update(0, "i"), word_update(1, "like"),
+                   word_update(1, "liked"), word_update(2, "it")]
+        rollback, suffix = coalesce_word_updates(updates, -1)
+        self.assertEqual(0, rollback)
+        self.assertEqual(["i", "liked", "it"], [w['word'] for w in suffix])
+
+    def test_rollback_into_graph(self):
+        updates = [word_update(3, "a"), word_update(2, "b")]
+        rollback, suffix = coalesce_word_updates(updates, 3)
+        self.assertEqual(2, rollback)
+        self.assertEqual(["b"], [w['word'] for w in suffix])
+
+    def test_word_update_tagger_rollback(self):
+        tagger = WordUpdateTagger(FakeDisfluencyTagger())
+        tagger.tag_word_updates([word_update(0, "i"), word_update(1, "go")])
+        updated = tagger.tag_word_updates([word_update(1, "went")])
+        self.assertEqual(["went"], [w['word'] for w in updated])
+        self.assertEqual(["i", "went"],
+                         [w['word'] for w in tagger.word_graph])
+        self.assertEqual(["i", "go", "went"],
+                         tagger.disf_tagger.tagged)
+
+
+@unittest.skipIf(fluteline is None, "fluteline is not installed")
+class DeepTaggerModulePipelineTest(unittest.TestCase):
+
+    def run_pipeline(self, word_updates, **kwargs):
+        fake = FakeDisfluencyTagger()
+        module = DeepTaggerModule(disf_tagger=fake, **kwargs)
+        collector = Collector()
+        # hold the module back until the whole burst is in its input queue
+        gate = threading.Event()
+        consume = module.consume
+
+        def gated_consume(msg):
+            gate.wait()
+            consume(msg)
+        module.consume = gated_consume
+        nodes = [module, collector]
+        fluteline.connect(nodes)
+        fluteline.start(nodes)
+        for update in word_updates:
+            module.input.put(update)
+        gate.set()
+        module.stop()
+        module.join(5)
+        collector.stop()
+        collector.join(5)
+        self.assertFalse(module.is_alive())
+        self.assertFalse(collector.is_alive())
+        return fake, collector.received
+
+    def test_burst_coalesced(self):
+        updates = [word_update(0, "i"), word_update(1, "like"),
+                   word_update(1, "liked"), word_update(2, "it")]
+        fake, received = self.run_pipeline(updates)
+        # the superseded 'like' is never tagged and each word is output
+        self.assertEqual(["i", "liked", "it"], fake.tagged)
+        self.assertEqual(["i", "liked", "it"],
+                         [w['word'] for w in received])
+        self.assertTrue(all(w['disf_tag'] == "<f/>" and w['pos_tag'] == "NN"
+                            for w in received))
+
+    def test_max_coalesced_updates(self):
+        updates = [word_update(0, "i"), word_update(1, "like"),
+                   word_update(1, "liked"), word_update(2, "it")]
+        fake, received = self.run_pipeline(updates, max_coalesced_updates=2)
+        self.assertEqual(["i", "like", "liked", "it"], fake.tagged)
+        self.assertEqual(["i", "like", "liked", "it"],
+                         [w['word'] for w in received])
+
+    def test_no_coalescing(self):
+        updates = [word_update(0, "i"), word_update(1, "like"),
+                   word_update(1, "liked")]
+        fake, received = self.run_pipeline(updates, coalesce_updates=False)
+        self.assertEqual(["i", "like", "liked"], fake.tagged)
+        self.assertEqual(["i", "like", "liked"],
+                         [w['word'] for w in received])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from collections import defaultdict
+
+try:
+    from deep_disfluency.evaluation.disf_evaluation import map_speakers, \
+        merge_error_analysis, merge_tag_dicts
+except ImportError:  # scipy is not installed
+    map_speakers = None
+
+
+def square(x):
+    return x * x
+
+
+@unittest.skipIf(map_speakers is None, "scipy is not installed")
+class SpeakerMergeTest(unittest.TestCase):
+
+    def test_merge_tag_dicts(self):
+        speakers = [{"<e": [1, 0.5, 2], "t_t_detection_<e_word": [1, 2]},
+                    {"<e": [2, 0.25, 0], "t_t_detection_<e_word": [0]}]
+        total = {"<e": [0, 0, 0], "t_t_detection_<e_word": []}
+        for part in speakers:
+            merge_tag_dicts(total, part)
+        self.assertEqual({"<e": [3, 0.75, 2],
+                          "t_t_detection_<e_word": [1, 2, 0]}, total)
+
+    def test_merge_error_analysis(self):
+        total = defaultdict(lambda: defaultdict(list))
+        merge_error_analysis(total, {"<rps": {"TP": ["a"], "FN": ["b"]}})
+        merge_error_analysis(total, {"<rps": {"TP": ["c"]}})
+        self.assertEqual(["a", "c"], total["<rps"]["TP"])
+        self.assertEqual(["b"], total["<rps"]["FN"])
+
+    def test_map_speakers(self):
+        speakers = range(10)
+        self.assertEqual(map(square, speakers),
+                         map_speakers(square, speakers))
+        self.assertEqual(map(square, speakers),
+                         map_speakers(square, speakers, n_jobs=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
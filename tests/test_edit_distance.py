@@ -0,0 +1,87 @@
+import random
+import unittest
+
+from deep_disfluency.utils.edit_distance import INFINITE_COST, \
+    corpus_wer, edit_distance, edit_distance_table, edit_distances, wer
+
+
+def naive_table(r, h, subcost=1):
+    table = [[i + j if i == 0 or j == 0 else 0
+              for j in range(len(h) + 1)] for i in range(len(r) + 1)]
+    for i in range(1, len(r) + 1):
+        for j in range(1, len(h) + 1):
+            table[i][j] = min(
+                table[i - 1][j - 1] + (0 if r[i - 1] == h[j - 1]
+                                       else subcost),
+                table[i - 1][j] + 1,
+                table[i][j - 1] + 1)
+    return table
+
+
+def random_pairs(n, seed=0):
+    rng = random.Random(seed)
+    words = ["a", "b", "c", "uh", "the"]
+    return [([rng.choice(words) for _ in range(rng.randint(0, 12))],
+             [rng.choice(words) for _ in range(rng.randint(0, 12))])
+            for _ in range(n)]
+
+
+class EditDistanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = random_pairs(300)
+
+    def test_edit_distance(self):
+        for subcost in [1, 2]:
+            for r, h in self.pairs:
+                self.assertEqual(naive_table(r, h, subcost)[-1][-1],
+                                 edit_distance(r, h, subcost))
+
+    def test_band(self):
+        for r, h in self.pairs:
+            distance = naive_table(r, h)[-1][-1]
+            for band in [0, 1, 3]:
+                banded = edit_distance(r, h, band=band)
+                self.assertTrue(banded >= distance)
+                if distance <= max(band, abs(len(r) - len(h))):
+                    self.assertEqual(distance, banded)
+
+    def test_table(self):
+        for r, h in self.pairs[:50]:
+            self.assertEqual(naive_table(r, h),
+                             edit_distance_table(r, h).tolist())
+        r, h = self.pairs[1]
+        table = edit_distance_table(r, h, band=1)
+        band = max(1, abs(len(r) - len(h)))
+        for i in range(len(r) + 1):
+            for j in range(len(h) + 1):
+                if abs(i - j) > band:
+                    self.assertEqual(INFINITE_COST, table[i, j])
+
+    def test_edit_distances(self):
+        for subcost in [1, 2]:
+            self.assertEqual([naive_table(r, h, subcost)[-1][-1]
+                              for r, h in self.pairs],
+                             edit_distances(self.pairs, subcost).tolist())
+            self.assertEqual([edit_distance(r, h, subcost, band=2)
+                              for r, h in self.pairs],
+                             edit_distances(self.pairs, subcost,
+                                            band=2).tolist())
+        self.assertEqual([], edit_distances([]).tolist())
+
+    def test_wer(self):
+        self.assertAlmostEqual(100 / 3.0, wer("who is there".split(),
+                                              "is there".split()))
+        self.assertEqual(100.0, wer("who is there".split(), []))
+        self.assertEqual(100.0, wer([], "who is there".split()))
+        self.assertEqual(1, wer("who is there".split(),
+                                "is there".split(), macro=True))
+        self.assertAlmostEqual(
+            100 * 2 / 5.0, corpus_wer([("who is there".split(),
+                                        "is there".split()),
+                                       ("hello there".split(),
+                                        "hello here".split())]))
+
+
+if __name__ == '__main__':
+    unittest.main()
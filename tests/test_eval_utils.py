@@ -0,0 +1,188 @@
+import random
+import unittest
+
+import numpy
+
+from deep_disfluency.evaluation.eval_utils import GoldIntervalIndex, \
+    _count_within, _overlap_durations, \
+    final_output_accuracy_interval_level, get_diff_and_new_prefix, \
+    update_hypothesis_with_new_prefix
+
+
+def random_intervals(rng, n, well_formed=True):
+    intervals = []
+    for i in range(n):
+        start = rng.randint(0, 20) / 2.0
+        end = start + rng.randint(0 if well_formed else -2, 4) / 2.0
+        intervals.append(("<tag{0}/>".format(i), start, end))
+    return intervals
+
+
+class GoldIntervalIndexTest(unittest.TestCase):
+
+    def check_within(self, gold, rng):
+        index = GoldIntervalIndex(gold)
+        for _ in range(50):
+            start_time = rng.randint(0, 24) / 2.0
+            end_time = start_time + rng.randint(0, 6) / 2.0
+            self.assertEqual([val for val in gold
+                              if val[1] >= start_time and
+                              val[2] <= end_time],
+                             index.within(start_time, end_time))
+
+    def test_within(self):
+        rng = random.Random(0)
+        for n in [0, 1, 5, 30]:
+            self.check_within(random_intervals(rng, n), rng)
+
+    def test_ending_before_start(self):
+        rng = random.Random(1)
+        gold = random_intervals(rng, 30, well_formed=False)
+        self.assertFalse(GoldIntervalIndex(gold).well_formed)
+        self.check_within(gold, rng)
+
+
+class UpdateHypothesisTest(unittest.TestCase):
+
+    def test_same_as_get_diff_and_new_prefix(self):
+        # increco updates revising the last few words of the hypothesis
+        rng = random.Random(0)
+        for _ in range(100):
+            current = []
+            expected = []
+            for _ in range(rng.randint(1, 15)):
+                back = rng.randint(0, min(3, len(current)))
+                start = current[-back][1] if back else \
+                    (current[-1][2] if current else 0.0)
+                prefix = []
+                for w in range(rng.randint(1, 4)):
+                    if w < back and rng.random() < 0.5:
+                        word = current[len(current) - back + w]
+                    else:
+                        word = (rng.choice("abc"), start, start + 0.5)
+                    prefix.append(word)
+                    start = word[2]
+                expected, new_prefix, rollback = get_diff_and_new_prefix(
+                    list(expected), list(prefix))
+                self.assertEqual((new_prefix, rollback),
+                                 update_hypothesis_with_new_prefix(current,
+                                                                   prefix))
+                self.assertEqual(expected, current)
+
+
+def interval_arrays(intervals):
+    return (numpy.array([x[1] for x in intervals], dtype=float),
+            numpy.array([x[2] for x in intervals], dtype=float))
+
+
+def naive_overlaps(intervals1, intervals2):
+    # as intervalframe_overlaps, by interval of the shorter frame
+    if len(intervals2) < len(intervals1):
+        intervals1, intervals2 = intervals2, intervals1
+    return [min(en1, en2) - max(st1, st2)
+            for _, st1, en1 in intervals1 for _, st2, en2 in intervals2
+            if en2 > st1 and st2 < en1]
+
+
+def speaker_intervals(rng, n, tags):
+    """Consecutive word intervals, each with one of the tags."""
+    intervals = []
+    time = 0.0
+    for _ in range(n):
+        duration = rng.randint(1, 8) / 4.0
+        intervals.append((rng.choice(tags), time, time + duration))
+        time += duration
+    return intervals
+
+
+class IntervalLevelTest(unittest.TestCase):
+
+    def test_count_within(self):
+        rng = random.Random(0)
+        starts, ends = interval_arrays(speaker_intervals(rng, 50, ["a"]))
+        lower = numpy.array([rng.randint(0, 40) for _ in range(20)],
+                            dtype=float)
+        upper = lower + numpy.array([rng.randint(0, 10) for _ in range(20)])
+        order = numpy.array(rng.sample(range(50), 50))
+        for upper_inclusive in [True, False]:
+            self.assertEqual(
+                [numpy.count_nonzero((starts >= l) &
+                                     ((ends <= u) if upper_inclusive
+                                      else (ends < u)))
+                 for l, u in zip(lower, upper)],
+                _count_within(starts, ends, lower, upper,
+                              upper_inclusive).tolist())
+            # unsorted, by a scan
+            self.assertEqual(
+                _count_within(starts, ends, lower, upper,
+                              upper_inclusive).tolist(),
+                _count_within(starts[order], ends[order], lower, upper,
+                              upper_inclusive).tolist())
+
+    def test_overlap_durations(self):
+        rng = random.Random(0)
+        for n1, n2 in [(0, 5), (5, 5), (20, 7), (7, 20)]:
+            intervals1 = speaker_intervals(rng, n1, ["a"])
+            intervals2 = speaker_intervals(rng, n2, ["a"])
+            self.assertEqual(naive_overlaps(intervals1, intervals2),
+                             _overlap_durations(
+                                 *(interval_arrays(intervals1) +
+                                   interval_arrays(intervals2))).tolist())
+            rng.shuffle(intervals2)
+            self.assertEqual(sorted(naive_overlaps(intervals1, intervals2)),
+                             sorted(_overlap_durations(
+                                 *(interval_arrays(intervals1) +
+                                   interval_arrays(intervals2))).tolist()))
+
+    def test_final_output_accuracy_interval_level(self):
+        rng = random.Random(0)
+        tags = ["<f/>", "<e/>", "<rps id=1/>", "<e/><ct/>", "<f/><tt/>"]
+        tag_keys = ["<rps", "<e", "t/>"]
+
+        def evaluate(gold, hyp):
+            tag_dict = {"DSER": [0, 0], "NIST_SU": [0, 0, 0]}
+            for tag in tag_keys:
+                tag_dict[tag] = [0, 0, 0]
+                tag_dict[tag + "_relaxed"] = [0, 0, 0]
+            reference = ([(x[1], x[2]) for x in gold], [None] * len(gold),
+                         [None] * len(gold), [x[0] for x in gold])
+            counts = final_output_accuracy_interval_level(
+                (None, None, hyp), reference, tag_dict, window=5)
+            return counts, tag_dict
+
+        gold = speaker_intervals(rng, 60, tags)
+        hyp = [(rng.choice(tags) if rng.random() < 0.3 else tag, start, end)
+               for tag, start, end in gold]
+        counts, tag_dict = evaluate(gold, hyp)
+        self.assertEqual((len([x for x in hyp if "<rps" in x[0]]),
+                          len([x for x in gold if "<rps" in x[0]]),
+                          len([x for x in hyp if "t/>" in x[0]]),
+                          len([x for x in gold if "t/>" in x[0]])), counts)
+        for tag in ["<rps", "<e"]:
+            gold_tag = [x for x in gold if tag in x[0]]
+            hyp_tag = [x for x in hyp if tag in x[0]]
+            overlap = sum(naive_overlaps(gold_tag, hyp_tag))
+            self.assertAlmostEqual(overlap, tag_dict[tag][0])
+            self.assertAlmostEqual(
+                sum(x[2] - x[1] for x in hyp_tag) - overlap, tag_dict[tag][1])
+            self.assertAlmostEqual(
+                sum(x[2] - x[1] for x in gold_tag) - overlap,
+                tag_dict[tag][2])
+        # a perfect hypothesis
+        counts, perfect = evaluate(gold, gold)
+        self.assertEqual(perfect["DSER"][0], perfect["DSER"][1])
+        self.assertEqual(0, perfect["NIST_SU"][1] + perfect["NIST_SU"][2])
+        for tag in ["<rps", "<e"]:
+            self.assertEqual(0, perfect[tag][1] + perfect[tag][2])
+        # the same counts from the unsorted fallback
+        shuffled = list(hyp)
+        rng.shuffle(shuffled)
+        self.assertEqual(evaluate(gold, hyp)[0], evaluate(gold, shuffled)[0])
+        shuffled_dict = evaluate(gold, shuffled)[1]
+        for key, values in tag_dict.items():
+            for value, shuffled_value in zip(values, shuffled_dict[key]):
+                self.assertAlmostEqual(value, shuffled_value)
+
+
+if __name__ == '__main__':
+    unittest.main()
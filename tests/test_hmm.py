@@ -0,0 +1,97 @@
+import itertools
+import os
+import unittest
+
+import numpy as np
+
+from deep_disfluency.decoder.hmm import FirstOrderHMM
+from deep_disfluency.decoder.hmm_utils import log
+
+TAGS_FILE = os.path.join(os.path.dirname(__file__), "..", "deep_disfluency",
+                         "data", "tag_representations",
+                         "swbd_disf1_uttseg_simple_033_tags.csv")
+
+
+def load_tags():
+    tags = {}
+    for line in open(TAGS_FILE):
+        index, tag = line.strip().split(",")[:2]
+        tags[tag] = int(index)
+    tags["<i/><cc/>"] = len(tags)
+    return tags
+
+
+class KBestTagSequencesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tags = load_tags()
+        self.rng = np.random.RandomState(0)
+
+    def path_log_prob(self, hmm, sequence, distribution):
+        """The log prob of a tag sequence scored as by viterbi_step, with
+        the conversions along the sequence itself."""
+        converted = "s"
+        total = 0.0
+        for i, tag in enumerate(sequence):
+            converted_tag = hmm.convert_tag(converted, tag)
+            if converted_tag not in hmm.tag_set:
+                return log(0.0)
+            if i == 0:
+                tag_prob = hmm.markov_model.prob("s", converted_tag)
+                if tag_prob < 0.00001:
+                    tag_prob = 0.0
+                elif hmm.constraint_only:
+                    tag_prob = 1.0
+            else:
+                tag_prob = hmm.transition_prob(converted, converted_tag, tag)
+            if tag_prob == 0.0:
+                return log(0.0)
+            total += log(tag_prob) + \
+                log(distribution[i][self.tags[tag]])
+            converted = converted_tag
+        return total
+
+    def brute_force(self, hmm, distribution, k):
+        tags = [t for t in self.tags if t not in ("s", "se")]
+        scored = []
+        for sequence in itertools.product(tags, repeat=len(distribution)):
+            prob = self.path_log_prob(hmm, sequence, distribution)
+            if prob > log(0.0):
+                scored.append((prob, list(sequence)))
+        scored.sort(reverse=True)
+        return scored[:k]
+
+    def check_against_brute_force(self, constraint_only):
+        hmm = FirstOrderHMM(self.tags,
+                            markov_model_file="swbd_disf1_uttseg_simple_033",
+                            constraint_only=constraint_only)
+        for length in [1, 2, 3, 4]:
+            distribution = self.rng.dirichlet(np.ones(len(self.tags)) * 0.3,
+                                              size=length)
+            hmm.viterbi_init()
+            for i in range(length):
+                hmm.viterbi_step(distribution, i, i == 0)
+            k_best = hmm.k_best_derivations(10)
+            expected = self.brute_force(hmm, distribution, 10)
+            self.assertEqual(len(expected), len(k_best))
+            for (prob, sequence), (expected_prob, _) in zip(k_best,
+                                                            expected):
+                self.assertEqual("s", sequence[0])
+                self.assertAlmostEqual(expected_prob, prob)
+                self.assertAlmostEqual(
+                    self.path_log_prob(hmm, sequence[1:], distribution),
+                    prob)
+            sequences = hmm.get_best_n_tag_sequences(10)
+            self.assertEqual([s for _, s in k_best], sequences)
+            self.assertEqual(len(sequences),
+                             len(set(tuple(s) for s in sequences)))
+
+    def test_k_best_conditional_probability(self):
+        self.check_against_brute_force(False)
+
+    def test_k_best_constraint_only(self):
+        self.check_against_brute_force(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
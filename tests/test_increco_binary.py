@@ -0,0 +1,115 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from deep_disfluency.evaluation.eval_utils import \
+    load_incremental_outputs_from_increco_file
+from deep_disfluency.load.columnar import parse_columns
+from deep_disfluency.load.increco_binary import MAGIC, BinaryIncreco, \
+    convert_increco_file, is_binary_increco_file, open_increco_output, \
+    read_increco_columns, write_binary_increco
+
+INCRECO_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "deep_disfluency", "experiments", "033", "epoch_45",
+    "swbd_disf_heldout_partial_timings_data_output_increco.text")
+
+
+def first_speakers_text(n):
+    """The text of the first n speakers of the shipped increco file."""
+    lines = []
+    with open(INCRECO_FILE) as f:
+        for line in f:
+            if line.startswith("Speaker:"):
+                n -= 1
+                if n < 0:
+                    break
+            lines.append(line)
+    return "".join(lines)
+
+
+class BinaryIncrecoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.text = first_speakers_text(3)
+        self.text_file = self.path("output_increco.text")
+        with open(self.text_file, "w") as f:
+            f.write(self.text)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_round_trip(self):
+        binary_file = self.path("output_increco.incb")
+        convert_increco_file(self.text_file, binary_file)
+        self.assertTrue(is_binary_increco_file(binary_file))
+        self.assertFalse(is_binary_increco_file(self.text_file))
+        self.assertTrue(os.path.getsize(binary_file) < len(self.text) / 2)
+        self.assertEqual(self.text, BinaryIncreco(binary_file).to_text())
+        convert_increco_file(binary_file, self.path("back.text"))
+        with open(self.path("back.text")) as f:
+            self.assertEqual(self.text, f.read())
+
+    def test_writer(self):
+        # written a line at a time, a block per speaker
+        binary_file = self.path("output_increco.incb")
+        f = open_increco_output(binary_file)
+        for line in self.text.splitlines(True):
+            f.write(line)
+        f.close()
+        increco = BinaryIncreco(binary_file)
+        self.assertEqual(3, len(increco.blocks))
+        self.assertEqual(["4519A", "4519B", "4548A"], increco.speakers)
+        self.assertEqual(self.text, increco.to_text())
+        columns = parse_columns(self.text)
+        binary_columns = read_increco_columns(binary_file)
+        self.assertEqual(columns.rows, binary_columns.rows)
+        self.assertEqual(columns.update_times.tolist(),
+                         binary_columns.update_times.tolist())
+
+    def test_updates(self):
+        binary_file = self.path("output_increco.incb")
+        write_binary_increco(binary_file, parse_columns(self.text))
+        increco = BinaryIncreco(binary_file)
+        columns = parse_columns(self.text)
+        speaker = increco.speaker_index("4519B")
+        updates = increco.updates(speaker)
+        expected = [columns.rows[start:end]
+                    for start, end in columns.speaker_updates(speaker)]
+        self.assertEqual(expected,
+                         [[[str(v) for v in row] for row in rows]
+                          for _, rows in updates])
+        until = updates[10][0]
+        self.assertEqual(updates[:11], increco.updates(speaker, until))
+
+    def test_loaded_outputs(self):
+        binary_file = self.path("output_increco.incb")
+        convert_increco_file(self.text_file, binary_file)
+        self.assertEqual(
+            load_incremental_outputs_from_increco_file(self.text_file),
+            load_incremental_outputs_from_increco_file(binary_file))
+
+    def test_float_exceptions(self):
+        # times not all exact at one scale, and a tag column of floats
+        text = "Speaker: a\n\nTime: 1.5\n0.1\t1.5\tuh\t0.25\n\n" \
+            "Time: 2.0\n0.1\t1.5\tuh\t0.5\n1.5\t1.0000001\tum\t1e-300\n\n"
+        binary_file = self.path("output_increco.incb")
+        write_binary_increco(binary_file, parse_columns(text))
+        self.assertEqual(text + "\n", BinaryIncreco(binary_file).to_text())
+
+    def test_not_binary(self):
+        self.assertRaises(ValueError, BinaryIncreco, self.text_file)
+        with open(self.path("future.incb"), "wb") as f:
+            f.write(MAGIC + struct.pack("<IQQ", 99, 0, 0))
+        self.assertRaises(ValueError, BinaryIncreco,
+                          self.path("future.incb"))
+
+
+if __name__ == '__main__':
+    unittest.main()
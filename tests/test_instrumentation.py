@@ -0,0 +1,78 @@
+import sys
+import time
+import unittest
+
+from deep_disfluency.utils import instrumentation
+from deep_disfluency.utils.instrumentation import Instrumentation, \
+    LatencyHistogram, clock
+
+
+class ClockTest(unittest.TestCase):
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "linux only")
+    def test_monotonic_on_linux(self):
+        self.assertTrue(instrumentation.CLOCK_IS_MONOTONIC)
+
+    def test_elapsed(self):
+        start = clock()
+        time.sleep(0.01)
+        elapsed = clock() - start
+        self.assertTrue(0.005 < elapsed < 1.0, elapsed)
+        times = [clock() for _ in range(1000)]
+        self.assertEqual(sorted(times), times)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_summary(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 101):
+            histogram.record(i * 1e-3)
+        summary = histogram.summary()
+        self.assertEqual(100, summary["count"])
+        self.assertAlmostEqual(0.0505, summary["mean"])
+        self.assertEqual(0.1, summary["max"])
+        # buckets are ~10% wide
+        self.assertTrue(0.05 <= summary["p50"] <= 0.05 * 1.1)
+        self.assertTrue(0.095 <= summary["p95"] <= 0.095 * 1.1)
+        self.assertTrue(summary["p99"] <= 0.1)
+
+    def test_negative_interval(self):
+        histogram = LatencyHistogram()
+        histogram.record(-0.5)
+        self.assertEqual(1, histogram.count)
+        self.assertEqual(0.0, histogram.total)
+        self.assertEqual(0.0, histogram.percentile(99))
+
+    def test_merge(self):
+        a, b = LatencyHistogram(), LatencyHistogram()
+        a.record(0.001)
+        b.record(0.002)
+        b.record(0.003)
+        a.merge(b)
+        self.assertEqual(3, a.count)
+        self.assertAlmostEqual(0.006, a.total)
+        self.assertEqual(0.003, a.max)
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def test_lap_and_report(self):
+        stats = Instrumentation()
+        t = clock()
+        t = stats.lap("a", t)
+        stats.lap("b", t)
+        stats.increment("words")
+        stats.increment("words", 2)
+        other = Instrumentation()
+        other.record("a", 0.5)
+        stats.merge(other)
+        report = stats.report()
+        self.assertEqual(["a", "b"], sorted(report["timers"]))
+        self.assertEqual(2, report["timers"]["a"]["count"])
+        self.assertEqual(0.5, report["timers"]["a"]["max"])
+        self.assertEqual({"words": 3}, report["counters"])
+
+
+if __name__ == '__main__':
+    unittest.main()
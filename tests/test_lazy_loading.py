@@ -0,0 +1,64 @@
+import copy
+import cPickle
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from deep_disfluency.utils.lazy_loading import LazyPickle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_DEPENDENCIES = ["theano", "gensim", "sklearn", "pandas", "scipy"]
+INFERENCE_MODULES = ["deep_disfluency.tagger.deep_tagger",
+                     "deep_disfluency.tagger.model_bundle",
+                     "deep_disfluency.decoder.hmm",
+                     "deep_disfluency.load.load",
+                     "deep_disfluency.evaluation.eval_utils"]
+
+
+class Scaler(object):
+    def __init__(self, scale):
+        self.scale = scale
+
+    def transform(self, x):
+        return x * self.scale
+
+
+class LazyPickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, "scaler.pkl")
+        with open(self.file_path, "wb") as f:
+            cPickle.dump(Scaler(3), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_loaded_on_first_use(self):
+        lazy = LazyPickle(self.file_path)
+        copied = copy.copy(lazy)  # without loading it
+        self.assertIsNone(lazy._obj)
+        self.assertEqual(6, lazy.transform(2))
+        self.assertIs(lazy.load(), lazy._obj)
+        os.remove(self.file_path)
+        self.assertEqual(3, lazy.scale)
+        self.assertRaises(IOError, copied.load)
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_no_heavy_dependencies(self):
+        # imported in a fresh interpreter, as this one has imported more
+        script = "import sys; sys.path.insert(0, {0!r}); {1}; " \
+            "print [m for m in {2!r} if m in sys.modules]".format(
+                ROOT, "; ".join("import " + m for m in INFERENCE_MODULES),
+                HEAVY_DEPENDENCIES)
+        output = subprocess.check_output([sys.executable, "-c", script])
+        self.assertEqual("[]", output.strip().split("\n")[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from deep_disfluency.embeddings.load_embeddings import \
+    _embeddings_cache_file, load_pretrained_embeddings, open_embeddings, \
+    populate_embeddings
+
+
+class KeyedVectors(object):
+    def __init__(self, index2word, vectors, attribute="vectors"):
+        self.index2word = index2word
+        setattr(self, attribute, vectors)
+
+
+class Word2Vec(object):
+    """The attributes of a gensim Word2Vec model populate_embeddings uses,
+    with the vectors in wv.vectors (new gensim) or wv.syn0 (old), or
+    elsewhere so only found by lookup."""
+    def __init__(self, words, vectors, attribute="vectors"):
+        self.layer1_size = vectors.shape[1]
+        self.lookup = dict(zip(words, vectors))
+        self.wv = KeyedVectors(words, vectors, attribute)
+
+    def __getitem__(self, word):
+        return self.lookup[word]
+
+
+class EmbeddingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.words2index = {"the": 0, "uh": 1, "cat": 2, "oov": 3}
+        self.words = ["cat", "dog", "the", "uh"]
+        self.vectors = np.arange(12, dtype=np.float32).reshape(4, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_populate_embeddings(self):
+        for attribute in ["vectors", "syn0", "elsewhere"]:
+            pretrained = Word2Vec(self.words, self.vectors, attribute)
+            emb = populate_embeddings(3, 4, self.words2index, pretrained)
+            self.assertEqual((5, 3), emb.shape)
+            self.assertEqual(np.float32, emb.dtype)
+            for word, index in self.words2index.items():
+                if word in self.words:
+                    self.assertEqual(
+                        self.vectors[self.words.index(word)].tolist(),
+                        emb[index].tolist())
+            self.assertTrue(np.abs(emb[3]).max() <= 0.2)
+
+    def test_open_embeddings(self):
+        file_path = os.path.join(self.folder, "embeddings.npy")
+        np.save(file_path, self.vectors)
+        emb = open_embeddings(file_path)
+        self.assertIs(emb, open_embeddings(file_path))
+        self.assertEqual(self.vectors.tolist(), emb.tolist())
+        self.assertRaises(ValueError, emb.__setitem__, (0, 0), 1)
+
+    def test_cached_table(self):
+        # a cached table is memory mapped without loading the model
+        pretrained_path = os.path.join(self.folder, "model.w2v")
+        with open(pretrained_path, "w") as f:
+            f.write("not a gensim model")
+        cache_file = _embeddings_cache_file(self.folder, 3, 4,
+                                            self.words2index,
+                                            pretrained_path)
+        np.save(cache_file, self.vectors)
+        emb = load_pretrained_embeddings(3, 4, self.words2index,
+                                         pretrained_path)
+        self.assertEqual(self.vectors.tolist(), emb.tolist())
+        self.assertNotEqual(cache_file, _embeddings_cache_file(
+            self.folder, 3, 4, {"the": 0}, pretrained_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from deep_disfluency.decoder.markov_model import MarkovTransitionModel, \
+    converted_file_path
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "deep_disfluency",
+                         "decoder", "models")
+
+
+class MarkovTransitionModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = MarkovTransitionModel.from_transitions(
+            [("s", "a"), ("a", "a"), ("a", "b"), ("a", "b"), ("b", "se")])
+
+    def test_probs(self):
+        self.assertEqual(["a", "b", "s", "se"], self.model.tags)
+        self.assertAlmostEqual(2 / 3.0, self.model.prob("a", "b"))
+        self.assertEqual(1.0, self.model.prob("s", "a"))
+        self.assertEqual(0.0, self.model.prob("b", "a"))
+        self.assertEqual(0.0, self.model.prob("a", "unseen"))
+        self.assertEqual(-np.inf, self.model.log_probs[1, 0])
+        self.assertAlmostEqual(np.log2(1 / 3.0), self.model.log_probs[0, 0])
+        self.assertEqual(["a", "b", "s"], self.model.conditions())
+        self.assertEqual(set(["a", "b", "s", "se"]), self.model.tag_set())
+        self.assertEqual(0, len(MarkovTransitionModel.from_transitions(
+            []).tags))
+
+    def test_merge(self):
+        other = MarkovTransitionModel.from_transitions([("a", "c")])
+        merged = self.model.merge(other)
+        self.assertEqual(["a", "b", "c", "s", "se"], merged.tags)
+        self.assertAlmostEqual(0.5, merged.prob("a", "b"))
+        self.assertAlmostEqual(0.25, merged.prob("a", "c"))
+
+    def test_save_and_load(self):
+        folder = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(folder, "model_tags.npz")
+            self.model.save(file_path)
+            loaded = MarkovTransitionModel.load(file_path)
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(self.model.tags, loaded.tags)
+        self.assertEqual(self.model.counts.tolist(), loaded.counts.tolist())
+        self.assertEqual(self.model.tabulate(), loaded.tabulate())
+        self.assertEqual("\ta\tb\tse\na\t1\t2\t\nb\t\t\t1\ns\t1\t\t\n",
+                         self.model.tabulate())
+
+    def test_converted_file_path(self):
+        self.assertEqual("models/x_tags.npz",
+                         converted_file_path("models/x_tags.pkl"))
+        self.assertEqual("models/x_tags.npz",
+                         converted_file_path("models/x.csv"))
+
+    def test_shipped_models(self):
+        # the .npz models are the conversions of the pickled and csv ones
+        name = os.path.join(MODEL_DIR, "swbd_disf1_uttseg_simple_033")
+        npz = MarkovTransitionModel.load(name + "_tags.npz")
+        for source in [MarkovTransitionModel.load(name + "_tags.pkl"),
+                       MarkovTransitionModel.from_count_table(name + ".csv",
+                                                              ",")]:
+            self.assertEqual(npz.tags, source.tags)
+            self.assertEqual(npz.counts.tolist(), source.counts.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
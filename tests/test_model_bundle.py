@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from deep_disfluency.tagger.model_bundle import load_pos_tagger, \
+    pos_tagger_model, read_bundle, write_bundle
+
+try:
+    import pycrfsuite
+    from nltk.tag import CRFTagger
+except ImportError:
+    pycrfsuite = None
+
+TRAIN_SENTS = [[(u"the", u"DT"), (u"dog", u"NN"), (u"runs", u"VBZ")],
+               [(u"a", u"DT"), (u"cat", u"NN"), (u"sleeps", u"VBZ")],
+               [(u"the", u"DT"), (u"cat", u"NN"), (u"runs", u"VBZ")]]
+
+
+class BundleFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, "test.ddb")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        arrays = {"a": np.arange(10, dtype=np.float32).reshape(2, 5),
+                  "b": np.array([1, 2, 3], dtype=np.int8)}
+        write_bundle(self.file_path, {"name": "test"}, arrays)
+        header, loaded = read_bundle(self.file_path)
+        self.assertEqual("test", header["name"])
+        self.assertEqual(sorted(arrays), sorted(loaded))
+        for name, array in arrays.items():
+            self.assertEqual(array.dtype, loaded[name].dtype)
+            self.assertTrue(np.array_equal(array, loaded[name]))
+        self.assertFalse(loaded["a"].flags.writeable)
+
+    def test_not_a_bundle(self):
+        with open(self.file_path, "wb") as f:
+            f.write(b"NOTABUNDLE")
+        self.assertRaises(ValueError, read_bundle, self.file_path)
+
+
+@unittest.skipIf(pycrfsuite is None, "python-crfsuite is not installed")
+class BundledPOSTaggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        model_file = os.path.join(self.folder, "pos.crfsuite")
+        self.trained = CRFTagger()
+        self.trained.train(TRAIN_SENTS, model_file)
+        with open(model_file, "rb") as f:
+            self.crf_model = np.frombuffer(f.read(), dtype=np.uint8)
+        self.tempdir = tempfile.tempdir
+        self.tagger_class = pycrfsuite.Tagger
+
+    def tearDown(self):
+        tempfile.tempdir = self.tempdir
+        pycrfsuite.Tagger = self.tagger_class
+        shutil.rmtree(self.folder)
+
+    def check_pos_tagger(self, pos_tagger):
+        sentence = [u"the", u"dog", u"sleeps"]
+        self.assertEqual(self.trained.tag(sentence), pos_tagger.tag(sentence))
+        # the bytes it was loaded from, to export again
+        self.assertEqual(self.crf_model.tostring(),
+                         pos_tagger_model(pos_tagger).tostring())
+
+    def test_in_memory(self):
+        self.check_pos_tagger(load_pos_tagger(self.crf_model))
+
+    def test_temporary_file_removed(self):
+        class FileOnlyTagger(self.tagger_class):
+            @property
+            def open_inmemory(self):
+                raise AttributeError("open_inmemory")
+        pycrfsuite.Tagger = FileOnlyTagger
+        tempfile.tempdir = os.path.join(self.folder, "tmp")
+        os.mkdir(tempfile.tempdir)
+        pos_tagger = load_pos_tagger(self.crf_model)
+        self.assertIsInstance(pos_tagger._tagger, FileOnlyTagger)
+        self.assertEqual([], os.listdir(tempfile.tempdir))
+        self.check_pos_tagger(pos_tagger)
+
+    def test_model_file(self):
+        self.assertTrue(np.array_equal(self.crf_model,
+                                       pos_tagger_model(self.trained)))
+
+
+if __name__ == '__main__':
+    unittest.main()
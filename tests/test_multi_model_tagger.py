@@ -0,0 +1,145 @@
+import unittest
+from copy import copy
+from argparse import Namespace
+
+import numpy as np
+
+from deep_disfluency.decoder.noisy_channel import SourceModel
+from deep_disfluency.tagger import multi_model_tagger
+from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+from deep_disfluency.tagger.multi_model_tagger import LastInputCache, \
+    MultiModelTagger, NgramProbCache
+
+
+class CountingLM(object):
+    order = 3
+
+    def __init__(self):
+        self.calls = 0
+
+    def ngram_prob(self, ngram, order):
+        self.calls += 1
+        return 1.0 / (2 + len("".join(w for w in ngram if w)))
+
+
+class CountingClassifier(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        return X * 2
+
+
+class FakeDecoder(object):
+
+    def __init__(self, source_model=None):
+        self.noisy_channel_source_model = source_model
+        self.timing_model = None
+        self.timing_model_scaler = None
+
+
+class FakeTagger(object):
+    """Records the arguments it is built with in place of a
+    DeepDisfluencyTagger."""
+    LAZY_COMPONENTS = DeepDisfluencyTagger.LAZY_COMPONENTS
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.args = Namespace(pos=True)
+        self.word_to_index_map = {"a": 0}
+        self.pos_to_index_map = {"DT": 0}
+        self.timing_model = None
+        self.timing_model_scaler = None
+        self.decoder = None
+        if kwargs.get("pos_tagger") is None:
+            self.pos_tagger = "pos tagger of {}".format(
+                kwargs["config_number"])
+
+    def new_session(self):
+        # as DeepDisfluencyTagger.new_session
+        session = copy(self)
+        if self.decoder:
+            session.decoder = copy(self.decoder)
+            session.decoder.noisy_channel_source_model = \
+                copy(self.decoder.noisy_channel_source_model)
+        return session
+
+
+class MultiModelTaggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tagger_class = multi_model_tagger.DeepDisfluencyTagger
+        multi_model_tagger.DeepDisfluencyTagger = FakeTagger
+
+    def tearDown(self):
+        multi_model_tagger.DeepDisfluencyTagger = self.tagger_class
+
+    def test_from_configs_keeps_config_numbers(self):
+        tagger = MultiModelTagger.from_configs(
+            [("joint", 35, "experiments/035/epoch_6"),
+             ("disf", 37, "experiments/037/epoch_6")])
+        joint, disf = tagger.taggers.values()
+        self.assertEqual(35, joint.kwargs["config_number"])
+        self.assertEqual(37, disf.kwargs["config_number"])
+        for t in [joint, disf]:
+            self.assertEqual("experiments/experiment_configs.csv",
+                             t.kwargs["config_file"])
+        # the POS tagger built by the first is given to the second
+        self.assertEqual("pos tagger of 35", disf.kwargs["pos_tagger"])
+
+    def test_source_model_language_models_shared(self):
+        lm = CountingLM()
+        taggers = []
+        for config_number in [35, 37]:
+            tagger = FakeTagger(config_number=config_number)
+            tagger.decoder = FakeDecoder(SourceModel(lm))
+            taggers.append(("m{}".format(config_number), tagger))
+        multi = MultiModelTagger(taggers)
+        sources = [t.decoder.noisy_channel_source_model
+                   for t in multi.taggers.values()]
+        self.assertIsInstance(sources[0].lm, NgramProbCache)
+        self.assertIs(sources[0].lm, sources[1].lm)
+        for word in "i want a tea".split():
+            sources[0].consume_word(word)
+        calls = lm.calls
+        for word in "i want a tea".split():
+            sources[1].consume_word(word)
+        self.assertEqual(calls, lm.calls)
+        self.assertEqual(sources[0].word_tree, sources[1].word_tree)
+        # new sessions keep the shared cache
+        session = multi.new_session()
+        self.assertIs(
+            sources[0].lm,
+            session.taggers["m35"].decoder.noisy_channel_source_model.lm)
+
+
+class CachesTest(unittest.TestCase):
+
+    def test_ngram_prob_cache(self):
+        lm = CountingLM()
+        cache = NgramProbCache(lm, max_size=2)
+        self.assertEqual(lm.ngram_prob(["a", "b"], 2),
+                         cache.ngram_prob(["a", "b"], 2))
+        cache.ngram_prob(("a", "b"), 2)
+        self.assertEqual(2, lm.calls)
+        cache.ngram_prob(["a"], 1)
+        cache.ngram_prob(["b"], 1)  # full, so cleared
+        cache.ngram_prob(["a", "b"], 2)
+        self.assertEqual(5, lm.calls)
+        self.assertEqual(3, cache.order)
+
+    def test_last_input_cache(self):
+        classifier = CountingClassifier()
+        cache = LastInputCache(classifier)
+        X = np.array([[1.0, 2.0]])
+        self.assertTrue(np.array_equal(X * 2, cache.predict_proba(X)))
+        cache.predict_proba(X.copy())
+        self.assertEqual(1, classifier.calls)
+        cache.predict_proba(X + 1)
+        self.assertEqual(2, classifier.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import unittest
+
+import numpy as np
+
+from deep_disfluency.rnn.numpy_rnn import load_weights_from_folder, \
+    model_from_folder
+
+EXPERIMENTS_DIR = os.path.join(os.path.dirname(__file__), "..",
+                               "deep_disfluency", "experiments")
+ELMAN_FOLDER = os.path.join(EXPERIMENTS_DIR, "021", "epoch_40")
+LSTM_FOLDER = os.path.join(EXPERIMENTS_DIR, "035", "epoch_6")
+
+
+class LoadShippedModelsTest(unittest.TestCase):
+
+    def test_elman(self):
+        weights = load_weights_from_folder(ELMAN_FOLDER, "elman")
+        self.assertEqual((weights["Wh"].shape[0],), weights["h0"].shape)
+
+    def test_lstm_without_w_xo_refused(self):
+        with self.assertRaises(ValueError) as context:
+            load_weights_from_folder(LSTM_FOLDER, "lstm")
+        self.assertIn("W_xo", str(context.exception))
+
+    def test_lstm_with_output_gate_seed(self):
+        weights = load_weights_from_folder(LSTM_FOLDER, "lstm",
+                                           output_gate_seed=1)
+        self.assertEqual(weights["W_xc"].shape, weights["W_xo"].shape)
+        self.assertTrue(np.abs(weights["W_xo"]).max() <= 0.1)
+        # the missing initial states are zeros
+        self.assertFalse(weights["h0"].any() or weights["c0"].any())
+        self.assertEqual((weights["W_hi"].shape[0],), weights["h0"].shape)
+        # the same W_xo on every load
+        again = load_weights_from_folder(LSTM_FOLDER, "lstm",
+                                         output_gate_seed=1)
+        self.assertTrue(np.array_equal(weights["W_xo"], again["W_xo"]))
+        other = load_weights_from_folder(LSTM_FOLDER, "lstm",
+                                         output_gate_seed=2)
+        self.assertFalse(np.array_equal(weights["W_xo"], other["W_xo"]))
+
+    def test_lstm_step_batch(self):
+        de, cs = 50, 2  # config 35
+        weights = load_weights_from_folder(LSTM_FOLDER, "lstm",
+                                           output_gate_seed=1)
+        npos = (weights["W_xi"].shape[0] - de * cs) // cs
+        model = model_from_folder(LSTM_FOLDER, "lstm", de=de, cs=cs,
+                                  npos=npos, output_gate_seed=1)
+        idxs = [[0, 1], [1, 2]]
+        pos_idxs = [[0, 1], [1, 2]]
+        h, c, s = model.soft_max_return_hidden_layer(idxs, pos_idxs)
+        self.assertEqual((2, weights["W_hy"].shape[1]), s.shape)
+        self.assertTrue(np.allclose(1.0, s.sum(axis=1)))
+        # the second step from the first's state, as a batch of one
+        h1, c1, s1 = model.step_batch(np.asarray(idxs[1:]),
+                                      np.asarray(pos_idxs[1:]),
+                                      h[:1], c[:1])
+        self.assertTrue(np.allclose(s[1:], s1, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from deep_disfluency.utils.pipeline import Pipeline, Stage, StageResult
+
+
+def copy_upper(source, target):
+    with open(source) as f:
+        text = f.read()
+    with open(target, "w") as f:
+        f.write(text.upper())
+    return len(text)
+
+
+def write_count(count, target):
+    with open(target, "w") as f:
+        f.write(str(count))
+    return count
+
+
+def fail():
+    raise RuntimeError("stage failed")
+
+
+def crash():
+    os._exit(3)
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.manifest = self.path("manifest.json")
+        with open(self.path("a.txt"), "w") as f:
+            f.write("abc")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def pipeline(self, n_jobs=1):
+        pipeline = Pipeline(self.manifest, n_jobs=n_jobs)
+        pipeline.add(Stage("upper", copy_upper,
+                           [self.path("a.txt"), self.path("b.txt")],
+                           inputs=[self.path("a.txt")],
+                           outputs=[self.path("b.txt")]))
+        pipeline.add(Stage("count", write_count,
+                           [StageResult("upper"), self.path("c.txt")],
+                           inputs=[self.path("b.txt")],
+                           outputs=[self.path("c.txt")]))
+        return pipeline
+
+    def test_dependencies(self):
+        self.assertEqual({"upper": set(), "count": set(["upper"])},
+                         self.pipeline().dependencies())
+
+    def test_cache(self):
+        self.assertEqual((["upper", "count"], [], []),
+                         self.pipeline().run())
+        with open(self.path("b.txt")) as f:
+            self.assertEqual("ABC", f.read())
+        with open(self.path("c.txt")) as f:
+            self.assertEqual("3", f.read())
+        # nothing has changed
+        self.assertEqual(([], ["upper", "count"], []),
+                         self.pipeline().run())
+        # an output has gone
+        os.remove(self.path("c.txt"))
+        self.assertEqual((["count"], ["upper"], []), self.pipeline().run())
+        # an input has changed, but not the inputs of the next stage
+        with open(self.path("a.txt"), "w") as f:
+            f.write("ABC")
+        self.assertEqual((["upper"], ["count"], []), self.pipeline().run())
+        self.assertEqual((["upper", "count"], [], []),
+                         self.pipeline().run(force=True))
+
+    def test_parallel(self):
+        pipeline = self.pipeline(n_jobs=2)
+        pipeline.add(Stage("other", write_count, [5, self.path("d.txt")],
+                           outputs=[self.path("d.txt")]))
+        ran, up_to_date, failed = pipeline.run()
+        self.assertEqual(["count", "other", "upper"], sorted(ran))
+        self.assertEqual(["upper", "count"],
+                         [name for name in ran if name != "other"])
+        self.assertEqual(([], []), (up_to_date, failed))
+
+    def check_failure(self, action, n_jobs):
+        pipeline = Pipeline(self.manifest, n_jobs=n_jobs)
+        pipeline.add(Stage("upper", action, outputs=[self.path("b.txt")]))
+        pipeline.add(Stage("count", write_count, [3, self.path("c.txt")],
+                           inputs=[self.path("b.txt")],
+                           outputs=[self.path("c.txt")]))
+        pipeline.add(Stage("other", write_count, [5, self.path("d.txt")],
+                           outputs=[self.path("d.txt")]))
+        ran, up_to_date, failed = pipeline.run()
+        self.assertEqual((["other"], []), (ran, up_to_date))
+        self.assertEqual(["count", "upper"], sorted(failed))
+        self.assertFalse(os.path.exists(self.path("c.txt")))
+
+    def test_failure(self):
+        self.check_failure(fail, 1)
+
+    def test_parallel_failure(self):
+        self.check_failure(fail, 2)
+
+    def test_crashed_worker(self):
+        self.check_failure(crash, 2)
+
+    def test_missing_dependency(self):
+        pipeline = Pipeline(self.manifest)
+        pipeline.add(Stage("count", write_count,
+                           [StageResult("upper"), self.path("c.txt")]))
+        self.assertRaises(ValueError, pipeline.run)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from deep_disfluency.rnn.numpy_rnn import dequantize, dot
+from deep_disfluency.rnn.quantization import QuantizedArray, \
+    quantize_array, quantize_weights, quantized_weights
+
+
+class QuantizedArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.W = rng.uniform(-0.5, 0.5, (20, 8)).astype(np.float32)
+        self.x = rng.uniform(-1, 1, (3, 20)).astype(np.float32)
+
+    def check_mode(self, mode, tolerance):
+        data, scale = quantize_array(self.W, mode)
+        W = QuantizedArray(data, scale)
+        self.assertEqual(self.W.shape, W.shape)
+        self.assertTrue(np.allclose(self.W, W.dequantize(), atol=tolerance))
+        product = dot(self.x, W)
+        self.assertEqual(np.float32, product.dtype)
+        self.assertTrue(np.allclose(np.dot(self.x, self.W), product,
+                                    atol=tolerance * 20))
+        # slices and looked up rows
+        self.assertTrue(np.allclose(np.dot(self.x[:, :5], self.W[:5]),
+                                    dot(self.x[:, :5], W[:5]),
+                                    atol=tolerance * 5))
+        self.assertTrue(np.allclose(self.W[[1, 3]], dequantize(W[[1, 3]]),
+                                    atol=tolerance))
+
+    def test_float16(self):
+        self.check_mode("float16", 1e-3)
+
+    def test_int8(self):
+        data, scale = quantize_array(self.W, "int8")
+        self.assertEqual(np.int8, data.dtype)
+        self.assertEqual(127, np.abs(data).max())
+        self.check_mode("int8", scale)
+
+    def test_no_float32_copy_kept(self):
+        data, scale = quantize_array(self.W, "int8")
+        W = QuantizedArray(data, scale)
+        first = dot(self.x, W)
+        dot(self.x[:, :5], W[:5])
+        self.assertTrue(np.array_equal(first, dot(self.x, W)))
+        self.assertEqual(["data", "scale"], sorted(vars(W)))
+        # a dequantized copy can be changed without changing W
+        values = W.dequantize()
+        values[:] = 0
+        self.assertTrue(np.array_equal(first, dot(self.x, W)))
+
+    def test_quantize_weights(self):
+        weights = {"W": self.W, "b": np.ones(8)}
+        quantized, scales = quantize_weights(weights, "int8")
+        self.assertEqual(["W"], scales.keys())
+        self.assertEqual(np.float32, quantized["b"].dtype)
+        loaded = quantized_weights(quantized, scales)
+        self.assertIsInstance(loaded["W"], QuantizedArray)
+        self.assertTrue(np.allclose(self.W, loaded["W"].dequantize(),
+                                    atol=scales["W"]))
+        self.assertRaises(ValueError, quantize_array, self.W, "int4")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+from deep_disfluency.tagger.deep_tagger import DeepDisfluencyTagger
+from deep_disfluency.tagger.session_state import COMMITTED, \
+    SNAPSHOT_VERSION, decode_snapshot, encode_snapshot, restore_session, \
+    snapshot_session
+
+WORDS = [("i", "PRP"), ("uh", "UH"), ("i", "PRP"), ("love", "VBP"),
+         ("cats", "NNS"), ("and", "CC"), ("the", "DT"), ("the", "DT"),
+         ("dogs", "NNS"), ("too", "RB")] * 4
+
+
+class SessionSnapshotTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tagger = DeepDisfluencyTagger(
+            config_file="experiments/experiment_configs.csv",
+            config_number=21, saved_model_dir="experiments/021/epoch_40",
+            numpy_model=True)
+
+    def tag(self, session, words):
+        for word, pos in words:
+            session.tag_new_word(word, pos)
+
+    def test_restored_session_continues(self):
+        session = self.tagger.new_session()
+        self.tag(session, WORDS[:30])
+        restored = self.tagger.new_session()
+        restored.restore_session_snapshot(
+            session.get_session_snapshot(horizon=20))
+        self.assertEqual([COMMITTED] * 10 + session.output_tags[10:],
+                         restored.output_tags)
+        # the same tags for the words after, with rollbacks in the horizon
+        for i, (word, pos) in enumerate(WORDS[30:]):
+            rollback = 2 if i % 3 == 2 else 0
+            session.tag_new_word(word, pos, rollback=rollback)
+            restored.tag_new_word(word, pos, rollback=rollback)
+            self.assertEqual(session.output_tags[10:],
+                             restored.output_tags[10:])
+
+    def test_short_session(self):
+        session = self.tagger.new_session()
+        self.tag(session, WORDS[:3])
+        restored = self.tagger.new_session()
+        restored_state = decode_snapshot(encode_snapshot(
+            snapshot_session(session)))
+        self.assertEqual(0, restored_state["committed"])
+        restore_session(restored, restored_state)
+        self.assertEqual(session.output_tags, restored.output_tags)
+        self.tag(session, WORDS[3:6])
+        self.tag(restored, WORDS[3:6])
+        self.assertEqual(session.output_tags, restored.output_tags)
+
+    def test_refused(self):
+        session = self.tagger.new_session()
+        self.tag(session, WORDS[:5])
+        state = snapshot_session(session)
+        self.assertRaises(ValueError, snapshot_session, session, 0)
+        state["version"] = SNAPSHOT_VERSION + 1
+        self.assertRaises(ValueError, restore_session,
+                          self.tagger.new_session(), state)
+        state = snapshot_session(session)
+        state["model"]["window_size"] += 1
+        self.assertRaises(ValueError, restore_session,
+                          self.tagger.new_session(), state)
+
+
+if __name__ == '__main__':
+    unittest.main()
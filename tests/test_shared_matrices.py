@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from deep_disfluency.load.shared_matrices import load_shared_matrices, \
+    pack_matrices
+
+
+class SharedMatricesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.matrix_dir = os.path.join(self.folder, "train")
+        self.cache_dir = os.path.join(self.folder, "cache")
+        os.mkdir(self.matrix_dir)
+        rng = np.random.RandomState(0)
+        self.matrices = {}
+        for i, n_rows in enumerate([5, 1, 12]):
+            matrix = rng.randint(0, 50, (n_rows, 4))
+            self.save("dialogue{}.npy".format(i), matrix)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def save(self, name, matrix):
+        np.save(os.path.join(self.matrix_dir, name), matrix)
+        self.matrices[name] = matrix
+
+    def check_matrices(self, shared):
+        self.assertEqual(sorted(self.matrices), sorted(shared.names))
+        self.assertEqual(len(self.matrices), len(shared))
+        for name, matrix in shared:
+            self.assertEqual(self.matrices[name].shape, matrix.shape)
+            self.assertEqual(self.matrices[name].tolist(), matrix.tolist())
+
+    def test_ids(self):
+        shared = load_shared_matrices(self.matrix_dir, self.cache_dir)
+        self.check_matrices(shared)
+        self.assertTrue(shared.verify())
+        self.assertFalse(shared.verify(n_lm=1))
+        self.assertRaises(ValueError, shared.ids.__setitem__, (0, 0), 1)
+
+    def test_extra_features(self):
+        self.matrices = {}
+        for i, n_rows in enumerate([3, 7]):
+            matrix = np.empty((n_rows, 6), dtype=object)
+            matrix[:, [0, 1, 2, 5]] = np.arange(n_rows * 4).reshape(-1, 4)
+            matrix[:, 3:5] = np.linspace(0, 1, n_rows * 2).reshape(-1, 2)
+            os.remove(os.path.join(self.matrix_dir,
+                                   "dialogue{}.npy".format(i)))
+            self.save("dialogue{}.npy".format(i), matrix)
+        os.remove(os.path.join(self.matrix_dir, "dialogue2.npy"))
+        shared = load_shared_matrices(self.matrix_dir, self.cache_dir)
+        self.check_matrices(shared)
+        self.assertTrue(shared.verify(n_lm=1, n_acoustic=1))
+
+    def test_packed_again_when_changed(self):
+        load_shared_matrices(self.matrix_dir, self.cache_dir)
+        self.save("dialogue3.npy", np.ones((2, 4), dtype=np.int64))
+        self.check_matrices(load_shared_matrices(self.matrix_dir,
+                                                 self.cache_dir))
+
+    def test_inconsistent_matrices(self):
+        target_prefix = os.path.join(self.folder, "packed")
+        unknown = np.array([[0, 1, None, 3]], dtype=object)
+        self.save("unknown.npy", unknown)
+        self.assertRaises(ValueError, pack_matrices, self.matrix_dir,
+                          target_prefix)
+        os.remove(os.path.join(self.matrix_dir, "unknown.npy"))
+        self.save("longer.npy", np.zeros((2, 5)))
+        self.assertRaises(ValueError, pack_matrices, self.matrix_dir,
+                          target_prefix)
+        self.assertFalse(os.path.exists(target_prefix + ".json"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import random
+import unittest
+from collections import defaultdict
+
+from deep_disfluency.evaluation.eval_utils import \
+    final_hyp_from_increco_and_incremental_metrics, p_r_f
+from deep_disfluency.evaluation.streaming_eval import \
+    StreamingIncrementalEval
+
+TAGS = ["<f/>", "<e/>", "<rm-1/><rpEndSub/>", "<rps id=\"1\"/>",
+        "<e/><rps id=\"2\"/>"]
+TTD_TAGS = ["<rms", "<rps", "<e"]
+
+
+def gold_speaker(rng, n):
+    timings = [(i * 0.5, (i + 1) * 0.5) for i in range(n)]
+    words = ["w{}".format(i) for i in range(n)]
+    labels = [rng.choice(TAGS) for _ in range(n)]
+    return timings, words, ["NN"] * n, labels
+
+
+def tagger_updates(rng, n):
+    """The (tags, words) of each update of a tagger's output for n words,
+    each adding a word and retagging up to the two before it."""
+    updates = []
+    for i in range(n):
+        first = max(0, i - rng.randint(0, 2))
+        words = [("<unk>", k * 0.5, (k + 1) * 0.5)
+                 for k in range(first, i + 1)]
+        tags = [(rng.choice(TAGS), w[1], w[2]) for w in words]
+        updates.append((tags, words))
+    return updates
+
+
+class StreamingIncrementalEvalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.gold = gold_speaker(self.rng, 60)
+        self.updates = tagger_updates(self.rng, 60)
+
+    def test_same_as_offline(self):
+        evaluation = StreamingIncrementalEval(interval=True)
+        evaluation.start_speaker("a", self.gold)
+        for tags, words in self.updates:
+            evaluation.update(tags, words)
+        tag_dict = defaultdict(list)
+        tag_dict["edit_overhead"] = [0, 0]
+        increco = [[words[-1][2] for _, words in self.updates],
+                   [words for _, words in self.updates],
+                   [[t[0] for t in tags] for tags, _ in self.updates]]
+        _, _, hypothesis = final_hyp_from_increco_and_incremental_metrics(
+            increco, [(x, y[0], y[1])
+                      for x, y in zip(self.gold[3], self.gold[0])],
+            self.gold[1], ttd_tags=TTD_TAGS, word=True, interval=True,
+            tag_dict=tag_dict)
+        self.assertEqual(hypothesis, evaluation.hypothesis)
+        for key, samples in evaluation.tag_dict.items():
+            self.assertEqual(tag_dict[key], samples)
+        self.assertTrue(evaluation.tag_dict["t_t_detection_<e_word"])
+        self.assertEqual(tag_dict["edit_overhead"][0], evaluation.edits)
+        results = evaluation.results()
+        self.assertAlmostEqual(
+            100 * (tag_dict["edit_overhead"][0] / 60.0 - 1),
+            results["edit_overhead_rel_word"])
+
+    def check_rolling_scores(self, evaluation, window):
+        hypothesis = evaluation.hypothesis[-window:]
+        labels = self.gold[3][len(evaluation.hypothesis) -
+                              len(hypothesis):len(evaluation.hypothesis)]
+        for tag, scores in evaluation.rolling_scores().items():
+            tp = sum(tag in h[0] and tag in g
+                     for h, g in zip(hypothesis, labels))
+            fp = sum(tag in h[0] and tag not in g
+                     for h, g in zip(hypothesis, labels))
+            fn = sum(tag not in h[0] and tag in g
+                     for h, g in zip(hypothesis, labels))
+            self.assertEqual(p_r_f(tp, fp, fn), scores)
+
+    def test_rolling_scores(self):
+        evaluation = StreamingIncrementalEval(window=10)
+        evaluation.start_speaker("a", self.gold)
+        for tags, words in self.updates:
+            evaluation.update(tags, words)
+            self.check_rolling_scores(evaluation, 10)
+        evaluation = StreamingIncrementalEval()
+        evaluation.start_speaker("a", self.gold)
+        for tags, words in self.updates:
+            evaluation.update(tags, words)
+        self.check_rolling_scores(evaluation, 60)
+
+    def test_add_tagged_word(self):
+        # as the diffs of tag_new_word, with an ASR rollback
+        evaluation = StreamingIncrementalEval(window=5)
+        evaluation.start_speaker("a", self.gold)
+        for tags, words in self.updates[:10]:
+            evaluation.add_tagged_word([t[0] for t in tags], *words[-1])
+        expected = list(evaluation.hypothesis)
+        self.assertEqual(2, evaluation.add_tagged_word(
+            ["<f/>"], "<unk>", 4.5, 5.0, rollback=2))
+        self.assertEqual(expected[:8] + [("<f/>", 4.5, 5.0)],
+                         evaluation.hypothesis)
+        self.check_rolling_scores(evaluation, 5)
+        evaluation.add_word_updates([{"id": 9, "word": "<unk>",
+                                      "start_time": 5.0, "end_time": 5.5,
+                                      "pos_tag": "NN",
+                                      "disf_tag": "<e/>"}])
+        self.assertEqual(("<e/>", 5.0, 5.5), evaluation.hypothesis[-1])
+        self.check_rolling_scores(evaluation, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import unittest
+
+# sweep.py is a script in the experiments folder, importing its siblings
+EXPERIMENTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "deep_disfluency", "experiments")
+sys.path.insert(0, EXPERIMENTS_DIR)
+try:
+    from sweep import cpu_slots, parse_config_ids
+finally:
+    sys.path.remove(EXPERIMENTS_DIR)
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_parse_config_ids(self):
+        self.assertEqual([35], parse_config_ids(["35"]))
+        self.assertEqual([33, 34, 35, 41, 21],
+                         parse_config_ids(["33-35", "41,34", "21"]))
+
+    def test_cpu_slots(self):
+        slots = cpu_slots(2, 1)
+        self.assertEqual(2, len(slots))
+        self.assertTrue(all(len(cpus) == 1 for cpus in slots))
+
+
+if __name__ == '__main__':
+    unittest.main()
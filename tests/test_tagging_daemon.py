@@ -0,0 +1,97 @@
+import unittest
+from argparse import Namespace
+
+from deep_disfluency.tagger import tagging_protocol as protocol
+from deep_disfluency.tagger.tagging_daemon import TaggingDaemon, _DISCONNECT
+
+
+class FakeSession(object):
+    """Tags every word '<f/>' in place of a DeepDisfluencyTagger
+    session."""
+    model = None
+
+    def __init__(self):
+        self.output_tags = []
+
+    def start_word(self, word, pos=None, timing=None, rollback=0):
+        self.rollback(rollback)
+        return {"word": word}
+
+    def rnn_step(self, step):
+        return None
+
+    def finish_word(self, step, rnn_output):
+        self.output_tags.append("<f/>")
+        return ["<f/>"]
+
+    def rollback(self, backwards):
+        self.output_tags = self.output_tags[:len(self.output_tags) -
+                                            backwards]
+
+
+class FakeTagger(object):
+    args = Namespace(pos=False)
+
+    def new_session(self):
+        return FakeSession()
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg_type, **fields):
+        self.sent.append((msg_type, fields))
+
+
+def word(session, word_id, text):
+    return {"type": protocol.WORD, "session": session, "word_id": word_id,
+            "word": text, "pos": None, "timing": None, "rollback": 0}
+
+
+class ProcessBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = TaggingDaemon("/tmp/unused.sock", tagger=FakeTagger())
+
+    def requests(self, connection, messages):
+        return [(connection, message, 0.0) for message in messages]
+
+    def test_session_order(self):
+        connection = FakeConnection()
+        self.daemon.process_batch(self.requests(connection, [
+            {"type": protocol.OPEN, "session": 1},
+            word(1, 0, "i"), word(1, 1, "want"),
+            {"type": protocol.ROLLBACK, "session": 1, "rollback": 1},
+            word(1, 1, "wanted"),
+            {"type": protocol.CLOSE, "session": 1}]))
+        self.assertEqual(
+            [protocol.OK, protocol.TAGS, protocol.TAGS, protocol.OK,
+             protocol.TAGS, protocol.OK],
+            [msg_type for msg_type, _ in connection.sent])
+        self.assertEqual([0, 1, 1], [fields["start"]
+                                     for msg_type, fields in connection.sent
+                                     if msg_type == protocol.TAGS])
+        self.assertEqual({}, self.daemon.sessions)
+
+    def test_disconnect_waits_for_words(self):
+        connection = FakeConnection()
+        other = FakeConnection()
+        batch = self.requests(connection, [
+            {"type": protocol.OPEN, "session": 1},
+            word(1, 0, "i"), word(1, 1, "want"), word(1, 2, "tea"),
+            {"type": _DISCONNECT}])
+        batch[2:2] = self.requests(other, [
+            {"type": protocol.OPEN, "session": 1}, word(1, 0, "hi")])
+        self.daemon.process_batch(batch)
+        self.assertEqual([0, 1, 2], [fields["word_id"]
+                                     for msg_type, fields in connection.sent
+                                     if msg_type == protocol.TAGS])
+        self.assertNotIn(protocol.ERROR,
+                         [msg_type for msg_type, _ in connection.sent])
+        self.assertEqual([(other, 1)], self.daemon.sessions.keys())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import random
+import unittest
+
+from deep_disfluency.feature_extraction.word_alignment import align
+
+
+class AlignTest(unittest.TestCase):
+
+    def test_align(self):
+        self.assertEqual([(0, 0, "ID", 0), (1, 1, "ID", 0),
+                          (2, 1, "DEL", 1), (3, 2, "ID", 1)],
+                         align("I want uh <laughter>cars</laughter>".split(),
+                               "i want cars.".split()))
+        self.assertEqual([(0, 0, "ID", 0), (0, 1, "INS", 1),
+                          (1, 1, "DEL", 2)],
+                         align(["a", "b"], ["a", "c"]))
+
+    def test_band(self):
+        # a narrow band is widened until it holds every cheapest path
+        rng = random.Random(0)
+        words = ["a", "b", "c", "uh", "the"]
+        for _ in range(200):
+            r = [rng.choice(words) for _ in range(rng.randint(1, 15))]
+            h = [rng.choice(words) for _ in range(rng.randint(1, 15))]
+            full = align(r, h, band=max(len(r), len(h)))
+            for band in [0, 1, 3]:
+                self.assertEqual(full, align(r, h, band=band))
+
+
+if __name__ == '__main__':
+    unittest.main()
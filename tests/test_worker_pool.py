@@ -0,0 +1,47 @@
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+from deep_disfluency.tagger.worker_pool import share_tagger_state
+from deep_disfluency.utils.lazy_loading import LazyPickle
+
+
+class FakeTagger(object):
+
+    def __init__(self, timing_model, timing_model_scaler):
+        self.args = Namespace(pos=False)
+        self.timing_model = timing_model
+        self.timing_model_scaler = timing_model_scaler
+
+
+class ShareTaggerStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def lazy_pickle(self, name, obj):
+        file_path = os.path.join(self.folder, name)
+        with open(file_path, "wb") as fid:
+            cPickle.dump(obj, fid)
+        return LazyPickle(file_path)
+
+    def test_timing_models_loaded_before_fork(self):
+        tagger = FakeTagger(self.lazy_pickle("timer.pkl", {"w": [1.0]}),
+                            self.lazy_pickle("scaler.pkl", {"s": 2.0}))
+        self.assertIsNone(tagger.timing_model._obj)
+        share_tagger_state(tagger)
+        self.assertEqual({"w": [1.0]}, tagger.timing_model._obj)
+        self.assertEqual({"s": 2.0}, tagger.timing_model_scaler._obj)
+
+    def test_no_timing_model(self):
+        share_tagger_state(FakeTagger(None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()